@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 import principal
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,11 +46,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'principal.middleware.MetricasMiddleware',  # Métricas por rota (/metrics); primeiro para medir os demais
     'django.middleware.security.SecurityMiddleware',
+    'principal.middleware.EstaticosMiddleware',  # Arquivos de STATIC_ROOT comprimidos e com cache longo (ESTATICOS_SERVIR)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'principal.middleware.ReplicaMiddleware',  # Leituras na réplica (se configurada)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -58,7 +62,8 @@ ROOT_URLCONF = 'gerenciamento_chaves.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Backend do Django com o tempo de renderização medido (métricas por rota)
+        'BACKEND': 'principal.services.metricasServices.TemplatesMedidos',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,17 +78,199 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'gerenciamento_chaves.wsgi.application'
 
+# Servidor ASGI (necessário para o feed ao vivo em /api/eventos-emprestimos/).
+# O barramento de eventos é em memória: use um único processo, ex.:
+# uvicorn gerenciamento_chaves.asgi:application --workers 1
+ASGI_APPLICATION = 'gerenciamento_chaves.asgi.application'
+
+# Views assíncronas (ORM assíncrono) para index, pegar_chave, histórico e a API de
+# últimos empréstimos. Use só com servidor ASGI: sob WSGI cada requisição a uma view
+# async ganha um event loop próprio, o que a deixa mais lenta que a versão síncrona.
+# Ex.: VIEWS_ASYNC=1 uvicorn gerenciamento_chaves.asgi:application
+VIEWS_ASYNC = os.environ.get('VIEWS_ASYNC') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# Perfil escolhido pela variável de ambiente DB_PERFIL:
+# - 'sqlite' (padrão): arquivo local (DB_NOME), em modo WAL e com os PRAGMAs de
+#   SQLITE_PRAGMAS aplicados a cada conexão (principal.signals.configurar_sqlite).
+#   Transações começam com BEGIN IMMEDIATE: duas retiradas simultâneas esperam a
+#   vez (busy_timeout) em vez de falhar com "database is locked".
+# - 'postgresql': servidor PostgreSQL (DB_NOME, DB_USUARIO, DB_SENHA, DB_HOST, DB_PORTA),
+#   com conexões persistentes (DB_CONN_MAX_AGE segundos, verificadas antes do uso)
+#   ou, com DB_POOL=1, pool de conexões do psycopg 3 (pip install "psycopg[binary,pool]").
+DB_PERFIL = os.environ.get('DB_PERFIL', 'sqlite')
+
+if DB_PERFIL == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NOME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+elif DB_PERFIL == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NOME', 'gerenciamento_chaves'),
+            'USER': os.environ.get('DB_USUARIO', 'postgres'),
+            'PASSWORD': os.environ.get('DB_SENHA', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORTA', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
+    if os.environ.get('DB_POOL') == '1':
+        # O pool do Django não aceita conexões persistentes: CONN_MAX_AGE fica 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+                'timeout': 10,
+            },
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+else:
+    raise ImproperlyConfigured(f"DB_PERFIL inválido: '{DB_PERFIL}' (use 'sqlite' ou 'postgresql').")
+
+# Réplica de leitura (opcional), usada pelas views de REPLICA_TOLERANCIA:
+# - SQLite: DB_REPLICA_NOME, arquivo mantido pelo comando sincronizar_replica
+#   (ex.: python manage.py sincronizar_replica --loop 5);
+# - PostgreSQL: DB_REPLICA_HOST (e DB_REPLICA_PORTA), servidor em hot standby.
+if DB_PERFIL == 'sqlite' and os.environ.get('DB_REPLICA_NOME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DB_REPLICA_NOME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+elif DB_PERFIL == 'postgresql' and os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORTA', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['principal.routers.RoteadorReplica']
+
+# Views (nome da URL) que podem ler da réplica e o atraso tolerado em segundos.
+# Se a réplica estiver mais atrasada, a view lê do principal
+REPLICA_TOLERANCIA = {
+    'historico_list': 60,  # Consulta de registros passados
+    'api_ultimos_emprestimos': 5,  # Atualização periódica da tela de staff
+    'index': 5,  # Status das chaves
+}
+REPLICA_ADERENCIA_SEGUNDOS = 10  # Depois de uma escrita, o usuário lê do principal por este tempo
+REPLICA_INTERVALO_MEDICAO = 2  # Validade (segundos) da medida de atraso da réplica
+
+# PRAGMAs aplicados a cada nova conexão SQLite (perfil 'sqlite')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Leitores não bloqueiam o escritor (e vice-versa)
+    'synchronous': 'NORMAL',  # Seguro com WAL; evita um fsync por commit
+    'busy_timeout': 20000,  # Espera (ms) pelo lock de escrita antes de desistir
+    'mmap_size': 256 * 1024 * 1024,  # Leitura via memória mapeada (bytes)
 }
 
+# Cache, escolhido pela variável de ambiente CACHE_PERFIL:
+# - 'memoria' (padrão): na memória de cada processo;
+# - 'arquivo': arquivos em CACHE_DIR, compartilhados pelos processos da máquina;
+# - 'redis': servidor Redis em CACHE_URL (pip install redis), compartilhado entre máquinas.
+# 'default' guarda os marcadores de versão (ETag, usuários) e o resto do sistema; 'fragmentos'
+# guarda os trechos de template em cache ({% cache ... using="fragmentos" %}: linhas das tabelas
+# de chaves e últimos empréstimos) e 'sessoes' as sessões (SESSAO_PERFIL), separados para que
+# a quantidade de linhas e de sessões não expulse os marcadores.
+# A chave de cada fragmento inclui a versão do que ele mostra (Chave.versao, versão do histórico):
+# nada precisa ser apagado quando uma chave muda, a linha nova simplesmente usa outra chave.
+CACHE_PERFIL = os.environ.get('CACHE_PERFIL', 'memoria')
+CACHE_FRAGMENTOS_MAX = int(os.environ.get('CACHE_FRAGMENTOS_MAX', 5000))  # Fragmentos por processo/diretório
+CACHE_SESSOES_MAX = int(os.environ.get('CACHE_SESSOES_MAX', 5000))  # Sessões ('sessoes', SESSAO_PERFIL=cached_db)
+
+if CACHE_PERFIL == 'memoria':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'fragmentos': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'fragmentos',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_FRAGMENTOS_MAX},
+        },
+        'sessoes': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sessoes',
+            'OPTIONS': {'MAX_ENTRIES': CACHE_SESSOES_MAX},
+        },
+    }
+elif CACHE_PERFIL == 'arquivo':
+    CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, 'default'),
+        },
+        'fragmentos': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, 'fragmentos'),
+            'OPTIONS': {'MAX_ENTRIES': CACHE_FRAGMENTOS_MAX},
+        },
+        'sessoes': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, 'sessoes'),
+            'OPTIONS': {'MAX_ENTRIES': CACHE_SESSOES_MAX},
+        },
+    }
+elif CACHE_PERFIL == 'redis':
+    CACHE_URL = os.environ.get('CACHE_URL', 'redis://127.0.0.1:6379/0')
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'chaves',
+        },
+        'fragmentos': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'chaves_fragmentos',
+        },
+        'sessoes': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'chaves_sessoes',
+        },
+    }
+else:
+    raise ImproperlyConfigured(f"CACHE_PERFIL inválido: '{CACHE_PERFIL}' (use 'memoria', 'arquivo' ou 'redis').")
+
+# Sessões, escolhidas pela variável de ambiente SESSAO_PERFIL:
+# - 'cached_db' (padrão): no banco e no cache 'sessoes'; a leitura de cada requisição
+#   vem do cache (o banco só é lido na falta, ex.: depois de reiniciar com cache em memória);
+# - 'db': só no banco (uma consulta em django_session por requisição);
+# - 'cookie': no próprio cookie, assinado com a SECRET_KEY (nenhuma consulta; o conteúdo
+#   é legível pelo navegador e o logout não invalida cópias antigas do cookie).
+SESSAO_PERFIL = os.environ.get('SESSAO_PERFIL', 'cached_db')
+SESSION_ENGINE = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'db': 'django.contrib.sessions.backends.db',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}.get(SESSAO_PERFIL)
+if SESSION_ENGINE is None:
+    raise ImproperlyConfigured(f"SESSAO_PERFIL inválido: '{SESSAO_PERFIL}' (use 'cached_db', 'db' ou 'cookie').")
+SESSION_CACHE_ALIAS = 'sessoes'
+
+# Usuário da sessão (com grupos e permissões) em cache no processo por AUTENTICACAO_CACHE_SEGUNDOS
+# (0 desativa), no máximo AUTENTICACAO_CACHE_MAXIMO usuários. Edições de usuários, grupos e
+# permissões invalidam o cache (principal.services.autenticacaoServices).
+# Sessões abertas antes de trocar o backend precisam de um novo login
+AUTHENTICATION_BACKENDS = ['principal.backends.UsuarioEmCacheBackend']
+AUTENTICACAO_CACHE_SEGUNDOS = 30
+AUTENTICACAO_CACHE_MAXIMO = 1000
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -119,13 +306,38 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
-# Para ambientes de produção, descomente a linha abaixo
-# STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# Destino do collectstatic (produção): python manage.py preparar_estaticos
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
     )
 
+# Em produção (DEBUG = False) o collectstatic grava os arquivos com o hash do conteúdo no
+# nome (style.3f2a9c1b7d4e.css), minifica o CSS/JS do projeto e gera as variantes .gz/.br
+# (principal.storage.EstaticosComprimidos). Sem o collectstatic, {% static %} falha.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'principal.storage.EstaticosComprimidos'
+        ),
+    },
+}
+
+# EstaticosMiddleware: serve STATIC_ROOT pelo próprio Django (com a variante comprimida e
+# 'Cache-Control: immutable' nos arquivos com hash). Desligue se um servidor web
+# (nginx etc.) servir /static/. Arquivos sem hash ficam ESTATICOS_MAX_AGE segundos em cache
+ESTATICOS_SERVIR = not DEBUG
+ESTATICOS_MAX_AGE = 300
+
+# Arquivos gerados pelo sistema (ex.: imagens de QR Code em MEDIA_ROOT/qrcodes)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -153,4 +365,58 @@ LOGOUT_REDIRECT_URL = 'login'
 #HSTS Settings - Após configurar HTTPS, descomente estas linhas para maior segurança
 #SECURE_HSTS_SECONDS = 31536000  # 1 ano
 #SECURE_HSTS_INCLUDE_SUBDOMAINS = True
-#SECURE_HSTS_PRELOAD = True
\ No newline at end of file
+#SECURE_HSTS_PRELOAD = True
+
+# Paginação do histórico: True usa cursor (keyset) por padrão em vez de número de página.
+# Também pode ser escolhida por requisição com ?paginacao=cursor ou ?paginacao=pagina
+HISTORICO_PAGINACAO_CURSOR = False
+
+# Dias do histórico mantidos na tabela principal; meses inteiros anteriores a isso vão
+# para o arquivo com o comando arquivar_historico (a busca por data consulta o arquivo)
+HISTORICO_DIAS_QUENTES = 365
+
+# Instantâneos do estado das chaves (comando capturar_instantaneos): um a cada
+# INSTANTANEO_INTERVALO_MINUTOS; depois de INSTANTANEO_RETENCAO_DIAS dias, só o primeiro de cada dia.
+# A consulta de um instante reaplica os eventos desde INSTANTANEO_MARGEM_SEGUNDOS antes do
+# instantâneo (movimentações ainda não confirmadas no momento da captura)
+INSTANTANEO_INTERVALO_MINUTOS = 60
+INSTANTANEO_RETENCAO_DIAS = 30
+INSTANTANEO_MARGEM_SEGUNDOS = 60
+
+# Métricas por rota em /metrics (formato Prometheus, apenas staff ou com o token abaixo).
+# Consultas acima de METRICAS_CONSULTA_LENTA_MS vão para o log e para as amostras
+# (as METRICAS_AMOSTRAS_LENTAS mais recentes, em /metrics/consultas-lentas/)
+METRICAS_ATIVAS = True
+METRICAS_CONSULTA_LENTA_MS = 200
+METRICAS_AMOSTRAS_LENTAS = 50
+# Token para o coletor do Prometheus (cabeçalho 'Authorization: Bearer <token>'); None desativa
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+
+# Marcadores de versão (ETag/304 das páginas de chaves e do histórico, fragmento dos últimos
+# empréstimos): só são confiáveis quando todos os processos leem o mesmo cache ('arquivo' ou
+# 'redis'). Com 'memoria' ficam desligados; com um único processo (ex.: runserver), podem ser
+# ligados com VERSOES_EM_CACHE=1
+VERSOES_EM_CACHE = os.environ.get('VERSOES_EM_CACHE', '0' if CACHE_PERFIL == 'memoria' else '1') == '1'
+# Validade (segundos) dos marcadores: limita por quanto tempo um marcador perdido ou antigo vale
+VERSAO_CACHE_TIMEOUT = 300
+
+# Leitura de QR Code por foto (scan_page): limites e pool de processos.
+# QRCODE_PROCESSOS = 0 lê no próprio processo da requisição (desenvolvimento)
+QRCODE_UPLOAD_MAX_BYTES = 15 * 1024 * 1024  # Tamanho máximo do arquivo enviado
+QRCODE_MAX_PIXELS = 50_000_000  # Resolução máxima (largura x altura)
+QRCODE_LADO_REDUZIDO = 1024  # Lado maior da cópia reduzida lida primeiro
+QRCODE_PROCESSOS = 2  # Processos do pool de leitura
+QRCODE_FILA_MAXIMA = 8  # Leituras em andamento, executando ou à espera de um processo (acima disso, pede para tentar de novo)
+QRCODE_TIMEOUT_SEGUNDOS = 5  # Tempo máximo de execução de uma leitura (a espera por um processo livre não conta)
+
+# Endereço gravado nos QR Codes e etiquetas (ex.: 'https://chaves.campus.edu.br').
+# None usa o endereço da requisição; o comando gerar_etiquetas exige um valor ou --url-base
+QRCODE_URL_BASE = None
+
+# Páginas da folha de etiquetas gerada pela tela (24 etiquetas por página), montada no
+# próprio processo do servidor; folhas maiores, com o comando gerar_etiquetas
+ETIQUETAS_PAGINAS_TELA = 10
+
+# Rotação dos tokens assinados dos QR Codes: trocar o valor invalida todas as etiquetas impressas
+# (para uma chave só, use a ação "Gerar novo QR Code" no admin)
+QRCODE_TOKEN_ROTACAO = '1'
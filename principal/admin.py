@@ -1,8 +1,12 @@
 # Author: João Victor Marques Favero
 
-from django.contrib import admin  # Admin do Django
+from django import forms  # Validação do formulário do histórico
+from django.contrib import admin, messages  # Admin do Django
 from django.contrib.auth.admin import UserAdmin  # Admin padrão de usuários
-from principal.models import Usuario, Chave, HistoricoEmprestimo  # Modelos do app
+from django.db.models import F  # Incremento no próprio banco
+from django.http import HttpResponseRedirect  # Volta ao formulário após conflito
+from principal.models import Usuario, Chave, HistoricoEmprestimo, InstantaneoChaves, ResumoArquivoMensal  # Modelos do app
+from principal.services.emprestimoServices import ConflitoEmprestimo  # Chave movimentada durante o save
 
 # Admin customizado para o modelo de usuário
 class UsuarioAdmin(UserAdmin):
@@ -27,13 +31,71 @@ class ChaveAdmin(admin.ModelAdmin):
     list_display = ('nome', 'status', 'portador_atual', 'excluido')
     # Widget horizontal para ManyToMany de grupos de permissão
     filter_horizontal = ('grupos_permissao',)
+    # A versão só muda pela ação abaixo
+    readonly_fields = ('versao_qrcode',)
+    actions = ['gerar_novo_qrcode']
+
+    # Invalida as etiquetas impressas (ex.: etiqueta perdida ou copiada)
+    @admin.action(description='Gerar novo QR Code (invalida as etiquetas impressas)')
+    def gerar_novo_qrcode(self, request, queryset):
+        total = queryset.update(versao_qrcode=F('versao_qrcode') + 1)
+        self.message_user(request, f'{total} chave(s) com novo QR Code. Imprima as novas etiquetas.')
+
+# Formulário do histórico: aquisições/devoluções novas movimentam a chave (HistoricoEmprestimo.save())
+class HistoricoEmprestimoForm(forms.ModelForm):
+    class Meta:
+        model = HistoricoEmprestimo
+        fields = '__all__'
+
+    def clean(self):
+        dados = super().clean()
+        chave = dados.get('chave')
+        if self.instance.pk is None and chave is not None:
+            if dados.get('acao') == 'devolucao' and chave.status != 'em_uso':
+                raise forms.ValidationError(f'A chave "{chave.nome}" já está disponível.')
+            if dados.get('acao') == 'adquirida' and dados.get('usuario') is None:
+                raise forms.ValidationError('Informe o usuário que retirou a chave.')
+        return dados
 
 # Admin para o histórico de empréstimos
 class HistoricoEmprestimoAdmin(admin.ModelAdmin):
+    form = HistoricoEmprestimoForm
     # Colunas exibidas na lista de históricos
     list_display = ('chave', 'usuario', 'data_hora', 'acao')
 
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # A chave pode mudar entre a validação e o save (outra retirada/devolução)
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except ConflitoEmprestimo as erro:
+            self.message_user(request, f'{erro} Nada foi gravado.', messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+# Admin para os resumos do arquivo do histórico (gerados pelo comando arquivar_historico)
+class ResumoArquivoMensalAdmin(admin.ModelAdmin):
+    list_display = ('mes', 'total', 'adquiridas', 'devolucoes', 'transferidas', 'arquivado_em')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+# Admin para os instantâneos do estado das chaves (gerados pelo comando capturar_instantaneos)
+class InstantaneoChavesAdmin(admin.ModelAdmin):
+    list_display = ('momento', 'chaves_em_uso')
+    # O estado (JSON) pode ser grande: fora da lista e do formulário
+    exclude = ('portadores',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Registros no site de administração
 admin.site.register(Usuario, UsuarioAdmin)
 admin.site.register(Chave, ChaveAdmin)
-admin.site.register(HistoricoEmprestimo, HistoricoEmprestimoAdmin)
\ No newline at end of file
+admin.site.register(HistoricoEmprestimo, HistoricoEmprestimoAdmin)
+admin.site.register(ResumoArquivoMensal, ResumoArquivoMensalAdmin)
+admin.site.register(InstantaneoChaves, InstantaneoChavesAdmin)
@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
 
 
 class PrincipalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'principal'
+
+    def ready(self):
+        # Conecta os receptores de sinais do app
+        from . import signals
+
+        connection_created.connect(signals.configurar_sqlite)
+        connection_created.connect(signals.instrumentar_conexao)
+        post_migrate.connect(signals.garantir_busca, sender=self)
+        post_save.connect(signals.chave_alterada, sender='principal.Chave')
+        post_delete.connect(signals.chave_alterada, sender='principal.Chave')
+        post_delete.connect(signals.chave_excluida, sender='principal.Chave')
+        post_save.connect(signals.usuario_alterado, sender='principal.Usuario')
+        post_save.connect(signals.historico_salvo, sender='principal.HistoricoEmprestimo')
+
+        # Cache do usuário autenticado (principal.backends.UsuarioEmCacheBackend)
+        from django.contrib.auth.models import Group, Permission
+        from .models import Usuario
+
+        post_save.connect(signals.usuario_invalidado, sender=Usuario)
+        post_delete.connect(signals.usuario_invalidado, sender=Usuario)
+        m2m_changed.connect(signals.grupos_usuario_alterados, sender=Usuario.groups.through)
+        m2m_changed.connect(signals.grupos_usuario_alterados, sender=Usuario.user_permissions.through)
+        for modelo in (Group, Permission):
+            post_save.connect(signals.permissoes_alteradas, sender=modelo)
+            post_delete.connect(signals.permissoes_alteradas, sender=modelo)
+        m2m_changed.connect(signals.permissoes_alteradas, sender=Group.permissions.through)
@@ -0,0 +1,26 @@
+# Author: João Victor Marques Favero
+"""
+Backend de autenticação do app 'principal' (AUTHENTICATION_BACKENDS).
+"""
+
+from django.contrib.auth.backends import ModelBackend
+from principal.services import autenticacaoServices
+
+
+class UsuarioEmCacheBackend(ModelBackend):
+    """
+    ModelBackend com o usuário da sessão (e seus grupos e permissões) em
+    cache no processo por AUTENTICACAO_CACHE_SEGUNDOS (autenticacaoServices).
+    O login (authenticate) continua igual ao do ModelBackend.
+    """
+
+    def get_user(self, user_id):
+        if not autenticacaoServices.validade():
+            return super().get_user(user_id)
+        return autenticacaoServices.obter(user_id, super().get_user)
+
+    def get_all_permissions(self, user_obj, obj=None):
+        permissoes = super().get_all_permissions(user_obj, obj)
+        if obj is None and user_obj.is_active and not user_obj.is_anonymous:
+            autenticacaoServices.guardar_permissoes(user_obj)
+        return permissoes
@@ -0,0 +1,12 @@
+# Author: João Victor Marques Favero
+"""
+Benchmark das rotas do sistema, executado no próprio processo (sem servidor
+nem rede), contra um banco de testes:
+
+- dados: gera usuários, grupos, chaves e histórico a partir de uma semente
+  (comando benchmark_dados);
+- carga: terminais simultâneos (threads com o Client do Django) repetindo as
+  rotas de principal/urls.py (comando benchmark_rotas);
+- relatorio: vazão, latências p50/p95/p99 e consultas por requisição, e a
+  comparação com um resultado salvo anteriormente (linha de base).
+"""
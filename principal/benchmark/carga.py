@@ -0,0 +1,267 @@
+# Author: João Victor Marques Favero
+"""
+Terminais simultâneos repetindo as rotas de principal/urls.py no próprio
+processo, com o Client do Django (sem servidor nem rede).
+
+Cada terminal é uma thread com conexão própria ao banco e dois clientes
+logados: um porteiro (staff) e um usuário comum. A sequência de rotas,
+chaves e usuários de cada terminal vem da semente: duas execuções sobre os
+mesmos dados fazem as mesmas requisições (só a intercalação entre as
+threads varia). As consultas de cada requisição são contadas por
+connection.execute_wrapper.
+
+As rotas que ficam fora da carga estão em FORA_DA_CARGA, com o motivo.
+scan/ entra só por POST, com a foto de um QR Code, como no formulário da
+lista de chaves (o GET renderiza ativos/qrcode/scan_page.html, que não
+existe no projeto).
+O Client não verifica CSRF nem envia If-None-Match: as rotas com ETag
+sempre renderizam a página.
+"""
+
+import random
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signals import got_request_exception
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from principal.models import Chave, HistoricoEmprestimo, InstantaneoChaves, Usuario
+from principal.services import etiquetaServices
+from principal.services.tokenServices import gerar_token
+
+# montar(contexto, sorteio) -> (caminho, parâmetros da query string ou do POST, cabeçalhos)
+Rota = namedtuple('Rota', ['metodo', 'staff', 'peso', 'esperados', 'montar'])
+
+# Dados sorteados pelos terminais (lidos uma vez, antes da carga)
+ContextoCarga = namedtuple(
+    'ContextoCarga', ['chaves', 'usuario_ids', 'staff_ids', 'dia_historico', 'primeiro_instantaneo', 'foto_qrcode']
+)
+
+Medicao = namedtuple('Medicao', ['rota', 'status', 'sucesso', 'inicio', 'ms', 'consultas'])
+
+_JSON = {'HTTP_ACCEPT': 'application/json'}
+
+
+def _chave(contexto, sorteio):
+    return sorteio.choice(contexto.chaves)
+
+
+def _token(contexto, sorteio):
+    # Token do QR Code impresso na etiqueta de uma chave sorteada
+    pk, _, versao = _chave(contexto, sorteio)
+    return gerar_token(pk, versao)
+
+
+def _lote(contexto, sorteio):
+    return {'acao': 'receber', 'chaves': [pk for pk, _, _ in sorteio.sample(contexto.chaves, min(5, len(contexto.chaves)))]}
+
+
+def _foto(contexto, sorteio):
+    # Foto enviada pelo formulário de leitura da lista de chaves
+    return {'qr_image': SimpleUploadedFile('qrcode.png', contexto.foto_qrcode, 'image/png')}
+
+
+def _momento(contexto, sorteio):
+    inicio = contexto.primeiro_instantaneo
+    momento = inicio + (timezone.now() - inicio) * sorteio.random()
+    return timezone.localtime(momento).strftime('%Y-%m-%dT%H:%M')
+
+
+# Nome da URL (com ':post' nas versões POST) -> Rota. Peso: proporção da rota na carga
+ROTAS = {
+    'index': Rota('get', False, 20, {200}, lambda c, s: ('/', {}, {})),
+    # Sempre redireciona: para a chave lida ou, com a mensagem de erro, para a tela inicial
+    'scan_page:post': Rota('post', False, 3, {302}, lambda c, s: ('/scan/', _foto(c, s), {})),
+    'pegar_chave': Rota('get', False, 10, {200}, lambda c, s: (f'/chave/{_chave(c, s)[0]}/', {}, {})),
+    'pegar_chave:post': Rota('post', False, 5, {302}, lambda c, s: (f'/chave/{_chave(c, s)[0]}/', {}, {})),
+    'retirar_por_qrcode': Rota('get', False, 2, {200}, lambda c, s: (f'/q/{_token(c, s)}/', {}, {})),
+    # 409: chave movimentada por outro terminal entre a leitura e a gravação
+    'retirar_por_qrcode:post': Rota('post', False, 2, {200, 409}, lambda c, s: (f'/q/{_token(c, s)}/', {}, _JSON)),
+    'api_ultimos_emprestimos': Rota('get', True, 15, {200}, lambda c, s: ('/api/ultimos-emprestimos/', {}, {})),
+    'historico_list': Rota('get', True, 6, {200}, lambda c, s: ('/historico/', {'page': s.randint(1, 5)}, {})),
+    'exportar_historico': Rota(
+        'get', True, 1, {200}, lambda c, s: ('/historico/exportar/', {'de': c.dia_historico, 'ate': c.dia_historico}, {})
+    ),
+    'sessoes_list': Rota('get', True, 2, {200}, lambda c, s: ('/historico/sessoes/', {'abertas': 1}, {})),
+    'estado_chaves_em': Rota('get', True, 1, {200}, lambda c, s: ('/historico/instante/', {'momento': _momento(c, s)}, {})),
+    'painel_uso': Rota('get', True, 1, {200}, lambda c, s: ('/analise/', {'dias': s.choice([7, 30, 90])}, {})),
+    'lista_chaves': Rota('get', True, 6, {200}, lambda c, s: ('/chaves/', {'page': s.randint(1, 5)}, {})),
+    'acoes_em_lote:post': Rota('post', True, 1, {200}, lambda c, s: ('/chaves/lote/', _lote(c, s), {})),
+    'receber_chave:post': Rota('post', True, 4, {302}, lambda c, s: (f'/chave/{_chave(c, s)[0]}/receber/', {}, {})),
+    'entregar_chave': Rota('get', True, 2, {200}, lambda c, s: (f'/chave/{_chave(c, s)[0]}/entregar/', {}, {})),
+    'entregar_chave:post': Rota(
+        'post', True, 3, {302}, lambda c, s: (f'/chave/{_chave(c, s)[0]}/entregar/', {'usuario_id': s.choice(c.usuario_ids)}, {})
+    ),
+    'gerar_qrcode_chave': Rota('get', True, 1, {200}, lambda c, s: (f'/chave/{_chave(c, s)[0]}/qrcode/', {}, {})),
+    'qrcode_chave_imagem': Rota('get', True, 1, {200}, lambda c, s: (f'/chave/{_chave(c, s)[0]}/qrcode.svg', {}, {})),
+    'folha_etiquetas': Rota('get', True, 1, {200}, lambda c, s: ('/chaves/etiquetas/', {'chave_nome': _chave(c, s)[1]}, {})),
+}
+
+# Nome da URL (com namespace) -> por que a rota não entra na carga. Toda rota
+# nomeada do projeto deve estar em ROTAS ou aqui (verificado nos testes)
+FORA_DA_CARGA = {
+    'login': 'encerraria a sessão do terminal',
+    'logout': 'encerraria a sessão do terminal',
+    'stream_emprestimos': 'fluxo SSE sem fim',
+    'qr_code:serve_qr_code_image': 'app de terceiros',
+    'metricas': 'monitoramento, não faz parte do uso do sistema',
+    'consultas_lentas': 'monitoramento, não faz parte do uso do sistema',
+}
+
+
+def preparar_contexto():
+    """
+    Lê do banco as chaves, usuários e datas sorteados pelos terminais.
+    """
+    chaves = list(Chave.objects.filter(excluido=False).order_by('pk').values_list('pk', 'nome', 'versao_qrcode'))
+    usuarios = Usuario.objects.filter(is_active=True).order_by('pk')
+    ultimo = HistoricoEmprestimo.objects.order_by('-data_hora').values_list('data_hora', flat=True).first()
+    primeiro_instantaneo = InstantaneoChaves.objects.order_by('momento').values_list('momento', flat=True).first()
+    foto_qrcode = b''
+    if chaves:
+        pk, _, versao = chaves[0]
+        url = etiquetaServices.url_da_chave(pk, versao, etiquetaServices.url_base() or f'http://{_host()}')
+        foto_qrcode = etiquetaServices.obter_qrcode(pk, url, 'png').read_bytes()
+    return ContextoCarga(
+        chaves=chaves,
+        usuario_ids=list(usuarios.filter(is_staff=False).values_list('pk', flat=True)),
+        staff_ids=list(usuarios.filter(is_staff=True).values_list('pk', flat=True)),
+        dia_historico=timezone.localtime(ultimo).date() if ultimo else timezone.localdate(),
+        primeiro_instantaneo=primeiro_instantaneo or timezone.now() - timedelta(days=1),
+        foto_qrcode=foto_qrcode,
+    )
+
+
+def _host():
+    # Um host aceito por ALLOWED_HOSTS (o padrão do Client, 'testserver', não está na lista)
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+# Exceção da última requisição de cada thread. O Client guardaria as de
+# todas as threads (o sinal é global), atribuindo-as à rota errada
+_excecoes = threading.local()
+
+
+def _guardar_excecao(sender, request, **kwargs):
+    _excecoes.ultima = sys.exc_info()[1]
+
+
+class ContadorConsultas:
+    """
+    execute_wrapper que conta as consultas feitas pela conexão da thread.
+    """
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class Terminal(threading.Thread):
+    """
+    Um terminal: 'aquecimento' requisições descartadas e depois
+    'requisicoes' medidas, sorteadas entre 'rotas' pelos pesos.
+    """
+
+    def __init__(self, numero, rotas, contexto, requisicoes, aquecimento, semente):
+        super().__init__(daemon=True)
+        self.numero = numero
+        self.rotas = rotas
+        self.contexto = contexto
+        self.requisicoes = requisicoes
+        self.aquecimento = aquecimento
+        self.semente = semente
+        self.medicoes = []
+        self.excecoes = Counter()
+        self.erro = None
+
+    def _clientes(self):
+        # Cada terminal com um porteiro e um usuário próprios (quando há vários)
+        clientes = {}
+        for staff, ids in ((True, self.contexto.staff_ids), (False, self.contexto.usuario_ids)):
+            cliente = Client(raise_request_exception=False, HTTP_HOST=_host())
+            if ids:
+                cliente.force_login(Usuario.objects.get(pk=ids[self.numero % len(ids)]))
+            clientes[staff] = cliente
+        return clientes
+
+    def _requisitar(self, cliente, rota, sorteio):
+        caminho, dados, cabecalhos = rota.montar(self.contexto, sorteio)
+        resposta = getattr(cliente, rota.metodo)(caminho, dados, **cabecalhos)
+        # Respostas em fluxo (CSV, arquivos): o tempo inclui gerar todo o conteúdo
+        if resposta.streaming:
+            for _ in resposta.streaming_content:
+                pass
+        resposta.close()
+        excecao, _excecoes.ultima = getattr(_excecoes, 'ultima', None), None
+        return resposta.status_code, excecao
+
+    def run(self):
+        sorteio = random.Random(f'{self.semente}:{self.numero}')
+        pesos = list(accumulate(ROTAS[nome].peso for nome in self.rotas))
+        contador = ContadorConsultas()
+        try:
+            clientes = self._clientes()
+            with connection.execute_wrapper(contador):
+                for indice in range(self.aquecimento + self.requisicoes):
+                    nome = sorteio.choices(self.rotas, cum_weights=pesos)[0]
+                    rota = ROTAS[nome]
+                    consultas = contador.total
+                    inicio = time.perf_counter()
+                    status, excecao = self._requisitar(clientes[rota.staff], rota, sorteio)
+                    ms = (time.perf_counter() - inicio) * 1000
+                    if excecao is not None:
+                        # Erro na view (ex.: banco travado): resposta 500, falha da rota
+                        self.excecoes[f'{nome}: {type(excecao).__name__}: {excecao}'] += 1
+                    if indice >= self.aquecimento:
+                        self.medicoes.append(
+                            Medicao(nome, status, status in rota.esperados, inicio, ms, contador.total - consultas)
+                        )
+        except Exception as e:
+            self.erro = e
+        finally:
+            # Cada thread abre a própria conexão: fecha ao terminar
+            connection.close()
+
+
+def executar(rotas, terminais=8, requisicoes=200, aquecimento=20, semente=42, contexto=None):
+    """
+    Roda a carga e retorna (medições, duração em segundos da fase medida,
+    Counter de exceções nas views). Levanta a primeira falha fora das requisições
+    (ex.: login do terminal).
+    """
+    contexto = contexto or preparar_contexto()
+    connection.close()  # As threads abrem as próprias conexões
+    got_request_exception.connect(_guardar_excecao, dispatch_uid='benchmark_carga')
+
+    threads = [Terminal(numero, rotas, contexto, requisicoes, aquecimento, semente) for numero in range(terminais)]
+    for terminal in threads:
+        terminal.start()
+    for terminal in threads:
+        terminal.join()
+    got_request_exception.disconnect(dispatch_uid='benchmark_carga')
+
+    for terminal in threads:
+        if terminal.erro is not None:
+            raise terminal.erro
+
+    medicoes = [medicao for terminal in threads for medicao in terminal.medicoes]
+    excecoes = Counter()
+    for terminal in threads:
+        excecoes.update(terminal.excecoes)
+    if not medicoes:
+        return medicoes, 0.0, excecoes
+    duracao = max(m.inicio + m.ms / 1000 for m in medicoes) - min(m.inicio for m in medicoes)
+    return medicoes, duracao, excecoes
@@ -0,0 +1,286 @@
+# Author: João Victor Marques Favero
+"""
+Gerador de dados do benchmark. A mesma semente (no mesmo dia) produz os
+mesmos usuários, grupos, chaves e histórico. Tudo é gravado em lote
+(bulk_create e INSERT com executemany), sem passar pelo serviço de
+empréstimos; os dados derivados (agregados de uso, sessões e instantâneos)
+são reconstruídos no final pelos próprios serviços.
+
+Proporções inspiradas no uso de uma portaria:
+- 1% dos usuários são staff; cada usuário está em nenhum, um ou dois grupos;
+- 40% das chaves são livres, as demais exigem um ou dois grupos;
+- poucas chaves concentram a maior parte das retiradas (lei de potência);
+- retiradas em dias úteis (fins de semana com 1/5 do movimento), com picos
+  às 7h, 13h e 18h, e empréstimos de 1h30 na mediana;
+- 15% dos empréstimos terminam em transferência e 10% das chaves terminam em uso.
+"""
+
+import math
+import random
+from collections import Counter, namedtuple
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.cache import cache, caches
+from django.db import connections, router, transaction
+from django.utils import timezone
+from principal.models import Chave, HistoricoEmprestimo, Usuario
+from principal.services import agregadosServices, autenticacaoServices, instantaneoServices, sessaoServices, versaoServices
+from principal.services.historicoServices import inicio_do_dia
+
+# Prefixo dos logins e grupos gerados; senha de todos os usuários gerados
+PREFIXO = 'bench'
+SENHA = 'benchmark'
+
+# Registros por bulk_create / executemany
+TAMANHO_LOTE = 5000
+
+# Peso de cada hora do dia nas retiradas
+PESOS_HORAS = {
+    7: 10, 8: 6, 9: 4, 10: 4, 11: 5, 12: 4, 13: 9, 14: 5,
+    15: 4, 16: 4, 17: 5, 18: 9, 19: 6, 20: 4, 21: 3, 22: 1,
+}
+
+PROPORCAO_STAFF = 0.01
+PROPORCAO_TRANSFERENCIA = 0.15
+PROPORCAO_EM_USO = 0.10
+DURACAO_MEDIANA_MINUTOS = 90
+
+# Pesos de nenhum, um e dois grupos
+GRUPOS_POR_USUARIO = (30, 50, 20)
+GRUPOS_POR_CHAVE = (40, 45, 15)
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+         'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Thiago', 'Vitória', 'Yuri']
+SOBRENOMES = ['Almeida', 'Barbosa', 'Costa', 'Dias', 'Ferreira', 'Gomes', 'Lima', 'Martins', 'Oliveira',
+              'Pereira', 'Ribeiro', 'Rocha', 'Santos', 'Silva', 'Souza', 'Teixeira']
+LOCAIS = ['Sala', 'Laboratório', 'Auditório', 'Almoxarifado', 'Sala de Reuniões', 'Depósito', 'Oficina']
+
+ResumoDados = namedtuple('ResumoDados', ['grupos', 'usuarios', 'chaves', 'historico', 'em_uso'])
+
+
+def banco_vazio():
+    """
+    True se não há chaves nem histórico (os dados gerados só são
+    reprodutíveis num banco recém-migrado).
+    """
+    return not (Chave.objects.exists() or HistoricoEmprestimo.objects.exists())
+
+
+def _sortear_grupos(sorteio, grupo_ids, pesos):
+    quantidade = sorteio.choices((0, 1, 2), weights=pesos)[0]
+    return sorteio.sample(grupo_ids, min(quantidade, len(grupo_ids)))
+
+
+def _criar_grupos(quantidade):
+    grupos = Group.objects.bulk_create([Group(name=f'{PREFIXO}-grupo-{n:03d}') for n in range(1, quantidade + 1)])
+    return [grupo.pk for grupo in grupos]
+
+
+def _criar_usuarios(sorteio, quantidade, grupo_ids):
+    """
+    Usuários e vínculos com grupos. Retorna (ids de staff, ids comuns,
+    {grupo_id: [ids dos membros]}).
+    """
+    senha = make_password(SENHA)  # Um hash para todos: o PBKDF2 é caro
+    total_staff = max(1, round(quantidade * PROPORCAO_STAFF))
+    usuarios = []
+    for n in range(1, quantidade + 1):
+        username = f'{PREFIXO}{n:06d}'
+        usuarios.append(Usuario(
+            username=username,
+            cpf=f'{n:011d}',
+            first_name=sorteio.choice(NOMES),
+            last_name=sorteio.choice(SOBRENOMES),
+            email=f'{username}@exemplo.edu.br',
+            contato=f'(34) 9{n % 10000:04d}-{sorteio.randrange(10000):04d}',
+            password=senha,
+            is_staff=n <= total_staff,
+        ))
+    Usuario.objects.bulk_create(usuarios, batch_size=TAMANHO_LOTE)
+
+    membros = {grupo_id: [] for grupo_id in grupo_ids}
+    vinculos = []
+    for usuario in usuarios:
+        for grupo_id in _sortear_grupos(sorteio, grupo_ids, GRUPOS_POR_USUARIO):
+            membros[grupo_id].append(usuario.pk)
+            vinculos.append(Usuario.groups.through(usuario_id=usuario.pk, group_id=grupo_id))
+    Usuario.groups.through.objects.bulk_create(vinculos, batch_size=TAMANHO_LOTE)
+
+    staff = [usuario.pk for usuario in usuarios if usuario.is_staff]
+    comuns = [usuario.pk for usuario in usuarios if not usuario.is_staff]
+    return staff, comuns, membros
+
+
+def _criar_chaves(sorteio, quantidade, grupo_ids):
+    """
+    Chaves e grupos exigidos. Retorna a lista de chaves e {chave_id: [grupo_ids]}.
+    """
+    chaves = [
+        Chave(nome=f'{sorteio.choice(LOCAIS)} {n:04d}', descricao=f'Bloco {sorteio.choice("ABCDEF")}, {n % 4}º andar')
+        for n in range(1, quantidade + 1)
+    ]
+    Chave.objects.bulk_create(chaves, batch_size=TAMANHO_LOTE)
+
+    grupos_da_chave, vinculos = {}, []
+    for chave in chaves:
+        grupos_da_chave[chave.pk] = _sortear_grupos(sorteio, grupo_ids, GRUPOS_POR_CHAVE)
+        vinculos.extend(
+            Chave.grupos_permissao.through(chave_id=chave.pk, group_id=grupo_id)
+            for grupo_id in grupos_da_chave[chave.pk]
+        )
+    Chave.grupos_permissao.through.objects.bulk_create(vinculos, batch_size=TAMANHO_LOTE)
+    return chaves, grupos_da_chave
+
+
+class _Simulacao:
+    """
+    Empréstimos de cada chave, em ordem, dentro da janela de 'dias' dias que
+    termina na meia-noite de hoje.
+    """
+
+    def __init__(self, sorteio, dias, usuario_ids, membros):
+        self.sorteio = sorteio
+        self.usuario_ids = usuario_ids
+        self.membros = membros
+        self.fim = inicio_do_dia(timezone.localdate())
+        self.primeiro_dia = timezone.localdate() - timedelta(days=dias)
+        self.dias = dias
+        self.horas = list(PESOS_HORAS)
+        self.pesos_horas = list(accumulate(PESOS_HORAS.values()))
+        self.eventos = []  # (data_hora, sequência, chave_id, usuario_id, acao)
+
+    def _horario(self):
+        while True:
+            dia = self.primeiro_dia + timedelta(days=self.sorteio.randrange(self.dias))
+            if dia.weekday() < 5 or self.sorteio.random() < 0.2:
+                break
+        hora = self.sorteio.choices(self.horas, cum_weights=self.pesos_horas)[0]
+        return inicio_do_dia(dia) + timedelta(
+            hours=hora, minutes=self.sorteio.randrange(60), seconds=self.sorteio.randrange(60)
+        )
+
+    def _duracao(self):
+        minutos = self.sorteio.lognormvariate(math.log(DURACAO_MEDIANA_MINUTOS), 0.8)
+        return timedelta(minutes=minutos)
+
+    def _portador(self, grupos_chave, diferente_de=None):
+        # Quase sempre alguém de um grupo com permissão (quando a chave exige grupo)
+        for _ in range(5):
+            candidatos = self.usuario_ids
+            if grupos_chave and self.sorteio.random() < 0.9:
+                candidatos = self.membros[self.sorteio.choice(grupos_chave)] or self.usuario_ids
+            usuario_id = self.sorteio.choice(candidatos)
+            if usuario_id != diferente_de:
+                return usuario_id
+        return None
+
+    def _evento(self, data_hora, chave_id, usuario_id, acao):
+        self.eventos.append((data_hora, len(self.eventos), chave_id, usuario_id, acao))
+
+    def emprestar(self, chave_id, grupos_chave, retiradas):
+        """
+        Gera os eventos de 'retiradas' empréstimos da chave. Retorna o
+        portador no fim da janela (None se a chave terminou disponível).
+        """
+        inicios = sorted(self._horario() for _ in range(retiradas))
+        usuario_id = self._portador(grupos_chave)
+        for posicao, inicio in enumerate(inicios):
+            self._evento(inicio, chave_id, usuario_id, 'adquirida')
+            fim = inicio + self._duracao()
+
+            if posicao == len(inicios) - 1:
+                if self.sorteio.random() < PROPORCAO_EM_USO:
+                    return usuario_id
+                self._evento(min(fim, self.fim - timedelta(seconds=1)), chave_id, usuario_id, 'devolucao')
+                return None
+
+            proximo = inicios[posicao + 1]
+            seguinte = None
+            if self.sorteio.random() < PROPORCAO_TRANSFERENCIA:
+                seguinte = self._portador(grupos_chave, diferente_de=usuario_id)
+            if seguinte is not None:
+                # Transferência: sai em nome do portador atual no instante da nova retirada
+                self._evento(proximo, chave_id, usuario_id, 'transferida')
+                usuario_id = seguinte
+            else:
+                self._evento(min(fim, inicio + (proximo - inicio) / 2), chave_id, usuario_id, 'devolucao')
+                usuario_id = self._portador(grupos_chave)
+        return None
+
+
+def _inserir_historico(eventos, progresso=None):
+    """
+    INSERT em lote direto na tabela: data_hora é auto_now_add e o
+    bulk_create gravaria a data atual em todos os registros.
+    """
+    conexao = connections[router.db_for_write(HistoricoEmprestimo)]
+    campos = [HistoricoEmprestimo._meta.get_field(nome) for nome in ('chave', 'usuario', 'data_hora', 'acao')]
+    data_hora = campos[2]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        conexao.ops.quote_name(HistoricoEmprestimo._meta.db_table),
+        ', '.join(conexao.ops.quote_name(campo.column) for campo in campos),
+        ', '.join(['%s'] * len(campos)),
+    )
+    with conexao.cursor() as cursor:
+        for inicio in range(0, len(eventos), TAMANHO_LOTE):
+            cursor.executemany(sql, [
+                (chave_id, usuario_id, data_hora.get_db_prep_value(momento, conexao), acao)
+                for momento, _, chave_id, usuario_id, acao in eventos[inicio:inicio + TAMANHO_LOTE]
+            ])
+            if progresso:
+                progresso(f'{min(inicio + TAMANHO_LOTE, len(eventos))} registros de histórico...')
+
+
+def gerar(usuarios=2000, chaves=500, historico=200_000, grupos=20, dias=180, semente=42, progresso=None):
+    """
+    Gera os dados do benchmark no banco configurado (que deve estar vazio,
+    ver banco_vazio). 'historico' é aproximado: cada empréstimo grava dois
+    registros. 'progresso(mensagem)' informa cada etapa. Retorna ResumoDados.
+    """
+    sorteio = random.Random(semente)
+
+    with transaction.atomic(using=router.db_for_write(HistoricoEmprestimo)):
+        grupo_ids = _criar_grupos(grupos)
+        staff, comuns, membros = _criar_usuarios(sorteio, usuarios, grupo_ids)
+        lista_chaves, grupos_da_chave = _criar_chaves(sorteio, chaves, grupo_ids)
+        if progresso:
+            progresso(f'{len(grupo_ids)} grupos, {usuarios} usuários e {chaves} chaves criados.')
+
+        # Popularidade: a i-ésima chave mais usada tem peso 1 / i^0,8 (ordem sorteada)
+        populares = sorteio.sample(lista_chaves, len(lista_chaves))
+        pesos = list(accumulate(1 / (posicao + 1) ** 0.8 for posicao in range(len(populares))))
+        retiradas = Counter(sorteio.choices(range(len(populares)), cum_weights=pesos, k=historico // 2))
+
+        simulacao = _Simulacao(sorteio, dias, comuns or staff, membros)
+        em_uso = []
+        for posicao, chave in enumerate(populares):
+            if retiradas[posicao]:
+                portador_id = simulacao.emprestar(chave.pk, grupos_da_chave[chave.pk], retiradas[posicao])
+                if portador_id is not None:
+                    chave.status, chave.portador_atual_id = 'em_uso', portador_id
+                    em_uso.append(chave)
+        Chave.objects.bulk_update(em_uso, ['status', 'portador_atual'], batch_size=TAMANHO_LOTE)
+
+        # Ordem cronológica: os ids seguem data_hora, como no uso real
+        simulacao.eventos.sort()
+        _inserir_historico(simulacao.eventos, progresso)
+
+    if progresso:
+        progresso('Reconstruindo agregados de uso, sessões e instantâneos...')
+    agregadosServices.reconstruir()
+    sessaoServices.reconstruir()
+    instantaneoServices.gerar_retroativos()
+    instantaneoServices.capturar()
+
+    # Marcadores de versão (ETag) de antes da carga não valem mais
+    cache.delete(versaoServices.CHAVE_VERSAO_HISTORICO)
+    versaoServices.registrar_alteracao_chaves()
+    # Nem o que está em cache por id (fragmentos das linhas, usuários autenticados):
+    # as chaves e os usuários novos repetem ids (e versões) do banco anterior
+    caches['fragmentos'].clear()
+    autenticacaoServices.invalidar_todos()
+
+    return ResumoDados(len(grupo_ids), usuarios, chaves, len(simulacao.eventos), len(em_uso))
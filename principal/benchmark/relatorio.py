@@ -0,0 +1,90 @@
+# Author: João Victor Marques Favero
+"""
+Resumo das medições do benchmark (por rota e no total), gravação em JSON e
+comparação com um resultado anterior (linha de base).
+"""
+
+import json
+
+from principal.management.commands.benchmark_qrcode import percentil
+
+# Versão do formato do arquivo de resultado
+VERSAO_FORMATO = 1
+
+# Métricas comparadas com a linha de base: nome -> True se maior é melhor
+METRICAS_COMPARADAS = {
+    'req_s': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'consultas_media': False,
+}
+
+
+def resumir(medicoes, duracao):
+    """
+    {rota: métricas} das medições, com a linha 'total' no final. req_s
+    usa a duração da fase medida (todas as threads juntas).
+    """
+    rotas = sorted({medicao.rota for medicao in medicoes}) + ['total']
+    resumo = {}
+    for nome in rotas:
+        linhas = [m for m in medicoes if nome == 'total' or m.rota == nome]
+        latencias = sorted(m.ms for m in linhas)
+        consultas = [m.consultas for m in linhas]
+        resumo[nome] = {
+            'requisicoes': len(linhas),
+            'erros': sum(1 for m in linhas if not m.sucesso),
+            'req_s': round(len(linhas) / duracao, 2) if duracao else 0.0,
+            'p50_ms': round(percentil(latencias, 50), 2),
+            'p95_ms': round(percentil(latencias, 95), 2),
+            'p99_ms': round(percentil(latencias, 99), 2),
+            'max_ms': round(latencias[-1], 2),
+            'consultas_media': round(sum(consultas) / len(consultas), 2),
+            'consultas_max': max(consultas),
+        }
+    return resumo
+
+
+def salvar(caminho, resultado):
+    resultado = dict(resultado, versao_formato=VERSAO_FORMATO)
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2, default=str)
+
+
+def carregar(caminho):
+    """
+    Resultado salvo por 'salvar'. Levanta ValueError se o arquivo não é um
+    resultado do benchmark.
+    """
+    with open(caminho, encoding='utf-8') as arquivo:
+        resultado = json.load(arquivo)
+    if not isinstance(resultado, dict) or resultado.get('versao_formato') != VERSAO_FORMATO:
+        raise ValueError(f'{caminho} não é um resultado do benchmark_rotas (formato {VERSAO_FORMATO}).')
+    return resultado
+
+
+def comparar(atual, base, tolerancia=10.0):
+    """
+    Diferenças entre dois resumos, só nas rotas presentes nos dois:
+    (rota, métrica, valor base, valor atual, variação %, situação), com
+    situação 'pior' ou 'melhor' quando a variação passa de 'tolerancia'
+    por cento e '' caso contrário.
+    """
+    diferencas = []
+    for nome, metricas in atual.items():
+        if nome not in base:
+            continue
+        for metrica, maior_melhor in METRICAS_COMPARADAS.items():
+            anterior, valor = base[nome].get(metrica), metricas[metrica]
+            if anterior is None:
+                continue
+            if anterior:
+                variacao = (valor - anterior) / anterior * 100
+            else:
+                variacao = 0.0 if not valor else float('inf')
+            situacao = ''
+            if abs(variacao) > tolerancia:
+                situacao = 'melhor' if (variacao > 0) == maior_melhor else 'pior'
+            diferencas.append((nome, metrica, anterior, valor, variacao, situacao))
+    return diferencas
@@ -0,0 +1,44 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py arquivar_historico [--dias N] [--simular]
+
+Move para o arquivo (HistoricoEmprestimoArquivo) os meses inteiros do
+histórico anteriores aos últimos N dias (padrão: HISTORICO_DIAS_QUENTES),
+um mês por transação, e grava o resumo de cada mês. Pode rodar a qualquer
+momento (ex.: cron mensal); meses já arquivados não voltam a aparecer.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from principal.services.arquivoServices import arquivar_mes, corte, meses_para_arquivar
+
+
+class Command(BaseCommand):
+    help = 'Arquiva os meses antigos do histórico de empréstimos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int,
+                            help='Dias mantidos na tabela principal (padrão: HISTORICO_DIAS_QUENTES).')
+        parser.add_argument('--simular', action='store_true',
+                            help='Só lista os meses que seriam arquivados.')
+
+    def handle(self, *args, **options):
+        dias = options['dias']
+        if dias is not None and dias < 0:
+            raise CommandError('--dias não pode ser negativo.')
+
+        meses = meses_para_arquivar(dias)
+        if not meses:
+            self.stdout.write(f'Nada a arquivar antes de {corte(dias):%m/%Y}.')
+            return
+
+        total = 0
+        for mes, registros in meses:
+            if options['simular']:
+                self.stdout.write(f'{mes:%m/%Y}: {registros} registro(s) seriam arquivados.')
+                continue
+            movidos = arquivar_mes(mes)
+            total += movidos
+            self.stdout.write(f'{mes:%m/%Y}: {movidos} registro(s) arquivados.')
+
+        if not options['simular']:
+            self.stdout.write(self.style.SUCCESS(f'{total} registro(s) arquivados em {len(meses)} mês(es).'))
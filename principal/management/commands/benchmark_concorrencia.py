@@ -0,0 +1,160 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py benchmark_concorrencia URL --usuario LOGIN [--terminais 200]
+
+Carga de leitura contra um servidor já em execução, simulando terminais da
+portaria: cada terminal é uma thread com conexão HTTP própria (keep-alive),
+logada com uma sessão criada no banco, que repete as rotas escolhidas em
+sequência. Serve para comparar o mesmo banco servido por WSGI (views
+síncronas) e por ASGI com VIEWS_ASYNC=1, por exemplo:
+
+    gunicorn gerenciamento_chaves.wsgi:application --workers 4 --threads 8
+    VIEWS_ASYNC=1 uvicorn gerenciamento_chaves.asgi:application --workers 1
+
+O cliente também roda em Python: para números confiáveis, execute-o em outra
+máquina (ou outros núcleos) que não a do servidor.
+"""
+
+import http.client
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from principal.management.commands.benchmark_qrcode import percentil
+from principal.models import Chave, Usuario
+
+# Rotas disponíveis: nome -> caminho ('{pk}' é sorteado entre as chaves ativas)
+ROTAS = {
+    'index': '/',
+    'api': '/api/ultimos-emprestimos/',
+    'historico': '/historico/',
+    'chave': '/chave/{pk}/',
+}
+
+
+def criar_sessao(usuario):
+    """
+    Sessão autenticada de 'usuario' (equivale a um login), gravada no banco.
+    """
+    sessao = SessionStore()
+    sessao[SESSION_KEY] = str(usuario.pk)
+    sessao[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+    sessao.create()
+    return sessao.session_key
+
+
+class Terminal(threading.Thread):
+    """
+    Um terminal: repete as rotas até 'fim' e guarda (rota, status, ms) das
+    respostas recebidas depois de 'inicio_medicao'.
+    """
+
+    def __init__(self, endereco, cookie, rotas, chave_ids, inicio_medicao, fim):
+        super().__init__(daemon=True)
+        self.endereco = endereco
+        self.cabecalhos = {'Cookie': cookie}
+        self.rotas = rotas
+        self.chave_ids = chave_ids
+        self.inicio_medicao = inicio_medicao
+        self.fim = fim
+        self.medicoes = []
+        self.falhas = 0
+
+    def _conectar(self):
+        classe = http.client.HTTPSConnection if self.endereco.scheme == 'https' else http.client.HTTPConnection
+        return classe(self.endereco.hostname, self.endereco.port, timeout=30)
+
+    def run(self):
+        sorteio = random.Random(id(self))
+        conexao = self._conectar()
+        posicao = sorteio.randrange(len(self.rotas))  # Terminais começam em rotas diferentes
+        while time.perf_counter() < self.fim:
+            nome = self.rotas[posicao % len(self.rotas)]
+            posicao += 1
+            caminho = ROTAS[nome].format(pk=sorteio.choice(self.chave_ids))
+            inicio = time.perf_counter()
+            try:
+                conexao.request('GET', self.endereco.path.rstrip('/') + caminho, headers=self.cabecalhos)
+                resposta = conexao.getresponse()
+                resposta.read()
+                status = resposta.status
+            except (OSError, http.client.HTTPException):
+                # Conexão recusada, fechada ou expirada: conta como erro e reconecta
+                conexao.close()
+                conexao = self._conectar()
+                status = None
+            termino = time.perf_counter()
+            if inicio >= self.inicio_medicao and termino <= self.fim:
+                self.medicoes.append((nome, status, (termino - inicio) * 1000))
+        conexao.close()
+
+
+class Command(BaseCommand):
+    help = 'Mede requisições/s e latência (p50/p95/p99) com muitos terminais simultâneos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Endereço do servidor em execução (ex.: http://127.0.0.1:8000).')
+        parser.add_argument('--usuario', required=True, help='Login usado pelos terminais (staff para a rota historico).')
+        parser.add_argument('--terminais', type=int, default=200, help='Conexões simultâneas.')
+        parser.add_argument('--duracao', type=float, default=30, help='Segundos de medição.')
+        parser.add_argument('--aquecimento', type=float, default=5, help='Segundos iniciais descartados.')
+        parser.add_argument('--rotas', nargs='+', choices=list(ROTAS), default=list(ROTAS))
+
+    def handle(self, *args, **options):
+        endereco = urlsplit(options['url'])
+        if endereco.scheme not in ('http', 'https') or not endereco.hostname:
+            raise CommandError('Informe a URL completa do servidor, ex.: http://127.0.0.1:8000')
+        try:
+            usuario = Usuario.objects.get(username=options['usuario'])
+        except Usuario.DoesNotExist:
+            raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+        if 'historico' in options['rotas'] and not usuario.is_staff:
+            raise CommandError('A rota historico exige um usuário staff.')
+
+        chave_ids = list(Chave.objects.filter(excluido=False).values_list('pk', flat=True)[:1000])
+        if not chave_ids:
+            raise CommandError('Nenhuma chave cadastrada.')
+
+        cookie = f'{settings.SESSION_COOKIE_NAME}={criar_sessao(usuario)}'
+        inicio_medicao = time.perf_counter() + options['aquecimento']
+        fim = inicio_medicao + options['duracao']
+        terminais = [
+            Terminal(endereco, cookie, options['rotas'], chave_ids, inicio_medicao, fim)
+            for _ in range(options['terminais'])
+        ]
+
+        self.stdout.write(
+            f"{options['terminais']} terminal(is), {options['aquecimento']:.0f}s de aquecimento e "
+            f"{options['duracao']:.0f}s de medição em {options['url']}..."
+        )
+        for terminal in terminais:
+            terminal.start()
+        for terminal in terminais:
+            terminal.join()
+
+        medicoes = [medicao for terminal in terminais for medicao in terminal.medicoes]
+        if not medicoes:
+            raise CommandError('Nenhuma resposta recebida no período de medição.')
+
+        self.stdout.write(
+            f'\n{"rota":<10} {"respostas":>10} {"erros":>7} {"req/s":>8} '
+            f'{"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"máx ms":>9}'
+        )
+        for nome in options['rotas'] + ['total']:
+            linhas = [m for m in medicoes if nome == 'total' or m[0] == nome]
+            if not linhas:
+                continue
+            # Só 200 conta como sucesso (redirecionamento para o login indica sessão inválida)
+            erros = sum(1 for _, status, _ in linhas if status != 200)
+            latencias = sorted(ms for _, _, ms in linhas)
+            self.stdout.write(
+                f'{nome:<10} {len(linhas):>10} {erros:>7} {len(linhas) / options["duracao"]:>8.1f} '
+                f'{percentil(latencias, 50):>9.1f} {percentil(latencias, 95):>9.1f} '
+                f'{percentil(latencias, 99):>9.1f} {latencias[-1]:>9.1f}'
+            )
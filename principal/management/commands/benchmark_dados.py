@@ -0,0 +1,56 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py benchmark_dados [--usuarios 2000] [--chaves 500] [--historico 200000] [--semente 42]
+
+Gera, num banco vazio, os dados usados pelo benchmark_rotas: usuários com
+grupos, chaves com grupos exigidos e histórico em proporções realistas
+(ver principal/benchmark/dados.py). A mesma semente gera os mesmos dados.
+Use um arquivo SQLite só para isso, por exemplo:
+
+    DB_NOME=bench.sqlite3 python manage.py migrate
+    DB_NOME=bench.sqlite3 python manage.py benchmark_dados
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from principal.benchmark import dados
+
+
+class Command(BaseCommand):
+    help = 'Gera dados reprodutíveis (usuários, grupos, chaves e histórico) para o benchmark.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=2000, help='Usuários (1%% deles staff).')
+        parser.add_argument('--chaves', type=int, default=500, help='Chaves.')
+        parser.add_argument('--historico', type=int, default=200_000, help='Registros de histórico (aproximado).')
+        parser.add_argument('--grupos', type=int, default=20, help='Grupos de permissão.')
+        parser.add_argument('--dias', type=int, default=180, help='Dias de histórico, até ontem.')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador.')
+
+    def handle(self, *args, **options):
+        if options['usuarios'] < 2 or options['chaves'] < 1 or options['grupos'] < 1 or options['dias'] < 1:
+            raise CommandError('Informe ao menos 2 usuários, 1 chave, 1 grupo e 1 dia.')
+        if not dados.banco_vazio():
+            raise CommandError(
+                'O banco já tem chaves ou histórico. Gere os dados num banco recém-migrado '
+                '(ex.: DB_NOME=bench.sqlite3 python manage.py migrate).'
+            )
+
+        self.stdout.write(f"Banco: {connection.vendor} ({connection.settings_dict['NAME']}), semente {options['semente']}.")
+        inicio = time.perf_counter()
+        resumo = dados.gerar(
+            usuarios=options['usuarios'],
+            chaves=options['chaves'],
+            historico=options['historico'],
+            grupos=options['grupos'],
+            dias=options['dias'],
+            semente=options['semente'],
+            progresso=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumo.grupos} grupos, {resumo.usuarios} usuários, {resumo.chaves} chaves '
+            f'({resumo.em_uso} em uso) e {resumo.historico} registros de histórico '
+            f'em {time.perf_counter() - inicio:.1f}s. Senha dos usuários gerados: {dados.SENHA}'
+        ))
@@ -0,0 +1,128 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py benchmark_escritas --confirmar [--threads 8] [--duracao 20]
+
+Teste de carga de escritas simultâneas no banco configurado (perfil de
+DB_PERFIL): cada thread, com sua própria conexão, alterna retiradas e
+devoluções de chaves pelo emprestimoServices, como vários terminais da
+portaria registrando movimentações ao mesmo tempo. Mostra movimentações/s,
+latência e quantas falharam por banco travado ("database is locked").
+
+Para comparar os perfis, rode o mesmo comando com cada configuração, ex.:
+    python manage.py benchmark_escritas --confirmar
+    DB_PERFIL=postgresql DB_POOL=1 python manage.py benchmark_escritas --confirmar
+
+ATENÇÃO: grava registros reais no histórico. Use um banco de testes.
+"""
+
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from principal.management.commands.benchmark_qrcode import percentil
+from principal.models import Chave, Usuario
+from principal.services.emprestimoServices import ConflitoEmprestimo, registrar_aquisicao, registrar_devolucao
+
+
+class Escritor(threading.Thread):
+    """
+    Uma thread de escrita: lê uma chave sorteada e a retira (se disponível)
+    ou devolve (se em uso), até 'fim'.
+    """
+
+    def __init__(self, chave_ids, usuarios, fim):
+        super().__init__(daemon=True)
+        self.chave_ids = chave_ids
+        self.usuarios = usuarios
+        self.fim = fim
+        self.latencias = []
+        self.conflitos = 0
+        self.travados = 0
+        self.erro = None
+
+    def _movimentar(self, sorteio):
+        chave = Chave.objects.get(pk=sorteio.choice(self.chave_ids))
+        if chave.status == 'em_uso':
+            registrar_devolucao(chave)
+        else:
+            registrar_aquisicao(chave, sorteio.choice(self.usuarios))
+
+    def run(self):
+        sorteio = random.Random(id(self))
+        try:
+            while time.perf_counter() < self.fim:
+                inicio = time.perf_counter()
+                try:
+                    self._movimentar(sorteio)
+                except ConflitoEmprestimo:
+                    # Outra thread movimentou a mesma chave: comportamento esperado
+                    self.conflitos += 1
+                    continue
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    self.travados += 1
+                    continue
+                self.latencias.append((time.perf_counter() - inicio) * 1000)
+        except Exception as e:
+            self.erro = e
+        finally:
+            # Cada thread abre a própria conexão: fecha ao terminar
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Mede a vazão de retiradas/devoluções simultâneas no banco configurado (grava no histórico).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--confirmar', action='store_true',
+                            help='Obrigatório: confirma que o banco é de testes (grava no histórico).')
+        parser.add_argument('--threads', type=int, default=8, help='Escritores simultâneos.')
+        parser.add_argument('--duracao', type=float, default=20, help='Segundos de medição.')
+        parser.add_argument('--chaves', type=int, default=200,
+                            help='Quantidade de chaves sorteadas (menos chaves = mais conflitos).')
+
+    def handle(self, *args, **options):
+        if not options['confirmar']:
+            raise CommandError('Este comando grava no histórico. Use um banco de testes e informe --confirmar.')
+
+        chave_ids = list(Chave.objects.filter(excluido=False).order_by('pk').values_list('pk', flat=True)[:options['chaves']])
+        usuarios = list(Usuario.objects.filter(is_active=True).order_by('pk')[:50])
+        if not chave_ids or not usuarios:
+            raise CommandError('São necessárias chaves e usuários cadastrados.')
+        connection.close()  # As threads abrem as próprias conexões
+
+        banco = connection.settings_dict
+        self.stdout.write(
+            f"Banco: {connection.vendor} ({banco['NAME']}), {options['threads']} thread(s), "
+            f"{len(chave_ids)} chave(s), {options['duracao']:.0f}s..."
+        )
+
+        fim = time.perf_counter() + options['duracao']
+        escritores = [Escritor(chave_ids, usuarios, fim) for _ in range(options['threads'])]
+        for escritor in escritores:
+            escritor.start()
+        for escritor in escritores:
+            escritor.join()
+
+        for escritor in escritores:
+            if escritor.erro is not None:
+                raise CommandError(f'Falha numa thread de escrita: {escritor.erro}')
+
+        latencias = sorted(ms for escritor in escritores for ms in escritor.latencias)
+        conflitos = sum(escritor.conflitos for escritor in escritores)
+        travados = sum(escritor.travados for escritor in escritores)
+        if not latencias:
+            raise CommandError(f'Nenhuma movimentação concluída ({travados} com banco travado).')
+
+        self.stdout.write(
+            f'\n{"movimentações":>14} {"por s":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} '
+            f'{"máx ms":>9} {"conflitos":>10} {"travados":>9}'
+        )
+        self.stdout.write(
+            f'{len(latencias):>14} {len(latencias) / options["duracao"]:>8.1f} '
+            f'{percentil(latencias, 50):>9.1f} {percentil(latencias, 95):>9.1f} '
+            f'{percentil(latencias, 99):>9.1f} {latencias[-1]:>9.1f} {conflitos:>10} {travados:>9}'
+        )
@@ -0,0 +1,88 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py benchmark_qrcode DIRETORIO [--lados 640 1024 1600]
+
+Mede a leitura de QR Code sobre um conjunto de fotos de exemplo (jpg/png/webp
+em DIRETORIO). Para cada configuração compara a taxa de acerto com a latência:
+
+- completa: só a imagem em resolução total (comportamento antigo do scan_page);
+- reduzida-N: só a cópia em tons de cinza com lado maior N;
+- pipeline-N: reduzida-N e, se falhar, a completa (o que o scan_page usa).
+
+As leituras rodam no próprio processo (sem pool), para medir só a decodificação.
+Fotos recusadas (resolução acima de QRCODE_MAX_PIXELS, arquivo inválido) são
+contadas à parte e ficam fora das latências.
+"""
+
+import math
+import statistics
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from principal.services.qrcodeServices import ImagemRecusada, configuracao, ler_qrcode
+
+EXTENSOES = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+
+def percentil(valores, p):
+    """
+    Percentil pelo método do posto mais próximo (valores já ordenados).
+    """
+    if not valores:
+        return 0.0
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Compara taxa de acerto e latência da leitura de QR Code num conjunto de fotos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('diretorio', help='Pasta com as fotos de exemplo.')
+        parser.add_argument('--lados', type=int, nargs='+', default=[640, 1024, 1600],
+                            help='Lados maiores testados para a cópia reduzida.')
+        parser.add_argument('--repeticoes', type=int, default=3, help='Leituras por foto e configuração.')
+
+    def handle(self, *args, **options):
+        fotos = sorted(
+            caminho for caminho in Path(options['diretorio']).iterdir()
+            if caminho.suffix.lower() in EXTENSOES
+        ) if Path(options['diretorio']).is_dir() else []
+        if not fotos:
+            raise CommandError('Nenhuma foto encontrada no diretório informado.')
+
+        conteudos = [caminho.read_bytes() for caminho in fotos]
+        max_pixels = configuracao('QRCODE_MAX_PIXELS')
+
+        # nome -> (lado da reduzida, tenta a completa na falha)
+        configuracoes = {'completa': (None, False)}
+        for lado in options['lados']:
+            configuracoes[f'reduzida-{lado}'] = (lado, False)
+            configuracoes[f'pipeline-{lado}'] = (lado, True)
+
+        self.stdout.write(f'{len(fotos)} foto(s), {options["repeticoes"]} repetição(ões) por configuração.\n')
+        self.stdout.write(
+            f'{"configuração":<16} {"acertos":>9} {"recusadas":>9} {"p50 ms":>9} {"p95 ms":>9} {"máx ms":>9}  etapas (média ms)'
+        )
+
+        for nome, (lado, tentar_completa) in configuracoes.items():
+            acertos, recusadas, latencias, tempos_etapas = 0, 0, [], {}
+            for conteudo in conteudos:
+                for repeticao in range(options['repeticoes']):
+                    # Sem redução: lado "infinito" faz a primeira tentativa já ser a completa
+                    try:
+                        resultado = ler_qrcode(conteudo, max_pixels, lado or 10 ** 6, tentar_completa)
+                    except ImagemRecusada:
+                        recusadas += 1
+                        break  # As repetições seriam recusadas do mesmo jeito
+                    latencias.append(sum(resultado.tempos.values()))
+                    for etapa, ms in resultado.tempos.items():
+                        tempos_etapas.setdefault(etapa, []).append(ms)
+                    if repeticao == 0 and resultado.dados is not None:
+                        acertos += 1
+
+            latencias.sort()
+            etapas = ', '.join(f'{etapa}={statistics.mean(ms):.1f}' for etapa, ms in tempos_etapas.items())
+            self.stdout.write(
+                f'{nome:<16} {acertos:>4}/{len(fotos):<4} {recusadas:>9} {percentil(latencias, 50):>9.1f} '
+                f'{percentil(latencias, 95):>9.1f} {max(latencias, default=0.0):>9.1f}  {etapas}'
+            )
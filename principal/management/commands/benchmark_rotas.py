@@ -0,0 +1,127 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py benchmark_rotas --confirmar [--terminais 8] [--requisicoes 200]
+         [--salvar resultado.json] [--comparar base.json]
+
+Carga nas rotas de principal/urls.py dentro do próprio processo (Client do
+Django, sem servidor nem rede), com terminais simultâneos: vazão, latências
+p50/p95/p99 e consultas por requisição de cada rota (ver
+principal/benchmark/carga.py). Roda inteiro offline contra o SQLite gerado
+pelo benchmark_dados.
+
+Para medir o efeito de uma alteração, salve uma linha de base antes e
+compare depois, com os mesmos dados, semente e parâmetros:
+
+    python manage.py benchmark_rotas --confirmar --salvar base.json
+    python manage.py benchmark_rotas --confirmar --comparar base.json
+
+ATENÇÃO: as rotas POST gravam retiradas e devoluções. Use um banco de testes.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from principal.benchmark import carga, relatorio
+
+
+class Command(BaseCommand):
+    help = 'Mede vazão, latência (p50/p95/p99) e consultas por requisição de cada rota, no próprio processo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--confirmar', action='store_true',
+                            help='Obrigatório: confirma que o banco é de testes (as rotas POST gravam no histórico).')
+        parser.add_argument('--terminais', type=int, default=8, help='Threads simultâneas.')
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições medidas por terminal.')
+        parser.add_argument('--aquecimento', type=int, default=20, help='Requisições iniciais descartadas por terminal.')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do sorteio de rotas e chaves.')
+        parser.add_argument('--rotas', nargs='+', choices=list(carga.ROTAS), default=list(carga.ROTAS))
+        parser.add_argument('--salvar', metavar='ARQUIVO', help='Grava o resultado em JSON (linha de base).')
+        parser.add_argument('--comparar', metavar='ARQUIVO', help='Compara com um resultado salvo.')
+        parser.add_argument('--tolerancia', type=float, default=10.0,
+                            help='Variação (%%) a partir da qual uma métrica é marcada como pior/melhor.')
+        parser.add_argument('--falhar-se-pior', action='store_true',
+                            help='Sai com erro se alguma métrica piorar além da tolerância.')
+
+    def handle(self, *args, **options):
+        if not options['confirmar']:
+            raise CommandError('As rotas POST gravam no histórico. Use um banco de testes e informe --confirmar.')
+
+        base = None
+        if options['comparar']:
+            try:
+                base = relatorio.carregar(options['comparar'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Não foi possível ler a linha de base: {e}')
+
+        contexto = carga.preparar_contexto()
+        if not contexto.chaves or not contexto.staff_ids or not contexto.usuario_ids:
+            raise CommandError('São necessárias chaves, um usuário staff e um usuário comum (ver benchmark_dados).')
+
+        parametros = {
+            'terminais': options['terminais'],
+            'requisicoes': options['requisicoes'],
+            'aquecimento': options['aquecimento'],
+            'semente': options['semente'],
+            'rotas': options['rotas'],
+        }
+        self.stdout.write(
+            f"Banco: {connection.vendor} ({connection.settings_dict['NAME']}), {len(contexto.chaves)} chave(s), "
+            f"{options['terminais']} terminal(is) x {options['requisicoes']} requisições..."
+        )
+        medicoes, duracao, excecoes = carga.executar(
+            options['rotas'], options['terminais'], options['requisicoes'], options['aquecimento'],
+            options['semente'], contexto,
+        )
+        if not medicoes:
+            raise CommandError('Nenhuma requisição medida.')
+
+        resumo = relatorio.resumir(medicoes, duracao)
+        self._mostrar(resumo, duracao)
+        for mensagem, ocorrencias in excecoes.most_common(5):
+            self.stdout.write(self.style.WARNING(f'{ocorrencias}x {mensagem}'))
+
+        if options['salvar']:
+            relatorio.salvar(options['salvar'], {
+                'data': timezone.now().isoformat(),
+                'banco': connection.vendor,
+                'parametros': parametros,
+                'duracao_s': round(duracao, 3),
+                'rotas': resumo,
+            })
+            self.stdout.write(f"Resultado salvo em {options['salvar']}.")
+
+        if base is not None:
+            if base.get('parametros') != parametros:
+                self.stdout.write(self.style.WARNING('A linha de base foi medida com outros parâmetros.'))
+            pioras = self._comparar(resumo, base['rotas'], options['tolerancia'])
+            if pioras and options['falhar_se_pior']:
+                raise CommandError(f'{pioras} métrica(s) piores que a linha de base.')
+
+    def _mostrar(self, resumo, duracao):
+        self.stdout.write(
+            f'\n{"rota":<26} {"respostas":>9} {"erros":>6} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"p99 ms":>8} {"máx ms":>8} {"consultas":>9}'
+        )
+        for nome, m in resumo.items():
+            self.stdout.write(
+                f'{nome:<26} {m["requisicoes"]:>9} {m["erros"]:>6} {m["req_s"]:>8.1f} {m["p50_ms"]:>8.1f} '
+                f'{m["p95_ms"]:>8.1f} {m["p99_ms"]:>8.1f} {m["max_ms"]:>8.1f} {m["consultas_media"]:>9.1f}'
+            )
+        self.stdout.write(f'\nFase medida: {duracao:.1f}s.')
+
+    def _comparar(self, resumo, base, tolerancia):
+        """
+        Mostra as métricas que variaram além da tolerância. Retorna quantas pioraram.
+        """
+        diferencas = [d for d in relatorio.comparar(resumo, base, tolerancia) if d[5]]
+        if not diferencas:
+            self.stdout.write(self.style.SUCCESS(f'\nSem variações acima de {tolerancia:.0f}% em relação à linha de base.'))
+            return 0
+
+        self.stdout.write(f'\n{"rota":<26} {"métrica":<16} {"base":>10} {"atual":>10} {"variação":>9}')
+        for nome, metrica, anterior, valor, variacao, situacao in diferencas:
+            estilo = self.style.ERROR if situacao == 'pior' else self.style.SUCCESS
+            self.stdout.write(estilo(
+                f'{nome:<26} {metrica:<16} {anterior:>10.1f} {valor:>10.1f} {variacao:>+8.0f}%  {situacao}'
+            ))
+        return sum(1 for d in diferencas if d[5] == 'pior')
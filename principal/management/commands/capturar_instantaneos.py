@@ -0,0 +1,48 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py capturar_instantaneos [--loop SEGUNDOS] [--retroativo]
+
+Grava um instantâneo do estado das chaves se o último tiver mais de
+INSTANTANEO_INTERVALO_MINUTOS e aplica a retenção (INSTANTANEO_RETENCAO_DIAS).
+Com --loop, repete a verificação a cada SEGUNDOS (agendador); também pode
+rodar pelo cron a cada poucos minutos.
+
+--retroativo cria, uma vez, instantâneos diários a partir do histórico
+existente, para consultar instantes anteriores à implantação.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from principal.services import instantaneoServices
+
+
+class Command(BaseCommand):
+    help = 'Captura instantâneos periódicos do estado das chaves.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=float, metavar='SEGUNDOS',
+                            help='Repete a verificação a cada SEGUNDOS (até Ctrl+C).')
+        parser.add_argument('--retroativo', action='store_true',
+                            help='Gera instantâneos diários a partir do histórico antes de capturar.')
+
+    def handle(self, *args, **options):
+        if options['retroativo']:
+            total = instantaneoServices.gerar_retroativos(
+                lambda parcial: self.stdout.write(f'{parcial} instantâneos retroativos...')
+            )
+            self.stdout.write(f'{total} instantâneo(s) retroativo(s) criado(s).')
+
+        while True:
+            instantaneo = instantaneoServices.capturar_se_necessario()
+            if instantaneo is not None:
+                self.stdout.write(f'Instantâneo capturado: {instantaneo}.')
+            apagados = instantaneoServices.aplicar_retencao()
+            if apagados:
+                self.stdout.write(f'{apagados} instantâneo(s) antigo(s) apagado(s).')
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['loop'])
+            except KeyboardInterrupt:
+                return
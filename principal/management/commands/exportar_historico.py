@@ -0,0 +1,58 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py exportar_historico [--saida ARQUIVO] [filtros]
+
+Exporta o histórico de empréstimos em CSV ou JSONL, com os mesmos filtros da
+tela de histórico. As linhas são lidas do banco e gravadas em blocos, então a
+memória usada não cresce com o tamanho da exportação.
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from principal.services import exportacaoServices
+
+
+class Command(BaseCommand):
+    help = 'Exporta o histórico de empréstimos (CSV/JSONL, opcionalmente em gzip).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saida', help='Arquivo de saída (padrão: saída padrão).')
+        parser.add_argument('--formato', choices=list(exportacaoServices.FORMATOS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Comprime a saída em gzip.')
+        parser.add_argument('--lote', type=int, default=exportacaoServices.TAMANHO_BLOCO_EXPORTACAO,
+                            help='Registros lidos do banco por vez.')
+        # Filtros (os mesmos parâmetros da tela de histórico)
+        parser.add_argument('--chave-nome', dest='chave_nome')
+        parser.add_argument('--usuario-nome', dest='usuario_nome')
+        parser.add_argument('--acao', choices=['adquirida', 'devolucao', 'transferida'])
+        parser.add_argument('--data', help='Um único dia (AAAA-MM-DD).')
+        parser.add_argument('--de', help='Início do intervalo (AAAA-MM-DD, inclusivo).')
+        parser.add_argument('--ate', help='Fim do intervalo (AAAA-MM-DD, inclusivo).')
+
+    def handle(self, *args, **options):
+        parametros = {
+            campo: options[campo]
+            for campo in ('chave_nome', 'usuario_nome', 'acao', 'data', 'de', 'ate')
+            if options[campo]
+        }
+        blocos = exportacaoServices.exportar_historico(
+            parametros, options['formato'], options['gzip'], options['lote']
+        )
+
+        try:
+            saida = open(options['saida'], 'wb') if options['saida'] else sys.stdout.buffer
+        except OSError as e:
+            raise CommandError(f'Não foi possível criar o arquivo: {e}')
+
+        total_bytes = 0
+        try:
+            for bloco in blocos:
+                saida.write(bloco)
+                total_bytes += len(bloco)
+        finally:
+            if options['saida']:
+                saida.close()
+
+        if options['saida']:
+            self.stdout.write(self.style.SUCCESS(f"Exportado para {options['saida']} ({total_bytes:,} bytes)."))
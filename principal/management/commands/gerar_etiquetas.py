@@ -0,0 +1,52 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py gerar_etiquetas --saida etiquetas.pdf [filtros]
+
+Gera o PDF com as etiquetas (QR Code + nome) das chaves, com os mesmos filtros
+da tela de gerenciamento. As páginas são montadas em paralelo e os QR Codes
+ficam guardados em MEDIA_ROOT/qrcodes para as próximas impressões.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from principal.models import Chave
+from principal.services import etiquetaServices
+from principal.services.buscaServices import filtrar_lista_chaves
+
+
+class Command(BaseCommand):
+    help = 'Gera a folha de etiquetas (PDF) com os QR Codes das chaves.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saida', required=True, help='Arquivo PDF de saída.')
+        parser.add_argument('--url-base', help='Endereço do sistema nos QR Codes (padrão: QRCODE_URL_BASE).')
+        parser.add_argument('--colunas', type=int, default=4)
+        parser.add_argument('--linhas', type=int, default=6)
+        parser.add_argument('--processos', type=int, help='Processos em paralelo (padrão: um por CPU).')
+        # Filtros (os mesmos parâmetros da tela de gerenciamento)
+        parser.add_argument('--chave-nome', dest='chave_nome')
+        parser.add_argument('--status', choices=['disponivel', 'em_uso'])
+        parser.add_argument('--excluido', choices=['sim', 'nao'], default='nao')
+
+    def handle(self, *args, **options):
+        base = (options['url_base'] or etiquetaServices.url_base() or '').rstrip('/')
+        if not base:
+            raise CommandError('Informe --url-base ou defina QRCODE_URL_BASE no settings.')
+
+        chaves = filtrar_lista_chaves(Chave.objects.order_by('nome'), options).values_list('pk', 'nome', 'versao_qrcode')
+        etiquetas = [
+            etiquetaServices.Etiqueta(pk, nome, etiquetaServices.url_da_chave(pk, versao, base))
+            for pk, nome, versao in chaves
+        ]
+        if not etiquetas:
+            raise CommandError('Nenhuma chave encontrada com os filtros informados.')
+
+        inicio = time.perf_counter()
+        paginas = etiquetaServices.gerar_folha(
+            etiquetas, options['saida'], options['colunas'], options['linhas'], options['processos']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(etiquetas)} etiqueta(s) em {paginas} página(s) gravadas em {options['saida']} "
+            f"({time.perf_counter() - inicio:.1f}s)."
+        ))
@@ -0,0 +1,291 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py importar_dados {usuarios|chaves} ARQUIVO [opções]
+
+Importa usuários ou chaves de um arquivo CSV ou JSONL, lido em blocos (sem
+carregar o arquivo inteiro na memória). Cada bloco vira um bulk_create com
+tratamento de conflito e um INSERT em lote nos vínculos de grupo (M2M).
+
+Colunas de usuários: username, cpf (obrigatórias), first_name, last_name,
+email, contato, password (hash do Django; sem ela a senha fica inutilizável),
+grupos (nomes separados por ';').
+Colunas de chaves: nome (obrigatória), descricao, grupos (separados por ';').
+Grupos inexistentes são criados. Os vínculos existentes nunca são removidos.
+"""
+
+import csv
+import json
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from principal.models import Chave, Usuario
+from principal.services import autenticacaoServices, versaoServices
+
+
+class ErroLinha(ValueError):
+    """
+    Linha inválida do arquivo (não interrompe a importação).
+    """
+
+
+def ler_registros(arquivo, formato):
+    """
+    Gera (número da linha, dicionário) a partir de um arquivo CSV ou JSONL.
+    """
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        for registro in leitor:
+            yield leitor.line_num, registro
+    else:
+        for numero, linha in enumerate(arquivo, start=1):
+            if linha.strip():
+                try:
+                    registro = json.loads(linha)
+                except json.JSONDecodeError as e:
+                    yield numero, ErroLinha(f'JSON inválido: {e}')
+                    continue
+                if not isinstance(registro, dict):
+                    yield numero, ErroLinha('cada linha deve ser um objeto JSON ({...}).')
+                    continue
+                yield numero, registro
+
+
+def em_blocos(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while bloco := list(islice(iterador, tamanho)):
+        yield bloco
+
+
+def _texto(registro, campo):
+    return str(registro.get(campo) or '').strip()
+
+
+def _nomes_grupos(registro):
+    grupos = registro.get('grupos') or []
+    if isinstance(grupos, str):
+        grupos = grupos.split(';')
+    elif not isinstance(grupos, list):
+        raise ErroLinha('grupos deve ser um texto separado por ";" ou uma lista.')
+    return {str(nome).strip() for nome in grupos if nome and str(nome).strip()}
+
+
+class Command(BaseCommand):
+    help = 'Importa usuários ou chaves (CSV/JSONL) em lote, com vínculos de grupo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=['usuarios', 'chaves'], help='O que importar.')
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv ou .jsonl.')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], help='Padrão: deduzido da extensão.')
+        parser.add_argument('--lote', type=int, default=2000, help='Registros por bloco (padrão: 2000).')
+        parser.add_argument('--atualizar', action='store_true', help='Atualiza registros existentes em vez de ignorá-los.')
+        parser.add_argument('--dry-run', action='store_true', help='Valida e executa tudo, mas desfaz no final.')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or ('jsonl' if options['arquivo'].endswith(('.jsonl', '.json')) else 'csv')
+        self.lote = options['lote']
+        self.atualizar = options['atualizar']
+        self.grupos = dict(Group.objects.values_list('name', 'pk'))  # nome -> id
+        self.contagem = {'lidos': 0, 'criados': 0, 'atualizados': 0, 'ignorados': 0, 'erros': 0}
+
+        importar = self.importar_usuarios if options['tipo'] == 'usuarios' else self.importar_chaves
+        inicio = time.perf_counter()
+
+        try:
+            with open(options['arquivo'], newline='', encoding='utf-8') as arquivo:
+                with transaction.atomic():
+                    importar(ler_registros(arquivo, formato))
+                    if options['dry_run']:
+                        transaction.set_rollback(True)
+        except OSError as e:
+            raise CommandError(f'Não foi possível ler o arquivo: {e}')
+
+        # Gravação em lote não dispara os sinais: invalida o cache de autenticação ou o das chaves
+        if options['tipo'] == 'usuarios' and not options['dry_run']:
+            autenticacaoServices.invalidar_todos()
+        elif options['tipo'] == 'chaves' and not options['dry_run']:
+            versaoServices.registrar_alteracao_chaves()
+
+        self.relatorio(time.perf_counter() - inicio, options['dry_run'])
+
+    # --- Utilitários ---
+
+    def erro(self, numero, mensagem):
+        self.contagem['erros'] += 1
+        self.stderr.write(f'Linha {numero}: {mensagem}')
+
+    def ids_grupos(self, nomes):
+        """
+        Ids dos grupos pelo nome, criando os que faltam (uma consulta por bloco, no máximo).
+        """
+        faltando = nomes - self.grupos.keys()
+        if faltando:
+            Group.objects.bulk_create([Group(name=nome) for nome in faltando], ignore_conflicts=True)
+            self.grupos.update(Group.objects.filter(name__in=faltando).values_list('name', 'pk'))
+        return self.grupos
+
+    def vincular_grupos(self, through, campo, vinculos):
+        """
+        Insere em lote os vínculos (id do objeto, nome do grupo) na tabela M2M.
+        """
+        if not vinculos:
+            return
+        grupos = self.ids_grupos({nome for _, nome in vinculos})
+        through.objects.bulk_create(
+            [through(**{campo: objeto_id, 'group_id': grupos[nome]}) for objeto_id, nome in vinculos],
+            ignore_conflicts=True,
+        )
+
+    def gravar(self, modelo, campo_unico, objetos, campos_atualizaveis):
+        """
+        Grava um bloco com bulk_create e retorna ({valor do campo único: id},
+        valores que já existiam). Existentes são atualizados (--atualizar) ou
+        ignorados.
+        """
+        valores = [getattr(objeto, campo_unico) for objeto in objetos]
+        existentes = set(modelo.objects.filter(**{f'{campo_unico}__in': valores}).values_list(campo_unico, flat=True))
+
+        if self.atualizar:
+            modelo.objects.bulk_create(
+                objetos, update_conflicts=True, unique_fields=[campo_unico], update_fields=campos_atualizaveis
+            )
+            self.contagem['atualizados'] += len(existentes)
+        else:
+            objetos = [objeto for objeto in objetos if getattr(objeto, campo_unico) not in existentes]
+            modelo.objects.bulk_create(objetos, ignore_conflicts=True)
+            self.contagem['ignorados'] += len(existentes)
+        self.contagem['criados'] += len(valores) - len(existentes)
+
+        ids = dict(modelo.objects.filter(**{f'{campo_unico}__in': valores}).values_list(campo_unico, 'pk'))
+        return ids, existentes
+
+    # --- Usuários ---
+
+    def importar_usuarios(self, registros):
+        # CPFs já cadastrados (cpf -> username, e o inverso), para validar unicidade sem consultar o banco por linha
+        cpfs = dict(Usuario.objects.values_list('cpf', 'username').iterator(chunk_size=5000))
+        cpf_de = {username: cpf for cpf, username in cpfs.items()}
+        senha_inutilizavel = make_password(None)
+        vistos = set()  # usernames já aceitos do arquivo
+
+        for bloco in em_blocos(registros, self.lote):
+            usuarios, vinculos = [], []
+            for numero, registro in bloco:
+                self.contagem['lidos'] += 1
+                try:
+                    if isinstance(registro, ErroLinha):
+                        raise registro
+                    usuario, grupos = self.validar_usuario(registro, cpfs, vistos)
+                except ErroLinha as e:
+                    self.erro(numero, e)
+                    continue
+                self.aceitar_cpf(usuario, cpfs, cpf_de)
+                vistos.add(usuario.username)
+                usuarios.append(usuario)
+                vinculos.extend((usuario.username, nome) for nome in grupos)
+
+            for usuario in usuarios:
+                if not usuario.password:
+                    usuario.password = senha_inutilizavel
+
+            ids, _ = self.gravar(Usuario, 'username', usuarios, ['first_name', 'last_name', 'email', 'cpf', 'contato'])
+            self.vincular_grupos(
+                Usuario.groups.through, 'usuario_id',
+                [(ids[username], nome) for username, nome in vinculos if username in ids]
+            )
+
+    def validar_usuario(self, registro, cpfs, vistos):
+        username = _texto(registro, 'username')
+        cpf = _texto(registro, 'cpf')
+        if not username or not cpf:
+            raise ErroLinha('username e cpf são obrigatórios.')
+        if username in vistos:
+            raise ErroLinha(f'username "{username}" repetido no arquivo.')
+
+        dono = cpfs.get(cpf)
+        if dono is not None and dono != username:
+            raise ErroLinha(f'CPF {cpf} já pertence a "{dono}".')
+
+        senha = _texto(registro, 'password')
+        if senha:
+            try:
+                identify_hasher(senha)
+            except ValueError:
+                raise ErroLinha('password deve ser um hash do Django (texto puro não é aceito).')
+
+        usuario = Usuario(
+            username=username,
+            cpf=cpf,
+            first_name=_texto(registro, 'first_name'),
+            last_name=_texto(registro, 'last_name'),
+            email=_texto(registro, 'email'),
+            contato=_texto(registro, 'contato'),
+            password=senha,
+        )
+        return usuario, _nomes_grupos(registro)
+
+    def aceitar_cpf(self, usuario, cpfs, cpf_de):
+        """
+        Atualiza os mapas de CPF com uma linha aceita, conforme o que vai
+        para o banco: usuário existente sem --atualizar é ignorado e mantém o
+        CPF; com --atualizar, o CPF anterior fica livre para as linhas seguintes.
+        """
+        anterior = cpf_de.get(usuario.username)
+        if anterior is not None and not self.atualizar:
+            return
+        if anterior is not None and anterior != usuario.cpf:
+            cpfs.pop(anterior, None)
+        cpfs[usuario.cpf] = usuario.username
+        cpf_de[usuario.username] = usuario.cpf
+
+    # --- Chaves ---
+
+    def importar_chaves(self, registros):
+        vistos = set()  # nomes já lidos no arquivo
+
+        for bloco in em_blocos(registros, self.lote):
+            chaves, vinculos = [], []
+            for numero, registro in bloco:
+                self.contagem['lidos'] += 1
+                try:
+                    if isinstance(registro, ErroLinha):
+                        raise registro
+                    chave, grupos = self.validar_chave(registro, vistos)
+                except ErroLinha as e:
+                    self.erro(numero, e)
+                    continue
+                vistos.add(chave.nome)
+                chaves.append(chave)
+                vinculos.extend((chave.nome, grupo) for grupo in grupos)
+
+            ids, existentes = self.gravar(Chave, 'nome', chaves, ['descricao'])
+            if self.atualizar and existentes:
+                # Chaves atualizadas: nova versão da linha (fragmentos em cache das tabelas)
+                Chave.objects.filter(nome__in=existentes).update(versao=F('versao') + 1)
+            self.vincular_grupos(
+                Chave.grupos_permissao.through, 'chave_id',
+                [(ids[nome], grupo) for nome, grupo in vinculos if nome in ids]
+            )
+
+    def validar_chave(self, registro, vistos):
+        nome = _texto(registro, 'nome')
+        if not nome:
+            raise ErroLinha('nome é obrigatório.')
+        if nome in vistos:
+            raise ErroLinha(f'chave "{nome}" repetida no arquivo.')
+        return Chave(nome=nome, descricao=_texto(registro, 'descricao')), _nomes_grupos(registro)
+
+    # --- Relatório ---
+
+    def relatorio(self, segundos, dry_run):
+        c = self.contagem
+        taxa = c['lidos'] / segundos if segundos else 0
+        prefixo = '[DRY-RUN] nada foi gravado. ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefixo}{c['lidos']} lidos, {c['criados']} criados, {c['atualizados']} atualizados, "
+            f"{c['ignorados']} ignorados, {c['erros']} com erro em {segundos:.1f}s ({taxa:,.0f} registros/s)."
+        ))
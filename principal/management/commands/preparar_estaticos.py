@@ -0,0 +1,72 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py preparar_estaticos [--baixar-scanner]
+
+Passo de build dos arquivos estáticos para produção (DEBUG = False): roda o
+collectstatic (nomes com hash, CSS/JS minificados, variantes .gz/.br) e
+mostra quantos bytes a página transfere na primeira carga e nas seguintes.
+
+--baixar-scanner grava antes a biblioteca html5-qrcode em
+principal/static/vendor/, para ela ser servida pelo sistema (com hash e
+cache longo) em vez do CDN. Basta uma vez por versão: o arquivo vai para o
+controle de versão.
+"""
+
+from urllib.error import URLError
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from principal.services import estaticosServices
+from principal.storage import EstaticosComprimidos
+
+
+def _kb(tamanho):
+    return '-' if tamanho is None else f'{tamanho / 1024:.1f}'
+
+
+class Command(BaseCommand):
+    help = 'Coleta, minifica e comprime os arquivos estáticos e mostra o tamanho transferido.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baixar-scanner', action='store_true',
+                            help='Baixa a biblioteca html5-qrcode para principal/static/vendor/.')
+        parser.add_argument('--sem-coleta', action='store_true',
+                            help='Só mostra o relatório do que já está em STATIC_ROOT.')
+
+    def handle(self, *args, **options):
+        if options['baixar_scanner']:
+            try:
+                destino = estaticosServices.baixar_html5_qrcode()
+            except (URLError, OSError) as erro:
+                raise CommandError(f'Não foi possível baixar {estaticosServices.HTML5_QRCODE_CDN}: {erro}')
+            self.stdout.write(f'Biblioteca do scanner gravada em {destino}.')
+
+        if not isinstance(staticfiles_storage, EstaticosComprimidos):
+            self.stderr.write(self.style.WARNING(
+                'Com DEBUG = True o storage é o padrão: sem hash nos nomes nem variantes comprimidas.'
+            ))
+
+        if not options['sem_coleta']:
+            call_command('collectstatic', interactive=False, verbosity=max(options['verbosity'] - 1, 0))
+
+        linhas, totais = estaticosServices.relatorio_transferencia()
+        self.stdout.write(f"\n{'arquivo':38} {'original':>9} {'coletado':>9} {'gzip':>9} {'br':>9} {'enviado':>9}  (KB)")
+        for nome, *tamanhos in linhas:
+            self.stdout.write(f'{nome:38} ' + ' '.join(f'{_kb(tamanho):>9}' for tamanho in tamanhos))
+
+        scanner_local = linhas[-1][1] is not None
+        if not scanner_local:
+            self.stdout.write(
+                f'\nBiblioteca do scanner não baixada: vem do CDN ({estaticosServices.HTML5_QRCODE_CDN}), '
+                'fora do relatório. Use --baixar-scanner.'
+            )
+        self.stdout.write(
+            f"\nPrimeira carga de uma página: {_kb(totais['primeira_antes'])} KB antes "
+            f"({'com o scanner, ' if scanner_local else ''}sem compressão) -> {_kb(totais['primeira_depois'])} KB"
+            + (f" (+{_kb(totais['scanner_depois'])} KB ao abrir a câmera)." if scanner_local else '.')
+        )
+        self.stdout.write(
+            f"Cargas seguintes: {totais['requisicoes_repeticao_antes']} revalidações de estáticos antes "
+            f"-> {totais['requisicoes_repeticao_depois']} (arquivos com hash em cache 'immutable')."
+        )
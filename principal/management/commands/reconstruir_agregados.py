@@ -0,0 +1,35 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py reconstruir_agregados [--dias-por-lote N]
+
+Recalcula do zero os agregados de uso (painel de análise) a partir do
+histórico, incluindo o arquivo. Necessário depois de importar histórico
+direto no banco ou de criar as tabelas de agregados num banco que já tinha
+histórico; no uso normal, as movimentações mantêm os agregados em dia.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from principal.services.agregadosServices import DIAS_POR_LOTE, reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os agregados de uso a partir do histórico de empréstimos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias-por-lote', type=int, default=DIAS_POR_LOTE,
+                            help=f'Dias de histórico por lote (padrão: {DIAS_POR_LOTE}).')
+
+    def handle(self, *args, **options):
+        if options['dias_por_lote'] < 1:
+            raise CommandError('--dias-por-lote deve ser pelo menos 1.')
+
+        def progresso(primeiro_dia, ultimo_dia):
+            self.stdout.write(f'{primeiro_dia:%d/%m/%Y} a {ultimo_dia:%d/%m/%Y}')
+
+        comeco = time.perf_counter()
+        lotes = reconstruir(options['dias_por_lote'], progresso)
+        self.stdout.write(self.style.SUCCESS(
+            f'Agregados reconstruídos em {lotes} lote(s), {time.perf_counter() - comeco:.1f}s.'
+        ))
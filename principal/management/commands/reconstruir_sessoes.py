@@ -0,0 +1,29 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py reconstruir_sessoes
+
+Recria as sessões de empréstimo (quem esteve com cada chave, de quando até
+quando) a partir do histórico, incluindo o arquivo. Necessário uma vez num
+banco que já tinha histórico e depois de importar histórico direto no banco;
+no uso normal, as movimentações mantêm as sessões em dia.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from principal.services.sessaoServices import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recria as sessões de empréstimo a partir do histórico.'
+
+    def handle(self, *args, **options):
+        def progresso(total):
+            if total % 100000 == 0:
+                self.stdout.write(f'{total} sessões...')
+
+        comeco = time.perf_counter()
+        total = reconstruir(progresso)
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} sessões criadas em {time.perf_counter() - comeco:.1f}s.'
+        ))
@@ -0,0 +1,44 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py sincronizar_replica [--loop SEGUNDOS] [--paginas N]
+
+Perfil SQLite: copia o banco principal para o arquivo da réplica
+(DB_REPLICA_NOME) com a API de backup do SQLite. É um substituto local da
+replicação de um servidor de banco: com --loop, repete a cópia a cada
+intervalo, e o atraso da réplica fica em torno desse valor.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from principal.routers import replica_configurada
+from principal.services.replicaServices import sincronizar_sqlite
+
+
+class Command(BaseCommand):
+    help = 'Copia o banco principal (SQLite) para a réplica de leitura.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=float, metavar='SEGUNDOS',
+                            help='Repete a cópia a cada SEGUNDOS (até Ctrl+C).')
+        parser.add_argument('--paginas', type=int, default=-1,
+                            help='Páginas copiadas por etapa (-1 = tudo de uma vez).')
+        parser.add_argument('--pausa', type=float, default=0,
+                            help='Segundos entre etapas, para liberar o principal para escritas.')
+
+    def handle(self, *args, **options):
+        if not replica_configurada():
+            raise CommandError('Nenhuma réplica configurada (defina DB_REPLICA_NOME).')
+
+        while True:
+            try:
+                duracao = sincronizar_sqlite(options['paginas'], options['pausa'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(f'Réplica sincronizada em {duracao:.2f}s.')
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['loop'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,56 @@
+# Author: João Victor Marques Favero
+"""
+Comando: python manage.py verificar_indices_historico
+
+Roda EXPLAIN QUERY PLAN (SQLite) para cada combinação de filtros da tela de
+histórico e falha se alguma consulta varrer a tabela de histórico sem índice.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from principal.models import HistoricoEmprestimo
+from principal.services.historicoServices import COMBINACOES_FILTROS, filtrar_historico
+
+TABELA = HistoricoEmprestimo._meta.db_table
+
+
+def varre_sem_indice(plano):
+    """
+    True se alguma linha do plano for um SCAN da tabela de histórico sem índice.
+    """
+    for linha in plano.splitlines():
+        if f'SCAN {TABELA}' in linha and 'USING' not in linha:
+            return True
+    return False
+
+
+class Command(BaseCommand):
+    help = 'Verifica (EXPLAIN QUERY PLAN) se os filtros do histórico usam índices.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mostrar-plano', action='store_true', help='Exibe o plano completo de cada consulta.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Esta verificação só está disponível para SQLite.')
+
+        base = HistoricoEmprestimo.objects.select_related('chave', 'usuario').order_by('-data_hora', '-id')
+        falhas = []
+
+        for parametros in COMBINACOES_FILTROS:
+            # Mesma forma da consulta da tela: filtros + primeira página
+            queryset = filtrar_historico(base, parametros)[:20]
+            plano = queryset.explain()
+            descricao = ', '.join(f'{k}={v}' for k, v in parametros.items()) or '(sem filtros)'
+
+            if varre_sem_indice(plano):
+                falhas.append(descricao)
+                self.stdout.write(self.style.ERROR(f'SEM ÍNDICE  {descricao}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'OK          {descricao}'))
+
+            if options['mostrar_plano']:
+                self.stdout.write(plano)
+
+        if falhas:
+            raise CommandError(f'{len(falhas)} combinação(ões) de filtros sem índice.')
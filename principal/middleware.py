@@ -0,0 +1,270 @@
+# Author: João Victor Marques Favero
+"""
+Middlewares do app 'principal'.
+"""
+
+import mimetypes
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+from principal import routers
+from principal.services import metricasServices
+from principal.services.replicaServices import atraso_replica, replica_em_dia
+
+# Cookie de aderência ao principal depois de uma escrita (ler o que acabou de gravar)
+COOKIE_ADERENCIA = 'leitura_principal'
+
+
+class ReplicaMiddleware:
+    """
+    Decide, por requisição, se as leituras podem ir para a réplica:
+    - a view está em REPLICA_TOLERANCIA e a requisição é GET/HEAD;
+    - o usuário não escreveu nada nos últimos REPLICA_ADERENCIA_SEGUNDOS
+      (cookie de aderência);
+    - o atraso atual da réplica não passa da tolerância da view.
+
+    Páginas lidas de uma réplica atrasada saem sem ETag/Last-Modified: esses
+    valores vêm do principal, e o navegador guardaria a página antiga como se
+    fosse a atual.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        estado, token = routers.iniciar_requisicao()
+        try:
+            resposta = self.get_response(request)
+        finally:
+            routers.encerrar_requisicao(token)
+        return self._finalizar(estado, resposta)
+
+    async def __acall__(self, request):
+        estado, token = routers.iniciar_requisicao()
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            routers.encerrar_requisicao(token)
+        return self._finalizar(estado, resposta)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        estado = routers.estado_atual()
+        if estado is None or not routers.replica_configurada():
+            return None
+        if request.method not in ('GET', 'HEAD') or COOKIE_ADERENCIA in request.COOKIES:
+            return None
+        tolerancia = getattr(settings, 'REPLICA_TOLERANCIA', {}).get(request.resolver_match.url_name)
+        if tolerancia is None:
+            return None
+        atraso, ultimo_id = atraso_replica()
+        if atraso is not None and atraso <= tolerancia:
+            estado.replica = True
+            estado.em_dia = atraso == 0 and replica_em_dia(ultimo_id)
+        return None
+
+    def _finalizar(self, estado, resposta):
+        if estado.escreveu:
+            resposta.set_cookie(
+                COOKIE_ADERENCIA, '1',
+                max_age=getattr(settings, 'REPLICA_ADERENCIA_SEGUNDOS', 10),
+                httponly=True, samesite='Lax',
+            )
+        elif estado.replica and not estado.em_dia:
+            del resposta['ETag']
+            del resposta['Last-Modified']
+        return resposta
+
+
+class MetricasMiddleware:
+    """
+    Mede cada requisição (latência, consultas, templates e tamanho da
+    resposta) e soma às métricas da rota (metricasServices). Fica no início
+    de MIDDLEWARE para incluir o tempo dos demais middlewares.
+
+    Em respostas em fluxo (exportação CSV, arquivos), a latência vai até o
+    início do envio, sem a geração do conteúdo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        if not metricasServices.ativas():
+            return self.get_response(request)
+        medicao, token = metricasServices.iniciar_requisicao()
+        inicio = time.perf_counter()
+        try:
+            resposta = self.get_response(request)
+        finally:
+            metricasServices.encerrar_requisicao(token)
+        self._registrar(request, resposta, medicao, time.perf_counter() - inicio)
+        return resposta
+
+    async def __acall__(self, request):
+        if not metricasServices.ativas():
+            return await self.get_response(request)
+        medicao, token = metricasServices.iniciar_requisicao()
+        inicio = time.perf_counter()
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            metricasServices.encerrar_requisicao(token)
+        self._registrar(request, resposta, medicao, time.perf_counter() - inicio)
+        return resposta
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Nome da URL (com namespace): poucos valores distintos, ao contrário do caminho
+        medicao = metricasServices.medicao_atual()
+        if medicao is not None:
+            medicao.rota = request.resolver_match.view_name
+        return None
+
+    def _registrar(self, request, resposta, medicao, duracao):
+        if resposta.streaming:
+            tamanho = resposta.get('Content-Length')
+            tamanho = int(tamanho) if tamanho else None
+        else:
+            tamanho = len(resposta.content)
+        metricasServices.registrar(medicao, request.method, resposta.status_code, duracao, tamanho)
+
+
+class EstaticosMiddleware:
+    """
+    Serve os arquivos de STATIC_ROOT (gerados pelo collectstatic) sem passar
+    pelas URLs nem pelos demais middlewares, quando ESTATICOS_SERVIR = True
+    (produção sem um servidor web na frente):
+
+    - a variante .br ou .gz do arquivo, se o navegador aceita (Accept-Encoding);
+    - arquivos com hash no nome (do manifesto): 'Cache-Control: immutable' de
+      um ano, o navegador não pergunta de novo;
+    - os demais: cache curto (ESTATICOS_MAX_AGE) e resposta 304 pelo Last-Modified.
+
+    Os arquivos são pequenos (CSS, JS, imagens do admin) e vão inteiros na
+    resposta. Fica logo depois do SecurityMiddleware; as requisições entram
+    nas métricas com a rota 'estaticos'.
+    """
+    sync_capable = True
+    async_capable = True
+
+    # Validade do cache dos arquivos com hash (um ano)
+    MAX_AGE_IMUTAVEL = 365 * 24 * 3600
+
+    # Codificações na ordem de preferência e o sufixo das variantes
+    CODIFICACOES = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'ESTATICOS_SERVIR', False) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefixo = '/' + settings.STATIC_URL.lstrip('/')
+        self.max_age = getattr(settings, 'ESTATICOS_MAX_AGE', 300)
+        self._imutaveis = None
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        if self._e_estatico(request):
+            resposta = self.servir(request)
+            if resposta is not None:
+                return resposta
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self._e_estatico(request):
+            resposta = await sync_to_async(self.servir)(request)
+            if resposta is not None:
+                return resposta
+        return await self.get_response(request)
+
+    def _e_estatico(self, request):
+        return request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefixo)
+
+    def imutaveis(self):
+        # Nomes com hash do manifesto (carregado uma vez por processo)
+        if self._imutaveis is None:
+            self._imutaveis = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return self._imutaveis
+
+    def servir(self, request):
+        """
+        Resposta com o arquivo pedido, ou None se ele não existe em STATIC_ROOT
+        (a requisição segue e termina em 404).
+        """
+        nome = request.path_info[len(self.prefixo):]
+        try:
+            caminho = safe_join(settings.STATIC_ROOT, nome)
+        except SuspiciousFileOperation:
+            return None
+        if not nome or not os.path.isfile(caminho):
+            return None
+
+        medicao = metricasServices.medicao_atual()
+        if medicao is not None:
+            medicao.rota = 'estaticos'
+
+        estado = os.stat(caminho)
+        if nome not in self.imutaveis() and not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'), estado.st_mtime
+        ):
+            return HttpResponseNotModified()
+
+        aceitas = self._aceitas(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        codificacao = None
+        for candidata, sufixo in self.CODIFICACOES:
+            if candidata in aceitas and os.path.isfile(caminho + sufixo):
+                codificacao, caminho = candidata, caminho + sufixo
+                break
+
+        with open(caminho, 'rb') as arquivo:
+            conteudo = arquivo.read()
+        tipo, _ = mimetypes.guess_type(nome)
+        resposta = HttpResponse(b'' if request.method == 'HEAD' else conteudo,
+                                content_type=tipo or 'application/octet-stream')
+        resposta['Content-Length'] = len(conteudo)
+        resposta['Last-Modified'] = http_date(estado.st_mtime)
+        resposta['Vary'] = 'Accept-Encoding'
+        resposta['X-Content-Type-Options'] = 'nosniff'
+        if codificacao:
+            resposta['Content-Encoding'] = codificacao
+        if nome in self.imutaveis():
+            resposta['Cache-Control'] = f'public, max-age={self.MAX_AGE_IMUTAVEL}, immutable'
+        else:
+            resposta['Cache-Control'] = f'public, max-age={self.max_age}'
+        return resposta
+
+    @staticmethod
+    def _aceitas(cabecalho):
+        # 'gzip, deflate, br;q=0.9' -> {'gzip', 'deflate', 'br'} (q=0 recusa)
+        aceitas = set()
+        for item in cabecalho.split(','):
+            codificacao, _, parametros = item.strip().partition(';')
+            if parametros.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            if codificacao:
+                aceitas.add(codificacao.strip().lower())
+        return aceitas
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('principal', '0003_remove_chave_grupo_permissao_chave_grupos_permissao'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chave',
+            name='excluido',
+            field=models.BooleanField(default=False, help_text='Não aparece para novos empréstimos, mas mantém histórico.', verbose_name='Excluído (Logicamente)'),
+        ),
+        migrations.AlterField(
+            model_name='chave',
+            name='grupos_permissao',
+            field=models.ManyToManyField(blank=True, help_text='Se definido, apenas usuários deste grupo podem retirar esta chave.', to='auth.group', verbose_name='Grupo com Permissão'),
+        ),
+        migrations.AddIndex(
+            model_name='historicoemprestimo',
+            index=models.Index(fields=['data_hora'], name='hist_data_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicoemprestimo',
+            index=models.Index(fields=['chave', 'data_hora'], name='hist_chave_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicoemprestimo',
+            index=models.Index(fields=['usuario', 'data_hora'], name='hist_usuario_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicoemprestimo',
+            index=models.Index(fields=['acao', 'data_hora'], name='hist_acao_data_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Author: João Victor Marques Favero
+"""
+Cria as tabelas FTS5 de busca de chaves/usuários e seus triggers (apenas SQLite).
+
+O SQL fica aqui, e não em buscaServices: mudanças futuras no serviço não
+alteram o que esta migration aplica.
+"""
+
+from django.db import migrations
+
+# Tabelas FTS5: nome -> (tabela de conteúdo, colunas indexadas)
+TABELAS_FTS = {
+    'principal_chave_fts': ('principal_chave', ('nome', 'descricao')),
+    'principal_usuario_fts': ('principal_usuario', ('username', 'first_name', 'last_name')),
+}
+
+
+def _sql_instalacao(tabela_fts, tabela, colunas):
+    lista = ', '.join(colunas)
+    novos = ', '.join(f'new.{c}' for c in colunas)
+    antigos = ', '.join(f'old.{c}' for c in colunas)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {tabela_fts} USING fts5("
+        f"{lista}, content='{tabela}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+
+        f"CREATE TRIGGER IF NOT EXISTS {tabela_fts}_ai AFTER INSERT ON {tabela} BEGIN "
+        f"INSERT INTO {tabela_fts}(rowid, {lista}) VALUES (new.id, {novos}); END",
+
+        f"CREATE TRIGGER IF NOT EXISTS {tabela_fts}_ad AFTER DELETE ON {tabela} BEGIN "
+        f"INSERT INTO {tabela_fts}({tabela_fts}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); END",
+
+        f"CREATE TRIGGER IF NOT EXISTS {tabela_fts}_au AFTER UPDATE OF {lista} ON {tabela} BEGIN "
+        f"INSERT INTO {tabela_fts}({tabela_fts}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); "
+        f"INSERT INTO {tabela_fts}(rowid, {lista}) VALUES (new.id, {novos}); END",
+    ]
+
+
+def instalar(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        for tabela_fts, (tabela, colunas) in TABELAS_FTS.items():
+            for comando in _sql_instalacao(tabela_fts, tabela, colunas):
+                cursor.execute(comando)
+            # Indexa as linhas que já existem
+            cursor.execute(f"INSERT INTO {tabela_fts}({tabela_fts}) VALUES ('rebuild')")
+
+
+def remover(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for tabela_fts in TABELAS_FTS:
+            for sufixo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {tabela_fts}_{sufixo}')
+            cursor.execute(f'DROP TABLE IF EXISTS {tabela_fts}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('principal', '0004_historicoemprestimo_indices'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar, remover),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('principal', '0005_busca_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chave',
+            name='versao_qrcode',
+            field=models.PositiveIntegerField(default=1, help_text='Ao gerar um novo QR Code, as etiquetas impressas anteriormente deixam de funcionar.', verbose_name='Versão do QR Code'),
+        ),
+    ]
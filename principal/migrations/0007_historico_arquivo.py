@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('principal', '0006_chave_versao_qrcode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoArquivoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(unique=True, verbose_name='Mês')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Registros')),
+                ('adquiridas', models.PositiveIntegerField(default=0, verbose_name='Aquisições')),
+                ('devolucoes', models.PositiveIntegerField(default=0, verbose_name='Devoluções')),
+                ('transferidas', models.PositiveIntegerField(default=0, verbose_name='Transferências')),
+                ('arquivado_em', models.DateTimeField(auto_now=True, verbose_name='Arquivado em')),
+            ],
+            options={
+                'verbose_name': 'Resumo Mensal do Arquivo',
+                'verbose_name_plural': 'Resumos Mensais do Arquivo',
+                'ordering': ['-mes'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HistoricoEmprestimoArquivo',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data_hora', models.DateTimeField(verbose_name='Data e Hora da Ação')),
+                ('acao', models.CharField(choices=[('adquirida', 'Adquirida'), ('devolucao', 'Devolução'), ('transferida', 'Transferida')], max_length=20, verbose_name='Ação Realizada')),
+                ('chave', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='historico_arquivado', to='principal.chave', verbose_name='Chave Transacionada')),
+                ('usuario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuário Responsável')),
+            ],
+            options={
+                'verbose_name': 'Histórico de Empréstimo (Arquivo)',
+                'verbose_name_plural': 'Históricos de Empréstimos (Arquivo)',
+                'ordering': ['-data_hora'],
+                'indexes': [models.Index(fields=['data_hora'], name='arq_data_hora_idx'), models.Index(fields=['chave', 'data_hora'], name='arq_chave_data_idx'), models.Index(fields=['usuario', 'data_hora'], name='arq_usuario_data_idx'), models.Index(fields=['acao', 'data_hora'], name='arq_acao_data_idx')],
+            },
+        ),
+    ]
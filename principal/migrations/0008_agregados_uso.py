@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('principal', '0007_historico_arquivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsoHora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('adquiridas', models.PositiveIntegerField(default=0, verbose_name='Aquisições')),
+                ('devolucoes', models.PositiveIntegerField(default=0, verbose_name='Devoluções')),
+                ('transferidas', models.PositiveIntegerField(default=0, verbose_name='Transferências')),
+                ('hora', models.DateTimeField(unique=True, verbose_name='Hora')),
+            ],
+            options={
+                'verbose_name': 'Uso por Hora',
+                'verbose_name_plural': 'Uso por Hora',
+            },
+        ),
+        migrations.CreateModel(
+            name='UsoChaveDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('adquiridas', models.PositiveIntegerField(default=0, verbose_name='Aquisições')),
+                ('devolucoes', models.PositiveIntegerField(default=0, verbose_name='Devoluções')),
+                ('transferidas', models.PositiveIntegerField(default=0, verbose_name='Transferências')),
+                ('dia', models.DateField(verbose_name='Dia')),
+                ('chave', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='principal.chave', verbose_name='Chave')),
+            ],
+            options={
+                'verbose_name': 'Uso de Chave por Dia',
+                'verbose_name_plural': 'Uso de Chaves por Dia',
+                'indexes': [models.Index(fields=['dia'], name='uso_chave_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('chave', 'dia'), name='uso_chave_dia_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsoGrupoDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('adquiridas', models.PositiveIntegerField(default=0, verbose_name='Aquisições')),
+                ('devolucoes', models.PositiveIntegerField(default=0, verbose_name='Devoluções')),
+                ('transferidas', models.PositiveIntegerField(default=0, verbose_name='Transferências')),
+                ('dia', models.DateField(verbose_name='Dia')),
+                ('grupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auth.group', verbose_name='Grupo')),
+            ],
+            options={
+                'verbose_name': 'Uso de Grupo por Dia',
+                'verbose_name_plural': 'Uso de Grupos por Dia',
+                'indexes': [models.Index(fields=['dia'], name='uso_grupo_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('grupo', 'dia'), name='uso_grupo_dia_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsoUsuarioDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('adquiridas', models.PositiveIntegerField(default=0, verbose_name='Aquisições')),
+                ('devolucoes', models.PositiveIntegerField(default=0, verbose_name='Devoluções')),
+                ('transferidas', models.PositiveIntegerField(default=0, verbose_name='Transferências')),
+                ('dia', models.DateField(verbose_name='Dia')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Uso de Usuário por Dia',
+                'verbose_name_plural': 'Uso de Usuários por Dia',
+                'indexes': [models.Index(fields=['dia'], name='uso_usuario_dia_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'dia'), name='uso_usuario_dia_unico')],
+            },
+        ),
+    ]
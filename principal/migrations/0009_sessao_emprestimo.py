@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('principal', '0008_agregados_uso'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessaoEmprestimo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(verbose_name='Início')),
+                ('fim', models.DateTimeField(blank=True, null=True, verbose_name='Fim')),
+                ('encerramento', models.CharField(blank=True, choices=[('devolucao', 'Devolução'), ('transferida', 'Transferência')], max_length=20, null=True, verbose_name='Encerrada por')),
+                ('chave', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sessoes', to='principal.chave', verbose_name='Chave')),
+                ('usuario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sessoes_emprestimo', to=settings.AUTH_USER_MODEL, verbose_name='Portador')),
+            ],
+            options={
+                'verbose_name': 'Sessão de Empréstimo',
+                'verbose_name_plural': 'Sessões de Empréstimo',
+                'ordering': ['-inicio'],
+                'indexes': [models.Index(fields=['chave', 'inicio'], name='sessao_chave_inicio_idx'), models.Index(fields=['usuario', 'inicio'], name='sessao_usuario_inicio_idx'), models.Index(fields=['inicio'], name='sessao_inicio_idx'), models.Index(fields=['fim'], name='sessao_fim_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('fim__isnull', True)), fields=('chave',), name='sessao_aberta_unica')],
+            },
+        ),
+    ]
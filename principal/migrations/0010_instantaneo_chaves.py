@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('principal', '0009_sessao_emprestimo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneoChaves',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('momento', models.DateTimeField(unique=True, verbose_name='Momento')),
+                ('portadores', models.JSONField(default=dict, verbose_name='Portadores')),
+                ('chaves_em_uso', models.PositiveIntegerField(default=0, verbose_name='Chaves em uso')),
+            ],
+            options={
+                'verbose_name': 'Instantâneo das Chaves',
+                'verbose_name_plural': 'Instantâneos das Chaves',
+                'ordering': ['-momento'],
+            },
+        ),
+    ]
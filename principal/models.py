@@ -7,3 +7,7 @@ from django.db import models
 from .submodels.usuarioModels import Usuario
 from .submodels.chaveModels import Chave
 from .submodels.emprestimoModels import HistoricoEmprestimo
+from .submodels.arquivoModels import HistoricoEmprestimoArquivo, ResumoArquivoMensal
+from .submodels.usoModels import UsoHora, UsoChaveDia, UsoUsuarioDia, UsoGrupoDia
+from .submodels.sessaoModels import SessaoEmprestimo
+from .submodels.instantaneoModels import InstantaneoChaves
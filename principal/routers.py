@@ -0,0 +1,89 @@
+# Author: João Victor Marques Favero
+"""
+Roteador de banco: leituras do histórico e das chaves na réplica ('replica').
+
+Quem decide se uma requisição pode ler da réplica é o ReplicaMiddleware
+(principal.middleware), conforme a view e o atraso tolerado em
+REPLICA_TOLERANCIA. A decisão fica num objeto por requisição, guardado numa
+ContextVar (vale para views síncronas e assíncronas). Escritas vão sempre
+para o banco principal; depois da primeira escrita, a requisição volta a ler
+do principal (lê o que acabou de gravar).
+
+Só os modelos de REPLICA_MODELOS são lidos da réplica. Usuário, sessão e
+permissões ficam no principal: uma sessão recém-criada ainda não existe na
+réplica.
+"""
+
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+ALIAS_REPLICA = 'replica'
+
+# Modelos que podem ser lidos da réplica (app_label.model)
+MODELOS_PADRAO = ('principal.historicoemprestimo', 'principal.historicoemprestimoarquivo', 'principal.chave')
+
+
+class EstadoLeitura:
+    """
+    Decisão de roteamento de uma requisição.
+    """
+    __slots__ = ('replica', 'em_dia', 'escreveu')
+
+    def __init__(self):
+        self.replica = False  # O middleware liberou a réplica para esta view
+        self.em_dia = False  # A réplica tinha tudo o que o principal tinha na decisão
+        self.escreveu = False  # Houve escrita: as próximas leituras vão para o principal
+
+
+_estado = ContextVar('principal_estado_leitura', default=None)
+
+
+def iniciar_requisicao():
+    """
+    Cria o estado da requisição. Retorna (estado, token para encerrar_requisicao).
+    """
+    estado = EstadoLeitura()
+    return estado, _estado.set(estado)
+
+
+def encerrar_requisicao(token):
+    _estado.reset(token)
+
+
+def estado_atual():
+    return _estado.get()
+
+
+def replica_configurada():
+    return ALIAS_REPLICA in settings.DATABASES
+
+
+class RoteadorReplica:
+    """
+    Leituras liberadas pelo ReplicaMiddleware vão para a réplica; todo o resto
+    (e tudo fora de requisições: comandos, shell) vai para o principal.
+    """
+
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        if estado is None or not estado.replica or estado.escreveu:
+            return DEFAULT_DB_ALIAS
+        if model._meta.label_lower not in getattr(settings, 'REPLICA_MODELOS', MODELOS_PADRAO):
+            return DEFAULT_DB_ALIAS
+        return ALIAS_REPLICA
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None:
+            estado.escreveu = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e principal têm os mesmos dados (com atraso)
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema junto com os dados (cópia ou replicação)
+        return db != ALIAS_REPLICA
@@ -0,0 +1,257 @@
+# Author: João Victor Marques Favero
+"""
+Agregados de uso (contadores por hora, chave, usuário e grupo).
+
+Cada movimentação soma os seus registros de histórico nos agregados dentro da
+mesma transação que grava o histórico (emprestimoServices): os contadores
+nunca divergem do histórico confirmado. A soma é um INSERT ... ON CONFLICT DO
+UPDATE por tabela (SQLite e PostgreSQL), sem ler as linhas antes.
+
+O painel de análise lê só estas tabelas: o custo depende do número de dias,
+horas e chaves do período, não da quantidade de registros de histórico.
+reconstruir() recalcula tudo a partir do histórico (tabela principal e
+arquivo) com INSERT ... SELECT ... GROUP BY, sem trazer as linhas para o
+Python.
+"""
+
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connections, router, transaction
+from django.db.models import Count, DateField, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, TruncHour
+from django.utils import timezone
+from principal.models import (
+    Chave, HistoricoEmprestimo, HistoricoEmprestimoArquivo,
+    UsoChaveDia, UsoGrupoDia, UsoHora, UsoUsuarioDia,
+)
+from principal.services.historicoServices import inicio_do_dia
+
+# Coluna de contador de cada ação do histórico
+CONTADORES = {
+    'adquirida': 'adquiridas',
+    'devolucao': 'devolucoes',
+    'transferida': 'transferidas',
+}
+
+# Linhas por INSERT ... ON CONFLICT
+TAMANHO_BLOCO_AGREGADOS = 500
+
+# Dias do histórico agregados por consulta na reconstrução
+DIAS_POR_LOTE = 31
+
+DIAS_DA_SEMANA = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
+
+
+def _upsert(modelo, conexao, colunas):
+    """
+    Início e fim do INSERT ... ON CONFLICT DO UPDATE que soma os contadores
+    de 'modelo'. 'colunas': nomes dos campos, na ordem dos valores.
+    """
+    q = conexao.ops.quote_name
+    tabela = q(modelo._meta.db_table)
+    contadores = list(CONTADORES.values())
+    chave = [q(modelo._meta.get_field(nome).column) for nome in colunas if nome not in contadores]
+    todas = ', '.join(q(modelo._meta.get_field(nome).column) for nome in colunas)
+    soma = ', '.join(f'{q(c)} = {tabela}.{q(c)} + excluded.{q(c)}' for c in contadores)
+    return f'INSERT INTO {tabela} ({todas})', f'ON CONFLICT ({", ".join(chave)}) DO UPDATE SET {soma}'
+
+
+def _somar(modelo, campos_chave, totais):
+    """
+    Soma 'totais' ({valores de campos_chave: {contador: n}}) às linhas de
+    'modelo', criando as que ainda não existem.
+    """
+    if not totais:
+        return
+    conexao = connections[router.db_for_write(modelo)]
+    campos = [modelo._meta.get_field(nome) for nome in campos_chave]
+    contadores = list(CONTADORES.values())
+    inicio_sql, fim_sql = _upsert(modelo, conexao, campos_chave + contadores)
+    marcador = '(' + ', '.join(['%s'] * (len(campos) + len(contadores))) + ')'
+    linhas = list(totais.items())
+
+    with conexao.cursor() as cursor:
+        for inicio in range(0, len(linhas), TAMANHO_BLOCO_AGREGADOS):
+            bloco = linhas[inicio:inicio + TAMANHO_BLOCO_AGREGADOS]
+            parametros = []
+            for chave, valores in bloco:
+                parametros.extend(campo.get_db_prep_value(valor, conexao) for campo, valor in zip(campos, chave))
+                parametros.extend(valores.get(contador, 0) for contador in contadores)
+            cursor.execute(f'{inicio_sql} VALUES {", ".join([marcador] * len(bloco))} {fim_sql}', parametros)
+
+
+def _somar_consulta(modelo, consulta):
+    """
+    Soma a 'modelo' o resultado de 'consulta' (values(...).annotate(contadores)
+    do histórico) sem passar pelo Python: INSERT ... SELECT ... GROUP BY.
+    """
+    conexao = connections[router.db_for_write(modelo)]
+    compilador = consulta.query.get_compiler(connection=conexao)
+    sql, parametros = compilador.as_sql()
+    # Colunas na ordem do SELECT gerado (os apelidos são os nomes do values()/annotate())
+    inicio_sql, fim_sql = _upsert(modelo, conexao, [apelido for _, _, apelido in compilador.select])
+    with conexao.cursor() as cursor:
+        cursor.execute(f'{inicio_sql} {sql} {fim_sql}', parametros)
+
+
+def registrar(registros):
+    """
+    Soma os registros de histórico recém-gravados aos agregados. Chamado
+    dentro da transação da movimentação.
+    """
+    por_hora, por_chave, por_usuario, por_grupo = (defaultdict(lambda: defaultdict(int)) for _ in range(4))
+
+    chave_ids = {registro.chave_id for registro in registros if registro.chave_id is not None}
+    grupos_da_chave = defaultdict(list)
+    for chave_id, grupo_id in Chave.grupos_permissao.through.objects.filter(
+        chave_id__in=chave_ids
+    ).values_list('chave_id', 'group_id'):
+        grupos_da_chave[chave_id].append(grupo_id)
+
+    for registro in registros:
+        contador = CONTADORES[registro.acao]
+        dia = timezone.localtime(registro.data_hora).date()
+        hora = registro.data_hora.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+        por_hora[(hora,)][contador] += 1
+        if registro.chave_id is not None:
+            por_chave[(registro.chave_id, dia)][contador] += 1
+            for grupo_id in grupos_da_chave[registro.chave_id]:
+                por_grupo[(grupo_id, dia)][contador] += 1
+        if registro.usuario_id is not None:
+            por_usuario[(registro.usuario_id, dia)][contador] += 1
+
+    _somar(UsoHora, ['hora'], por_hora)
+    _somar(UsoChaveDia, ['chave', 'dia'], por_chave)
+    _somar(UsoUsuarioDia, ['usuario', 'dia'], por_usuario)
+    _somar(UsoGrupoDia, ['grupo', 'dia'], por_grupo)
+
+
+def _contagens():
+    # Contadores por ação para um values(...).annotate(...) do histórico
+    return {
+        contador: Count('pk', filter=Q(acao=acao))
+        for acao, contador in CONTADORES.items()
+    }
+
+
+def _agregar(consulta, campos_chave):
+    # GROUP BY 'campos_chave' com os contadores por ação
+    return consulta.values(*campos_chave).annotate(**_contagens()).order_by()
+
+
+def _agregar_intervalo(historico, primeiro_dia, ultimo_dia):
+    # Soma aos agregados os registros de 'historico' (principal ou arquivo) de primeiro_dia a ultimo_dia
+    registros = historico.objects.filter(
+        data_hora__gte=inicio_do_dia(primeiro_dia), data_hora__lt=inicio_do_dia(ultimo_dia + timedelta(days=1))
+    )
+    _somar_consulta(UsoHora, _agregar(registros.annotate(hora=TruncHour('data_hora', tzinfo=dt_timezone.utc)), ['hora']))
+
+    # Agregados diários: uma consulta por dia, com o dia como constante (sem converter
+    # cada data_hora para o dia local, o que no SQLite é uma função Python por linha)
+    dia = primeiro_dia
+    while dia <= ultimo_dia:
+        do_dia = historico.objects.filter(
+            data_hora__gte=inicio_do_dia(dia), data_hora__lt=inicio_do_dia(dia + timedelta(days=1))
+        ).annotate(dia=Value(dia, output_field=DateField()))
+        _somar_consulta(UsoChaveDia, _agregar(do_dia.filter(chave__isnull=False), ['chave', 'dia']))
+        _somar_consulta(UsoUsuarioDia, _agregar(do_dia.filter(usuario__isnull=False), ['usuario', 'dia']))
+        # Uma linha por (registro, grupo da chave): chaves com vários grupos contam em cada um
+        por_grupo = do_dia.filter(chave__grupos_permissao__isnull=False).annotate(grupo=F('chave__grupos_permissao'))
+        _somar_consulta(UsoGrupoDia, _agregar(por_grupo, ['grupo', 'dia']))
+        dia += timedelta(days=1)
+
+
+def reconstruir(dias_por_lote=DIAS_POR_LOTE, progresso=None):
+    """
+    Apaga e recalcula todos os agregados a partir do histórico (tabela
+    principal e arquivo), 'dias_por_lote' dias por vez. Roda numa única
+    transação: as movimentações feitas durante a reconstrução esperam por
+    ela (SQLite) ou entram depois dela, sem contagem dupla.
+
+    'progresso(primeiro_dia, ultimo_dia)' é chamado a cada lote. Retorna a
+    quantidade de lotes.
+    """
+    lotes = 0
+    with transaction.atomic(using=router.db_for_write(UsoHora)):
+        for modelo in (UsoHora, UsoChaveDia, UsoUsuarioDia, UsoGrupoDia):
+            modelo.objects.all().delete()
+
+        for historico in (HistoricoEmprestimoArquivo, HistoricoEmprestimo):
+            extremos = historico.objects.aggregate(primeiro=Min('data_hora'), ultimo=Max('data_hora'))
+            if extremos['primeiro'] is None:
+                continue
+            dia = timezone.localtime(extremos['primeiro']).date()
+            ultimo = timezone.localtime(extremos['ultimo']).date()
+            while dia <= ultimo:
+                fim = min(dia + timedelta(days=dias_por_lote - 1), ultimo)
+                _agregar_intervalo(historico, dia, fim)
+                lotes += 1
+                if progresso:
+                    progresso(dia, fim)
+                dia = fim + timedelta(days=1)
+    return lotes
+
+
+def _ranking(modelo, campo, campo_nome, desde, limite):
+    # Os 'limite' mais movimentados (retiradas) desde 'desde', agrupados por id
+    return list(
+        modelo.objects.filter(dia__gte=desde)
+        .values(campo, nome=F(campo_nome))
+        .annotate(retiradas=Sum('adquiridas'), devolucoes=Sum('devolucoes'))
+        .order_by('-retiradas')[:limite]
+    )
+
+
+def painel(dias=30, limite=10):
+    """
+    Dados do painel de análise para os últimos 'dias' dias, lidos só dos agregados.
+    """
+    hoje = timezone.localdate()
+    desde = hoje - timedelta(days=dias - 1)
+    por_hora = UsoHora.objects.filter(hora__gte=inicio_do_dia(desde))
+
+    totais = por_hora.aggregate(
+        retiradas=Sum('adquiridas'), devolucoes=Sum('devolucoes'), transferencias=Sum('transferidas')
+    )
+
+    # Mapa de calor: retiradas por dia da semana (1 = segunda) e hora do dia, no horário local
+    celulas = {
+        (linha['dia_semana'], linha['hora_dia']): linha['retiradas']
+        for linha in por_hora.annotate(
+            dia_semana=ExtractIsoWeekDay('hora'), hora_dia=ExtractHour('hora')
+        ).values('dia_semana', 'hora_dia').annotate(retiradas=Sum('adquiridas')).order_by()
+    }
+    maximo = max(celulas.values(), default=0) or 1
+    mapa_calor = [
+        {
+            'dia': nome,
+            'horas': [
+                {'hora': hora, 'retiradas': celulas.get((numero, hora), 0),
+                 'intensidade': f'{celulas.get((numero, hora), 0) / maximo:.2f}'}
+                for hora in range(24)
+            ],
+        }
+        for numero, nome in enumerate(DIAS_DA_SEMANA, start=1)
+    ]
+
+    retiradas_por_hora = defaultdict(int)
+    for (_, hora), retiradas in celulas.items():
+        retiradas_por_hora[hora] += retiradas
+    horarios_pico = sorted(
+        ({'hora': hora, 'retiradas': total} for hora, total in retiradas_por_hora.items() if total),
+        key=lambda item: item['retiradas'], reverse=True,
+    )[:3]
+
+    return {
+        'dias': dias,
+        'desde': desde,
+        'totais': {chave: valor or 0 for chave, valor in totais.items()},
+        'mapa_calor': mapa_calor,
+        'horarios_pico': horarios_pico,
+        'rankings': [
+            ('Chaves mais retiradas', _ranking(UsoChaveDia, 'chave', 'chave__nome', desde, limite)),
+            ('Usuários que mais retiraram', _ranking(UsoUsuarioDia, 'usuario', 'usuario__username', desde, limite)),
+            ('Grupos com mais retiradas', _ranking(UsoGrupoDia, 'grupo', 'grupo__name', desde, limite)),
+        ],
+    }
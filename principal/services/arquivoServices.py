@@ -0,0 +1,121 @@
+# Author: João Victor Marques Favero
+"""
+Arquivo do histórico: meses antigos saem da tabela principal (quente) para
+HistoricoEmprestimoArquivo, com um resumo por mês em ResumoArquivoMensal.
+
+A tabela quente guarda só os últimos HISTORICO_DIAS_QUENTES dias (meses
+inteiros); as telas de uso diário (index, últimos empréstimos, histórico sem
+filtro de data) leem só dela, e o custo não cresce com os anos de dados.
+A busca do histórico consulta o arquivo apenas quando o intervalo de datas
+pedido começa antes do fim do arquivo (historicoServices.partes_historico).
+
+Cada mês é movido numa transação: INSERT ... SELECT no arquivo, DELETE na
+tabela quente e o resumo do mês.
+"""
+
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from principal.models import HistoricoEmprestimo, HistoricoEmprestimoArquivo, ResumoArquivoMensal
+from principal.services.historicoServices import inicio_do_dia
+
+CHAVE_LIMITE_ARQUIVO = 'principal:limite_arquivo'
+
+# Validade (segundos) do limite do arquivo em cache, em cada processo
+TIMEOUT_LIMITE_ARQUIVO = 60
+
+# Colunas copiadas, na ordem das duas tabelas
+COLUNAS = ('id', 'chave_id', 'usuario_id', 'data_hora', 'acao')
+
+
+def proximo_mes(mes):
+    """
+    Primeiro dia do mês seguinte a 'mes' (date).
+    """
+    return (mes.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def limite_arquivo():
+    """
+    Início (datetime com fuso) do período que está na tabela quente: o
+    primeiro dia depois do último mês arquivado. None se nada foi arquivado.
+    """
+    limite = cache.get(CHAVE_LIMITE_ARQUIVO)
+    if limite is None:
+        ultimo_mes = ResumoArquivoMensal.objects.order_by('-mes').values_list('mes', flat=True).first()
+        # Numa tupla: "nada arquivado" (None) também fica em cache
+        limite = (inicio_do_dia(proximo_mes(ultimo_mes)) if ultimo_mes else None,)
+        cache.set(CHAVE_LIMITE_ARQUIVO, limite, TIMEOUT_LIMITE_ARQUIVO)
+    return limite[0]
+
+
+def corte(dias=None):
+    """
+    Primeiro dia (date) do mês que contém o dia de 'dias' atrás: tudo antes
+    dele pode ir para o arquivo. Só meses inteiros são arquivados.
+    """
+    if dias is None:
+        dias = getattr(settings, 'HISTORICO_DIAS_QUENTES', 365)
+    return (timezone.localdate() - timedelta(days=dias)).replace(day=1)
+
+
+def meses_para_arquivar(dias=None):
+    """
+    Lista de (mês, registros) da tabela quente anteriores ao corte.
+    """
+    limite = corte(dias)
+    antigos = HistoricoEmprestimo.objects.filter(data_hora__lt=inicio_do_dia(limite))
+    primeiro = antigos.aggregate(primeiro=Min('data_hora'))['primeiro']
+    if primeiro is None:
+        return []
+
+    meses = []
+    mes = timezone.localtime(primeiro).date().replace(day=1)
+    while mes < limite:
+        total = antigos.filter(
+            data_hora__gte=inicio_do_dia(mes), data_hora__lt=inicio_do_dia(proximo_mes(mes))
+        ).count()
+        if total:
+            meses.append((mes, total))
+        mes = proximo_mes(mes)
+    return meses
+
+
+def _resumo(mes):
+    # Totais do mês lidos do próprio arquivo (vale também para um mês arquivado em partes)
+    return HistoricoEmprestimoArquivo.objects.filter(
+        data_hora__gte=inicio_do_dia(mes), data_hora__lt=inicio_do_dia(proximo_mes(mes))
+    ).aggregate(
+        total=Count('pk'),
+        adquiridas=Count('pk', filter=Q(acao='adquirida')),
+        devolucoes=Count('pk', filter=Q(acao='devolucao')),
+        transferidas=Count('pk', filter=Q(acao='transferida')),
+    )
+
+
+def arquivar_mes(mes):
+    """
+    Move os registros de 'mes' (date, primeiro dia) para o arquivo e atualiza
+    o resumo do mês. Retorna a quantidade de registros movidos.
+    """
+    quentes = HistoricoEmprestimo.objects.filter(
+        data_hora__gte=inicio_do_dia(mes), data_hora__lt=inicio_do_dia(proximo_mes(mes))
+    ).order_by()
+    banco = router.db_for_write(HistoricoEmprestimo)
+    tabela = connections[banco].ops.quote_name(HistoricoEmprestimoArquivo._meta.db_table)
+
+    with transaction.atomic(using=banco):
+        # INSERT ... SELECT: as linhas não passam pelo Python
+        sql, parametros = quentes.values_list(*COLUNAS).query.sql_with_params()
+        with connections[banco].cursor() as cursor:
+            cursor.execute(f'INSERT INTO {tabela} ({", ".join(COLUNAS)}) {sql}', parametros)
+            movidos = cursor.rowcount
+        quentes.delete()
+        ResumoArquivoMensal.objects.update_or_create(mes=mes, defaults=_resumo(mes))
+
+    cache.delete(CHAVE_LIMITE_ARQUIVO)
+    return movidos
@@ -0,0 +1,122 @@
+# Author: João Victor Marques Favero
+"""
+Cache do usuário autenticado, por processo.
+
+Toda view exige login: sem cache, cada requisição lê o Usuario no banco
+(e as telas do admin ainda leem as permissões). O UsuarioEmCacheBackend
+(principal.backends) guarda aqui, por AUTENTICACAO_CACHE_SEGUNDOS, o usuário
+com os ids dos seus grupos e, depois da primeira verificação, as permissões.
+
+Invalidação (principal.signals): edição ou exclusão do usuário, mudança nos
+seus grupos ou permissões e qualquer mudança em grupos ou permissões. Além de
+apagar a entrada deste processo, ela grava um marcador no cache do Django;
+cada busca confere os marcadores (uma leitura no cache, sem banco). Com cache
+compartilhado (CACHE_PERFIL 'arquivo' ou 'redis') os outros processos veem a
+mudança na hora; com cache em memória, em até AUTENTICACAO_CACHE_SEGUNDOS.
+"""
+
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from principal.services import metricasServices
+
+# Marcador de grupos/permissões (vale para todos os usuários) e o de cada usuário
+CHAVE_GERACAO = 'principal:geracao_usuarios'
+PREFIXO_USUARIO = 'principal:versao_usuario:'
+
+
+class _Entrada:
+    __slots__ = ('usuario', 'grupo_ids', 'permissoes', 'versao', 'expira')
+
+    def __init__(self, usuario, grupo_ids, versao, expira):
+        self.usuario = usuario
+        self.grupo_ids = grupo_ids
+        self.permissoes = None  # (do usuário, dos grupos, todas), preenchidas no primeiro uso
+        self.versao = versao
+        self.expira = expira
+
+
+_entradas = {}  # pk -> _Entrada
+_lock = threading.Lock()
+
+
+def validade():
+    # 0 desativa o cache (o backend se comporta como o ModelBackend)
+    return getattr(settings, 'AUTENTICACAO_CACHE_SEGUNDOS', 30)
+
+
+def _maximo():
+    return getattr(settings, 'AUTENTICACAO_CACHE_MAXIMO', 1000)
+
+
+def _versao(pk):
+    chave_usuario = f'{PREFIXO_USUARIO}{pk}'
+    valores = cache.get_many([CHAVE_GERACAO, chave_usuario])
+    return valores.get(CHAVE_GERACAO, 0), valores.get(chave_usuario, 0)
+
+
+def obter(pk, carregar):
+    """
+    Usuário 'pk' do cache do processo ou, na falta, de 'carregar(pk)'
+    (retorna o usuário ou None). Cada chamada recebe a sua cópia, com o
+    atributo 'grupo_ids' (frozenset) e as permissões já lidas.
+    """
+    versao = _versao(pk)
+    entrada = _entradas.get(pk)
+    if entrada is not None and entrada.versao == versao and entrada.expira > time.monotonic():
+        metricasServices.contar('chaves_cache_usuario_total', resultado='acerto')
+        return _copia(entrada)
+
+    metricasServices.contar('chaves_cache_usuario_total', resultado='falta')
+    usuario = carregar(pk)
+    if usuario is None:
+        return None
+    entrada = _Entrada(
+        usuario, frozenset(usuario.groups.values_list('pk', flat=True)), versao, time.monotonic() + validade()
+    )
+    with _lock:
+        _entradas.pop(pk, None)
+        while len(_entradas) >= _maximo():
+            _entradas.pop(next(iter(_entradas)))  # A mais antiga
+        _entradas[pk] = entrada
+    return _copia(entrada)
+
+
+def _copia(entrada):
+    usuario = copy.copy(entrada.usuario)
+    usuario.grupo_ids = entrada.grupo_ids
+    if entrada.permissoes is not None:
+        usuario._user_perm_cache, usuario._group_perm_cache, usuario._perm_cache = entrada.permissoes
+    return usuario
+
+
+def guardar_permissoes(usuario):
+    """
+    Guarda na entrada de 'usuario' as permissões calculadas pelo ModelBackend
+    (atributos _user_perm_cache, _group_perm_cache e _perm_cache).
+    """
+    entrada = _entradas.get(usuario.pk)
+    if entrada is None or entrada.permissoes is not None:
+        return
+    if not all(hasattr(usuario, atributo) for atributo in ('_user_perm_cache', '_group_perm_cache', '_perm_cache')):
+        return
+    entrada.permissoes = (
+        usuario._user_perm_cache,
+        usuario._group_perm_cache,
+        usuario._perm_cache,
+    )
+
+
+def invalidar_usuario(pk):
+    with _lock:
+        _entradas.pop(pk, None)
+    cache.set(f'{PREFIXO_USUARIO}{pk}', time.time_ns(), None)
+
+
+def invalidar_todos():
+    with _lock:
+        _entradas.clear()
+    cache.set(CHAVE_GERACAO, time.time_ns(), None)
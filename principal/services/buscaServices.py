@@ -0,0 +1,193 @@
+# Author: João Victor Marques Favero
+"""
+Busca textual de chaves e usuários.
+
+No SQLite, usa tabelas virtuais FTS5 (external content) mantidas em sincronia
+por triggers sobre principal_chave e principal_usuario, inclusive em
+bulk_create/update. O tokenizador remove acentos ("laboratorio" encontra
+"Laboratório") e cada termo é buscado por prefixo. Em outros bancos, ou se o
+SQLite não tiver FTS5, a busca cai no __icontains do ORM.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Tabelas FTS5: nome -> (tabela de conteúdo, colunas indexadas)
+TABELAS_FTS = {
+    'principal_chave_fts': ('principal_chave', ('nome', 'descricao')),
+    'principal_usuario_fts': ('principal_usuario', ('username', 'first_name', 'last_name')),
+}
+
+# Cache por alias de banco: a tabela FTS existe?
+_fts_disponivel = {}
+
+
+def _sql_instalacao(tabela_fts, tabela, colunas):
+    """
+    Comandos (idempotentes) que criam a tabela FTS5 e os triggers de sincronia.
+    """
+    lista = ', '.join(colunas)
+    novos = ', '.join(f'new.{c}' for c in colunas)
+    antigos = ', '.join(f'old.{c}' for c in colunas)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {tabela_fts} USING fts5("
+        f"{lista}, content='{tabela}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+
+        f"CREATE TRIGGER IF NOT EXISTS {tabela_fts}_ai AFTER INSERT ON {tabela} BEGIN "
+        f"INSERT INTO {tabela_fts}(rowid, {lista}) VALUES (new.id, {novos}); END",
+
+        f"CREATE TRIGGER IF NOT EXISTS {tabela_fts}_ad AFTER DELETE ON {tabela} BEGIN "
+        f"INSERT INTO {tabela_fts}({tabela_fts}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); END",
+
+        # Só dispara quando uma coluna indexada aparece no UPDATE (ex.: não no status da chave)
+        f"CREATE TRIGGER IF NOT EXISTS {tabela_fts}_au AFTER UPDATE OF {lista} ON {tabela} BEGIN "
+        f"INSERT INTO {tabela_fts}({tabela_fts}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); "
+        f"INSERT INTO {tabela_fts}(rowid, {lista}) VALUES (new.id, {novos}); END",
+    ]
+
+
+def sqlite_tem_fts5(connection):
+    """
+    True se o SQLite desta conexão foi compilado com FTS5.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def instalar_busca(connection):
+    """
+    Cria (ou recria) as tabelas FTS5 e os triggers.
+
+    Quando algum trigger está faltando, por exemplo porque uma migration
+    reconstruiu a tabela de origem, o índice é reconstruído a partir do conteúdo.
+    Não faz nada fora do SQLite ou sem FTS5.
+    """
+    if connection.vendor != 'sqlite' or not sqlite_tem_fts5(connection):
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers_existentes = {linha[0] for linha in cursor.fetchall()}
+
+        for tabela_fts, (tabela, colunas) in TABELAS_FTS.items():
+            faltando = {f'{tabela_fts}_ai', f'{tabela_fts}_ad', f'{tabela_fts}_au'} - triggers_existentes
+            for comando in _sql_instalacao(tabela_fts, tabela, colunas):
+                cursor.execute(comando)
+            if faltando:
+                cursor.execute(f"INSERT INTO {tabela_fts}({tabela_fts}) VALUES ('rebuild')")
+
+    _fts_disponivel.pop(connection.alias, None)
+
+
+def remover_busca(connection):
+    """
+    Remove as tabelas FTS5 e os triggers (reverso de instalar_busca).
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for tabela_fts in TABELAS_FTS:
+            for sufixo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {tabela_fts}_{sufixo}')
+            cursor.execute(f'DROP TABLE IF EXISTS {tabela_fts}')
+    _fts_disponivel.pop(connection.alias, None)
+
+
+def fts_disponivel(using='default'):
+    """
+    True se as tabelas FTS5 existem no banco 'using' (resultado em cache).
+    """
+    if using not in _fts_disponivel:
+        connection = connections[using]
+        _fts_disponivel[using] = (
+            connection.vendor == 'sqlite'
+            and set(TABELAS_FTS) <= set(connection.introspection.table_names())
+        )
+    return _fts_disponivel[using]
+
+
+def expressao_fts(termo, colunas=None):
+    """
+    Converte o texto digitado numa consulta FTS5: cada palavra vira um
+    prefixo entre aspas ("lab"* "red"*), todas obrigatórias. Com 'colunas',
+    a busca fica restrita a elas ({nome} : ("lab"* "red"*)).
+    Retorna None se não houver palavras.
+    """
+    palavras = re.findall(r'\w+', termo or '')
+    if not palavras:
+        return None
+    expressao = ' '.join(f'"{palavra}"*' for palavra in palavras)
+    if colunas:
+        expressao = f"{{{' '.join(colunas)}}} : ({expressao})"
+    return expressao
+
+
+def _ids_fts(tabela_fts, expressao):
+    # Subconsulta com os ids que casam com a expressão
+    return RawSQL(f'SELECT rowid FROM {tabela_fts} WHERE {tabela_fts} MATCH %s', (expressao,))
+
+
+def filtrar_chaves(queryset, termo):
+    """
+    Filtra um queryset de Chave pelo texto no nome. A descrição também está
+    na tabela FTS, mas fica fora da busca (os filtros das telas são por nome).
+    """
+    expressao = expressao_fts(termo, colunas=('nome',))
+    if expressao is None:
+        return queryset
+    if fts_disponivel(queryset.db):
+        return queryset.filter(pk__in=_ids_fts('principal_chave_fts', expressao))
+    return queryset.filter(nome__icontains=termo)
+
+
+def filtrar_lista_chaves(queryset, parametros):
+    """
+    Filtros da tela de gerenciamento (chave_nome, status, excluido), também
+    usados na folha de etiquetas.
+    """
+    chave_nome = parametros.get('chave_nome')
+    status = parametros.get('status')
+    excluido = parametros.get('excluido')
+
+    if chave_nome:
+        queryset = filtrar_chaves(queryset, chave_nome)
+    if status:
+        queryset = queryset.filter(status=status)
+    if excluido == 'sim':
+        queryset = queryset.filter(excluido=True)
+    elif excluido == 'nao':
+        queryset = queryset.filter(excluido=False)
+    return queryset
+
+
+def filtrar_usuarios(queryset, termo, ordenar_por_relevancia=False):
+    """
+    Filtra um queryset de Usuario pelo texto em username, nome ou sobrenome.
+
+    Com 'ordenar_por_relevancia', os resultados vêm do mais relevante para o
+    menos relevante (só com FTS; no ORM mantém a ordem do queryset).
+    """
+    expressao = expressao_fts(termo)
+    if expressao is None:
+        return queryset
+    if fts_disponivel(queryset.db):
+        if ordenar_por_relevancia:
+            # Junção direta com a tabela FTS: o SQLite parte do MATCH e usa o bm25 (rank)
+            tabela = queryset.model._meta.db_table
+            return queryset.extra(
+                tables=['principal_usuario_fts'],
+                where=[f'principal_usuario_fts.rowid = {tabela}.id', 'principal_usuario_fts MATCH %s'],
+                params=[expressao],
+                select={'relevancia': 'principal_usuario_fts.rank'},
+            ).order_by('relevancia', 'username')
+        return queryset.filter(pk__in=_ids_fts('principal_usuario_fts', expressao))
+    return queryset.filter(
+        Q(username__icontains=termo) |
+        Q(first_name__icontains=termo) |
+        Q(last_name__icontains=termo)
+    )
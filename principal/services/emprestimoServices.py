@@ -0,0 +1,235 @@
+# Author: João Victor Marques Favero
+"""
+Serviço de movimentação de chaves (retirada e devolução).
+
+Toda mudança de posse passa por aqui. A troca de estado da chave é feita
+com um único UPDATE condicional (compare-and-swap sobre status/portador)
+e os registros de histórico são inseridos em lote (e somados aos agregados
+de uso e às sessões de empréstimo), tudo na mesma transação.
+Se outra requisição alterou a chave entre a leitura e a escrita, o UPDATE
+não afeta nenhuma linha e o serviço levanta ConflitoEmprestimo, sem gravar nada.
+"""
+
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q
+from principal.models import Chave, HistoricoEmprestimo
+from principal.services import agregadosServices, eventosServices, sessaoServices, versaoServices
+
+
+class ConflitoEmprestimo(Exception):
+    """
+    A chave foi movimentada por outra requisição depois de ter sido lida.
+    """
+
+
+# Chaves por UPDATE condicional nas operações em lote
+TAMANHO_BLOCO_LOTE = 200
+
+# Resultado por chave de uma operação em lote
+ResultadoLote = namedtuple('ResultadoLote', ['chave_id', 'chave', 'sucesso', 'mensagem'])
+
+
+def _apos_commit(registros):
+    """
+    Efeitos colaterais de registros já confirmados no banco.
+    """
+    # Versão do histórico (ETag das telas e do polling)
+    versaoServices.registrar_alteracao_historico(registros)
+    # Feed ao vivo (SSE) das telas de staff
+    eventosServices.publicar(registros)
+
+
+def _trocar_estado(chave, novo_status, novo_portador):
+    """
+    UPDATE condicional: só altera a chave se status/portador (e a versão do
+    QR Code) ainda forem os que foram lidos em 'chave'. Avança a versão da
+    linha (cache das tabelas de chaves). Retorna True se a troca aconteceu.
+    """
+    atualizadas = Chave.objects.filter(
+        pk=chave.pk,
+        status=chave.status,
+        portador_atual_id=chave.portador_atual_id,
+        versao_qrcode=chave.versao_qrcode,
+    ).update(status=novo_status, portador_atual=novo_portador, versao=F('versao') + 1)
+    return atualizadas == 1
+
+
+def _inserir(registros, reaproveitado=None):
+    """
+    Grava 'registros' com um INSERT em lote. O registro 'reaproveitado'
+    (vindo de HistoricoEmprestimo.save()) passa pelo save padrão do modelo:
+    recebe a pk e dispara os sinais pre_save/post_save.
+    """
+    HistoricoEmprestimo.objects.bulk_create([registro for registro in registros if registro is not reaproveitado])
+    if reaproveitado is not None:
+        reaproveitado.gravar()
+
+
+def registrar_aquisicao(chave, usuario, registro=None):
+    """
+    Registra a retirada de 'chave' por 'usuario'.
+
+    Se outro usuário estava com a chave, grava também a linha 'transferida'
+    em nome do portador anterior. Na transação: o UPDATE da chave, um INSERT
+    em lote no histórico, a leitura dos grupos da chave, um upsert por
+    agregado de uso e a sessão de empréstimo (contagem fixada nos testes).
+
+    'registro' permite reaproveitar uma instância de HistoricoEmprestimo já
+    criada (usado por HistoricoEmprestimo.save()). Retorna o registro de aquisição.
+    """
+    portador_anterior_id = chave.portador_atual_id
+
+    reaproveitado = registro
+    if registro is None:
+        registro = HistoricoEmprestimo(chave=chave, usuario=usuario, acao='adquirida')
+
+    registros = []
+    # Se havia portador e é diferente do novo usuário, registra transferência
+    if portador_anterior_id is not None and portador_anterior_id != usuario.pk:
+        registros.append(HistoricoEmprestimo(
+            chave=chave,
+            usuario_id=portador_anterior_id,
+            acao='transferida'
+        ))
+    registros.append(registro)
+
+    with transaction.atomic():
+        if not _trocar_estado(chave, 'em_uso', usuario):
+            raise ConflitoEmprestimo(f'A chave "{chave.nome}" foi movimentada por outra pessoa.')
+        _inserir(registros, reaproveitado)
+        agregadosServices.registrar(registros)
+        sessaoServices.registrar(registros)
+        transaction.on_commit(lambda: _apos_commit(registros))
+
+    # Mantém a instância em memória coerente com o banco
+    chave.status = 'em_uso'
+    chave.portador_atual = usuario
+    return registro
+
+
+def registrar_devolucao(chave, registro=None):
+    """
+    Registra a devolução de 'chave' à portaria, em nome do portador atual.
+
+    A chave precisa estar em uso; devolver uma chave já disponível (ex.: duplo
+    clique em "Receber") é tratado como conflito. Retorna o registro de devolução.
+    """
+    if chave.status != 'em_uso':
+        raise ConflitoEmprestimo(f'A chave "{chave.nome}" já está disponível.')
+
+    reaproveitado = registro
+    if registro is None:
+        registro = HistoricoEmprestimo(chave=chave, usuario_id=chave.portador_atual_id, acao='devolucao')
+
+    with transaction.atomic():
+        if not _trocar_estado(chave, 'disponivel', None):
+            raise ConflitoEmprestimo(f'A chave "{chave.nome}" foi movimentada por outra pessoa.')
+        _inserir([registro], reaproveitado)
+        agregadosServices.registrar([registro])
+        sessaoServices.registrar([registro])
+        transaction.on_commit(lambda: _apos_commit([registro]))
+
+    chave.status = 'disponivel'
+    chave.portador_atual = None
+    return registro
+
+
+def _trocar_estado_em_lote(chaves, novo_status, novo_portador):
+    """
+    UPDATE único para várias chaves, condicionado ao estado lido de cada uma
+    (equivale ao compare-and-swap de _trocar_estado, linha a linha).
+    """
+    atualizadas = 0
+    # Em blocos, para a condição não estourar o limite de profundidade de expressões do SQLite
+    for inicio in range(0, len(chaves), TAMANHO_BLOCO_LOTE):
+        condicao = reduce(or_, (
+            Q(pk=chave.pk, status=chave.status, portador_atual_id=chave.portador_atual_id,
+              versao_qrcode=chave.versao_qrcode)
+            for chave in chaves[inicio:inicio + TAMANHO_BLOCO_LOTE]
+        ))
+        atualizadas += Chave.objects.filter(condicao).update(
+            status=novo_status, portador_atual=novo_portador, versao=F('versao') + 1
+        )
+    return atualizadas == len(chaves)
+
+
+def _executar_lote(chave_ids, preparar, novo_status, novo_portador):
+    """
+    Esqueleto das operações em lote: trava as chaves uma vez, deixa 'preparar'
+    decidir cada uma, grava todo o histórico com um bulk_create e aplica a
+    mudança de estado com um único UPDATE.
+
+    'preparar(chave)' retorna (registros, mensagem) ou (None, motivo) para ignorar.
+    """
+    chave_ids = list(dict.fromkeys(chave_ids))  # Remove repetidos, mantém a ordem
+    resultados = {}
+
+    with transaction.atomic():
+        chaves = {
+            chave.pk: chave
+            for chave in Chave.objects.select_for_update().filter(pk__in=chave_ids)
+        }
+
+        alteradas, registros = [], []
+        for chave_id in chave_ids:
+            chave = chaves.get(chave_id)
+            if chave is None:
+                resultados[chave_id] = ResultadoLote(chave_id, None, False, 'Chave não encontrada.')
+                continue
+            novos, mensagem = preparar(chave)
+            if novos is None:
+                resultados[chave_id] = ResultadoLote(chave_id, chave, False, mensagem)
+                continue
+            alteradas.append(chave)
+            registros.extend(novos)
+            resultados[chave_id] = ResultadoLote(chave_id, chave, True, mensagem)
+
+        if alteradas:
+            if not _trocar_estado_em_lote(alteradas, novo_status, novo_portador):
+                # Alguma chave mudou depois da leitura: desfaz o lote inteiro
+                raise ConflitoEmprestimo('Algumas chaves foram movimentadas durante a operação. Nada foi alterado.')
+            HistoricoEmprestimo.objects.bulk_create(registros)
+            agregadosServices.registrar(registros)
+            sessaoServices.registrar(registros)
+            transaction.on_commit(lambda: _apos_commit(registros))
+
+    for chave in alteradas:
+        chave.status = novo_status
+        chave.portador_atual = novo_portador
+    return [resultados[chave_id] for chave_id in chave_ids]
+
+
+def receber_em_lote(chave_ids):
+    """
+    Devolve à portaria todas as chaves em uso entre 'chave_ids'.
+    Chaves já disponíveis são ignoradas. Retorna uma lista de ResultadoLote.
+    """
+    def preparar(chave):
+        if chave.status != 'em_uso':
+            return None, 'Já estava disponível.'
+        registro = HistoricoEmprestimo(chave=chave, usuario_id=chave.portador_atual_id, acao='devolucao')
+        return [registro], 'Recebida.'
+
+    return _executar_lote(chave_ids, preparar, 'disponivel', None)
+
+
+def entregar_em_lote(chave_ids, usuario):
+    """
+    Entrega todas as chaves de 'chave_ids' a 'usuario', registrando
+    transferências quando outra pessoa estava com a chave.
+    Retorna uma lista de ResultadoLote.
+    """
+    def preparar(chave):
+        if chave.portador_atual_id == usuario.pk:
+            return None, 'Já estava com este usuário.'
+        registros = []
+        if chave.portador_atual_id is not None:
+            registros.append(HistoricoEmprestimo(chave=chave, usuario_id=chave.portador_atual_id, acao='transferida'))
+        registros.append(HistoricoEmprestimo(chave=chave, usuario=usuario, acao='adquirida'))
+        return registros, 'Transferida.' if len(registros) > 1 else 'Entregue.'
+
+    return _executar_lote(chave_ids, preparar, 'em_uso', usuario)
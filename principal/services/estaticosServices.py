@@ -0,0 +1,205 @@
+# Author: João Victor Marques Favero
+"""
+Arquivos estáticos para produção: minificação e compressão (gzip e, se o
+pacote 'brotli' estiver instalado, brotli) dos arquivos coletados, a
+biblioteca de leitura de QR Code (html5-qrcode) servida pelo próprio sistema
+e o relatório de bytes transferidos por página.
+
+O passo de build é o collectstatic com o storage EstaticosComprimidos
+(principal.storage), usado quando DEBUG = False: os arquivos ganham nomes com
+o hash do conteúdo e variantes .gz/.br ao lado; o EstaticosMiddleware os
+serve com cache 'immutable'. O comando preparar_estaticos faz tudo isso e
+mostra o relatório.
+"""
+
+import gzip
+import os
+import re
+import urllib.request
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+try:
+    import brotli
+except ImportError:  # Opcional: pip install brotli
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # Opcional: pip install rjsmin (sem ele, só comentários de linha e indentação saem)
+    rjsmin = None
+
+# Diretório estático do app (principal/static)
+DIRETORIO_ESTATICO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+# Biblioteca do scanner por câmera: versão fixa, baixada para o diretório estático do app
+HTML5_QRCODE_VERSAO = '2.3.8'
+HTML5_QRCODE = f'vendor/html5-qrcode-{HTML5_QRCODE_VERSAO}.min.js'
+HTML5_QRCODE_CDN = f'https://unpkg.com/html5-qrcode@{HTML5_QRCODE_VERSAO}/html5-qrcode.min.js'
+
+# Extensões que valem a pena comprimir (imagens e fontes já são comprimidas)
+EXTENSOES_COMPRIMIVEIS = {'.css', '.js', '.mjs', '.json', '.svg', '.txt', '.html', '.map', '.xml', '.ico'}
+
+# Abaixo disso a compressão não compensa os cabeçalhos
+TAMANHO_MINIMO_COMPRESSAO = 256
+
+# Arquivos carregados por toda página (base.html) e pelo scanner, para o relatório
+ARQUIVOS_PAGINA = ('styles/style.css', 'js/main.js')
+ARQUIVOS_SCANNER = (HTML5_QRCODE,)
+
+_COMENTARIO_CSS = re.compile(r'/\*.*?\*/', re.DOTALL)
+_ESPACOS = re.compile(r'\s+')
+_ESPACO_SEPARADOR_CSS = re.compile(r'\s*([{};,>])\s*')
+
+
+def minificar_css(texto):
+    """
+    Remove comentários e espaços desnecessários de CSS. Não mexe em ':' (o
+    espaço em 'a :hover' tem significado) nem em strings.
+    """
+    texto = _COMENTARIO_CSS.sub('', texto)
+    texto = _ESPACOS.sub(' ', texto)
+    texto = _ESPACO_SEPARADOR_CSS.sub(r'\1', texto)
+    return texto.replace(';}', '}').strip()
+
+
+def minificar_js(texto):
+    """
+    Minifica JavaScript com o rjsmin, se instalado. Sem ele, só tira a
+    indentação, as linhas em branco e as linhas que são apenas comentário
+    (seguro sem analisar o código; o gzip cuida do resto).
+    """
+    if rjsmin is not None:
+        return rjsmin.jsmin(texto)
+    linhas = (linha.strip() for linha in texto.splitlines())
+    return '\n'.join(linha for linha in linhas if linha and not linha.startswith('//')) + '\n'
+
+
+MINIFICADORES = {'.css': minificar_css, '.js': minificar_js}
+
+
+def do_projeto(caminho):
+    """
+    True se o arquivo de origem é do projeto (estáticos do app ou de
+    STATICFILES_DIRS), e não do Django ou de outro pacote.
+    """
+    caminho = os.path.abspath(caminho)
+    raizes = [DIRETORIO_ESTATICO, *(os.fspath(d[1] if isinstance(d, tuple) else d) for d in settings.STATICFILES_DIRS)]
+    return any(caminho.startswith(os.path.abspath(raiz) + os.sep) for raiz in raizes)
+
+
+def minificar(nome, texto):
+    """
+    Conteúdo de 'nome' minificado, ou None se o tipo não é minificado ou o
+    arquivo já vem minificado ('.min.').
+    """
+    base, extensao = os.path.splitext(nome)
+    minificador = MINIFICADORES.get(extensao)
+    if minificador is None or base.endswith('.min'):
+        return None
+    return minificador(texto)
+
+
+def comprimir(caminho):
+    """
+    Grava caminho.gz (e caminho.br, com o pacote brotli) ao lado do arquivo,
+    quando o tipo é comprimível e a variante fica menor. Retorna
+    {codificação: tamanho} das variantes gravadas.
+    """
+    if os.path.splitext(caminho)[1] not in EXTENSOES_COMPRIMIVEIS:
+        return {}
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read()
+    if len(conteudo) < TAMANHO_MINIMO_COMPRESSAO:
+        return {}
+
+    variantes = {'gzip': ('.gz', gzip.compress(conteudo, compresslevel=9, mtime=0))}
+    if brotli is not None:
+        variantes['br'] = ('.br', brotli.compress(conteudo, quality=11))
+
+    gravadas = {}
+    for codificacao, (sufixo, comprimido) in variantes.items():
+        if len(comprimido) >= len(conteudo):
+            continue
+        with open(caminho + sufixo, 'wb') as arquivo:
+            arquivo.write(comprimido)
+        gravadas[codificacao] = len(comprimido)
+    return gravadas
+
+
+def baixar_html5_qrcode(url=HTML5_QRCODE_CDN, timeout=30):
+    """
+    Baixa a versão fixa da biblioteca html5-qrcode para principal/static/vendor/
+    (o arquivo entra no controle de versão com o resto). Retorna o caminho gravado.
+    """
+    destino = os.path.join(DIRETORIO_ESTATICO, HTML5_QRCODE)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with urllib.request.urlopen(url, timeout=timeout) as resposta:
+        conteudo = resposta.read()
+    with open(destino, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    return destino
+
+
+@lru_cache(maxsize=1)
+def url_html5_qrcode():
+    """
+    Endereço da biblioteca do scanner: a cópia local (com hash e cache longo
+    em produção) ou, se ainda não foi baixada, o CDN.
+    """
+    if finders.find(HTML5_QRCODE):
+        return static(HTML5_QRCODE)
+    return HTML5_QRCODE_CDN
+
+
+def _tamanhos(raiz, nome):
+    """
+    (original, minificado/coletado, gzip, br) de um arquivo coletado em
+    STATIC_ROOT; None nos que não existem.
+    """
+    def tamanho(caminho):
+        return os.path.getsize(caminho) if caminho and os.path.isfile(caminho) else None
+
+    origem = finders.find(nome)
+    coletado = os.path.join(raiz, nome)
+    return (
+        tamanho(origem),
+        tamanho(coletado),
+        tamanho(coletado + '.gz'),
+        tamanho(coletado + '.br'),
+    )
+
+
+def relatorio_transferencia(raiz=None):
+    """
+    Bytes por arquivo e por carga de página, antes do build (arquivos
+    originais, sem compressão, com o scanner em toda página) e depois (menor
+    variante: br, gz ou o arquivo minificado; scanner só ao abrir a câmera).
+
+    Retorna (linhas, totais): linhas com (nome, original, coletado, gzip, br,
+    transferido); totais com os bytes da primeira carga antes e depois, os do
+    scanner depois e as requisições de estáticos ao repetir a carga. Antes,
+    sem cabeçalhos de cache, cada arquivo era revalidado; depois, os arquivos
+    com hash ficam em cache 'immutable' e a repetição não faz nenhuma.
+    """
+    raiz = raiz or settings.STATIC_ROOT
+    linhas = []
+    for nome in ARQUIVOS_PAGINA + ARQUIVOS_SCANNER:
+        original, coletado, tamanho_gz, tamanho_br = _tamanhos(raiz, nome)
+        presentes = [tamanho for tamanho in (coletado, tamanho_gz, tamanho_br) if tamanho is not None]
+        linhas.append((nome, original, coletado, tamanho_gz, tamanho_br, min(presentes) if presentes else None))
+
+    def somar(nomes, coluna):
+        return sum(linha[coluna] or 0 for linha in linhas if linha[0] in nomes)
+
+    totais = {
+        'primeira_antes': somar(ARQUIVOS_PAGINA + ARQUIVOS_SCANNER, 1),
+        'primeira_depois': somar(ARQUIVOS_PAGINA, 5),
+        'scanner_depois': somar(ARQUIVOS_SCANNER, 5),
+        'requisicoes_repeticao_antes': len(ARQUIVOS_PAGINA + ARQUIVOS_SCANNER),
+        'requisicoes_repeticao_depois': 0,
+    }
+    return linhas, totais
@@ -0,0 +1,229 @@
+# Author: João Victor Marques Favero
+"""
+Arquivos de QR Code das chaves e folhas de etiquetas para impressão.
+
+Cada QR Code é gerado uma única vez (PNG e SVG, com segno) e guardado em
+MEDIA_ROOT/qrcodes com o nome "<pk>-<hash da URL>.<formato>". A URL leva o
+token assinado da chave (tokenServices); se ela mudar (outro domínio, nova
+versão do QR Code), o nome muda: o arquivo novo é gerado e os antigos
+daquela chave são apagados.
+
+A folha de etiquetas (PDF, várias páginas) é montada página a página. No
+comando gerar_etiquetas, num pool de processos criado para a execução (as
+funções usadas pelo pool não dependem do Django). Na tela (folha_etiquetas),
+no próprio processo do servidor e com no máximo ETIQUETAS_PAGINAS_TELA
+páginas: um pool por requisição custaria mais que a folha.
+"""
+
+import hashlib
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+from pathlib import Path
+
+import segno
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image, ImageDraw, ImageFont
+from principal.services.tokenServices import gerar_token
+
+# Pixels por módulo e módulos de margem (quiet zone) dos arquivos gerados
+ESCALA = 10
+BORDA = 4
+
+# Página A4 a 300 dpi, em preto e branco (1 bit por pixel: PDF pequeno)
+RESOLUCAO_FOLHA = 300
+TAMANHO_FOLHA = (2480, 3508)
+MARGEM_FOLHA = 120
+
+FORMATOS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Uma etiqueta da folha: chave, texto impresso e URL do QR Code
+Etiqueta = namedtuple('Etiqueta', ['chave_pk', 'nome', 'url'])
+
+
+def diretorio_qrcodes():
+    return Path(settings.MEDIA_ROOT) / 'qrcodes'
+
+
+def url_base(request=None):
+    """
+    Início das URLs gravadas nos QR Codes: QRCODE_URL_BASE, se definido
+    (ex.: 'https://chaves.campus.edu.br'), ou o endereço da requisição.
+    """
+    base = getattr(settings, 'QRCODE_URL_BASE', None)
+    if not base and request is not None:
+        base = request.build_absolute_uri('/')
+    return base.rstrip('/') if base else None
+
+
+def url_da_chave(chave_pk, versao, base):
+    """
+    URL gravada no QR Code: retirada direta com o token assinado da chave.
+    """
+    return base + reverse('retirar_por_qrcode', args=[gerar_token(chave_pk, versao)])
+
+
+def hash_url(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+
+def caminho_qrcode(diretorio, chave_pk, url, formato):
+    return Path(diretorio) / f'{chave_pk}-{hash_url(url)}.{formato}'
+
+
+# --- Geração (sem Django: também roda nos processos do pool) ---
+
+def _imagem_qrcode(qr):
+    # Desenha a matriz direto no Pillow (1 pixel por módulo) e amplia sem suavização
+    lado = qr.symbol_size(scale=1, border=BORDA)[0]
+    imagem = Image.new('1', (lado, lado))
+    imagem.putdata([0 if modulo else 1 for linha in qr.matrix_iter(scale=1, border=BORDA) for modulo in linha])
+    return imagem.resize((lado * ESCALA, lado * ESCALA), Image.NEAREST)
+
+
+def _gravar(destino, dados):
+    # Escreve num temporário e renomeia: quem lê nunca vê um arquivo pela metade
+    temporario = destino.with_name(f'{destino.name}.{os.getpid()}.tmp')
+    temporario.write_bytes(dados)
+    os.replace(temporario, destino)
+
+
+def renderizar_qrcode(diretorio, chave_pk, url):
+    """
+    Gera e grava o PNG e o SVG do QR Code de 'url', apagando as versões de
+    outras URLs da mesma chave. Retorna a imagem (Pillow, 1 bit por pixel).
+    """
+    diretorio = Path(diretorio)
+    diretorio.mkdir(parents=True, exist_ok=True)
+
+    qr = segno.make(url, error='h')
+    imagem = _imagem_qrcode(qr)
+    png = io.BytesIO()
+    imagem.save(png, 'PNG')
+    svg = io.BytesIO()
+    qr.save(svg, kind='svg', scale=ESCALA, border=BORDA)
+
+    for formato, dados in (('png', png), ('svg', svg)):
+        destino = caminho_qrcode(diretorio, chave_pk, url, formato)
+        _gravar(destino, dados.getvalue())
+        for antigo in diretorio.glob(f'{chave_pk}-*.{formato}'):
+            if antigo != destino:
+                antigo.unlink(missing_ok=True)
+    return imagem
+
+
+def carregar_qrcode(diretorio, chave_pk, url):
+    """
+    Imagem do QR Code já gravado (ou gerado agora, se ainda não existir).
+    """
+    try:
+        with Image.open(caminho_qrcode(diretorio, chave_pk, url, 'png')) as imagem:
+            imagem.load()
+            return imagem
+    except FileNotFoundError:
+        return renderizar_qrcode(diretorio, chave_pk, url)
+
+
+def obter_qrcode(chave_pk, url, formato='png'):
+    """
+    Caminho do arquivo do QR Code da chave, gerando-o na primeira vez.
+    """
+    diretorio = diretorio_qrcodes()
+    caminho = caminho_qrcode(diretorio, chave_pk, url, formato)
+    if not caminho.exists():
+        renderizar_qrcode(diretorio, chave_pk, url)
+    return caminho
+
+
+def remover_qrcodes(chave_pk):
+    """
+    Apaga todos os arquivos de QR Code de uma chave.
+    """
+    for arquivo in diretorio_qrcodes().glob(f'{chave_pk}-*.*'):
+        arquivo.unlink(missing_ok=True)
+
+
+# --- Folha de etiquetas ---
+
+def _encurtar(texto, fonte, largura):
+    # Corta o nome com reticências para caber na largura da etiqueta
+    if fonte.getlength(texto) <= largura:
+        return texto
+    while texto and fonte.getlength(texto + '…') > largura:
+        texto = texto[:-1]
+    return texto + '…'
+
+
+def montar_pagina(diretorio, etiquetas, colunas, linhas):
+    """
+    Desenha uma página de etiquetas (QR Code + nome da chave, com linhas de
+    corte) e a devolve como PNG (bytes). Executada nos processos do pool.
+    """
+    pagina = Image.new('L', TAMANHO_FOLHA, 255)
+    desenho = ImageDraw.Draw(pagina)
+    fonte = ImageFont.load_default(size=44)
+
+    largura = (TAMANHO_FOLHA[0] - 2 * MARGEM_FOLHA) // colunas
+    altura = (TAMANHO_FOLHA[1] - 2 * MARGEM_FOLHA) // linhas
+    espaco_texto = 80
+    recuo = 30
+
+    for posicao, etiqueta in enumerate(etiquetas):
+        x = MARGEM_FOLHA + (posicao % colunas) * largura
+        y = MARGEM_FOLHA + (posicao // colunas) * altura
+        desenho.rectangle([x, y, x + largura, y + altura], outline=0)  # Linha de corte
+
+        # Amplia por um fator inteiro, para todos os módulos terem o mesmo tamanho
+        qr = carregar_qrcode(diretorio, etiqueta.chave_pk, etiqueta.url)
+        modulos = qr.width // ESCALA
+        lado = max(1, (min(largura, altura - espaco_texto) - 2 * recuo) // modulos) * modulos
+        qr = qr.resize((lado, lado), Image.NEAREST)
+        pagina.paste(qr, (x + (largura - lado) // 2, y + recuo))
+
+        nome = _encurtar(etiqueta.nome, fonte, largura - 2 * recuo)
+        desenho.text((x + largura // 2, y + recuo + lado + 10), nome, fill=0, font=fonte, anchor='ma')
+
+    saida = io.BytesIO()
+    pagina.convert('1', dither=Image.Dither.NONE).save(saida, 'PNG')
+    return saida.getvalue()
+
+
+def maximo_etiquetas_tela(colunas=4, linhas=6):
+    """
+    Quantas etiquetas a tela de gerenciamento imprime de uma vez
+    (ETIQUETAS_PAGINAS_TELA páginas); acima disso, o comando gerar_etiquetas.
+    """
+    return getattr(settings, 'ETIQUETAS_PAGINAS_TELA', 10) * colunas * linhas
+
+
+def gerar_folha(etiquetas, destino, colunas=4, linhas=6, processos=None):
+    """
+    Grava em 'destino' (caminho ou arquivo aberto em binário) o PDF com as
+    etiquetas, 'colunas' x 'linhas' por página. As páginas são montadas em
+    paralelo por 'processos' processos (padrão: um por CPU; 1 = sem pool,
+    como nas requisições web). Retorna a quantidade de páginas.
+    """
+    por_pagina = colunas * linhas
+    grupos = [etiquetas[inicio:inicio + por_pagina] for inicio in range(0, len(etiquetas), por_pagina)]
+    if not grupos:
+        raise ValueError('Nenhuma etiqueta para imprimir.')
+
+    montar = partial(montar_pagina, str(diretorio_qrcodes()), colunas=colunas, linhas=linhas)
+    processos = processos or os.cpu_count() or 1
+    if processos == 1 or len(grupos) == 1:
+        paginas = [montar(grupo) for grupo in grupos]
+    else:
+        # 'spawn': o pool não herda o estado (conexões, threads) de quem chamou
+        with ProcessPoolExecutor(max_workers=min(processos, len(grupos)), mp_context=get_context('spawn')) as pool:
+            paginas = list(pool.map(montar, grupos))
+
+    imagens = [Image.open(io.BytesIO(pagina)) for pagina in paginas]
+    imagens[0].save(destino, 'PDF', save_all=True, append_images=imagens[1:], resolution=RESOLUCAO_FOLHA)
+    return len(imagens)
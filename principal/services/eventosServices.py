@@ -0,0 +1,122 @@
+# Author: João Victor Marques Favero
+"""
+Barramento de eventos em memória para o feed ao vivo do histórico (SSE).
+
+O serviço de empréstimos publica os registros depois do commit. Cada conexão
+SSE é um assinante com sua própria fila asyncio, no loop do servidor ASGI.
+A publicação pode vir de qualquer thread (views síncronas), por isso usa
+call_soon_threadsafe. O barramento é do processo: rode um único processo ASGI
+para o feed, ou deixe os terminais no polling de reserva.
+
+Eventos perdidos (reconexão, fila cheia) são reenviados a partir do banco
+usando o id do último evento recebido (Last-Event-ID), em ordem e sem
+lacunas. Se passarem de LIMITE_REENVIO, vai um único evento 'recarregar' com
+o id do registro mais recente: a página busca a lista de novo.
+"""
+
+import asyncio
+import threading
+
+from django.template.loader import render_to_string
+
+# Tamanho máximo da fila por assinante; um cliente lento é desconectado e
+# recupera os eventos pelo Last-Event-ID ao reconectar
+TAMANHO_FILA = 100
+
+# Quantidade máxima de eventos reenviados numa reconexão
+LIMITE_REENVIO = 50
+
+_assinantes = set()
+_trava = threading.Lock()
+
+
+class Evento:
+    """
+    Um registro de histórico pronto para ser enviado (id + linha HTML), ou o
+    aviso para recarregar a lista (tipo 'recarregar').
+    """
+
+    def __init__(self, id, html, tipo='emprestimo'):
+        self.id = id
+        self.html = html
+        self.tipo = tipo
+
+    def formatar_sse(self):
+        # Cada linha do HTML vira uma linha 'data:' do protocolo SSE
+        linhas = ''.join(f'data: {linha}\n' for linha in self.html.splitlines() if linha.strip())
+        return f'id: {self.id}\nevent: {self.tipo}\n{linhas}\n'
+
+
+class Assinante:
+    """
+    Conexão SSE inscrita no barramento.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+        self.transbordou = False
+
+    def entregar(self, evento):
+        # Executado no loop do assinante (via call_soon_threadsafe)
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.transbordou = True
+
+
+def renderizar_evento(registro):
+    """
+    Renderiza a linha da tabela de histórico para um registro.
+    """
+    return Evento(registro.pk, render_to_string('historico/_linha_emprestimo.html', {'emprestimo': registro}))
+
+
+def assinar():
+    assinante = Assinante()
+    with _trava:
+        _assinantes.add(assinante)
+    return assinante
+
+
+def cancelar(assinante):
+    with _trava:
+        _assinantes.discard(assinante)
+
+
+def publicar(registros):
+    """
+    Envia os registros recém-gravados a todos os assinantes.
+    Não renderiza nada se não houver ninguém conectado.
+    """
+    with _trava:
+        assinantes = list(_assinantes)
+    if not assinantes:
+        return
+
+    eventos = [renderizar_evento(registro) for registro in registros]
+    for assinante in assinantes:
+        for evento in eventos:
+            try:
+                assinante.loop.call_soon_threadsafe(assinante.entregar, evento)
+            except RuntimeError:
+                # Loop já encerrado: conexão morta
+                cancelar(assinante)
+                break
+
+
+def eventos_desde(ultimo_id):
+    """
+    Os eventos gravados depois de 'ultimo_id', do mais antigo para o mais
+    novo. Se forem mais de LIMITE_REENVIO, só o evento 'recarregar' com o id
+    do mais recente (os do meio não se perdem: vêm com a lista recarregada).
+    Acessa o banco: chamar via sync_to_async.
+    """
+    from principal.models import HistoricoEmprestimo
+
+    historico = HistoricoEmprestimo.objects.filter(pk__gt=ultimo_id)
+    registros = list(historico.select_related('chave', 'usuario').order_by('pk')[:LIMITE_REENVIO + 1])
+    if len(registros) > LIMITE_REENVIO:
+        ultimo = historico.order_by('-pk').values_list('pk', flat=True).first()
+        return [Evento(ultimo, str(ultimo), tipo='recarregar')]
+    return [renderizar_evento(registro) for registro in registros]
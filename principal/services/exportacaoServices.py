@@ -0,0 +1,147 @@
+# Author: João Victor Marques Favero
+"""
+Exportação do histórico de empréstimos em CSV ou JSONL, em fluxo.
+
+As linhas saem do banco com values_list() + iterator(chunk_size), sem criar
+instâncias de modelo nem carregar o resultado inteiro: o consumo de memória
+fica constante, seja a exportação de mil ou de milhões de registros. O texto
+é gerado em blocos e pode ser comprimido em gzip durante o envio.
+
+Buscas que alcançam meses arquivados leem as partes (arquivo e tabela
+principal) uma depois da outra, na ordem cronológica.
+
+Sob ASGI, o StreamingHttpResponse leria um iterador síncrono inteiro antes de
+enviar a primeira parte: a view usa então em_fluxo_async, que busca um bloco
+por vez numa thread.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from principal.services.historicoServices import partes_historico
+
+# Registros buscados no banco (e escritos) por vez
+TAMANHO_BLOCO_EXPORTACAO = 2000
+
+# Colunas exportadas: (cabeçalho, campo do values_list)
+COLUNAS = [
+    ('id', 'pk'),
+    ('data_hora', 'data_hora'),
+    ('acao', 'acao'),
+    ('chave_id', 'chave_id'),
+    ('chave', 'chave__nome'),
+    ('usuario_id', 'usuario_id'),
+    ('usuario', 'usuario__username'),
+    ('usuario_nome', 'usuario__first_name'),
+    ('usuario_sobrenome', 'usuario__last_name'),
+]
+
+FORMATOS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+_POSICAO_DATA = [campo for _, campo in COLUNAS].index('data_hora')
+
+
+def consulta_exportacao(queryset):
+    """
+    Tuplas (values_list) do histórico na ordem cronológica, prontas para o fluxo.
+    """
+    return queryset.order_by('data_hora', 'pk').values_list(*[campo for _, campo in COLUNAS])
+
+
+def _linhas(partes, tamanho_bloco):
+    # Tuplas com a data/hora no fuso local, em ISO 8601
+    for queryset in partes:
+        for linha in consulta_exportacao(queryset).iterator(chunk_size=tamanho_bloco):
+            linha = list(linha)
+            linha[_POSICAO_DATA] = timezone.localtime(linha[_POSICAO_DATA]).isoformat()
+            yield linha
+
+
+def gerar_csv(partes, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Gera o CSV em blocos de texto (cabeçalho + até 'tamanho_bloco' linhas por bloco).
+    'partes': querysets sem sobreposição, na ordem cronológica.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow([cabecalho for cabecalho, _ in COLUNAS])
+
+    for numero, linha in enumerate(_linhas(partes, tamanho_bloco), start=1):
+        escritor.writerow(linha)
+        if numero % tamanho_bloco == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gerar_jsonl(partes, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Gera o JSONL (um objeto por linha) em blocos de texto.
+    """
+    cabecalhos = [cabecalho for cabecalho, _ in COLUNAS]
+    bloco = []
+    for linha in _linhas(partes, tamanho_bloco):
+        bloco.append(json.dumps(dict(zip(cabecalhos, linha)), ensure_ascii=False))
+        if len(bloco) == tamanho_bloco:
+            yield '\n'.join(bloco) + '\n'
+            bloco = []
+    if bloco:
+        yield '\n'.join(bloco) + '\n'
+
+
+def comprimir_gzip(blocos):
+    """
+    Comprime em gzip, durante o fluxo, os blocos de texto gerados.
+    """
+    compressor = zlib.compressobj(wbits=31)  # wbits=31: formato gzip (cabeçalho + CRC)
+    for bloco in blocos:
+        dados = compressor.compress(bloco.encode('utf-8'))
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def exportar_historico(parametros, formato='csv', gzip=False, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Iterador de bytes com o histórico filtrado por 'parametros' (mesmos filtros
+    da tela de histórico), em 'formato' ('csv' ou 'jsonl'), opcionalmente em gzip.
+    """
+    # Partes do histórico (mais recente primeiro), exportadas da mais antiga para a mais recente
+    partes = list(reversed(partes_historico(parametros)))
+    gerar = gerar_jsonl if formato == 'jsonl' else gerar_csv
+    blocos = gerar(partes, tamanho_bloco)
+    if gzip:
+        return comprimir_gzip(blocos)
+    return (bloco.encode('utf-8') for bloco in blocos)
+
+
+async def em_fluxo_async(blocos):
+    """
+    Iterador assíncrono sobre o iterador síncrono 'blocos' (ex.: o de
+    exportar_historico): cada bloco é gerado numa thread (a mesma das
+    consultas do ORM), e o envio começa já no primeiro.
+    """
+    fim = object()
+    proximo = sync_to_async(next)
+    try:
+        while (bloco := await proximo(blocos, fim)) is not fim:
+            yield bloco
+    finally:
+        # Cliente desconectou ou fluxo terminou: fecha o gerador (e o cursor) na thread do ORM
+        await sync_to_async(blocos.close)()
+
+
+def nome_arquivo(formato, gzip=False):
+    """
+    Nome sugerido para o arquivo exportado (ex.: historico-20250115-1030.csv.gz).
+    """
+    sufixo = '.gz' if gzip else ''
+    return f"historico-{timezone.localtime():%Y%m%d-%H%M}.{formato}{sufixo}"
@@ -0,0 +1,121 @@
+# Author: João Victor Marques Favero
+"""
+Filtros do histórico de empréstimos, compartilhados pelas telas e exportações.
+
+Os filtros de data usam intervalos semiabertos [início, fim) em datetime com
+fuso horário, em vez de data_hora__date. Assim o banco compara a coluna
+diretamente e consegue usar os índices sobre data_hora.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from principal.models import Chave, Usuario
+from principal.services.buscaServices import filtrar_chaves, filtrar_usuarios
+
+# Combinações de filtros cobertas pelos índices de HistoricoEmprestimo
+# (verificadas pelo comando 'verificar_indices_historico')
+COMBINACOES_FILTROS = [
+    {},
+    {'chave_nome': 'Lab'},
+    {'usuario_nome': 'joao'},
+    {'acao': 'adquirida'},
+    {'data': '2025-01-15'},
+    {'de': '2025-01-01', 'ate': '2025-01-31'},
+    {'acao': 'devolucao', 'data': '2025-01-15'},
+    {'chave_nome': 'Lab', 'de': '2025-01-01'},
+    {'usuario_nome': 'joao', 'acao': 'adquirida'},
+    {'chave_nome': 'Lab', 'usuario_nome': 'joao', 'acao': 'transferida', 'de': '2025-01-01', 'ate': '2025-12-31'},
+]
+
+
+def inicio_do_dia(data):
+    """
+    Meia-noite de 'data' no fuso horário atual (datetime com fuso).
+    """
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def _ler_data(valor):
+    # parse_date levanta ValueError para datas bem formadas mas impossíveis (ex.: mês 13)
+    try:
+        return parse_date(valor) if valor else None
+    except ValueError:
+        return None
+
+
+def intervalo_datas(de=None, ate=None):
+    """
+    Converte datas 'AAAA-MM-DD' (inclusivas) em [início, fim) com fuso.
+    Valores vazios ou inválidos são ignorados (retornam None).
+    """
+    data_de, data_ate = _ler_data(de), _ler_data(ate)
+    inicio = inicio_do_dia(data_de) if data_de else None
+    fim = inicio_do_dia(data_ate + timedelta(days=1)) if data_ate else None
+    return inicio, fim
+
+
+def filtrar_historico(queryset, parametros):
+    """
+    Aplica ao queryset de HistoricoEmprestimo os filtros da tela de histórico.
+
+    'parametros' é um dicionário (ou QueryDict) com as chaves opcionais:
+    chave_nome, usuario_nome, acao, data (um dia), de e ate (intervalo de dias).
+    """
+    chave_nome = parametros.get('chave_nome')  # Nome da chave para filtro
+    usuario_nome = parametros.get('usuario_nome')  # Nome do usuário para filtro
+    acao = parametros.get('acao')  # Ação para filtro
+    data = parametros.get('data')  # Um único dia
+    de = parametros.get('de')  # Início do intervalo (inclusivo)
+    ate = parametros.get('ate')  # Fim do intervalo (inclusivo)
+
+    # Nomes resolvidos em subconsultas: o histórico é filtrado por chave_id/usuario_id
+    if chave_nome:
+        queryset = queryset.filter(
+            chave_id__in=filtrar_chaves(Chave.objects.all(), chave_nome).values('pk')
+        )
+    if usuario_nome:
+        queryset = queryset.filter(
+            usuario_id__in=filtrar_usuarios(Usuario.objects.all(), usuario_nome).values('pk')
+        )
+    if acao:
+        queryset = queryset.filter(acao=acao)
+
+    # 'data' equivale a de=ate=data
+    if data:
+        de = ate = data
+    inicio, fim = intervalo_datas(de, ate)
+    if inicio:
+        queryset = queryset.filter(data_hora__gte=inicio)
+    if fim:
+        queryset = queryset.filter(data_hora__lt=fim)
+
+    return queryset
+
+
+def partes_historico(parametros):
+    """
+    Querysets filtrados que cobrem a busca, do mais recente ao mais antigo:
+    a tabela principal e, se o intervalo de datas começar antes do fim do
+    arquivo, também HistoricoEmprestimoArquivo. As partes não se sobrepõem
+    (o arquivo só tem meses anteriores aos da tabela principal).
+    """
+    from principal.models import HistoricoEmprestimo, HistoricoEmprestimoArquivo
+    from principal.services.arquivoServices import limite_arquivo
+
+    partes = []
+    limite = limite_arquivo()
+    data = parametros.get('data')
+    inicio, fim = intervalo_datas(data or parametros.get('de'), data or parametros.get('ate'))
+
+    if limite is None or fim is None or fim > limite:
+        partes.append(HistoricoEmprestimo.objects.all())
+    # Sem filtro de data, só a tabela principal: o arquivo é lido apenas quando o intervalo pede
+    if limite is not None and (inicio or fim) and (inicio is None or inicio < limite):
+        partes.append(HistoricoEmprestimoArquivo.objects.all())
+
+    return [
+        filtrar_historico(parte.select_related('chave', 'usuario').order_by(), parametros)
+        for parte in partes
+    ]
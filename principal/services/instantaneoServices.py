@@ -0,0 +1,170 @@
+# Author: João Victor Marques Favero
+"""
+Estado das chaves num instante passado ("com quem estava cada chave às 22h
+de 14/03"), a partir de instantâneos periódicos e do histórico.
+
+estado_em(momento) lê um único instantâneo (o mais recente até 'momento') e
+aplica os eventos do histórico entre ele e 'momento'. O trecho de eventos é
+limitado pelo intervalo entre instantâneos: INSTANTANEO_INTERVALO_MINUTOS
+nos últimos INSTANTANEO_RETENCAO_DIAS dias e um dia antes disso (a retenção
+mantém só o primeiro instantâneo de cada dia antigo).
+
+O estado do instantâneo é lido antes do seu momento ser marcado: todo evento
+já visível na leitura é anterior ao momento. Um evento com data anterior que
+ainda não tinha sido confirmado aparece depois; por isso a reaplicação
+começa INSTANTANEO_MARGEM_SEGUNDOS antes do instantâneo. Reaplicar um evento
+já refletido não muda o resultado (cada evento define o portador da chave).
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min, Subquery
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from principal.models import Chave, HistoricoEmprestimo, HistoricoEmprestimoArquivo, InstantaneoChaves
+from principal.services.historicoServices import inicio_do_dia
+from principal.services.paginacaoServices import unir
+
+# Estado reconstruído: {chave_id: usuario_id} das chaves em uso em 'momento'
+EstadoChaves = namedtuple('EstadoChaves', ['momento', 'instantaneo', 'eventos_aplicados', 'portadores'])
+
+# Colunas dos eventos, na ordem de aplicação (data_hora, id)
+_COLUNAS = ('data_hora', 'id', 'chave_id', 'usuario_id', 'acao')
+
+# Instantâneos gravados por bulk_create na geração retroativa
+TAMANHO_LOTE_INSTANTANEOS = 100
+
+
+def _intervalo():
+    return timedelta(minutes=getattr(settings, 'INSTANTANEO_INTERVALO_MINUTOS', 60))
+
+
+def _margem():
+    return timedelta(seconds=getattr(settings, 'INSTANTANEO_MARGEM_SEGUNDOS', 60))
+
+
+def _eventos(historico, depois_de=None, ate=None):
+    # Eventos de chaves existentes em (depois_de, ate], como tuplas de _COLUNAS
+    eventos = historico.objects.filter(chave__isnull=False)
+    if depois_de is not None:
+        eventos = eventos.filter(data_hora__gt=depois_de)
+    if ate is not None:
+        eventos = eventos.filter(data_hora__lte=ate)
+    return eventos.values_list(*_COLUNAS)
+
+
+def aplicar(portadores, eventos):
+    """
+    Aplica a 'portadores' ({chave_id: usuario_id}) os eventos em ordem.
+    'transferida' e 'devolucao' liberam a chave (como nas sessões de
+    empréstimo); a 'adquirida' do novo portador vem logo depois da transferência.
+    """
+    for _, _, chave_id, usuario_id, acao in eventos:
+        if acao == 'adquirida':
+            portadores[chave_id] = usuario_id
+        else:
+            portadores.pop(chave_id, None)
+    return portadores
+
+
+def capturar():
+    """
+    Grava um instantâneo com o estado atual das chaves.
+    """
+    portadores = dict(Chave.objects.filter(status='em_uso').values_list('pk', 'portador_atual_id'))
+    # Marcado depois da leitura: todo evento refletido no estado é anterior ao momento
+    momento = timezone.now()
+    return InstantaneoChaves.objects.create(momento=momento, portadores=portadores, chaves_em_uso=len(portadores))
+
+
+def capturar_se_necessario():
+    """
+    Captura um instantâneo se o último tem mais de INSTANTANEO_INTERVALO_MINUTOS.
+    Retorna o instantâneo criado ou None.
+    """
+    ultimo = InstantaneoChaves.objects.order_by('-momento').values_list('momento', flat=True).first()
+    if ultimo is not None and timezone.now() - ultimo < _intervalo():
+        return None
+    return capturar()
+
+
+def aplicar_retencao(dias=None):
+    """
+    Mantém todos os instantâneos dos últimos 'dias' dias (padrão:
+    INSTANTANEO_RETENCAO_DIAS); dos mais antigos, só o primeiro de cada dia.
+    Retorna a quantidade apagada.
+    """
+    if dias is None:
+        dias = getattr(settings, 'INSTANTANEO_RETENCAO_DIAS', 30)
+    antigos = InstantaneoChaves.objects.filter(momento__lt=timezone.now() - timedelta(days=dias))
+    primeiros_do_dia = antigos.annotate(dia=TruncDate('momento')).values('dia').annotate(
+        primeiro=Min('momento')
+    ).values('primeiro')
+    apagados, _ = antigos.exclude(momento__in=Subquery(primeiros_do_dia)).delete()
+    return apagados
+
+
+def gerar_retroativos(progresso=None):
+    """
+    Cria, a partir do histórico (arquivo e tabela principal), um instantâneo
+    por dia (meia-noite) desde o primeiro registro até o instantâneo mais
+    antigo que já existe (ou até agora). Uma passada pelos eventos em ordem.
+    'progresso(total)' é chamado a cada lote gravado. Retorna a quantidade criada.
+    """
+    margem = _margem()
+    limite = InstantaneoChaves.objects.order_by('momento').values_list('momento', flat=True).first()
+    if limite is None:
+        limite = timezone.now() - margem
+
+    partes = [_eventos(historico, ate=limite) for historico in (HistoricoEmprestimoArquivo, HistoricoEmprestimo)]
+    portadores, proximo, lote, total = {}, None, [], 0
+
+    def registrar_instantaneo(momento):
+        nonlocal lote, total
+        lote.append(InstantaneoChaves(momento=momento, portadores=dict(portadores), chaves_em_uso=len(portadores)))
+        if len(lote) == TAMANHO_LOTE_INSTANTANEOS:
+            InstantaneoChaves.objects.bulk_create(lote)
+            total += len(lote)
+            lote = []
+            if progresso:
+                progresso(total)
+
+    for evento in unir(partes, ('data_hora', 'id')).iterator(chunk_size=2000):
+        data_hora = evento[0]
+        if proximo is None:
+            proximo = inicio_do_dia(timezone.localtime(data_hora).date() + timedelta(days=1))
+        # Todos os eventos até 'proximo' já foram aplicados
+        while data_hora > proximo:
+            registrar_instantaneo(proximo)
+            proximo = inicio_do_dia(timezone.localtime(proximo).date() + timedelta(days=1))
+        aplicar(portadores, [evento])
+
+    # Dias sem eventos entre o último evento e o limite (com folga para os não confirmados)
+    while proximo is not None and proximo < limite - margem:
+        registrar_instantaneo(proximo)
+        proximo = inicio_do_dia(timezone.localtime(proximo).date() + timedelta(days=1))
+
+    InstantaneoChaves.objects.bulk_create(lote)
+    return total + len(lote)
+
+
+def estado_em(momento):
+    """
+    EstadoChaves em 'momento' (datetime com fuso): um instantâneo e os eventos
+    desde ele. None se 'momento' é anterior ao instantâneo mais antigo.
+    """
+    instantaneo = InstantaneoChaves.objects.filter(momento__lte=momento).order_by('-momento').first()
+    if instantaneo is None:
+        return None
+
+    # Chaves do JSON voltam como texto
+    portadores = {int(chave_id): usuario_id for chave_id, usuario_id in instantaneo.portadores.items()}
+    inicio = instantaneo.momento - _margem()
+    eventos = []
+    for historico in (HistoricoEmprestimoArquivo, HistoricoEmprestimo):
+        eventos.extend(_eventos(historico, inicio, momento))
+    eventos.sort()
+    aplicar(portadores, eventos)
+    return EstadoChaves(momento, instantaneo, len(eventos), portadores)
@@ -0,0 +1,316 @@
+# Author: João Victor Marques Favero
+"""
+Métricas das requisições por rota (nome da URL), expostas em /metrics no
+formato de texto do Prometheus:
+
+- latência (histograma) e requisições por método e status;
+- consultas ao banco por requisição (histograma) e tempo total em consultas;
+- tempo de renderização de templates (inclui as consultas feitas durante a
+  renderização, ex.: querysets avaliados no template);
+- tamanho das respostas (histograma; respostas em fluxo sem Content-Length
+  ficam de fora);
+- consultas lentas (acima de METRICAS_CONSULTA_LENTA_MS): contadas por rota,
+  registradas no log e guardadas como amostras com o SQL (sem parâmetros);
+- contadores avulsos de outros serviços (CONTADORES, ex.: acertos do cache
+  do usuário autenticado).
+
+O MetricasMiddleware abre uma medição por requisição, guardada numa
+ContextVar (como o estado de leitura do roteador de réplica). As consultas
+são medidas por um execute_wrapper instalado uma vez em cada conexão
+(signals.instrumentar_conexao) e os templates pelo backend TemplatesMedidos.
+Fora de uma requisição (comandos, shell), nada é medido.
+
+Os valores ficam na memória do processo: com vários workers, cada um tem
+os seus (e cada coleta do Prometheus vê o worker que atendeu).
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Limites dos histogramas (segundos, consultas e bytes)
+LIMITES_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+LIMITES_BYTES = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Tamanho máximo do SQL guardado em cada amostra de consulta lenta
+TAMANHO_SQL_AMOSTRA = 2000
+
+# Rota de requisições que não casaram com nenhuma URL (404)
+ROTA_DESCONHECIDA = 'sem_rota'
+
+# Outros métodos entram como 'outro' (o rótulo não cresce com métodos inventados)
+METODOS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# Contadores avulsos (contar()): nome -> ajuda
+CONTADORES = {
+    'chaves_cache_usuario_total': 'Buscas do usuário autenticado no cache do processo, por resultado (acerto/falta).',
+}
+
+
+def ativas():
+    return getattr(settings, 'METRICAS_ATIVAS', True)
+
+
+def _limite_lenta():
+    return getattr(settings, 'METRICAS_CONSULTA_LENTA_MS', 200) / 1000
+
+
+class Medicao:
+    """
+    Contadores de uma requisição em andamento.
+    """
+    __slots__ = ('rota', 'consultas', 'tempo_consultas', 'tempo_templates', 'renderizando', 'lentas')
+
+    def __init__(self):
+        self.rota = None  # Preenchida pelo middleware quando a URL é resolvida
+        self.consultas = 0
+        self.tempo_consultas = 0.0
+        self.tempo_templates = 0.0
+        self.renderizando = False  # Template dentro de template conta uma vez só
+        self.lentas = []  # (segundos, sql) das consultas lentas
+
+
+_medicao = ContextVar('principal_medicao', default=None)
+
+
+def iniciar_requisicao():
+    """
+    Abre a medição da requisição. Retorna (medição, token para encerrar_requisicao).
+    """
+    medicao = Medicao()
+    return medicao, _medicao.set(medicao)
+
+
+def encerrar_requisicao(token):
+    _medicao.reset(token)
+
+
+def medicao_atual():
+    return _medicao.get()
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """
+    execute_wrapper das conexões: mede as consultas feitas durante uma requisição.
+    """
+    medicao = _medicao.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracao = time.perf_counter() - inicio
+        medicao.consultas += 1
+        medicao.tempo_consultas += duracao
+        if duracao >= _limite_lenta():
+            medicao.lentas.append((duracao, sql))
+
+
+class _TemplateMedido:
+    """
+    Template do backend Django que soma o tempo de render() à medição.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, nome):
+        return getattr(self.template, nome)
+
+    def render(self, context=None, request=None):
+        medicao = _medicao.get()
+        if medicao is None or medicao.renderizando:
+            return self.template.render(context, request)
+        medicao.renderizando = True
+        inicio = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            medicao.renderizando = False
+            medicao.tempo_templates += time.perf_counter() - inicio
+
+
+class TemplatesMedidos(DjangoTemplates):
+    """
+    Backend de templates do Django com o tempo de renderização medido
+    (settings.TEMPLATES['BACKEND']).
+    """
+
+    def from_string(self, template_code):
+        return _TemplateMedido(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TemplateMedido(super().get_template(template_name))
+
+
+class _Histograma:
+    __slots__ = ('limites', 'contagens', 'soma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * len(limites)
+        self.soma = 0
+        self.total = 0
+
+    def observar(self, valor):
+        for posicao, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.contagens[posicao] += 1
+                break
+        self.soma += valor
+        self.total += 1
+
+
+class _Registro:
+    """
+    Valores acumulados no processo, por rota. Um lock por atualização:
+    uma requisição faz uma única chamada a registrar().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.limpar()
+
+    def limpar(self):
+        self.requisicoes = {}  # (rota, método, status) -> quantidade
+        self.duracao = {}  # rota -> _Histograma
+        self.consultas = {}
+        self.bytes = {}
+        self.tempo_consultas = {}  # rota -> segundos
+        self.tempo_templates = {}
+        self.lentas = {}  # rota -> quantidade
+        self.contadores = {}  # (nome, rótulos) -> quantidade
+        self.amostras = deque(maxlen=getattr(settings, 'METRICAS_AMOSTRAS_LENTAS', 50))
+
+    def registrar(self, rota, metodo, status, duracao, medicao, tamanho):
+        with self.lock:
+            chave = (rota, metodo, status)
+            self.requisicoes[chave] = self.requisicoes.get(chave, 0) + 1
+            self.duracao.setdefault(rota, _Histograma(LIMITES_DURACAO)).observar(duracao)
+            self.consultas.setdefault(rota, _Histograma(LIMITES_CONSULTAS)).observar(medicao.consultas)
+            if tamanho is not None:
+                self.bytes.setdefault(rota, _Histograma(LIMITES_BYTES)).observar(tamanho)
+            self.tempo_consultas[rota] = self.tempo_consultas.get(rota, 0.0) + medicao.tempo_consultas
+            self.tempo_templates[rota] = self.tempo_templates.get(rota, 0.0) + medicao.tempo_templates
+            if medicao.lentas:
+                self.lentas[rota] = self.lentas.get(rota, 0) + len(medicao.lentas)
+                agora = timezone.now()
+                for segundos, sql in medicao.lentas:
+                    self.amostras.append({
+                        'momento': agora.isoformat(),
+                        'rota': rota,
+                        'ms': round(segundos * 1000, 1),
+                        'sql': sql[:TAMANHO_SQL_AMOSTRA],
+                    })
+
+
+_registro = _Registro()
+
+
+def registrar(medicao, metodo, status, duracao, tamanho=None):
+    """
+    Soma ao registro do processo uma requisição encerrada.
+    """
+    rota = medicao.rota or ROTA_DESCONHECIDA
+    metodo = metodo if metodo in METODOS else 'outro'
+    _registro.registrar(rota, metodo, str(status), duracao, medicao, tamanho)
+    for segundos, sql in medicao.lentas:
+        logger.warning('Consulta lenta (%.0f ms) em %s: %s', segundos * 1000, rota, sql[:TAMANHO_SQL_AMOSTRA])
+
+
+def contar(nome, **rotulos):
+    """
+    Soma 1 ao contador 'nome' (de CONTADORES) com estes rótulos.
+    """
+    if not ativas():
+        return
+    chave = (nome, tuple(sorted(rotulos.items())))
+    with _registro.lock:
+        _registro.contadores[chave] = _registro.contadores.get(chave, 0) + 1
+
+
+def consultas_lentas():
+    """
+    Amostras mais recentes de consultas lentas (a mais nova primeiro).
+    """
+    with _registro.lock:
+        return list(reversed(_registro.amostras))
+
+
+def limpar():
+    with _registro.lock:
+        _registro.limpar()
+
+
+def _rotulos(**rotulos):
+    texto = ','.join(
+        '{}="{}"'.format(nome, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for nome, valor in rotulos.items()
+    )
+    return '{' + texto + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _linhas_histograma(nome, histogramas):
+    for rota, histograma in sorted(histogramas.items()):
+        acumulado = 0
+        for limite, contagem in zip(histograma.limites, histograma.contagens):
+            acumulado += contagem
+            yield f'{nome}_bucket{_rotulos(rota=rota, le=limite)} {acumulado}'
+        yield f'{nome}_bucket{_rotulos(rota=rota, le="+Inf")} {histograma.total}'
+        yield f'{nome}_sum{_rotulos(rota=rota)} {_numero(histograma.soma)}'
+        yield f'{nome}_count{_rotulos(rota=rota)} {histograma.total}'
+
+
+def _linhas_contador(nome, valores):
+    for rota, valor in sorted(valores.items()):
+        yield f'{nome}{_rotulos(rota=rota)} {_numero(valor)}'
+
+
+def exportar():
+    """
+    Métricas no formato de texto do Prometheus (versão 0.0.4).
+    """
+    metricas = [
+        ('chaves_requisicao_duracao_segundos', 'histogram', 'Latência das requisições por rota.', 'duracao'),
+        ('chaves_requisicao_consultas', 'histogram', 'Consultas ao banco por requisição.', 'consultas'),
+        ('chaves_resposta_bytes', 'histogram', 'Tamanho das respostas (corpo).', 'bytes'),
+        ('chaves_consultas_segundos_total', 'counter', 'Tempo gasto em consultas ao banco.', 'tempo_consultas'),
+        ('chaves_templates_segundos_total', 'counter', 'Tempo de renderização de templates.', 'tempo_templates'),
+        ('chaves_consultas_lentas_total', 'counter', 'Consultas acima de METRICAS_CONSULTA_LENTA_MS.', 'lentas'),
+    ]
+    linhas = [
+        '# HELP chaves_requisicoes_total Requisições atendidas por rota, método e status.',
+        '# TYPE chaves_requisicoes_total counter',
+    ]
+    with _registro.lock:
+        for (rota, metodo, status), quantidade in sorted(_registro.requisicoes.items()):
+            linhas.append(f'chaves_requisicoes_total{_rotulos(rota=rota, metodo=metodo, status=status)} {quantidade}')
+        for nome, tipo, ajuda, atributo in metricas:
+            linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} {tipo}')
+            valores = getattr(_registro, atributo)
+            if tipo == 'histogram':
+                linhas.extend(_linhas_histograma(nome, valores))
+            else:
+                linhas.extend(_linhas_contador(nome, valores))
+        for nome, ajuda in CONTADORES.items():
+            linhas.append(f'# HELP {nome} {ajuda}')
+            linhas.append(f'# TYPE {nome} counter')
+            for (contador, rotulos), quantidade in sorted(_registro.contadores.items()):
+                if contador == nome:
+                    linhas.append(f'{nome}{_rotulos(**dict(rotulos))} {quantidade}')
+    return '\n'.join(linhas) + '\n'
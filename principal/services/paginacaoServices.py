@@ -0,0 +1,261 @@
+# Author: João Victor Marques Favero
+"""
+Paginação por cursor (keyset) para listas ordenadas por data mais recente.
+
+Em vez de OFFSET + COUNT(*), cada página é buscada a partir da última linha
+vista, usando a chave de ordenação (campo de data, id). O custo de uma página
+é o mesmo na primeira ou na milésima página. Os cursores são tokens opacos
+(base64) que guardam a direção e a posição.
+
+Os dois paginadores também aceitam uma lista de querysets ("partes") que não
+se sobrepõem no tempo, da mais recente para a mais antiga (tabela principal
+e arquivo do histórico, ver arquivoServices).
+"""
+
+import base64
+from datetime import datetime, timedelta, timezone
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+_EPOCA = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSSEGUNDO = timedelta(microseconds=1)
+
+
+class CursorInvalido(ValueError):
+    """
+    Token de cursor malformado ou adulterado.
+    """
+
+
+def _codificar_cursor(direcao, data_hora, pk):
+    # Data em microssegundos UTC para não depender de formato/fuso
+    micros = (data_hora - _EPOCA) // _MICROSSEGUNDO
+    bruto = f'{direcao}:{micros}:{pk}'.encode('ascii')
+    return base64.urlsafe_b64encode(bruto).decode('ascii').rstrip('=')
+
+
+def _decodificar_cursor(token):
+    try:
+        preenchido = token + '=' * (-len(token) % 4)
+        direcao, micros, pk = base64.urlsafe_b64decode(preenchido).decode('ascii').split(':')
+        if direcao not in ('n', 'p'):
+            raise ValueError(direcao)
+        data_hora = _EPOCA + int(micros) * _MICROSSEGUNDO
+        return direcao, data_hora, int(pk)
+    except (ValueError, UnicodeDecodeError, OverflowError) as e:
+        raise CursorInvalido(token) from e
+
+
+class PaginaCursor:
+    """
+    Uma página de resultados com os tokens para a próxima e a anterior.
+    """
+
+    def __init__(self, object_list, proximo_cursor, cursor_anterior, total_aproximado=None, total_excede_limite=False):
+        self.object_list = object_list
+        self.proximo_cursor = proximo_cursor
+        self.cursor_anterior = cursor_anterior
+        self.total_aproximado = total_aproximado
+        self.total_excede_limite = total_excede_limite
+
+    @property
+    def has_next(self):
+        return self.proximo_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Pagina um queryset em ordem decrescente de (campo_data, id).
+
+    Exemplo:
+        paginador = CursorPaginator(queryset, 20)
+        pagina = paginador.get_page(request.GET.get('cursor'))
+
+    'queryset' pode ser uma lista de partes (da mais recente para a mais
+    antiga): a página é preenchida parte a parte, e a parte seguinte só é
+    consultada quando a anterior não completa a página.
+    """
+
+    def __init__(self, queryset, per_page, campo_data='data_hora', limite_total=1000):
+        self.partes = list(queryset) if isinstance(queryset, (list, tuple)) else [queryset]
+        self.per_page = per_page
+        self.campo_data = campo_data
+        # Limite da contagem aproximada (COUNT sobre no máximo N+1 linhas)
+        self.limite_total = limite_total
+
+    def _antes_de(self, data_hora, pk):
+        # Linhas estritamente "mais antigas" que (data_hora, pk)
+        return Q(**{f'{self.campo_data}__lt': data_hora}) | Q(**{self.campo_data: data_hora, 'pk__lt': pk})
+
+    def _depois_de(self, data_hora, pk):
+        # Linhas estritamente "mais recentes" que (data_hora, pk)
+        return Q(**{f'{self.campo_data}__gt': data_hora}) | Q(**{self.campo_data: data_hora, 'pk__gt': pk})
+
+    def contar_aproximado(self):
+        """
+        Contagem limitada: lê no máximo 'limite_total' + 1 linhas.
+        Retorna (total, excede_limite).
+        """
+        total = 0
+        for parte in self.partes:
+            total += parte.order_by()[:self.limite_total + 1 - total].count()
+            if total > self.limite_total:
+                return self.limite_total, True
+        return total, False
+
+    async def acontar_aproximado(self):
+        """
+        Versão assíncrona de contar_aproximado().
+        """
+        total = 0
+        for parte in self.partes:
+            total += await parte.order_by()[:self.limite_total + 1 - total].acount()
+            if total > self.limite_total:
+                return self.limite_total, True
+        return total, False
+
+    def _ler_cursor(self, cursor):
+        # (direcao, data_hora, pk); tudo None para a primeira página ou token inválido
+        if cursor:
+            try:
+                return _decodificar_cursor(cursor)
+            except CursorInvalido:
+                pass
+        return None, None, None
+
+    def _partes_na_ordem(self, direcao):
+        # Ao voltar uma página (ordem crescente), a parte mais antiga vem primeiro
+        return reversed(self.partes) if direcao == 'p' else self.partes
+
+    def _consulta(self, parte, direcao, data_hora, pk, limite):
+        """
+        Queryset da página pedida numa parte, limitado a 'limite' linhas (até
+        per_page + 1: a linha a mais indica se há outra página naquela direção).
+        """
+        if direcao == 'p':
+            # Volta uma página: busca em ordem crescente (invertida em _montar_pagina)
+            queryset = parte.filter(self._depois_de(data_hora, pk)).order_by(self.campo_data, 'pk')
+        else:
+            queryset = parte
+            if direcao == 'n':
+                queryset = queryset.filter(self._antes_de(data_hora, pk))
+            queryset = queryset.order_by(f'-{self.campo_data}', '-pk')
+        return queryset[:limite]
+
+    def _montar_pagina(self, direcao, linhas, total=None, excede=False):
+        if direcao == 'p':
+            ha_mais_recentes = len(linhas) > self.per_page
+            linhas = linhas[:self.per_page]
+            linhas.reverse()
+            ha_mais_antigas = True
+        else:
+            ha_mais_antigas = len(linhas) > self.per_page
+            linhas = linhas[:self.per_page]
+            ha_mais_recentes = direcao == 'n'
+
+        proximo = anterior = None
+        if linhas:
+            primeira, ultima = linhas[0], linhas[-1]
+            if ha_mais_antigas:
+                proximo = _codificar_cursor('n', getattr(ultima, self.campo_data), ultima.pk)
+            if ha_mais_recentes:
+                anterior = _codificar_cursor('p', getattr(primeira, self.campo_data), primeira.pk)
+
+        return PaginaCursor(linhas, proximo, anterior, total, excede)
+
+    def get_page(self, cursor=None, com_total=False):
+        """
+        Retorna a PaginaCursor indicada pelo token (ou a primeira, se vazio/inválido).
+        """
+        direcao, data_hora, pk = self._ler_cursor(cursor)
+        linhas = []
+        for parte in self._partes_na_ordem(direcao):
+            linhas += self._consulta(parte, direcao, data_hora, pk, self.per_page + 1 - len(linhas))
+            if len(linhas) > self.per_page:
+                break
+        if direcao == 'p' and not linhas:
+            # Nada mais recente que o cursor: volta para a primeira página
+            return self.get_page(None, com_total)
+
+        total, excede = self.contar_aproximado() if com_total else (None, False)
+        return self._montar_pagina(direcao, linhas, total, excede)
+
+    async def aget_page(self, cursor=None, com_total=False):
+        """
+        Versão assíncrona de get_page() (ORM assíncrono, para views async).
+        """
+        direcao, data_hora, pk = self._ler_cursor(cursor)
+        linhas = []
+        for parte in self._partes_na_ordem(direcao):
+            consulta = self._consulta(parte, direcao, data_hora, pk, self.per_page + 1 - len(linhas))
+            linhas += [linha async for linha in consulta]
+            if len(linhas) > self.per_page:
+                break
+        if direcao == 'p' and not linhas:
+            return await self.aget_page(None, com_total)
+
+        total, excede = await self.acontar_aproximado() if com_total else (None, False)
+        return self._montar_pagina(direcao, linhas, total, excede)
+
+
+class PaginadorPartes(Paginator):
+    """
+    Paginator do Django sobre uma lista de partes: as páginas vêm da união
+    (UNION ALL) das partes, ordenada por 'ordenacao'; o total é a soma das
+    contagens de cada parte (COUNT sobre a união ordenada não é suportado).
+    """
+
+    def __init__(self, partes, per_page, ordenacao=('-data_hora', '-pk'), **kwargs):
+        self.partes = partes
+        super().__init__(unir(partes, ordenacao), per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return sum(parte.count() for parte in self.partes)
+
+    async def acount(self):
+        total = 0
+        for parte in self.partes:
+            total += await parte.acount()
+        return total
+
+
+def unir(partes, ordenacao):
+    """
+    Um queryset com as linhas de todas as partes (UNION ALL), ordenado. Com
+    uma só parte, o próprio queryset (sem UNION).
+    """
+    if len(partes) == 1:
+        return partes[0].order_by(*ordenacao)
+    # Sem ORDER BY nas partes: não é permitido dentro da união
+    primeira, *outras = [parte.order_by() for parte in partes]
+    return primeira.union(*outras, all=True).order_by(*ordenacao)
+
+
+async def apagina(paginador, numero):
+    """
+    Equivalente assíncrono de Paginator.get_page(numero) para querysets: o
+    COUNT usa acount() e a página é lida com iteração assíncrona. Retorna o
+    mesmo Page do Django, que os templates já usam.
+    """
+    # 'count' é cached_property: com o valor já preenchido, o Paginator não consulta o banco
+    if isinstance(paginador, PaginadorPartes):
+        paginador.count = await paginador.acount()
+    else:
+        paginador.count = await paginador.object_list.acount()
+    pagina = paginador.get_page(numero)
+    pagina.object_list = [objeto async for objeto in pagina.object_list]
+    return pagina
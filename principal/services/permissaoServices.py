@@ -0,0 +1,63 @@
+# Author: João Victor Marques Favero
+"""
+Permissão de retirada por grupo: "o usuário U pode retirar a chave K?".
+
+Uma chave sem grupos em 'grupos_permissao' pode ser retirada por qualquer
+usuário autenticado; com grupos, o usuário precisa estar em pelo menos um
+deles. A verificação é feita pelo banco, com EXISTS sobre as tabelas M2M,
+anotada no próprio queryset. Não é preciso carregar os grupos de cada usuário.
+
+Orçamento de consultas (além de sessão/usuário da requisição):
+- Página de usuários para uma chave (entregar_chave): 1 consulta para os
+  grupos da chave + COUNT e página do Paginator. A quantidade de usuários
+  na página não altera o total.
+- Uma chave para o usuário logado (pegar_chave): 1 consulta (a própria
+  leitura da chave). Os nomes dos grupos só são lidos quando a permissão
+  é negada, para o aviso: +1 consulta.
+"""
+
+from django.db.models import Exists, OuterRef, Value
+from principal.models import Chave, Usuario
+
+GruposChave = Chave.grupos_permissao.through
+GruposUsuario = Usuario.groups.through
+
+
+def grupos_exigidos(chave):
+    """
+    Lista de (id, nome) dos grupos com permissão na chave (uma consulta).
+    """
+    return list(chave.grupos_permissao.order_by('name').values_list('pk', 'name'))
+
+
+def anotar_permissao_usuarios(queryset, grupo_ids):
+    """
+    Anota 'tem_permissao' num queryset de Usuario, dados os ids dos grupos
+    exigidos pela chave (vazio = sem restrição).
+    """
+    if not grupo_ids:
+        return queryset.annotate(tem_permissao=Value(True))
+    return queryset.annotate(tem_permissao=Exists(
+        GruposUsuario.objects.filter(usuario_id=OuterRef('pk'), group_id__in=grupo_ids)
+    ))
+
+
+def anotar_permissao_chaves(queryset, usuario):
+    """
+    Anota num queryset de Chave:
+    - 'exige_grupo': a chave tem grupos com permissão;
+    - 'tem_permissao': 'usuario' pode retirar a chave.
+    """
+    exige_grupo = Exists(GruposChave.objects.filter(chave_id=OuterRef('pk')))
+    # Usuário da requisição vindo do cache de autenticação: grupos já conhecidos, sem subconsulta
+    grupo_ids = getattr(usuario, 'grupo_ids', None)
+    if grupo_ids is None:
+        grupo_ids = GruposUsuario.objects.filter(usuario_id=usuario.pk).values('group_id')
+    em_grupo_permitido = Exists(GruposChave.objects.filter(
+        chave_id=OuterRef('pk'),
+        group_id__in=grupo_ids,
+    ))
+    return queryset.annotate(
+        exige_grupo=exige_grupo,
+        tem_permissao=~exige_grupo | em_grupo_permitido,
+    )
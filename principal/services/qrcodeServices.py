@@ -0,0 +1,316 @@
+# Author: João Victor Marques Favero
+"""
+Leitura de QR Code em fotos enviadas pelo scan_page, fora da thread da requisição.
+
+Fotos de celular chegam com 12 MP ou mais, e o pyzbar sobre a imagem inteira
+prende o worker por segundos. O pipeline:
+
+1. Recusa arquivos acima de QRCODE_UPLOAD_MAX_BYTES e imagens acima de
+   QRCODE_MAX_PIXELS (lidos do cabeçalho, antes de decodificar a imagem).
+2. Tenta primeiro numa cópia reduzida em tons de cinza (lado maior igual a
+   QRCODE_LADO_REDUZIDO; em JPEG a redução é feita pelo próprio decodificador,
+   com draft()). Só em caso de falha decodifica a imagem em resolução total.
+3. Roda num pool de processos limitado (QRCODE_PROCESSOS), com no máximo
+   QRCODE_FILA_MAXIMA leituras em andamento (executando ou esperando um
+   processo livre). Cada processo atende uma leitura por vez, e só a
+   execução conta para QRCODE_TIMEOUT_SEGUNDOS: a espera por um processo
+   livre não. Um processo que passa do tempo é finalizado e substituído,
+   sem afetar as leituras dos outros. Com QRCODE_PROCESSOS = 0 a leitura
+   roda no próprio processo.
+
+Cada etapa tem seu tempo medido (ms) e devolvido no resultado.
+"""
+
+import io
+import logging
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+from pyzbar.pyzbar import decode
+
+logger = logging.getLogger(__name__)
+
+# Padrões (sobrescritos pelas configurações de mesmo nome no settings)
+PADROES = {
+    'QRCODE_UPLOAD_MAX_BYTES': 15 * 1024 * 1024,
+    'QRCODE_MAX_PIXELS': 50_000_000,
+    'QRCODE_LADO_REDUZIDO': 1024,
+    'QRCODE_PROCESSOS': 2,
+    'QRCODE_FILA_MAXIMA': 8,
+    'QRCODE_TIMEOUT_SEGUNDOS': 5,
+}
+
+# dados: texto do QR (ou None); etapa: 'reduzida', 'completa' ou None; tempos: {etapa: ms}
+ResultadoLeitura = namedtuple('ResultadoLeitura', ['dados', 'etapa', 'tempos'])
+
+
+class ErroLeitura(Exception):
+    """
+    A imagem não pôde ser lida (mensagem pronta para o usuário).
+    """
+
+
+class ImagemRecusada(ErroLeitura):
+    """
+    Arquivo grande demais, resolução acima do limite ou formato inválido.
+    """
+
+
+class LeituraIndisponivel(ErroLeitura):
+    """
+    Pool ocupado ou leitura acima do tempo limite.
+    """
+
+
+def configuracao(nome):
+    return getattr(settings, nome, PADROES[nome])
+
+
+# --- Leitura (executada no processo do pool) ---
+
+def _ms(inicio):
+    return round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def _primeiro_texto(imagem):
+    resultados = decode(imagem)
+    return resultados[0].data.decode('utf-8') if resultados else None
+
+
+def _abrir(conteudo, max_pixels):
+    imagem = Image.open(io.BytesIO(conteudo))  # Lê só o cabeçalho
+    largura, altura = imagem.size
+    if largura * altura > max_pixels:
+        raise ImagemRecusada(
+            f'Imagem com {largura}x{altura} pixels excede o limite de {max_pixels:,} pixels.'
+        )
+    return imagem
+
+
+def ler_qrcode(conteudo, max_pixels, lado_reduzido, tentar_completa=True):
+    """
+    Procura um QR Code nos bytes de uma imagem: primeiro na versão reduzida em
+    tons de cinza, depois (se 'tentar_completa') na resolução total.
+    Não usa o Django: roda tanto no processo da requisição quanto no pool.
+    """
+    tempos = {}
+
+    inicio = time.perf_counter()
+    try:
+        imagem = _abrir(conteudo, max_pixels)
+        largura, altura = imagem.size
+        # JPEG: o decodificador já entrega a imagem reduzida (escala DCT), bem mais rápido
+        imagem.draft('L', (lado_reduzido, lado_reduzido))
+        reduzida = imagem.convert('L')
+    except ImagemRecusada:
+        raise
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ImagemRecusada('Arquivo de imagem inválido ou corrompido.')
+    reduzida.thumbnail((lado_reduzido, lado_reduzido))
+    tempos['reduzir'] = _ms(inicio)
+
+    inicio = time.perf_counter()
+    dados = _primeiro_texto(reduzida)
+    tempos['ler_reduzida'] = _ms(inicio)
+    if dados is not None:
+        return ResultadoLeitura(dados, 'reduzida', tempos)
+
+    # A reduzida já tinha o tamanho original: não há o que escalar
+    if not tentar_completa or max(largura, altura) <= lado_reduzido:
+        return ResultadoLeitura(None, None, tempos)
+
+    inicio = time.perf_counter()
+    completa = _abrir(conteudo, max_pixels).convert('L')
+    tempos['carregar_completa'] = _ms(inicio)
+
+    inicio = time.perf_counter()
+    dados = _primeiro_texto(completa)
+    tempos['ler_completa'] = _ms(inicio)
+    return ResultadoLeitura(dados, 'completa' if dados is not None else None, tempos)
+
+
+# --- Pool de processos ---
+
+def _laco_leitor(conexao):
+    """
+    Corpo de cada processo do pool: executa (função, argumentos) recebidos
+    pelo pipe e devolve (True, resultado) ou (False, exceção).
+    """
+    conexao.send(None)  # Pronto (módulos importados)
+    while True:
+        try:
+            funcao, argumentos = conexao.recv()
+        except (EOFError, OSError):
+            return  # O processo do servidor fechou o pipe
+        try:
+            resposta = (True, funcao(*argumentos))
+        except Exception as erro:
+            resposta = (False, erro)
+        conexao.send(resposta)
+
+
+# Tempo máximo para um processo novo do pool ficar pronto
+ESPERA_INICIO_SEGUNDOS = 30
+
+
+class _TempoEsgotado(Exception):
+    pass
+
+
+class _Leitor:
+    """
+    Um processo do pool, usado por uma leitura de cada vez.
+    """
+
+    def __init__(self):
+        # 'spawn': o servidor tem threads, e fork com threads ativas é inseguro
+        contexto = get_context('spawn')
+        self.conexao, filho = contexto.Pipe()
+        self.processo = contexto.Process(target=_laco_leitor, args=(filho,), daemon=True)
+        self.processo.start()
+        filho.close()
+        # Espera o processo importar os módulos: esse tempo não conta para a primeira leitura
+        if not self.conexao.poll(ESPERA_INICIO_SEGUNDOS):
+            self.encerrar()
+            raise OSError('O processo de leitura não iniciou.')
+        self.conexao.recv()
+
+    def executar(self, funcao, argumentos, timeout):
+        """
+        Executa funcao(*argumentos) no processo e retorna (sucesso, resultado
+        ou exceção). Levanta _TempoEsgotado se passar de 'timeout' segundos e
+        EOFError/OSError se o processo morrer.
+        """
+        self.conexao.send((funcao, argumentos))
+        if not self.conexao.poll(timeout):
+            raise _TempoEsgotado
+        return self.conexao.recv()
+
+    def encerrar(self):
+        # Um processo preso no zbar só é liberado sendo finalizado
+        self.processo.terminate()
+        self.processo.join(1)
+        self.conexao.close()
+
+
+_livres = []  # Processos ociosos
+_total = 0  # Processos existentes (ociosos + em uso + sendo criados)
+_condicao = threading.Condition()
+_vagas = None  # Semáforo: leituras em andamento (executando ou esperando um processo)
+_trava_vagas = threading.Lock()
+
+
+def _obter_vagas():
+    global _vagas
+    with _trava_vagas:
+        if _vagas is None:
+            _vagas = threading.BoundedSemaphore(configuracao('QRCODE_FILA_MAXIMA'))
+        return _vagas
+
+
+def _reservar_leitor():
+    """
+    Um processo ocioso, ou um novo se o pool ainda não tem QRCODE_PROCESSOS;
+    senão, espera um ser devolvido.
+    """
+    global _total
+    with _condicao:
+        while not _livres and _total >= configuracao('QRCODE_PROCESSOS'):
+            _condicao.wait()
+        if _livres:
+            return _livres.pop()
+        _total += 1
+    try:
+        return _Leitor()  # Fora da trava: a criação leva alguns décimos de segundo
+    except BaseException:
+        _descartar_leitor(None)
+        raise
+
+
+def _devolver_leitor(leitor):
+    with _condicao:
+        _livres.append(leitor)
+        _condicao.notify()
+
+
+def _descartar_leitor(leitor):
+    """
+    Finaliza um processo travado ou morto; o próximo pedido cria outro no lugar.
+    """
+    global _total
+    if leitor is not None:
+        leitor.encerrar()
+    with _condicao:
+        _total -= 1
+        _condicao.notify()
+
+
+def executar_no_pool(funcao, argumentos):
+    """
+    Executa funcao(*argumentos) (função de módulo, com argumentos e retorno
+    serializáveis) num processo do pool, com os limites de fila e de tempo.
+    Levanta LeituraIndisponivel se a fila está cheia, se a execução passa de
+    QRCODE_TIMEOUT_SEGUNDOS ou se o processo morre.
+    """
+    vagas = _obter_vagas()
+    if not vagas.acquire(blocking=False):
+        raise LeituraIndisponivel('Muitas leituras em andamento. Tente novamente em instantes.')
+    try:
+        try:
+            leitor = _reservar_leitor()
+        except (EOFError, OSError):
+            raise LeituraIndisponivel('Falha temporária ao ler a imagem. Tente novamente.')
+        try:
+            sucesso, valor = leitor.executar(funcao, argumentos, configuracao('QRCODE_TIMEOUT_SEGUNDOS'))
+        except _TempoEsgotado:
+            _descartar_leitor(leitor)
+            raise LeituraIndisponivel('A leitura da imagem demorou demais. Tente uma foto mais nítida.')
+        except (EOFError, OSError):
+            # O processo morreu (ex.: falta de memória)
+            _descartar_leitor(leitor)
+            raise LeituraIndisponivel('Falha temporária ao ler a imagem. Tente novamente.')
+        except BaseException:
+            # Interrompido no meio: a resposta pendente ficaria para o próximo pedido
+            _descartar_leitor(leitor)
+            raise
+        _devolver_leitor(leitor)
+        if not sucesso:
+            raise valor  # Erro da própria função (ex.: ImagemRecusada): o processo segue em uso
+        return valor
+    finally:
+        vagas.release()
+
+
+def decodificar_upload(arquivo):
+    """
+    Lê o QR Code de um arquivo enviado (UploadedFile), respeitando os limites
+    de tamanho, resolução, concorrência e tempo. Levanta ErroLeitura.
+    """
+    limite_bytes = configuracao('QRCODE_UPLOAD_MAX_BYTES')
+    if arquivo.size > limite_bytes:
+        raise ImagemRecusada(f'Arquivo maior que o limite de {filesizeformat(limite_bytes)}.')
+
+    inicio = time.perf_counter()
+    conteudo = arquivo.read()
+    argumentos = (conteudo, configuracao('QRCODE_MAX_PIXELS'), configuracao('QRCODE_LADO_REDUZIDO'))
+
+    if configuracao('QRCODE_PROCESSOS') == 0:
+        resultado = ler_qrcode(*argumentos)
+    else:
+        resultado = executar_no_pool(ler_qrcode, argumentos)
+
+    resultado.tempos['total'] = _ms(inicio)
+    logger.debug('Leitura de QR Code (%s): %s', resultado.etapa or 'sem resultado', resultado.tempos)
+    return resultado
+
+
+def cabecalho_server_timing(tempos):
+    """
+    Tempos das etapas no formato do cabeçalho Server-Timing (visível no DevTools).
+    """
+    return ', '.join(f'{etapa};dur={ms}' for etapa, ms in tempos.items())
@@ -0,0 +1,82 @@
+# Author: João Victor Marques Favero
+"""
+Réplica de leitura: atraso em relação ao banco principal e, no perfil
+SQLite, a cópia do principal para o arquivo da réplica.
+
+O atraso é medido pelo histórico (toda mudança de posse gera um registro):
+é a idade do registro mais antigo que o principal tem e a réplica ainda não.
+Edições diretas de chaves sem histórico (admin) não entram na medida.
+A medida fica em cache por REPLICA_INTERVALO_MEDICAO segundos.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+from principal.routers import ALIAS_REPLICA
+from principal.services.versaoServices import obter_versao_historico
+
+CHAVE_CACHE_ATRASO = 'principal:atraso_replica'
+
+
+def _medir_atraso():
+    from principal.models import HistoricoEmprestimo
+
+    try:
+        ultimo_na_replica = HistoricoEmprestimo.objects.using(ALIAS_REPLICA).order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        primeiro_pendente = HistoricoEmprestimo.objects.using(DEFAULT_DB_ALIAS).filter(
+            pk__gt=ultimo_na_replica
+        ).order_by('pk').values_list('data_hora', flat=True).first()
+    except DatabaseError:
+        return None, 0
+    if primeiro_pendente is None:
+        return 0.0, ultimo_na_replica
+    return max(0.0, (timezone.now() - primeiro_pendente).total_seconds()), ultimo_na_replica
+
+
+def atraso_replica():
+    """
+    (atraso, ultimo_id): atraso estimado da réplica em segundos (0 = em dia;
+    None se ela não pôde ser consultada e não deve ser usada) e o último
+    registro de histórico que ela tinha na medição.
+    """
+    medida = cache.get(CHAVE_CACHE_ATRASO)
+    if medida is None:
+        medida = _medir_atraso()
+        cache.set(CHAVE_CACHE_ATRASO, medida, getattr(settings, 'REPLICA_INTERVALO_MEDICAO', 2))
+    return medida
+
+
+def replica_em_dia(ultimo_id):
+    """
+    True se a réplica (que tinha até 'ultimo_id' na medição) já tem o último
+    registro gravado no principal, segundo a versão do histórico em cache.
+    Cobre as escritas feitas depois da última medição.
+    """
+    return obter_versao_historico()[0] <= ultimo_id
+
+
+def sincronizar_sqlite(paginas=-1, pausa=0):
+    """
+    Copia o banco principal (SQLite) para o arquivo da réplica com a API de
+    backup do SQLite, sem parar o sistema. Com a réplica em WAL, quem lê dela
+    continua vendo a cópia anterior até o fim da cópia nova.
+
+    'paginas' por etapa (-1 = tudo de uma vez) e 'pausa' (segundos) entre
+    etapas deixam o principal livre para escritas durante a cópia.
+    Retorna o tempo gasto em segundos.
+    """
+    origem, destino = connections[DEFAULT_DB_ALIAS], connections[ALIAS_REPLICA]
+    if origem.vendor != 'sqlite' or destino.vendor != 'sqlite':
+        raise ValueError('A cópia só vale para o perfil SQLite; no PostgreSQL use a replicação do servidor.')
+
+    inicio = time.perf_counter()
+    origem.ensure_connection()
+    destino.ensure_connection()
+    origem.connection.backup(destino.connection, pages=paginas, sleep=pausa)
+    cache.delete(CHAVE_CACHE_ATRASO)
+    return time.perf_counter() - inicio
@@ -0,0 +1,223 @@
+# Author: João Victor Marques Favero
+"""
+Sessões de empréstimo: o histórico de eventos ('adquirida', 'transferida',
+'devolucao') convertido em períodos (chave, portador, início, fim).
+
+Cada movimentação atualiza as sessões na mesma transação do histórico
+(emprestimoServices): 'transferida' e 'devolucao' fecham a sessão aberta da
+chave e 'adquirida' abre uma nova. Perguntas como "com quem estava a chave às
+15h" ou "quanto tempo a chave ficou fora" viram consultas por intervalo nos
+índices de SessaoEmprestimo, sem percorrer e parear eventos.
+
+reconstruir() recria todas as sessões a partir do histórico (tabela
+principal e arquivo) numa única passada pelos eventos ordenados por chave e
+data.
+"""
+
+from django.db import router, transaction
+from django.db.models import Avg, Case, CharField, Count, DateTimeField, DurationField, ExpressionWrapper, F, Max, Q, Sum, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from principal.models import Chave, HistoricoEmprestimo, HistoricoEmprestimoArquivo, SessaoEmprestimo, Usuario
+from principal.services.buscaServices import filtrar_chaves, filtrar_usuarios
+from principal.services.historicoServices import intervalo_datas
+from principal.services.paginacaoServices import unir
+
+# Chaves por UPDATE ao fechar sessões (limite de profundidade de expressões do SQLite)
+TAMANHO_BLOCO_SESSOES = 200
+
+# Sessões gravadas por bulk_create na reconstrução
+TAMANHO_LOTE_RECONSTRUCAO = 2000
+
+_DURACAO = ExpressionWrapper(F('fim') - F('inicio'), output_field=DurationField())
+
+
+def registrar(registros):
+    """
+    Atualiza as sessões com os registros de histórico recém-gravados.
+    Chamado dentro da transação da movimentação.
+    """
+    fechamentos = [
+        registro for registro in registros
+        if registro.acao in ('transferida', 'devolucao') and registro.chave_id is not None
+    ]
+    for inicio in range(0, len(fechamentos), TAMANHO_BLOCO_SESSOES):
+        bloco = fechamentos[inicio:inicio + TAMANHO_BLOCO_SESSOES]
+        SessaoEmprestimo.objects.filter(
+            chave_id__in=[registro.chave_id for registro in bloco], fim__isnull=True
+        ).update(
+            fim=Case(*[When(chave_id=r.chave_id, then=Value(r.data_hora)) for r in bloco], output_field=DateTimeField()),
+            encerramento=Case(*[When(chave_id=r.chave_id, then=Value(r.acao)) for r in bloco], output_field=CharField()),
+        )
+
+    # Nova retirada de quem já está com a chave: a sessão aberta continua
+    # (a restrição de uma sessão aberta por chave descarta a repetida)
+    SessaoEmprestimo.objects.bulk_create([
+        SessaoEmprestimo(chave_id=registro.chave_id, usuario_id=registro.usuario_id, inicio=registro.data_hora)
+        for registro in registros
+        if registro.acao == 'adquirida' and registro.chave_id is not None
+    ], ignore_conflicts=True)
+
+
+def parear_eventos(eventos):
+    """
+    Gera as sessões de uma sequência de eventos (chave_id, usuario_id,
+    data_hora, acao) ordenada por chave, data/hora e id. Uma passada, com
+    memória constante: só a sessão aberta da chave atual fica guardada.
+    """
+    chave_atual = aberta = None
+    for chave_id, usuario_id, data_hora, acao in eventos:
+        if chave_id != chave_atual:
+            if aberta is not None:
+                yield aberta
+            chave_atual, aberta = chave_id, None
+
+        if acao == 'adquirida':
+            if aberta is not None:
+                if aberta.usuario_id == usuario_id:
+                    continue  # Nova retirada de quem já estava com a chave
+                # Troca de portador sem a linha 'transferida' (ex.: histórico importado)
+                aberta.fim, aberta.encerramento = data_hora, 'transferida'
+                yield aberta
+            aberta = SessaoEmprestimo(chave_id=chave_id, usuario_id=usuario_id, inicio=data_hora)
+        elif aberta is not None:
+            aberta.fim, aberta.encerramento = data_hora, acao
+            yield aberta
+            aberta = None
+
+    if aberta is not None:
+        yield aberta
+
+
+def reconstruir(progresso=None):
+    """
+    Apaga e recria todas as sessões a partir do histórico (arquivo e tabela
+    principal), numa única transação. 'progresso(total)' é chamado a cada
+    lote gravado. Retorna a quantidade de sessões criadas.
+    """
+    colunas = ('chave_id', 'usuario_id', 'data_hora', 'acao', 'id')
+    partes = [
+        historico.objects.filter(chave__isnull=False).values_list(*colunas)
+        for historico in (HistoricoEmprestimo, HistoricoEmprestimoArquivo)
+    ]
+    eventos = (
+        linha[:4]
+        for linha in unir(partes, ('chave_id', 'data_hora', 'id')).iterator(chunk_size=TAMANHO_LOTE_RECONSTRUCAO)
+    )
+
+    total = 0
+    with transaction.atomic(using=router.db_for_write(SessaoEmprestimo)):
+        SessaoEmprestimo.objects.all().delete()
+        lote = []
+        for sessao in parear_eventos(eventos):
+            lote.append(sessao)
+            if len(lote) == TAMANHO_LOTE_RECONSTRUCAO:
+                SessaoEmprestimo.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+                if progresso:
+                    progresso(total)
+        SessaoEmprestimo.objects.bulk_create(lote)
+        total += len(lote)
+    return total
+
+
+def portador_em(chave, momento):
+    """
+    Sessão em que 'chave' estava com alguém em 'momento', ou None se estava
+    na portaria. Uma busca no índice (chave, inicio).
+    """
+    sessao = SessaoEmprestimo.objects.select_related('usuario').filter(
+        chave=chave, inicio__lte=momento
+    ).order_by('-inicio').first()
+    if sessao is None or (sessao.fim is not None and sessao.fim <= momento):
+        return None
+    return sessao
+
+
+def filtrar_sessoes(queryset, parametros):
+    """
+    Aplica ao queryset de SessaoEmprestimo os filtros da tela de sessões.
+
+    'parametros' (dicionário ou QueryDict), chaves opcionais: chave_nome,
+    usuario_nome, momento ('AAAA-MM-DDTHH:MM': sessões em andamento nesse
+    instante), de e ate (dias: sessões que se sobrepõem ao intervalo) e
+    abertas ('1': só as que ainda não terminaram).
+    """
+    chave_nome = parametros.get('chave_nome')
+    usuario_nome = parametros.get('usuario_nome')
+
+    if chave_nome:
+        queryset = queryset.filter(chave_id__in=filtrar_chaves(Chave.objects.all(), chave_nome).values('pk'))
+    if usuario_nome:
+        queryset = queryset.filter(usuario_id__in=filtrar_usuarios(Usuario.objects.all(), usuario_nome).values('pk'))
+    if parametros.get('abertas') == '1':
+        queryset = queryset.filter(fim__isnull=True)
+
+    momento = ler_momento(parametros.get('momento'))
+    if momento:
+        queryset = queryset.filter(inicio__lte=momento).filter(Q(fim__gt=momento) | Q(fim__isnull=True))
+
+    # Sobreposição com [inicio, fim): começou antes do fim e terminou depois do início
+    inicio, fim = intervalo_datas(parametros.get('de'), parametros.get('ate'))
+    if fim:
+        queryset = queryset.filter(inicio__lt=fim)
+    if inicio:
+        queryset = queryset.filter(Q(fim__gt=inicio) | Q(fim__isnull=True))
+
+    return queryset
+
+
+def tem_filtro(parametros):
+    """
+    True se 'parametros' restringe as sessões por chave, usuário ou data
+    (valores inválidos não contam).
+    """
+    return bool(
+        parametros.get('chave_nome') or parametros.get('usuario_nome')
+        or ler_momento(parametros.get('momento'))
+        or any(intervalo_datas(parametros.get('de'), parametros.get('ate')))
+    )
+
+
+def ler_momento(valor):
+    """
+    'AAAA-MM-DDTHH:MM' (campo datetime-local) como datetime no fuso atual;
+    None se vazio ou inválido.
+    """
+    try:
+        momento = parse_datetime(valor) if valor else None
+    except ValueError:
+        return None
+    if momento is not None and timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+
+def resumo_duracoes(queryset):
+    """
+    Quantidade de sessões e duração média, máxima e total das já encerradas.
+    """
+    return queryset.order_by().aggregate(
+        sessoes=Count('pk'),
+        abertas=Count('pk', filter=Q(fim__isnull=True)),
+        media=Avg(_DURACAO, filter=Q(fim__isnull=False)),
+        maxima=Max(_DURACAO, filter=Q(fim__isnull=False)),
+        total=Sum(_DURACAO, filter=Q(fim__isnull=False)),
+    )
+
+
+def formatar_duracao(duracao):
+    """
+    timedelta como texto curto ('2d 5h 10min'); '-' se None.
+    """
+    if duracao is None:
+        return '-'
+    minutos = int(duracao.total_seconds() // 60)
+    dias, minutos = divmod(minutos, 24 * 60)
+    horas, minutos = divmod(minutos, 60)
+    partes = [f'{dias}d'] if dias else []
+    if horas or dias:
+        partes.append(f'{horas}h')
+    partes.append(f'{minutos}min')
+    return ' '.join(partes)
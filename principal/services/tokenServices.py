@@ -0,0 +1,68 @@
+# Author: João Victor Marques Favero
+"""
+Tokens assinados gravados nos QR Codes das chaves.
+
+O token leva o id da chave e a versão do QR Code (Chave.versao_qrcode), em
+base 36, e uma assinatura HMAC-SHA256 truncada (SECRET_KEY + salt). Fica
+curto, para o QR Code continuar pequeno, e é validado sem consultar o banco:
+token forjado ou com assinatura de outra rotação é recusado de imediato.
+Uma versão antiga (etiqueta substituída) é recusada na leitura da chave,
+filtrada pela versão, e pelo UPDATE condicional da retirada.
+
+Para invalidar todas as etiquetas de uma vez, troque QRCODE_TOKEN_ROTACAO.
+"""
+
+import base64
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# Bytes da assinatura mantidos no token (128 bits)
+TAMANHO_ASSINATURA = 16
+
+
+class TokenInvalido(Exception):
+    """
+    Token malformado ou com assinatura que não confere.
+    """
+
+
+def _salt():
+    return f"principal.qrcode:{getattr(settings, 'QRCODE_TOKEN_ROTACAO', '1')}"
+
+
+def _assinatura(valor):
+    digest = salted_hmac(_salt(), valor, algorithm='sha256').digest()[:TAMANHO_ASSINATURA]
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def _base36(numero):
+    digitos = '0123456789abcdefghijklmnopqrstuvwxyz'
+    texto = ''
+    while True:
+        numero, resto = divmod(numero, 36)
+        texto = digitos[resto] + texto
+        if not numero:
+            return texto
+
+
+def gerar_token(chave_pk, versao):
+    """
+    Token da chave na versão informada (ex.: '2s.1.Xr3...').
+    """
+    valor = f'{_base36(chave_pk)}.{_base36(versao)}'
+    return f'{valor}.{_assinatura(valor)}'
+
+
+def ler_token(token):
+    """
+    Valida o token e retorna (chave_pk, versao). Levanta TokenInvalido.
+    """
+    try:
+        chave_b36, versao_b36, assinatura = token.split('.')
+        chave_pk, versao = int(chave_b36, 36), int(versao_b36, 36)
+    except ValueError:
+        raise TokenInvalido('QR Code inválido.')
+    if not constant_time_compare(assinatura, _assinatura(f'{chave_b36}.{versao_b36}')):
+        raise TokenInvalido('QR Code inválido ou de outro sistema.')
+    return chave_pk, versao
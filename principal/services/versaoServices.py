@@ -0,0 +1,162 @@
+# Author: João Victor Marques Favero
+"""
+Marcadores de versão do histórico e das chaves, para GET condicional.
+
+Cada marcador fica no cache (uma leitura em memória por requisição) e é
+atualizado quando algo muda. Com eles as views calculam ETag/Last-Modified e
+respondem 304 sem consultar o histórico nem renderizar templates.
+
+- Versão do histórico: id e data_hora do último registro gravado. Toda mudança
+  de posse gera um registro, então ela também cobre o status das chaves.
+- Versão das chaves: muda em edições diretas de Chave (admin, importações).
+
+Os marcadores só valem se todos os processos leem o mesmo cache
+(CACHE_PERFIL 'arquivo' ou 'redis'): com VERSOES_EM_CACHE desligado (padrão
+com 'memoria'), as views não mandam ETag/Last-Modified e o fragmento dos
+últimos empréstimos não fica em cache. Cada marcador expira em
+VERSAO_CACHE_TIMEOUT segundos.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.middleware.csrf import CSRF_SESSION_KEY
+from django.utils import timezone
+
+CHAVE_VERSAO_HISTORICO = 'principal:versao_historico'
+CHAVE_VERSAO_CHAVES = 'principal:versao_chaves'
+
+
+# Tempo em cache do fragmento dos últimos empréstimos (index.html)
+SEGUNDOS_FRAGMENTO_HISTORICO = 3600
+
+
+def versoes_ativas():
+    return getattr(settings, 'VERSOES_EM_CACHE', True)
+
+
+def _timeout():
+    return getattr(settings, 'VERSAO_CACHE_TIMEOUT', 300)
+
+
+def obter_versao_historico():
+    """
+    (id, data_hora) do último registro de histórico. Na falta do valor em
+    cache, busca no banco (uma leitura pela chave primária).
+    """
+    versao = cache.get(CHAVE_VERSAO_HISTORICO)
+    if versao is None:
+        from principal.models import HistoricoEmprestimo
+
+        # Sempre do principal: uma versão lida da réplica atrasada ficaria no cache
+        ultimo = HistoricoEmprestimo.objects.using(DEFAULT_DB_ALIAS).order_by('-pk').values_list(
+            'pk', 'data_hora'
+        ).first()
+        versao = ultimo or (0, None)
+        cache.set(CHAVE_VERSAO_HISTORICO, versao, _timeout())
+    return versao
+
+
+def registrar_alteracao_historico(registros):
+    """
+    Avança a versão do histórico para o registro mais novo de 'registros'.
+    Nunca volta para uma versão anterior (commits concorrentes fora de ordem).
+    """
+    ultimo = max(registros, key=lambda registro: registro.pk)
+    atual = cache.get(CHAVE_VERSAO_HISTORICO)
+    if atual is None or atual[0] < ultimo.pk:
+        cache.set(CHAVE_VERSAO_HISTORICO, (ultimo.pk, ultimo.data_hora), _timeout())
+
+
+def obter_versao_chaves():
+    """
+    (marcador, data/hora) da última edição direta de chaves neste cache.
+    """
+    versao = cache.get(CHAVE_VERSAO_CHAVES)
+    if versao is None:
+        versao = registrar_alteracao_chaves()
+    return versao
+
+
+def registrar_alteracao_chaves():
+    versao = (time.time_ns(), timezone.now())
+    cache.set(CHAVE_VERSAO_CHAVES, versao, _timeout())
+    return versao
+
+
+def contexto_ultimos_emprestimos():
+    """
+    Contexto do fragmento em cache dos últimos empréstimos (index.html): o
+    tempo em cache e as versões que o identificam. Sem VERSOES_EM_CACHE o
+    tempo é 0 e a lista é lida a cada requisição.
+    """
+    if not versoes_ativas():
+        return {'segundos_ultimos_emprestimos': 0}
+    return {
+        'segundos_ultimos_emprestimos': SEGUNDOS_FRAGMENTO_HISTORICO,
+        'versao_historico': obter_versao_historico()[0],
+        'versao_chaves': obter_versao_chaves()[0],
+    }
+
+
+def _tem_mensagens(request):
+    # len() não marca as mensagens como lidas
+    return len(get_messages(request)) > 0
+
+
+def _etag(*partes):
+    return hashlib.md5(':'.join(str(parte) for parte in partes).encode()).hexdigest()
+
+
+def _identidade(request):
+    # O que muda a página de um usuário para outro: usuário, staff e o token CSRF
+    # embutido nos formulários (muda quando o segredo CSRF é rotacionado no login)
+    usuario = request.user
+    segredo_csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    if settings.CSRF_USE_SESSIONS:
+        segredo_csrf = request.session.get(CSRF_SESSION_KEY, '')
+    return (usuario.pk, usuario.is_staff, str(usuario), segredo_csrf)
+
+
+# --- Funções para django.views.decorators.http.condition ---
+
+def etag_lista_emprestimos(request, *args, **kwargs):
+    """
+    ETag do fragmento de últimos empréstimos: só depende do histórico e da query string.
+    """
+    if not versoes_ativas():
+        return None
+    return _etag('emprestimos', obter_versao_historico()[0], request.GET.urlencode())
+
+
+def ultima_modificacao_historico(request, *args, **kwargs):
+    if not versoes_ativas():
+        return None
+    return obter_versao_historico()[1]
+
+
+def etag_pagina_chaves(request, *args, **kwargs):
+    """
+    ETag das páginas de chaves (index, lista_chaves). None (sem ETag) quando
+    há mensagens pendentes, que precisam ser exibidas.
+    """
+    if not versoes_ativas() or _tem_mensagens(request):
+        return None
+    return _etag(
+        request.resolver_match.url_name,
+        obter_versao_historico()[0],
+        obter_versao_chaves()[0],
+        request.GET.urlencode(),
+        *_identidade(request)
+    )
+
+
+def ultima_modificacao_chaves(request, *args, **kwargs):
+    if not versoes_ativas() or _tem_mensagens(request):
+        return None
+    datas = [data for data in (obter_versao_historico()[1], obter_versao_chaves()[1]) if data]
+    return max(datas) if datas else None
@@ -0,0 +1,116 @@
+# Author: João Victor Marques Favero
+"""
+Receptores de sinais do app 'principal' (conectados em PrincipalConfig.ready).
+"""
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+
+def chave_alterada(sender, **kwargs):
+    """
+    Edição direta de Chave (admin, shell): invalida o ETag das páginas de chaves.
+    """
+    from principal.services.versaoServices import registrar_alteracao_chaves
+    registrar_alteracao_chaves()
+
+
+def usuario_alterado(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Usuário editado: o nome dele aparece nas linhas das chaves que estão em
+    sua posse e nos últimos empréstimos. Avança a versão dessas linhas e a
+    das chaves (ETag e fragmentos em cache). O login só grava last_login.
+    """
+    from principal.models import Chave
+    from principal.services.versaoServices import registrar_alteracao_chaves
+
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    Chave.objects.filter(portador_atual=instance).update(versao=F('versao') + 1)
+    registrar_alteracao_chaves()
+
+
+def usuario_invalidado(sender, instance, **kwargs):
+    """
+    Usuário salvo ou apagado: tira do cache de autenticação.
+    """
+    from principal.services.autenticacaoServices import invalidar_usuario
+    invalidar_usuario(instance.pk)
+
+
+def grupos_usuario_alterados(sender, instance, action, reverse, **kwargs):
+    """
+    Grupos ou permissões de usuários alterados (M2M). Pelo lado do usuário,
+    invalida só ele; pelo lado do grupo/permissão, todos.
+    """
+    from principal.services.autenticacaoServices import invalidar_todos, invalidar_usuario
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        invalidar_todos()
+    else:
+        invalidar_usuario(instance.pk)
+
+
+def permissoes_alteradas(sender, **kwargs):
+    """
+    Grupo ou permissão criado, editado ou apagado, ou permissões de um grupo
+    alteradas: invalida o cache de autenticação de todos os usuários.
+    """
+    from principal.services.autenticacaoServices import invalidar_todos
+    if kwargs.get('action', 'post_').startswith('post_'):
+        invalidar_todos()
+
+
+def chave_excluida(sender, instance, **kwargs):
+    """
+    Chave apagada: remove os arquivos de QR Code gerados para ela.
+    """
+    from principal.services.etiquetaServices import remover_qrcodes
+    remover_qrcodes(instance.pk)
+
+
+def historico_salvo(sender, instance, created, **kwargs):
+    """
+    Registro de histórico salvo individualmente (admin, shell ou o registro
+    reaproveitado pelo serviço de empréstimos). A versão só avança depois do
+    commit, para não anunciar um registro que ainda pode ser desfeito.
+    """
+    from principal.services.versaoServices import registrar_alteracao_historico
+    if created:
+        transaction.on_commit(lambda: registrar_alteracao_historico([instance]))
+
+
+def garantir_busca(sender, using, **kwargs):
+    """
+    Após cada migrate, recria triggers FTS5 perdidos quando uma migration
+    reconstrói principal_chave/principal_usuario (comum no SQLite).
+    """
+    from principal.services.buscaServices import instalar_busca
+
+    connection = connections[using]
+    if 'principal_chave_fts' in connection.introspection.table_names():
+        instalar_busca(connection)
+
+
+def configurar_sqlite(sender, connection, **kwargs):
+    """
+    Nova conexão com o banco: aplica SQLITE_PRAGMAS (WAL, busy_timeout etc.)
+    quando o banco é SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, valor in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {valor}')
+
+
+def instrumentar_conexao(sender, connection, **kwargs):
+    """
+    Nova conexão com o banco: instala a medição de consultas das métricas
+    (uma vez por conexão; ela continua instalada nas reconexões).
+    """
+    from principal.services.metricasServices import medir_consulta
+    if medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_consulta)
@@ -8,24 +8,103 @@ document.addEventListener('DOMContentLoaded', function () {
     // Prossegue apenas se o container existir e se for a página inicial
     if (containerLista && window.location.pathname === '/') {
         
-        // Busca o HTML da lista e injeta no container
+        // ETag da última resposta: o servidor responde 304 se nada mudou
+        let etagLista = null;
+
+        // Busca o HTML da lista e injeta no container (modo polling, reserva)
         function atualizarListaEmprestimos() {
             console.log('Atualizando lista...');
-            fetch('/api/ultimos-emprestimos/', {
-                headers: { 'X-Requested-With': 'XMLHttpRequest' }
-            })
-                .then((r) => r.text())
+            const headers = { 'X-Requested-With': 'XMLHttpRequest' };
+            if (etagLista) {
+                headers['If-None-Match'] = etagLista;
+            }
+            // 'no-store': o 304 chega aqui em vez de ser resolvido pelo cache do navegador
+            fetch('/api/ultimos-emprestimos/', { headers: headers, cache: 'no-store' })
+                .then((r) => {
+                    if (r.status === 304) {
+                        return null;
+                    }
+                    etagLista = r.headers.get('ETag');
+                    return r.text();
+                })
                 .then((html) => {
+                    if (html === null) {
+                        console.log('Lista sem alterações.');
+                        return;
+                    }
                     containerLista.innerHTML = html;
                     console.log('Lista atualizada.');
                 })
                 .catch((e) => console.error('Erro ao atualizar a lista:', e));
         }
 
-        // Atualização automática a cada 60s
-        setInterval(atualizarListaEmprestimos, 60000);
+        let intervaloPolling = null;
+        function iniciarPolling() {
+            if (!intervaloPolling) {
+                // Atualização automática a cada 60s
+                intervaloPolling = setInterval(atualizarListaEmprestimos, 60000);
+            }
+        }
+
+        // Insere uma linha nova no topo da tabela, mantendo o limite de linhas
+        function inserirLinha(html) {
+            const tbody = containerLista.querySelector('tbody');
+            if (!tbody) {
+                return;
+            }
+            const vazia = tbody.querySelector('.linha-vazia');
+            if (vazia) {
+                vazia.remove();
+            }
+            tbody.insertAdjacentHTML('afterbegin', html);
+            const limite = parseInt(containerLista.dataset.limite || '10', 10);
+            while (tbody.rows.length > limite) {
+                tbody.deleteRow(-1);
+            }
+        }
+
+        // Feed ao vivo (SSE); se indisponível (ex.: servidor WSGI), volta ao polling
+        if (window.EventSource) {
+            const ultimoId = containerLista.dataset.ultimoId || '0';
+            const fonte = new EventSource('/api/eventos-emprestimos/?ultimo_id=' + encodeURIComponent(ultimoId));
+            let falhas = 0;
+
+            fonte.addEventListener('emprestimo', function (e) {
+                falhas = 0;
+                inserirLinha(e.data);
+            });
+
+            // Muitos eventos perdidos (reconexão tardia): busca a lista inteira de novo
+            fonte.addEventListener('recarregar', function () {
+                falhas = 0;
+                atualizarListaEmprestimos();
+            });
+
+            fonte.onerror = function () {
+                falhas += 1;
+                // O navegador reconecta sozinho (com Last-Event-ID); após várias falhas, desiste
+                if (fonte.readyState === EventSource.CLOSED || falhas >= 3) {
+                    fonte.close();
+                    console.log('Feed ao vivo indisponível, usando polling.');
+                    iniciarPolling();
+                }
+            };
+        } else {
+            iniciarPolling();
+        }
     }
     
+    // --- Lógica 1b: Seleção de todas as chaves (ações em lote)  ---
+    const selecionarTodas = document.getElementById('selecionar-todas');
+
+    if (selecionarTodas) {
+        selecionarTodas.addEventListener('change', function () {
+            document.querySelectorAll('.selecao-chave').forEach(function (caixa) {
+                caixa.checked = selecionarTodas.checked;
+            });
+        });
+    }
+
     // --- Lógica 2: Script de Upload de Imagem  ---
     const scanFormUpload = document.getElementById('form-scan-upload');
     const scanInputUpload = document.getElementById('qr_image_input');
@@ -64,16 +143,69 @@ document.addEventListener('DOMContentLoaded', function () {
                         console.error("Falha ao limpar o scanner.", error);
                     });
                 }
+                // Etiqueta deste sistema (/q/<token>/): retira a chave direto, sem trocar de página
+                const url = new URL(decodedText, window.location.href);
+                if (url.origin === window.location.origin && url.pathname.startsWith('/q/')) {
+                    retirarPorQrcode(url.href);
+                    return;
+                }
                 // Redireciona para a URL lida!
                 window.location.href = decodedText;
             }
         }
 
+        // Lê o token CSRF do cookie (exigido pelo POST da retirada)
+        function lerCookie(nome) {
+            const item = document.cookie.split('; ').find(par => par.startsWith(nome + '='));
+            return item ? decodeURIComponent(item.split('=')[1]) : '';
+        }
+
+        // Retirada direta: um único POST, resposta em JSON mostrada no status
+        function retirarPorQrcode(url) {
+            statusEl.innerHTML = 'QR Code detectado! Registrando a retirada...';
+            fetch(url, {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: {'X-CSRFToken': lerCookie('csrftoken'), 'Accept': 'application/json'},
+            })
+                .then(resposta => resposta.json())
+                .then(dados => {
+                    statusEl.textContent = dados.aviso ? `${dados.mensagem} ${dados.aviso}` : dados.mensagem;
+                    redirectionDone = false;  // Permite ler outra etiqueta
+                })
+                .catch(() => {
+                    // Resposta inesperada (ex.: sessão expirada): abre a página da etiqueta
+                    window.location.href = url;
+                });
+        }
+
         // Função chamada na FALHA (frame não encontrado)
         function onScanFailure(error) {
             // Apenas "não encontrado", não é um erro real.
         }
 
+        // Carrega a biblioteca do scanner só no primeiro uso da câmera
+        // (endereço em data-biblioteca: cópia local com cache longo ou o CDN)
+        let carregamentoBiblioteca = null;
+        function carregarBiblioteca() {
+            if (window.Html5QrcodeScanner) {
+                return Promise.resolve();
+            }
+            if (!carregamentoBiblioteca) {
+                carregamentoBiblioteca = new Promise(function (resolve, reject) {
+                    const script = document.createElement('script');
+                    script.src = btnIniciarScan.dataset.biblioteca;
+                    script.onload = resolve;
+                    script.onerror = function () {
+                        carregamentoBiblioteca = null;  // Permite tentar de novo
+                        reject(new Error('Falha ao carregar o scanner.'));
+                    };
+                    document.head.appendChild(script);
+                });
+            }
+            return carregamentoBiblioteca;
+        }
+
         // --- Lógica dos Botões ---
 
         // 1. Clicar em "Escanear com Câmera"
@@ -83,10 +215,21 @@ document.addEventListener('DOMContentLoaded', function () {
 
             // Mostra o container do scanner
             scannerContainer.style.display = 'block';
+            statusEl.innerHTML = "Carregando o scanner...";
+
+            carregarBiblioteca().then(iniciarScanner).catch(function (erro) {
+                console.error(erro);
+                statusEl.innerHTML = "Não foi possível carregar o scanner. Verifique a conexão e tente de novo.";
+            });
+        });
+
+        // Configura e inicia o scanner
+        // (Html5QrcodeScanner e Html5QrcodeScanType vêm da biblioteca carregada acima)
+        function iniciarScanner() {
+            if (scannerContainer.style.display === 'none') {
+                return;  // Cancelado enquanto a biblioteca carregava
+            }
             statusEl.innerHTML = "Iniciando câmera...";
-            
-            // Configura e inicia o scanner
-            // (Html5QrcodeScanner e Html5QrcodeScanType vêm da biblioteca importada no index.html)
             const scannerConfig = {
                 fps: 10,
                 qrbox: { width: 250, height: 250 },
@@ -108,7 +251,7 @@ document.addEventListener('DOMContentLoaded', function () {
             redirectionDone = false; // Reseta o flag
             html5QrcodeScanner.render(onScanSuccess, onScanFailure);
             statusEl.innerHTML = "Posicione o QR Code na área de leitura.";
-        });
+        }
 
         // 2. Clicar em "Cancelar" (no scanner de vídeo)
         btnCancelarScan.addEventListener('click', function() {
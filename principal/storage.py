@@ -0,0 +1,56 @@
+# Author: João Victor Marques Favero
+"""
+Storage dos arquivos estáticos em produção (STORAGES['staticfiles'] com
+DEBUG = False).
+"""
+
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from principal.services import estaticosServices
+
+
+class EstaticosComprimidos(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage (nomes com o hash do conteúdo, ex.:
+    style.3f2a9c1b7d4e.css) que, no collectstatic, também:
+
+    - minifica o CSS e o JS do próprio projeto antes do cálculo do hash
+      (os do Django e os '.min.' ficam como estão);
+    - grava as variantes .gz e .br de cada arquivo coletado, servidas pelo
+      EstaticosMiddleware conforme o Accept-Encoding.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = self._minificar(paths)
+
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        if not dry_run:
+            for nome in {*self.hashed_files.keys(), *self.hashed_files.values()}:
+                if self.exists(nome):
+                    estaticosServices.comprimir(self.path(nome))
+
+    def _minificar(self, paths):
+        """
+        Minifica a cópia coletada e passa a apontar para ela: o post_process
+        do Manifest lê a origem de 'paths' para calcular o hash e gravar a
+        cópia com hash.
+        """
+        paths = dict(paths)
+        for nome, (storage, caminho) in paths.items():
+            if os.path.splitext(nome)[1] not in estaticosServices.MINIFICADORES:
+                continue
+            if not estaticosServices.do_projeto(storage.path(caminho)):
+                continue
+            with storage.open(caminho) as arquivo:
+                texto = arquivo.read().decode('utf-8')
+            minificado = estaticosServices.minificar(nome, texto)
+            if minificado is None or minificado == texto:
+                continue
+            self.delete(nome)
+            self._save(nome, ContentFile(minificado.encode('utf-8')))
+            paths[nome] = (self, nome)
+        return paths
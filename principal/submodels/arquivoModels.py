@@ -0,0 +1,78 @@
+# Author: João Victor Marques Favero
+
+from django.db import models
+from ..submodels.usuarioModels import Usuario
+from .chaveModels import Chave
+from .emprestimoModels import HistoricoEmprestimo
+
+class HistoricoEmprestimoArquivo(models.Model):
+    """
+    Registros de histórico antigos, movidos da tabela principal pelo comando
+    arquivar_historico (meses inteiros). Mesmas colunas e na mesma ordem de
+    HistoricoEmprestimo, para as duas tabelas poderem ser unidas (UNION ALL)
+    nas buscas que abrangem os dois períodos.
+    """
+    # Mesmo id do registro original
+    id = models.BigIntegerField(primary_key=True)
+
+    chave = models.ForeignKey(
+        Chave,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='historico_arquivado',
+        verbose_name='Chave Transacionada'
+    )
+
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name='Usuário Responsável'
+    )
+
+    # Data/hora original (copiada, não gerada)
+    data_hora = models.DateTimeField('Data e Hora da Ação')
+
+    acao = models.CharField('Ação Realizada', max_length=20, choices=HistoricoEmprestimo.ACAO_CHOICES)
+
+    class Meta:
+        verbose_name = 'Histórico de Empréstimo (Arquivo)'
+        verbose_name_plural = 'Históricos de Empréstimos (Arquivo)'
+        ordering = ['-data_hora']
+        # Os mesmos caminhos de acesso da tabela principal
+        indexes = [
+            models.Index(fields=['data_hora'], name='arq_data_hora_idx'),
+            models.Index(fields=['chave', 'data_hora'], name='arq_chave_data_idx'),
+            models.Index(fields=['usuario', 'data_hora'], name='arq_usuario_data_idx'),
+            models.Index(fields=['acao', 'data_hora'], name='arq_acao_data_idx'),
+        ]
+
+    def __str__(self):
+        nome_chave = self.chave.nome if self.chave else "[Chave Excluída]"
+        nome_usuario = self.usuario.username if self.usuario else "[Usuário Excluído]"
+        data_formatada = self.data_hora.strftime("%d/%m/%Y às %H:%M")
+        return f'{nome_chave} - {self.get_acao_display()} por {nome_usuario} em {data_formatada} (arquivo)'
+
+class ResumoArquivoMensal(models.Model):
+    """
+    Uma linha por mês arquivado: totais por ação, sem precisar ler o arquivo.
+    Também indica até onde vai o arquivo (busca do histórico).
+    """
+    # Primeiro dia do mês
+    mes = models.DateField('Mês', unique=True)
+
+    total = models.PositiveIntegerField('Registros', default=0)
+    adquiridas = models.PositiveIntegerField('Aquisições', default=0)
+    devolucoes = models.PositiveIntegerField('Devoluções', default=0)
+    transferidas = models.PositiveIntegerField('Transferências', default=0)
+
+    arquivado_em = models.DateTimeField('Arquivado em', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Resumo Mensal do Arquivo'
+        verbose_name_plural = 'Resumos Mensais do Arquivo'
+        ordering = ['-mes']
+
+    def __str__(self):
+        return f'{self.mes:%m/%Y}: {self.total} registro(s)'
@@ -4,6 +4,7 @@ Modelo Chave para gerenciamento de chaves físicas.
 """
 
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser, Group
 from .usuarioModels import Usuario
 
@@ -66,6 +67,21 @@ class Chave(models.Model):
         help_text='Não aparece para novos empréstimos, mas mantém histórico.'
     )
 
+    # Versão do QR Code impresso: incrementar invalida as etiquetas antigas
+    versao_qrcode = models.PositiveIntegerField(
+        'Versão do QR Code',
+        default=1,
+        help_text='Ao gerar um novo QR Code, as etiquetas impressas anteriormente deixam de funcionar.'
+    )
+
+    # Versão da linha: muda a cada alteração da chave (retirada, devolução, edição).
+    # Identifica o fragmento em cache da linha nas tabelas de chaves
+    versao = models.PositiveIntegerField(
+        'Versão',
+        default=1,
+        editable=False
+    )
+
     class Meta:
         verbose_name = 'Chave'
         verbose_name_plural = 'Chaves'
@@ -73,3 +89,14 @@ class Chave(models.Model):
     def __str__(self):
         # Exibe o nome da chave
         return self.nome
+
+    def save(self, *args, **kwargs):
+        # Edição de chave existente (admin, shell): avança a versão da linha no próprio UPDATE
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        self.versao = F('versao') + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'versao'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['versao'])
@@ -40,41 +40,42 @@ class HistoricoEmprestimo(models.Model):
         verbose_name = 'Histórico de Empréstimo'
         verbose_name_plural = 'Históricos de Empréstimos'
         ordering = ['-data_hora']  # Mais recente primeiro
+        # Índices que seguem os caminhos reais de acesso: todas as telas ordenam
+        # por data_hora e filtram por chave, usuário ou ação
+        indexes = [
+            models.Index(fields=['data_hora'], name='hist_data_hora_idx'),
+            models.Index(fields=['chave', 'data_hora'], name='hist_chave_data_idx'),
+            models.Index(fields=['usuario', 'data_hora'], name='hist_usuario_data_idx'),
+            models.Index(fields=['acao', 'data_hora'], name='hist_acao_data_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """
-        Aplica regras de negócio ao criar um novo histórico (aquisição/devolução/transferência).
+        Na criação de uma aquisição/devolução, delega ao serviço de empréstimos,
+        que atualiza a chave e grava o histórico numa única transação (o
+        registro em si é gravado por gravar(), com pk e sinais normais).
+        Levanta emprestimoServices.ConflitoEmprestimo se a chave mudou.
         """
         is_new = self.pk is None  # Executa apenas na criação
 
-        if is_new:
-            if self.acao == 'adquirida':
-                # Chave sendo movimentada
-                chave_movimentada = self.chave
-                # Portador anterior, se houver
-                portador_anterior = chave_movimentada.portador_atual
-
-                # Se havia portador e é diferente do novo usuário, registra transferência
-                if portador_anterior is not None and portador_anterior != self.usuario:
-                    HistoricoEmprestimo.objects.create(
-                        chave=chave_movimentada,
-                        usuario=portador_anterior,
-                        acao='transferida'
-                    )
+        if is_new and self.acao in ('adquirida', 'devolucao'):
+            from principal.services import emprestimoServices
 
-                # Atualiza status e portador atual da chave
-                chave_movimentada.status = 'em_uso'
-                chave_movimentada.portador_atual = self.usuario
-                chave_movimentada.save()
-
-            elif self.acao == 'devolucao':
-                # Devolução para a portaria: chave volta a ficar disponível
-                self.chave.status = 'disponivel'
-                self.chave.portador_atual = None
-                self.chave.save()
+            if self.acao == 'adquirida':
+                emprestimoServices.registrar_aquisicao(self.chave, self.usuario, registro=self)
+            else:
+                emprestimoServices.registrar_devolucao(self.chave, registro=self)
+            return
 
         super().save(*args, **kwargs)
 
+    def gravar(self):
+        """
+        Save padrão do modelo (pre_save/post_save e pk), sem passar pelo
+        serviço de empréstimos. Usado pelo próprio serviço.
+        """
+        super().save()
+
     def __str__(self):
         # Resiliente a chaves/usuários excluídos
         nome_chave = self.chave.nome if self.chave else "[Chave Excluída]"
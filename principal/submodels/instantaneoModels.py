@@ -0,0 +1,26 @@
+# Author: João Victor Marques Favero
+
+from django.db import models
+
+class InstantaneoChaves(models.Model):
+    """
+    Estado de todas as chaves num instante: quem estava com cada chave em uso.
+    Gravado periodicamente (comando capturar_instantaneos). O estado num
+    instante qualquer é o instantâneo anterior mais próximo mais os eventos
+    do histórico desde ele (instantaneoServices.estado_em).
+    """
+    # Instante a que o estado se refere
+    momento = models.DateTimeField('Momento', unique=True)
+
+    # {id da chave: id do portador} das chaves em uso; as ausentes estavam disponíveis
+    portadores = models.JSONField('Portadores', default=dict)
+
+    chaves_em_uso = models.PositiveIntegerField('Chaves em uso', default=0)
+
+    class Meta:
+        verbose_name = 'Instantâneo das Chaves'
+        verbose_name_plural = 'Instantâneos das Chaves'
+        ordering = ['-momento']
+
+    def __str__(self):
+        return f'{self.momento:%d/%m/%Y %H:%M}: {self.chaves_em_uso} chave(s) em uso'
@@ -0,0 +1,74 @@
+# Author: João Victor Marques Favero
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+from ..submodels.usuarioModels import Usuario
+from .chaveModels import Chave
+
+class SessaoEmprestimo(models.Model):
+    """
+    Período em que um usuário esteve com uma chave: da aquisição até a
+    devolução ou a transferência para outra pessoa. Derivado do histórico e
+    mantido pelo serviço de empréstimos a cada movimentação (reconstruído
+    pelo comando reconstruir_sessoes).
+    """
+    ENCERRAMENTO_CHOICES = [
+        ('devolucao', 'Devolução'),
+        ('transferida', 'Transferência'),
+    ]
+
+    # SET_NULL, como no histórico: as sessões continuam nos relatórios
+    chave = models.ForeignKey(
+        Chave,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='sessoes',
+        verbose_name='Chave'
+    )
+
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='sessoes_emprestimo',
+        verbose_name='Portador'
+    )
+
+    inicio = models.DateTimeField('Início')
+
+    # Vazio enquanto a chave continua com o portador
+    fim = models.DateTimeField('Fim', null=True, blank=True)
+
+    encerramento = models.CharField(
+        'Encerrada por', max_length=20, choices=ENCERRAMENTO_CHOICES, null=True, blank=True
+    )
+
+    class Meta:
+        verbose_name = 'Sessão de Empréstimo'
+        verbose_name_plural = 'Sessões de Empréstimo'
+        ordering = ['-inicio']
+        constraints = [
+            # No máximo uma sessão aberta por chave
+            models.UniqueConstraint(fields=['chave'], condition=Q(fim__isnull=True), name='sessao_aberta_unica'),
+        ]
+        # Portador num instante: (chave, inicio) com inicio <= instante, a mais recente.
+        # Durações de um período: inicio dentro do intervalo
+        indexes = [
+            models.Index(fields=['chave', 'inicio'], name='sessao_chave_inicio_idx'),
+            models.Index(fields=['usuario', 'inicio'], name='sessao_usuario_inicio_idx'),
+            models.Index(fields=['inicio'], name='sessao_inicio_idx'),
+            models.Index(fields=['fim'], name='sessao_fim_idx'),
+        ]
+
+    @property
+    def duracao(self):
+        """
+        Tempo com a chave (até agora, se a sessão ainda está aberta).
+        """
+        return (self.fim or timezone.now()) - self.inicio
+
+    def __str__(self):
+        nome_chave = self.chave.nome if self.chave else "[Chave Excluída]"
+        nome_usuario = self.usuario.username if self.usuario else "[Usuário Excluído]"
+        return f'{nome_chave} com {nome_usuario} desde {self.inicio:%d/%m/%Y %H:%M}'
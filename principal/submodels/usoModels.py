@@ -0,0 +1,78 @@
+# Author: João Victor Marques Favero
+
+from django.contrib.auth.models import Group
+from django.db import models
+from ..submodels.usuarioModels import Usuario
+from .chaveModels import Chave
+
+class ContadoresUso(models.Model):
+    """
+    Contadores por ação do histórico. Somados a cada movimentação
+    (agregadosServices.registrar) e recalculados pelo comando
+    reconstruir_agregados.
+    """
+    adquiridas = models.PositiveIntegerField('Aquisições', default=0)
+    devolucoes = models.PositiveIntegerField('Devoluções', default=0)
+    transferidas = models.PositiveIntegerField('Transferências', default=0)
+
+    class Meta:
+        abstract = True
+
+class UsoHora(ContadoresUso):
+    """
+    Movimentações de todas as chaves por hora: horários de pico e mapa de
+    calor por dia da semana (o painel converte para o horário local).
+    """
+    # Início da hora cheia, em UTC
+    hora = models.DateTimeField('Hora', unique=True)
+
+    class Meta:
+        verbose_name = 'Uso por Hora'
+        verbose_name_plural = 'Uso por Hora'
+
+class UsoChaveDia(ContadoresUso):
+    """
+    Movimentações de uma chave por dia.
+    """
+    chave = models.ForeignKey(Chave, on_delete=models.CASCADE, related_name='+', verbose_name='Chave')
+    dia = models.DateField('Dia')
+
+    class Meta:
+        verbose_name = 'Uso de Chave por Dia'
+        verbose_name_plural = 'Uso de Chaves por Dia'
+        constraints = [
+            models.UniqueConstraint(fields=['chave', 'dia'], name='uso_chave_dia_unico'),
+        ]
+        # Ranking de um período: filtra por dia e agrupa por chave
+        indexes = [models.Index(fields=['dia'], name='uso_chave_dia_idx')]
+
+class UsoUsuarioDia(ContadoresUso):
+    """
+    Movimentações registradas em nome de um usuário por dia.
+    """
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='+', verbose_name='Usuário')
+    dia = models.DateField('Dia')
+
+    class Meta:
+        verbose_name = 'Uso de Usuário por Dia'
+        verbose_name_plural = 'Uso de Usuários por Dia'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'dia'], name='uso_usuario_dia_unico'),
+        ]
+        indexes = [models.Index(fields=['dia'], name='uso_usuario_dia_idx')]
+
+class UsoGrupoDia(ContadoresUso):
+    """
+    Movimentações das chaves de um grupo de permissão por dia (uma chave
+    com vários grupos conta em cada um deles).
+    """
+    grupo = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='+', verbose_name='Grupo')
+    dia = models.DateField('Dia')
+
+    class Meta:
+        verbose_name = 'Uso de Grupo por Dia'
+        verbose_name_plural = 'Uso de Grupos por Dia'
+        constraints = [
+            models.UniqueConstraint(fields=['grupo', 'dia'], name='uso_grupo_dia_unico'),
+        ]
+        indexes = [models.Index(fields=['dia'], name='uso_grupo_dia_idx')]
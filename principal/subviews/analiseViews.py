@@ -0,0 +1,29 @@
+# Author: João Victor Marques Favero
+from django.shortcuts import render, redirect
+from django.contrib.auth.decorators import login_required
+from principal.services import agregadosServices
+
+# Períodos oferecidos no painel (dias)
+PERIODOS = [7, 30, 90, 365]
+
+@login_required
+def painel_uso(request):
+    """
+    View para o Painel de Análise de Uso (chaves, usuários, grupos e horários).
+    Lê apenas os agregados de uso, nunca o histórico.
+    *** RESTRITA APENAS PARA STAFF ***
+    """
+    if not request.user.is_staff:
+        return redirect('index')
+
+    # ?dias=7|30|90|365 (padrão: 30)
+    try:
+        dias = int(request.GET.get('dias', 30))
+    except ValueError:
+        dias = 30
+    if dias not in PERIODOS:
+        dias = 30
+
+    contexto = agregadosServices.painel(dias)
+    contexto['periodos'] = PERIODOS
+    return render(request, 'analise/painel.html', contexto)
@@ -1,15 +1,26 @@
 # Author: João Victor Marques Favero
 
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.db.models import Q
 from principal.models import HistoricoEmprestimo, Chave, Usuario
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 from django.contrib import messages
+from principal.services.emprestimoServices import (
+    registrar_aquisicao, registrar_devolucao, receber_em_lote, entregar_em_lote, ConflitoEmprestimo
+)
+from principal.services.buscaServices import filtrar_lista_chaves, filtrar_usuarios
+from principal.services.permissaoServices import anotar_permissao_chaves, anotar_permissao_usuarios, grupos_exigidos
+from principal.services.versaoServices import etag_pagina_chaves, ultima_modificacao_chaves
+from .decoradoresAsync import arender, usuario_resolvido
 
 # Lista e filtra chaves para staff, com paginação
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_pagina_chaves, last_modified_func=ultima_modificacao_chaves)  # 304 se nada mudou
 def lista_chaves(request):
     """
     Tela de Gerenciamento de Chaves (apenas staff).
@@ -21,18 +32,7 @@ def lista_chaves(request):
     queryset = Chave.objects.select_related('portador_atual').order_by('nome')
 
     # Filtros por nome, status e exclusão
-    chave_nome = request.GET.get('chave_nome')
-    status = request.GET.get('status')
-    excluido = request.GET.get('excluido')
-
-    if chave_nome:
-        queryset = queryset.filter(nome__icontains=chave_nome)
-    if status:
-        queryset = queryset.filter(status=status)
-    if excluido == 'sim':
-        queryset = queryset.filter(excluido=True)
-    elif excluido == 'nao':
-        queryset = queryset.filter(excluido=False)
+    queryset = filtrar_lista_chaves(queryset, request.GET)
 
     # Paginação
     paginador = Paginator(queryset, 20)
@@ -59,43 +59,73 @@ def pegar_chave(request, pk):
     GET: mostra confirmação e possíveis avisos de permissão.
     POST: registra aquisição da chave (apenas login exigido).
     """
-    chave = get_object_or_404(
-        Chave.objects.select_related('portador_atual').prefetch_related('grupos_permissao'),
-        pk=pk
-    )
     usuario_logado = request.user
 
     if request.method == 'POST':
+        chave = get_object_or_404(Chave, pk=pk)
+
         # Sem checagem de grupo no POST: apenas login
-        if chave.portador_atual != usuario_logado:
-            HistoricoEmprestimo.objects.create(
-                chave=chave,
-                usuario=usuario_logado,
-                acao='adquirida'
-            )
+        if chave.portador_atual_id != usuario_logado.pk:
+            try:
+                registrar_aquisicao(chave, usuario_logado)
+            except ConflitoEmprestimo as e:
+                # Outra pessoa movimentou a chave ao mesmo tempo: mostra o estado atual
+                messages.warning(request, f'{e} Confira a situação atual e confirme novamente.')
+                return redirect('pegar_chave', pk=pk)
         return redirect('index')
 
     else:
-        # Verifica interseção entre grupos da chave e do usuário
-        grupos_requeridos_ids = set(chave.grupos_permissao.values_list('pk', flat=True))
-
-        if not grupos_requeridos_ids:
-            tem_permissao_grupo = True  # Sem restrição
-        else:
-            grupos_usuario_ids = set(usuario_logado.groups.values_list('pk', flat=True))
-            tem_permissao_grupo = not grupos_requeridos_ids.isdisjoint(grupos_usuario_ids)
+        # Permissão calculada na própria consulta da chave (EXISTS nas tabelas de grupos)
+        chave = get_object_or_404(
+            anotar_permissao_chaves(Chave.objects.select_related('portador_atual'), usuario_logado),
+            pk=pk
+        )
 
         # Mostra aviso se a chave exigir grupos e o usuário não tiver nenhum
-        if grupos_requeridos_ids and not tem_permissao_grupo:
-            nomes_grupos = ", ".join(g.name for g in chave.grupos_permissao.all())
-            messages.warning(
-                request,
-                f"Aviso: Você não faz parte de nenhum grupo com permissão para acessar essa chave. Grupos: '{nomes_grupos}'."
-            )
+        if not chave.tem_permissao:
+            _avisar_sem_permissao(request, grupos_exigidos(chave))
 
         contexto = {'chave': chave}
         return render(request, 'ativos/chaves/chave.html', contexto)
 
+def _avisar_sem_permissao(request, grupos):
+    nomes_grupos = ", ".join(nome for _, nome in grupos)
+    messages.warning(
+        request,
+        f"Aviso: Você não faz parte de nenhum grupo com permissão para acessar essa chave. Grupos: '{nomes_grupos}'."
+    )
+
+# Versão assíncrona de pegar_chave (VIEWS_ASYNC, servidor ASGI)
+@login_required
+@usuario_resolvido
+async def pegar_chave_async(request, pk):
+    """
+    Mesmo comportamento de pegar_chave, com as leituras pelo ORM assíncrono.
+    A retirada (transação com UPDATE condicional) continua no serviço síncrono,
+    executado numa thread.
+    """
+    usuario_logado = request.user
+
+    if request.method == 'POST':
+        chave = await aget_object_or_404(Chave, pk=pk)
+
+        if chave.portador_atual_id != usuario_logado.pk:
+            try:
+                await sync_to_async(registrar_aquisicao)(chave, usuario_logado)
+            except ConflitoEmprestimo as e:
+                messages.warning(request, f'{e} Confira a situação atual e confirme novamente.')
+                return redirect('pegar_chave', pk=pk)
+        return redirect('index')
+
+    chave = await aget_object_or_404(
+        anotar_permissao_chaves(Chave.objects.select_related('portador_atual'), usuario_logado),
+        pk=pk
+    )
+    if not chave.tem_permissao:
+        _avisar_sem_permissao(request, await sync_to_async(grupos_exigidos)(chave))
+
+    return await arender(request, 'ativos/chaves/chave.html', {'chave': chave})
+
 # Receber (devolução) de chave por staff; apenas POST
 @login_required
 @require_POST
@@ -104,14 +134,12 @@ def receber_chave(request, pk):
         return redirect('index')
 
     chave = get_object_or_404(Chave, pk=pk)
-    usuario_que_devolveu = chave.portador_atual
 
-    # Registro de devolução (o save() no modelo ajusta status/portador)
-    HistoricoEmprestimo.objects.create(
-        chave=chave,
-        usuario=usuario_que_devolveu,
-        acao='devolucao'
-    )
+    # Registro de devolução (o serviço ajusta status/portador)
+    try:
+        registrar_devolucao(chave)
+    except ConflitoEmprestimo as e:
+        messages.warning(request, str(e))
 
     # Redireciona apenas para index ou lista_chaves
     next_url = request.GET.get('next', 'lista_chaves')
@@ -119,6 +147,37 @@ def receber_chave(request, pk):
         next_url = 'lista_chaves'
     return redirect(next_url)
 
+def _pagina_usuarios(request, chave):
+    """
+    Página de usuários ativos (com busca) para entregar_chave, com a flag
+    'tem_permissao' de cada um já calculada pelo banco.
+    """
+    busca_termo = request.GET.get('busca_usuario', '')
+    grupos = grupos_exigidos(chave)
+
+    queryset = anotar_permissao_usuarios(
+        Usuario.objects.filter(is_active=True).order_by('username'),
+        [pk for pk, _ in grupos]
+    )
+
+    # Busca em username, nome e sobrenome, do mais relevante ao menos relevante
+    if busca_termo:
+        queryset = filtrar_usuarios(queryset, busca_termo, ordenar_por_relevancia=True)
+
+    paginador = Paginator(queryset, 20)
+    page_obj = paginador.get_page(request.GET.get('page'))
+
+    get_params = request.GET.copy()
+    if 'page' in get_params:
+        del get_params['page']
+
+    return {
+        'page_obj': page_obj,
+        'busca_termo': busca_termo,
+        'get_params_url': get_params.urlencode(),
+        'nomes_grupos_requeridos': ", ".join(nome for _, nome in grupos),
+    }
+
 # Entregar chave a um usuário (seleção e atribuição) por staff
 @login_required
 def entregar_chave(request, pk):
@@ -133,67 +192,95 @@ def entregar_chave(request, pk):
         usuario_id = request.POST.get('usuario_id')
         if not usuario_id:
             contexto['erro'] = "Nenhum usuário selecionado."
-            queryset = Usuario.objects.filter(is_active=True).prefetch_related('groups').order_by('username')
-            paginador = Paginator(queryset, 20)
-            page_obj = paginador.get_page(request.GET.get('page'))
-            contexto['page_obj'] = page_obj
+            contexto.update(_pagina_usuarios(request, chave))
             return render(request, 'ativos/chaves/entregar_chave.html', contexto)
 
         try:
             usuario_selecionado = Usuario.objects.get(pk=usuario_id)
         except Usuario.DoesNotExist:
             contexto['erro'] = "Usuário selecionado não encontrado."
-            queryset = Usuario.objects.filter(is_active=True).prefetch_related('groups').order_by('username')
-            paginador = Paginator(queryset, 20)
-            page_obj = paginador.get_page(request.GET.get('page'))
-            contexto['page_obj'] = page_obj
+            contexto.update(_pagina_usuarios(request, chave))
             return render(request, 'ativos/chaves/entregar_chave.html', contexto)
 
         # Registro de aquisição pelo usuário selecionado
-        HistoricoEmprestimo.objects.create(
-            chave=chave,
-            usuario=usuario_selecionado,
-            acao='adquirida'
-        )
+        if chave.portador_atual_id != usuario_selecionado.pk:
+            try:
+                registrar_aquisicao(chave, usuario_selecionado)
+            except ConflitoEmprestimo as e:
+                messages.warning(request, str(e))
 
         return redirect(request.GET.get('next', 'lista_chaves'))
 
     # GET: busca e lista usuários com indicação de permissão por grupo
     else:
-        busca_termo = request.GET.get('busca_usuario', '')
-
-        queryset = Usuario.objects.filter(is_active=True).prefetch_related('groups').order_by('username')
-
-        if busca_termo:
-            queryset = queryset.filter(
-                Q(username__icontains=busca_termo) |
-                Q(first_name__icontains=busca_termo) |
-                Q(last_name__icontains=busca_termo)
-            )
-
-        paginador = Paginator(queryset, 20)
-        pagina_num = request.GET.get('page')
-        page_obj = paginador.get_page(pagina_num)
-
-        get_params = request.GET.copy()
-        if 'page' in get_params:
-            del get_params['page']
-        get_params_url = get_params.urlencode()
-
-        # Grupos exigidos pela chave
-        grupos_requeridos_ids = set(chave.grupos_permissao.values_list('pk', flat=True))
-        nomes_grupos = ", ".join(g.name for g in chave.grupos_permissao.all())
-
-        # Marca flag de permissão por usuário (para o template)
-        if not grupos_requeridos_ids:
-            for usuario in page_obj.object_list:
-                usuario.tem_permissao = True
+        contexto.update(_pagina_usuarios(request, chave))
+        return render(request, 'ativos/chaves/entregar_chave.html', contexto)
+
+
+# Maior id aceito (BigAutoField; acima disso o banco recusa o parâmetro)
+_MAIOR_ID = 2 ** 63 - 1
+
+
+def _ler_ids(valores):
+    """
+    Ids de chave válidos em 'valores' (texto do formulário), na ordem e sem
+    os que não são inteiros positivos.
+    """
+    ids = []
+    for valor in valores:
+        try:
+            pk = int(valor)
+        except ValueError:
+            continue
+        if 0 < pk <= _MAIOR_ID:
+            ids.append(pk)
+    return ids
+
+
+# Ações em lote (receber/entregar várias chaves de uma vez) por staff; apenas POST
+@login_required
+@require_POST
+def acoes_em_lote(request):
+    """
+    Recebe ou entrega as chaves marcadas na lista de gerenciamento.
+    Tudo numa requisição: uma leitura das chaves, um INSERT em lote no
+    histórico e um UPDATE. Exibe o resultado de cada chave.
+    """
+    if not request.user.is_staff:
+        return redirect('index')
+
+    acao = request.POST.get('acao')
+    chave_ids = _ler_ids(request.POST.getlist('chaves'))
+
+    if not chave_ids:
+        messages.warning(request, 'Nenhuma chave selecionada.')
+        return redirect('lista_chaves')
+
+    try:
+        if acao == 'receber':
+            resultados = receber_em_lote(chave_ids)
+            usuario = None
+        elif acao == 'entregar':
+            # Usuário informado pelo username ou CPF
+            identificador = request.POST.get('usuario', '').strip()
+            usuario = Usuario.objects.filter(
+                Q(username=identificador) | Q(cpf=identificador), is_active=True
+            ).first() if identificador else None
+            if usuario is None:
+                messages.warning(request, 'Informe um usuário válido (username ou CPF) para entregar as chaves.')
+                return redirect('lista_chaves')
+            resultados = entregar_em_lote(chave_ids, usuario)
         else:
-            for usuario in page_obj.object_list:
-                grupos_usuario_ids = set(usuario.groups.values_list('pk', flat=True))
-                usuario.tem_permissao = not grupos_requeridos_ids.isdisjoint(grupos_usuario_ids)
+            messages.warning(request, 'Ação inválida.')
+            return redirect('lista_chaves')
+    except ConflitoEmprestimo as e:
+        messages.warning(request, str(e))
+        return redirect('lista_chaves')
 
-        contexto['page_obj'] = page_obj
-        contexto['busca_termo'] = busca_termo
-        contexto['nomes_grupos_requeridos'] = nomes_grupos
-        return render(request, 'ativos/chaves/entregar_chave.html', contexto)
+    contexto = {
+        'acao': acao,
+        'usuario_destino': usuario,
+        'resultados': resultados,
+        'total_sucesso': sum(1 for r in resultados if r.sucesso),
+    }
+    return render(request, 'ativos/chaves/resultado_lote.html', contexto)
@@ -0,0 +1,73 @@
+# Author: João Victor Marques Favero
+"""
+Peças compartilhadas pelas views assíncronas (usadas com VIEWS_ASYNC = True).
+
+O ORM assíncrono cobre as consultas das views, mas algumas partes do Django
+continuam síncronas: o request.user preguiçoso, as mensagens/sessão lidas
+pelas funções de ETag e a renderização de templates. Aqui elas são
+resolvidas com auser() ou executadas numa thread via sync_to_async.
+"""
+
+import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def usuario_resolvido(view):
+    """
+    Troca o request.user preguiçoso (que consultaria o banco de forma
+    síncrona) pelo usuário já lido com auser(). Usar abaixo de login_required.
+    """
+    @wraps(view)
+    async def interna(request, *args, **kwargs):
+        request.user = await request.auser()
+        return await view(request, *args, **kwargs)
+    return interna
+
+
+def condicao_async(etag_func=None, last_modified_func=None):
+    """
+    django.views.decorators.http.condition para views assíncronas: as funções
+    de ETag/Last-Modified (que leem sessão, usuário e, na falta do cache, o
+    banco) rodam numa thread antes da view.
+    """
+    def validadores(request, *args, **kwargs):
+        ultima = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+        if ultima and not timezone.is_aware(ultima):
+            ultima = timezone.make_aware(ultima, datetime.timezone.utc)
+        etag = etag_func(request, *args, **kwargs) if etag_func else None
+        return (
+            quote_etag(etag) if etag is not None else None,
+            int(ultima.timestamp()) if ultima else None,
+        )
+
+    def decorador(view):
+        @wraps(view)
+        async def interna(request, *args, **kwargs):
+            etag, ultima = await sync_to_async(validadores)(request, *args, **kwargs)
+            resposta = get_conditional_response(request, etag=etag, last_modified=ultima)
+            if resposta is None:
+                resposta = await view(request, *args, **kwargs)
+            # Mesmos cabeçalhos que o condition() acrescenta
+            if request.method in ('GET', 'HEAD'):
+                if ultima and not resposta.has_header('Last-Modified'):
+                    resposta.headers['Last-Modified'] = http_date(ultima)
+                if etag:
+                    resposta.headers.setdefault('ETag', etag)
+            return resposta
+        return interna
+    return decorador
+
+
+async def arender(request, template, contexto):
+    """
+    render() numa thread. As consultas que o template ainda fizer (QuerySets
+    preguiçosos, ex.: dentro de um {% cache %}) rodam nessa thread, de forma
+    síncrona; as demais devem chegar já executadas.
+    """
+    return await sync_to_async(render)(request, template, contexto)
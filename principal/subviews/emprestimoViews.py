@@ -1,10 +1,38 @@
 # Author: João Victor Marques Favero
 
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Q
-from principal.models import HistoricoEmprestimo, Chave, Usuario  # Importa os modelos necessários
+from principal.models import HistoricoEmprestimo, Chave, SessaoEmprestimo, Usuario  # Importa os modelos necessários
+from principal.services.paginacaoServices import CursorPaginator, PaginadorPartes, apagina
+from principal.services.historicoServices import partes_historico
+from principal.services import eventosServices, exportacaoServices, instantaneoServices, sessaoServices
+from principal.services.buscaServices import filtrar_chaves
+from principal.services.versaoServices import etag_lista_emprestimos, ultima_modificacao_historico
+from .decoradoresAsync import arender, condicao_async, usuario_resolvido
+
+# Feed ao vivo: intervalo do comentário de keep-alive e espera sugerida para reconexão
+INTERVALO_PING_SEGUNDOS = 20
+RECONEXAO_MS = 5000
+
+def _parametros_sem_pagina(request):
+    # Query string dos filtros, sem a posição (para os links de paginação)
+    get_params = request.GET.copy()
+    for parametro in ('page', 'cursor'):
+        if parametro in get_params:
+            del get_params[parametro]
+    return get_params.urlencode()
+
+def _paginacao_por_cursor(request):
+    modo_padrao = 'cursor' if getattr(settings, 'HISTORICO_PAGINACAO_CURSOR', False) else 'pagina'
+    return request.GET.get('paginacao', modo_padrao) == 'cursor'
 
 @login_required
 def historico_list(request):
@@ -16,46 +44,259 @@ def historico_list(request):
     if not request.user.is_staff:
         return redirect('index')
     
-    # Obtém todos os registros de empréstimo, ordenados por data/hora
-    queryset = HistoricoEmprestimo.objects.select_related('chave', 'usuario').order_by('-data_hora')
-
     # --- Lógica de Filtro/Pesquisa  ---
-    chave_nome = request.GET.get('chave_nome')  # Nome da chave para filtro
-    usuario_nome = request.GET.get('usuario_nome')  # Nome do usuário para filtro
-    acao = request.GET.get('acao')  # Ação para filtro
-    data = request.GET.get('data')  # Data para filtro
-    if chave_nome: queryset = queryset.filter(chave__nome__icontains=chave_nome)  # Filtro por nome da chave
-    if usuario_nome: queryset = queryset.filter(Q(usuario__username__icontains=usuario_nome) | 
-                                                Q(usuario__first_name__icontains=usuario_nome) | 
-                                                Q(usuario__last_name__icontains=usuario_nome))  # Filtro por nome do usuário
-    if acao: queryset = queryset.filter(acao=acao)  # Filtro por ação
-    if data: queryset = queryset.filter(data_hora__date=data)  # Filtro por data
+    # Nome da chave, nome do usuário, ação, data e intervalo de datas (de/ate).
+    # Se o intervalo de datas alcança meses arquivados, o arquivo entra como segunda parte
+    partes = partes_historico(request.GET)
+
+    contexto = {'get_params_url': _parametros_sem_pagina(request), 'inclui_arquivo': partes[-1].model is not HistoricoEmprestimo}
 
     # --- Lógica de Paginação  ---
-    paginador = Paginator(queryset, 20)  # Pagina os resultados em grupos de 20
-    pagina_num = request.GET.get('page')  # Obtém o número da página atual
-    page_obj = paginador.get_page(pagina_num)  # Obtém os objetos da página atual
+    # Modo cursor (opcional): custo constante por página, sem COUNT(*) nem OFFSET
+    if _paginacao_por_cursor(request):
+        paginador = CursorPaginator(partes, 20)
+        pagina_cursor = paginador.get_page(
+            request.GET.get('cursor'),
+            com_total=request.GET.get('total') == '1'
+        )
+        contexto['pagina_cursor'] = pagina_cursor
+        contexto['emprestimos_list'] = pagina_cursor.object_list
+    else:
+        paginador = PaginadorPartes(partes, 20)  # Pagina os resultados em grupos de 20
+        pagina_num = request.GET.get('page')  # Obtém o número da página atual
+        page_obj = paginador.get_page(pagina_num)  # Obtém os objetos da página atual
+        contexto['page_obj'] = page_obj  # Objeto da página atual
+        contexto['emprestimos_list'] = page_obj.object_list  # Lista de empréstimos da página atual
 
-    get_params = request.GET.copy()
-    if 'page' in get_params:
-        del get_params['page']
-    get_params_url = get_params.urlencode()
-    
+    return render(request, 'historico/historico.html', contexto)  # Renderiza a template com o contexto
+
+@login_required
+def sessoes_list(request):
+    """
+    View para a Tela de Sessões de Empréstimo (quem esteve com cada chave e por quanto tempo).
+    *** RESTRITA APENAS PARA STAFF ***
+    """
+    if not request.user.is_staff:
+        return redirect('index')
+
+    # Chave, usuário, instante (quem estava com a chave), intervalo de dias e só abertas
+    queryset = sessaoServices.filtrar_sessoes(
+        SessaoEmprestimo.objects.select_related('chave', 'usuario'), request.GET
+    )
+
+    pagina_cursor = CursorPaginator(queryset, 20, campo_data='inicio').get_page(request.GET.get('cursor'))
     contexto = {
-        'page_obj': page_obj,  # Objeto da página atual
-        'emprestimos_list': page_obj.object_list,  # Lista de empréstimos da página atual
-        'get_params_url': get_params_url
+        'get_params_url': _parametros_sem_pagina(request),
+        'pagina_cursor': pagina_cursor,
+        'sessoes_list': pagina_cursor.object_list,
     }
-    return render(request, 'historico/historico.html', contexto)  # Renderiza a template com o contexto
+
+    # Resumo das durações só com algum filtro (sem filtro, seriam todas as sessões)
+    if sessaoServices.tem_filtro(request.GET):
+        resumo = sessaoServices.resumo_duracoes(queryset)
+        for campo in ('media', 'maxima', 'total'):
+            resumo[campo] = sessaoServices.formatar_duracao(resumo[campo])
+        contexto['resumo'] = resumo
+
+    return render(request, 'historico/sessoes.html', contexto)
+
+@login_required
+def estado_chaves_em(request):
+    """
+    View para a Tela "Chaves num Instante": com quem estava cada chave em
+    ?momento=AAAA-MM-DDTHH:MM (um instantâneo + os eventos desde ele).
+    Com ?formato=json, responde em JSON (consulta para scripts de investigação).
+    *** RESTRITA APENAS PARA STAFF ***
+    """
+    if not request.user.is_staff:
+        return redirect('index')
+
+    momento_texto = request.GET.get('momento', '')
+    momento = sessaoServices.ler_momento(momento_texto)
+    estado = instantaneoServices.estado_em(momento) if momento else None
+
+    portadores = []
+    if estado is not None:
+        chave_ids = list(estado.portadores)
+        chave_nome = request.GET.get('chave_nome')
+        chaves = Chave.objects.filter(pk__in=chave_ids)
+        if chave_nome:
+            chaves = filtrar_chaves(chaves, chave_nome)
+        nomes_chaves = dict(chaves.values_list('pk', 'nome'))
+        usuarios = Usuario.objects.in_bulk([estado.portadores[pk] for pk in nomes_chaves if estado.portadores[pk]])
+        portadores = sorted(
+            (
+                {'chave_id': pk, 'chave': nome, 'usuario_id': estado.portadores[pk],
+                 'usuario': str(usuarios[estado.portadores[pk]]) if estado.portadores[pk] in usuarios else None}
+                for pk, nome in nomes_chaves.items()
+            ),
+            key=lambda item: item['chave'],
+        )
+
+    if request.GET.get('formato') == 'json':
+        if momento is None:
+            return JsonResponse({'erro': 'Informe ?momento=AAAA-MM-DDTHH:MM.'}, status=400)
+        if estado is None:
+            return JsonResponse({'erro': 'Instante anterior ao instantâneo mais antigo.'}, status=404)
+        return JsonResponse({
+            'momento': momento.isoformat(),
+            'instantaneo': estado.instantaneo.momento.isoformat(),
+            'eventos_aplicados': estado.eventos_aplicados,
+            'portadores': portadores,
+        })
+
+    contexto = {
+        'momento': momento,
+        'estado': estado,
+        'portadores': portadores,
+        'get_params_url': _parametros_sem_pagina(request),
+    }
+    return render(request, 'historico/instante.html', contexto)
+
+@login_required
+def exportar_historico(request):
+    """
+    Exportação do histórico filtrado (mesmos filtros da tela) em CSV ou JSONL.
+    *** RESTRITA APENAS PARA STAFF ***
+    """
+    if not request.user.is_staff:
+        return redirect('index')
+
+    # ?formato=csv|jsonl e ?gzip=1 (compressão durante o envio)
+    formato = request.GET.get('formato', 'csv')
+    if formato not in exportacaoServices.FORMATOS:
+        formato = 'csv'
+    gzip = request.GET.get('gzip') == '1'
+
+    # As linhas são geradas e enviadas aos poucos, sem montar o arquivo na memória
+    blocos = exportacaoServices.exportar_historico(request.GET, formato, gzip)
+    if isinstance(request, ASGIRequest):
+        # Sob ASGI um iterador síncrono seria lido inteiro antes do envio
+        blocos = exportacaoServices.em_fluxo_async(blocos)
+    resposta = StreamingHttpResponse(
+        blocos,
+        content_type='application/gzip' if gzip else f'{exportacaoServices.FORMATOS[formato]}; charset=utf-8',
+    )
+    resposta['Content-Disposition'] = f'attachment; filename="{exportacaoServices.nome_arquivo(formato, gzip)}"'
+    return resposta
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_lista_emprestimos, last_modified_func=ultima_modificacao_historico)  # 304 se nada mudou
 def api_ultimos_emprestimos(request):
     """
     View 'API' especial (para atualização da index de staff).
     """
-    # Obtém os últimos 20 empréstimos
-    emprestimos = HistoricoEmprestimo.objects.select_related('chave', 'usuario').order_by('-data_hora')[:20]
+    # Obtém os últimos 20 empréstimos (ou os 20 anteriores ao cursor informado)
+    queryset = HistoricoEmprestimo.objects.select_related('chave', 'usuario')
+    pagina_cursor = CursorPaginator(queryset, 20).get_page(request.GET.get('cursor'))
     contexto = {
-        'emprestimos_list': emprestimos  # Lista de empréstimos para a API
+        'emprestimos_list': pagina_cursor.object_list  # Lista de empréstimos para a API
     }
-    return render(request, 'historico/_lista_emprestimos.html', contexto)  # Renderiza a template da lista de empréstimos
\ No newline at end of file
+    resposta = render(request, 'historico/_lista_emprestimos.html', contexto)  # Renderiza a template da lista de empréstimos
+    # Token para buscar a página seguinte (mais antiga), se houver
+    if pagina_cursor.proximo_cursor:
+        resposta['X-Proximo-Cursor'] = pagina_cursor.proximo_cursor
+    return resposta
+
+
+@login_required
+@usuario_resolvido
+async def historico_list_async(request):
+    """
+    Versão assíncrona de historico_list (VIEWS_ASYNC, servidor ASGI).
+    *** RESTRITA APENAS PARA STAFF ***
+    """
+    if not request.user.is_staff:
+        return redirect('index')
+
+    # Os filtros por nome podem verificar as tabelas FTS e o limite do arquivo (consultas síncronas): montados numa thread
+    partes = await sync_to_async(partes_historico)(request.GET)
+
+    contexto = {'get_params_url': _parametros_sem_pagina(request), 'inclui_arquivo': partes[-1].model is not HistoricoEmprestimo}
+    if _paginacao_por_cursor(request):
+        pagina_cursor = await CursorPaginator(partes, 20).aget_page(
+            request.GET.get('cursor'),
+            com_total=request.GET.get('total') == '1'
+        )
+        contexto['pagina_cursor'] = pagina_cursor
+        contexto['emprestimos_list'] = pagina_cursor.object_list
+    else:
+        page_obj = await apagina(PaginadorPartes(partes, 20), request.GET.get('page'))
+        contexto['page_obj'] = page_obj
+        contexto['emprestimos_list'] = page_obj.object_list
+
+    return await arender(request, 'historico/historico.html', contexto)
+
+@login_required
+@usuario_resolvido
+@cache_control(private=True, no_cache=True)
+@condicao_async(etag_func=etag_lista_emprestimos, last_modified_func=ultima_modificacao_historico)
+async def api_ultimos_emprestimos_async(request):
+    """
+    Versão assíncrona de api_ultimos_emprestimos (VIEWS_ASYNC, servidor ASGI).
+    """
+    queryset = HistoricoEmprestimo.objects.select_related('chave', 'usuario')
+    pagina_cursor = await CursorPaginator(queryset, 20).aget_page(request.GET.get('cursor'))
+    resposta = await arender(request, 'historico/_lista_emprestimos.html', {
+        'emprestimos_list': pagina_cursor.object_list
+    })
+    if pagina_cursor.proximo_cursor:
+        resposta['X-Proximo-Cursor'] = pagina_cursor.proximo_cursor
+    return resposta
+
+
+async def _fluxo_eventos(ultimo_id):
+    """
+    Gerador SSE: reenvia o que foi perdido desde 'ultimo_id' e depois
+    repassa os eventos do barramento até o cliente desconectar.
+    """
+    # Assina antes do reenvio para não perder eventos entre as duas etapas
+    assinante = eventosServices.assinar()
+    try:
+        yield f'retry: {RECONEXAO_MS}\n\n'
+
+        if ultimo_id is not None:
+            for evento in await sync_to_async(eventosServices.eventos_desde)(ultimo_id):
+                ultimo_id = evento.id
+                yield evento.formatar_sse()
+
+        # Fila transbordada: encerra; o cliente reconecta com Last-Event-ID
+        while not assinante.transbordou:
+            try:
+                evento = await asyncio.wait_for(assinante.fila.get(), timeout=INTERVALO_PING_SEGUNDOS)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'  # Mantém a conexão viva em proxies
+                continue
+            if ultimo_id is not None and evento.id <= ultimo_id:
+                continue  # Já enviado no reenvio
+            ultimo_id = evento.id
+            yield evento.formatar_sse()
+    finally:
+        eventosServices.cancelar(assinante)
+
+
+async def stream_emprestimos(request):
+    """
+    Feed ao vivo (Server-Sent Events) dos novos registros de histórico.
+    *** RESTRITO A STAFF; requer servidor ASGI ***
+    """
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI a conexão prenderia um worker: 204 faz o navegador desistir
+        # e o main.js continua no polling
+        return HttpResponse(status=204)
+
+    usuario = await request.auser()
+    if not usuario.is_authenticated or not usuario.is_staff:
+        return HttpResponseForbidden()
+
+    # Last-Event-ID (reconexão automática) ou ultimo_id (primeira conexão da página)
+    try:
+        ultimo_id = int(request.headers.get('Last-Event-ID') or request.GET['ultimo_id'])
+    except (KeyError, ValueError):
+        ultimo_id = None
+
+    resposta = StreamingHttpResponse(_fluxo_eventos(ultimo_id), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'  # Desativa buffering em proxies nginx
+    return resposta
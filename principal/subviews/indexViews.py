@@ -1,11 +1,23 @@
 # Author: João Victor Marques Favero
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.core.paginator import Paginator
 from django.db.models import Q
 from principal.models import HistoricoEmprestimo, Chave  # Importa os modelos necessários
+from principal.services.buscaServices import filtrar_chaves
+from principal.services.estaticosServices import url_html5_qrcode
+from principal.services.paginacaoServices import apagina
+from principal.services.versaoServices import (
+    contexto_ultimos_emprestimos, etag_pagina_chaves, ultima_modificacao_chaves
+)
+from asgiref.sync import sync_to_async
+from .decoradoresAsync import arender, condicao_async, usuario_resolvido
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_pagina_chaves, last_modified_func=ultima_modificacao_chaves)  # 304 se nada mudou
 def index(request):
     """
     View para a Tela Inicial.
@@ -16,7 +28,7 @@ def index(request):
     queryset = Chave.objects.select_related('portador_atual').filter(excluido=False).order_by('nome')  # Obtém chaves não excluídas
     chave_nome = request.GET.get('chave_nome')  # Obtém o nome da chave da query string
     if chave_nome:
-        queryset = queryset.filter(nome__icontains=chave_nome)  # Filtra chaves pelo nome se fornecido
+        queryset = filtrar_chaves(queryset, chave_nome)  # Filtra chaves pelo nome se fornecido
     
     paginador = Paginator(queryset, 20)  # Pagina as chaves em grupos de 20
     pagina_num = request.GET.get('page')  # Obtém o número da página da query string
@@ -32,16 +44,52 @@ def index(request):
     # 2. Contexto inicial
     contexto = {
         'page_obj': page_obj,  # Adiciona o objeto da página ao contexto
-        'chaves_list': page_obj.object_list  # Adiciona a lista de chaves ao contexto
+        'chaves_list': page_obj.object_list,  # Adiciona a lista de chaves ao contexto
+        'url_html5_qrcode': url_html5_qrcode()  # Biblioteca do scanner, carregada ao abrir a câmera
     }
 
     # 3. Busca os últimos 10 empréstimos SE o usuário for staff
     if request.user.is_staff:
         ultimos_emprestimos = HistoricoEmprestimo.objects.select_related(
             'chave', 'usuario'
-        ).order_by('-data_hora')[:10]  # Obtém os últimos 10 empréstimos
+        ).order_by('-data_hora')[:10]  # Obtém os últimos 10 empréstimos (consulta só se o fragmento não estiver em cache)
         
         # Adiciona a lista ao contexto
         contexto['ultimos_10_emprestimos'] = ultimos_emprestimos
+        # Tempo em cache e versões que identificam o fragmento da lista
+        contexto.update(contexto_ultimos_emprestimos())
 
-    return render(request, 'index.html', contexto)  # Renderiza a página com o contexto
\ No newline at end of file
+    return render(request, 'index.html', contexto)  # Renderiza a página com o contexto
+
+
+@login_required
+@usuario_resolvido
+@cache_control(private=True, no_cache=True)
+@condicao_async(etag_func=etag_pagina_chaves, last_modified_func=ultima_modificacao_chaves)
+async def index_async(request):
+    """
+    Versão assíncrona de index (VIEWS_ASYNC, servidor ASGI).
+    COUNT e página de chaves pelo ORM assíncrono; os últimos empréstimos,
+    como na versão síncrona, só são consultados sem o fragmento em cache.
+    """
+    queryset = Chave.objects.select_related('portador_atual').filter(excluido=False).order_by('nome')
+    chave_nome = request.GET.get('chave_nome')
+    if chave_nome:
+        # Na primeira chamada, filtrar_chaves verifica as tabelas FTS (consulta síncrona)
+        queryset = await sync_to_async(filtrar_chaves)(queryset, chave_nome)
+
+    page_obj = await apagina(Paginator(queryset, 20), request.GET.get('page'))
+    contexto = {
+        'page_obj': page_obj,
+        'chaves_list': page_obj.object_list,
+        'url_html5_qrcode': url_html5_qrcode()
+    }
+
+    if request.user.is_staff:
+        # QuerySet preguiçoso: avaliado pelo template na thread do arender, só sem o fragmento em cache
+        contexto['ultimos_10_emprestimos'] = HistoricoEmprestimo.objects.select_related(
+            'chave', 'usuario'
+        ).order_by('-data_hora')[:10]
+        contexto.update(await sync_to_async(contexto_ultimos_emprestimos)())
+
+    return await arender(request, 'index.html', contexto)
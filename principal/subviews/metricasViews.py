@@ -0,0 +1,42 @@
+# Author: João Victor Marques Favero
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import never_cache
+from principal.services import metricasServices
+
+
+def _autorizado(request):
+    # Staff logado ou o coletor do Prometheus com 'Authorization: Bearer <METRICAS_TOKEN>'
+    token = getattr(settings, 'METRICAS_TOKEN', None)
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+# Métricas por rota no formato de texto do Prometheus
+@never_cache
+def metricas(request):
+    """
+    Latência, consultas, templates e tamanho das respostas por rota
+    (valores deste processo desde o início).
+    *** RESTRITA A STAFF OU AO COLETOR COM METRICAS_TOKEN ***
+    """
+    if not _autorizado(request):
+        return HttpResponseForbidden('Acesso restrito.')
+    return HttpResponse(metricasServices.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Amostras recentes de consultas lentas, com o SQL
+@never_cache
+def consultas_lentas(request):
+    """
+    As consultas mais recentes acima de METRICAS_CONSULTA_LENTA_MS (JSON).
+    *** RESTRITA A STAFF OU AO COLETOR COM METRICAS_TOKEN ***
+    """
+    if not _autorizado(request):
+        return HttpResponseForbidden('Acesso restrito.')
+    return JsonResponse({
+        'limite_ms': getattr(settings, 'METRICAS_CONSULTA_LENTA_MS', 200),
+        'amostras': metricasServices.consultas_lentas(),
+    })
@@ -3,19 +3,45 @@
 # Imports para todas as funções neste arquivo
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.urls import reverse
+from django.http import FileResponse, Http404
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from principal.models import Chave  # Importa o modelo Chave
+from principal.services import etiquetaServices
 
 # Imports para a função de scan (upload)
 from django.contrib import messages
-from PIL import Image
-from pyzbar.pyzbar import decode
+from django.utils.http import url_has_allowed_host_and_scheme
+from principal.services.qrcodeServices import ErroLeitura, cabecalho_server_timing, decodificar_upload
+
+# Imports para a folha de etiquetas
+import tempfile
+from django.urls import reverse
+from principal.services.buscaServices import filtrar_lista_chaves
+
+# Imports para a retirada direta pelo QR Code
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+from principal.services.emprestimoServices import ConflitoEmprestimo, registrar_aquisicao
+from principal.services.permissaoServices import anotar_permissao_chaves
+from principal.services.tokenServices import TokenInvalido, ler_token
+
+
+def _url_qrcode(request, chave):
+    return etiquetaServices.url_da_chave(chave.pk, chave.versao_qrcode, etiquetaServices.url_base(request))
+
+
+def _etag_qrcode(request, pk, formato):
+    # O nome do arquivo já identifica a URL do QR (domínio + versão): serve de ETag
+    chave = Chave.objects.filter(pk=pk).only('pk', 'versao_qrcode').first()
+    return etiquetaServices.hash_url(_url_qrcode(request, chave)) if chave else None
 
 
 @login_required
 def gerar_qrcode_chave(request, pk):
     """
-    View para exibir um QR Code para uma chave específica (usando django-qr-code).
+    View para exibir um QR Code para uma chave específica.
+    A imagem vem de qrcode_chave_imagem (gerada uma vez e guardada em disco).
     """
     # 1. Garante que apenas staff possa acessar
     if not request.user.is_staff:
@@ -25,7 +51,7 @@ def gerar_qrcode_chave(request, pk):
     chave = get_object_or_404(Chave, pk=pk)
 
     # 3. Constrói a URL que o QR Code deve conter
-    url_chave = request.build_absolute_uri(reverse('pegar_chave', args=[chave.pk]))
+    url_chave = _url_qrcode(request, chave)
     
     # 4. Passa a URL para o template
     contexto = {
@@ -37,6 +63,122 @@ def gerar_qrcode_chave(request, pk):
     return render(request, 'ativos/qrcode/qrcode_chave.html', contexto)
 
 
+@login_required
+@cache_control(private=True, max_age=86400)
+@condition(etag_func=_etag_qrcode)  # 304 enquanto a URL da chave não mudar
+def qrcode_chave_imagem(request, pk, formato):
+    """
+    Imagem (PNG ou SVG) do QR Code de uma chave, servida do disco.
+    """
+    if not request.user.is_staff:
+        return redirect('index')
+    if formato not in etiquetaServices.FORMATOS:
+        raise Http404('Formato não suportado.')
+
+    chave = get_object_or_404(Chave, pk=pk)
+    url_chave = _url_qrcode(request, chave)
+    caminho = etiquetaServices.obter_qrcode(chave.pk, url_chave, formato)
+    return FileResponse(open(caminho, 'rb'), content_type=etiquetaServices.FORMATOS[formato])
+
+
+@login_required
+def folha_etiquetas(request):
+    """
+    PDF com as etiquetas (QR Code + nome) das chaves filtradas na tela de
+    gerenciamento, para impressão. Montado no próprio processo e limitado a
+    ETIQUETAS_PAGINAS_TELA páginas; folhas maiores, com o comando gerar_etiquetas.
+    """
+    if not request.user.is_staff:
+        return redirect('index')
+
+    base = etiquetaServices.url_base(request)
+    limite = etiquetaServices.maximo_etiquetas_tela()
+    chaves = filtrar_lista_chaves(Chave.objects.order_by('nome'), request.GET).values_list('pk', 'nome', 'versao_qrcode')
+    chaves = chaves[:limite + 1]
+    etiquetas = [
+        etiquetaServices.Etiqueta(pk, nome, etiquetaServices.url_da_chave(pk, versao, base))
+        for pk, nome, versao in chaves
+    ]
+    if not etiquetas:
+        messages.warning(request, 'Nenhuma chave encontrada para imprimir.')
+        return redirect('lista_chaves')
+    if len(etiquetas) > limite:
+        messages.warning(
+            request,
+            f'A impressão pela tela vai até {limite} etiquetas. Filtre as chaves ou use o comando gerar_etiquetas.'
+        )
+        destino = reverse('lista_chaves')
+        return redirect(f'{destino}?{request.GET.urlencode()}' if request.GET else destino)
+
+    # Arquivo temporário em disco: o PDF não fica inteiro na memória e é apagado ao fechar
+    arquivo = tempfile.TemporaryFile()
+    etiquetaServices.gerar_folha(etiquetas, arquivo, processos=1)
+    arquivo.seek(0)
+    return FileResponse(arquivo, as_attachment=True, filename='etiquetas_chaves.pdf', content_type='application/pdf')
+
+
+def _resposta_retirada(request, status, mensagem, chave=None, sucesso=False, aviso=None):
+    """
+    Resultado da retirada: JSON para o scanner da página (fetch) ou uma
+    página HTML mínima para quem abriu o link pela câmera do celular.
+    """
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'sucesso': sucesso,
+            'mensagem': mensagem,
+            'chave': chave.nome if chave else None,
+            'aviso': aviso,
+        }, status=status)
+    contexto = {'mensagem': mensagem, 'chave': chave, 'sucesso': sucesso, 'aviso': aviso}
+    return render(request, 'ativos/qrcode/retirada.html', contexto, status=status)
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def retirar_por_qrcode(request, token):
+    """
+    Retirada direta pelo QR Code (token assinado com id e versão da chave).
+    GET: confirmação mínima (o navegador não envia POST ao abrir um link).
+    POST: registra a retirada na mesma requisição: uma leitura da chave,
+    o UPDATE condicional e o INSERT no histórico.
+    """
+    # Token forjado ou de outra rotação: recusado sem consultar o banco
+    try:
+        chave_pk, versao = ler_token(token)
+    except TokenInvalido as e:
+        return _resposta_retirada(request, 400, str(e))
+
+    # Chave na versão do token, com a permissão do usuário calculada na mesma consulta
+    chave = anotar_permissao_chaves(
+        Chave.objects.filter(pk=chave_pk, versao_qrcode=versao, excluido=False),
+        request.user
+    ).first()
+    if chave is None:
+        return _resposta_retirada(request, 410, 'Este QR Code foi substituído ou a chave não está mais disponível.')
+
+    # Sem checagem de grupo na retirada (como em pegar_chave): apenas aviso
+    aviso = None
+    if not chave.tem_permissao:
+        aviso = 'Você não faz parte de nenhum grupo com permissão para acessar essa chave.'
+
+    if request.method == 'GET':
+        contexto = {'chave': chave, 'aviso': aviso, 'confirmar': True}
+        return render(request, 'ativos/qrcode/retirada.html', contexto)
+
+    if chave.portador_atual_id == request.user.pk:
+        return _resposta_retirada(request, 200, 'Você já está com esta chave.', chave, sucesso=True)
+
+    try:
+        registrar_aquisicao(chave, request.user)
+    except ConflitoEmprestimo as e:
+        # Movimentada por outra pessoa (ou QR Code substituído) entre a leitura e a gravação
+        return _resposta_retirada(request, 409, f'{e} Leia o QR Code novamente.', chave)
+
+    return _resposta_retirada(
+        request, 200, f'Chave "{chave.nome}" registrada com você.', chave, sucesso=True, aviso=aviso
+    )
+
+
 @login_required
 def scan_page(request):
     """
@@ -51,24 +193,27 @@ def scan_page(request):
         image_file = request.FILES['qr_image']
 
         try:
-            # 2. Abre a imagem
-            img = Image.open(image_file)
-            
-            # 3. Decodifica a imagem
-            decoded_objects = decode(img)
-
-            if decoded_objects:
-                # 4. Pega o link e redireciona (SUCESSO)
-                url = decoded_objects[0].data.decode('utf-8')
-                return redirect(url)
-            else:
-                messages.error(request, 'Nenhum QR Code encontrado na imagem. Tente novamente.')
-                return redirect('index')  # Redireciona para a página inicial
-                
-        except Exception as e:
+            # 2. Decodifica fora da thread da requisição (pool com limites de tamanho e tempo)
+            resultado = decodificar_upload(image_file)
+        except ErroLeitura as e:
             messages.error(request, f'Erro ao processar a imagem: {e}')
             return redirect('index')  # Redireciona para a página inicial
 
+        url = resultado.dados
+        if url is None:
+            messages.error(request, 'Nenhum QR Code encontrado na imagem. Tente novamente.')
+            return redirect('index')  # Redireciona para a página inicial
+
+        # 3. Só segue links deste sistema (o QR pode ter sido trocado por um externo)
+        if not url_has_allowed_host_and_scheme(url, allowed_hosts={request.get_host()}):
+            messages.error(request, 'O QR Code lido não é de uma chave deste sistema.')
+            return redirect('index')
+
+        # 4. Redireciona para a chave (SUCESSO), com os tempos de cada etapa da leitura
+        resposta = redirect(url)
+        resposta['Server-Timing'] = cabecalho_server_timing(resultado.tempos)
+        return resposta
+
     else:
         # Método GET: Se o usuário for para /scan/ manualmente,
         # ele ainda vê a página de scan dedicada.
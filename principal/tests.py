@@ -1,3 +1,1632 @@
-from django.test import TestCase
+# Author: João Victor Marques Favero
+"""
+Testes do app 'principal'.
 
-# Create your tests here.
+Rodar com: python manage.py test principal
+"""
+
+import base64
+import csv
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from itertools import count
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, include, path, resolve, reverse
+from django.utils import timezone
+from PIL import Image
+from principal import routers, views
+from principal.benchmark import carga
+from principal.backends import UsuarioEmCacheBackend
+from principal.middleware import COOKIE_ADERENCIA, EstaticosMiddleware, ReplicaMiddleware
+from principal.models import (
+    Chave, HistoricoEmprestimo, HistoricoEmprestimoArquivo, InstantaneoChaves, ResumoArquivoMensal, SessaoEmprestimo,
+    UsoChaveDia, UsoGrupoDia, UsoHora, UsoUsuarioDia, Usuario,
+)
+from principal.services import (
+    agregadosServices, arquivoServices, autenticacaoServices, buscaServices, emprestimoServices, estaticosServices,
+    eventosServices, historicoServices, instantaneoServices, metricasServices, paginacaoServices, permissaoServices,
+    qrcodeServices, sessaoServices, tokenServices, versaoServices,
+)
+from principal.services.emprestimoServices import ConflitoEmprestimo
+from principal.subviews.emprestimoViews import _fluxo_eventos
+
+
+_cpfs = count(1)
+
+
+def criar_usuario(username, **campos):
+    # CPF é obrigatório e único
+    campos.setdefault('cpf', str(next(_cpfs)).zfill(11))
+    campos.setdefault('contato', '0000-0000')
+    return Usuario.objects.create_user(username=username, password='senha', **campos)
+
+
+# Hash de senha rápido: os testes criam muitos usuários
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BaseTestCase(TestCase):
+    """
+    Limpa os caches a cada teste: marcadores de versão, fragmentos e o cache
+    de usuários do processo sobreviveriam ao rollback do banco entre testes
+    (com pks reaproveitadas).
+    """
+
+    def setUp(self):
+        for alias in caches:
+            caches[alias].clear()
+        autenticacaoServices._entradas.clear()
+
+
+class EmprestimoConcorrenciaTests(BaseTestCase):
+    """
+    Compare-and-swap de emprestimoServices._trocar_estado: uma leitura
+    desatualizada da chave nunca sobrescreve a mudança de outra requisição.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ana = criar_usuario('ana')
+        self.bruno = criar_usuario('bruno')
+        self.chave = Chave.objects.create(nome='Sala 101')
+
+    def test_versao_qrcode_desatualizada(self):
+        lida = Chave.objects.get(pk=self.chave.pk)
+        # Novo QR Code gerado depois da leitura (ação do admin)
+        Chave.objects.filter(pk=self.chave.pk).update(versao_qrcode=F('versao_qrcode') + 1)
+
+        with self.assertRaises(ConflitoEmprestimo):
+            emprestimoServices.registrar_aquisicao(lida, self.ana)
+
+        self.chave.refresh_from_db()
+        self.assertEqual(self.chave.status, 'disponivel')
+        self.assertFalse(HistoricoEmprestimo.objects.exists())
+
+    def test_portador_diferente_do_lido(self):
+        emprestimoServices.registrar_aquisicao(self.chave, self.ana)
+        lida = Chave.objects.get(pk=self.chave.pk)
+        # Bruno pegou a chave depois da leitura
+        emprestimoServices.registrar_aquisicao(Chave.objects.get(pk=self.chave.pk), self.bruno)
+
+        with self.assertRaises(ConflitoEmprestimo):
+            emprestimoServices.registrar_devolucao(lida)
+
+        self.chave.refresh_from_db()
+        self.assertEqual(self.chave.portador_atual, self.bruno)
+        self.assertFalse(HistoricoEmprestimo.objects.filter(acao='devolucao').exists())
+
+    def test_retirada_dupla(self):
+        primeira = Chave.objects.get(pk=self.chave.pk)
+        segunda = Chave.objects.get(pk=self.chave.pk)
+
+        emprestimoServices.registrar_aquisicao(primeira, self.ana)
+        with self.assertRaises(ConflitoEmprestimo):
+            emprestimoServices.registrar_aquisicao(segunda, self.bruno)
+
+        self.chave.refresh_from_db()
+        self.assertEqual(self.chave.portador_atual, self.ana)
+        self.assertEqual(list(HistoricoEmprestimo.objects.values_list('acao', 'usuario')), [('adquirida', self.ana.pk)])
+
+    def test_devolucao_dupla(self):
+        emprestimoServices.registrar_aquisicao(self.chave, self.ana)
+        lida = Chave.objects.get(pk=self.chave.pk)
+        emprestimoServices.registrar_devolucao(Chave.objects.get(pk=self.chave.pk))
+
+        with self.assertRaises(ConflitoEmprestimo):
+            emprestimoServices.registrar_devolucao(lida)
+        self.assertEqual(HistoricoEmprestimo.objects.filter(acao='devolucao').count(), 1)
+
+    def test_lote_desfeito_inteiro_em_conflito(self):
+        outra = Chave.objects.create(nome='Sala 102')
+        original = emprestimoServices._trocar_estado_em_lote
+
+        def trocar_com_corrida(chaves, *args):
+            # Outra requisição pega uma das chaves entre a leitura e o UPDATE
+            Chave.objects.filter(pk=outra.pk).update(status='em_uso', portador_atual=self.bruno)
+            return original(chaves, *args)
+
+        with mock.patch.object(emprestimoServices, '_trocar_estado_em_lote', trocar_com_corrida):
+            with self.assertRaises(ConflitoEmprestimo):
+                emprestimoServices.entregar_em_lote([self.chave.pk, outra.pk], self.ana)
+
+        self.chave.refresh_from_db()
+        self.assertEqual(self.chave.status, 'disponivel')
+        self.assertFalse(HistoricoEmprestimo.objects.exists())
+
+
+class HistoricoEmprestimoSaveTests(BaseTestCase):
+    """
+    HistoricoEmprestimo.save() de aquisições/devoluções passa pelo serviço,
+    mas o registro recebe a pk e dispara os sinais como num save comum.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ana = criar_usuario('ana')
+        self.bruno = criar_usuario('bruno')
+        self.chave = Chave.objects.create(nome='Sala 101')
+
+    def test_save_grava_com_pk_e_sinais(self):
+        salvos = []
+
+        def receptor(sender, instance, created, **kwargs):
+            salvos.append((instance.acao, created))
+
+        post_save.connect(receptor, sender=HistoricoEmprestimo)
+        self.addCleanup(post_save.disconnect, receptor, sender=HistoricoEmprestimo)
+
+        registro = HistoricoEmprestimo(chave=self.chave, usuario=self.ana, acao='adquirida')
+        registro.save()
+
+        self.assertIsNotNone(registro.pk)
+        self.assertEqual(salvos, [('adquirida', True)])
+        self.chave.refresh_from_db()
+        self.assertEqual((self.chave.status, self.chave.portador_atual), ('em_uso', self.ana))
+
+    def test_save_com_transferencia(self):
+        emprestimoServices.registrar_aquisicao(self.chave, self.ana)
+        registro = HistoricoEmprestimo(chave=Chave.objects.get(pk=self.chave.pk), usuario=self.bruno, acao='adquirida')
+        registro.save()
+
+        self.assertEqual(
+            list(HistoricoEmprestimo.objects.order_by('pk').values_list('acao', 'usuario')),
+            [('adquirida', self.ana.pk), ('transferida', self.ana.pk), ('adquirida', self.bruno.pk)],
+        )
+        self.assertEqual(HistoricoEmprestimo.objects.order_by('pk').last().pk, registro.pk)
+
+
+class HistoricoEmprestimoAdminTests(BaseTestCase):
+    """
+    Conflitos ao criar aquisições/devoluções pelo admin viram erro no
+    formulário ou mensagem, nunca erro 500.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.admin = criar_usuario('admin', is_staff=True, is_superuser=True)
+        self.ana = criar_usuario('ana')
+        self.chave = Chave.objects.create(nome='Sala 101')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:principal_historicoemprestimo_add')
+
+    def test_devolucao_de_chave_disponivel_e_erro_do_formulario(self):
+        resposta = self.client.post(self.url, {'chave': self.chave.pk, 'usuario': self.ana.pk, 'acao': 'devolucao'})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'já está disponível')
+        self.assertFalse(HistoricoEmprestimo.objects.exists())
+
+    def test_conflito_no_save_vira_mensagem(self):
+        with mock.patch.object(emprestimoServices, '_trocar_estado', return_value=False):
+            resposta = self.client.post(self.url, {'chave': self.chave.pk, 'usuario': self.ana.pk, 'acao': 'adquirida'})
+
+        self.assertRedirects(resposta, self.url, fetch_redirect_response=False)
+        mensagens = [str(mensagem) for mensagem in resposta.wsgi_request._messages]
+        self.assertTrue(any('movimentada por outra pessoa' in mensagem for mensagem in mensagens))
+        self.assertFalse(HistoricoEmprestimo.objects.exists())
+
+    def test_aquisicao_pelo_admin(self):
+        resposta = self.client.post(self.url, {'chave': self.chave.pk, 'usuario': self.ana.pk, 'acao': 'adquirida'})
+
+        self.assertEqual(resposta.status_code, 302)
+        registro = HistoricoEmprestimo.objects.get()
+        self.assertEqual((registro.acao, registro.usuario), ('adquirida', self.ana))
+        self.chave.refresh_from_db()
+        self.assertEqual(self.chave.portador_atual, self.ana)
+
+
+class PaginacaoCursorTests(BaseTestCase):
+    """
+    CursorPaginator: páginas sem repetir nem pular linhas (com datas
+    empatadas), ida e volta, cursores inválidos e partes (principal + arquivo).
+    """
+
+    def setUp(self):
+        super().setUp()
+        staff = criar_usuario('portaria', is_staff=True)
+        chave = Chave.objects.create(nome='Sala 101')
+        HistoricoEmprestimo.objects.bulk_create([
+            HistoricoEmprestimo(chave=chave, usuario=staff, acao='transferida') for _ in range(7)
+        ])
+        pks = sorted(HistoricoEmprestimo.objects.values_list('pk', flat=True))
+        # Duas datas, com empates: a ordem dentro de cada data é pelo pk
+        self.recente = timezone.now()
+        HistoricoEmprestimo.objects.filter(pk__in=pks[:4]).update(data_hora=self.recente - timedelta(days=1))
+        HistoricoEmprestimo.objects.filter(pk__in=pks[4:]).update(data_hora=self.recente)
+        self.esperado = pks[4:][::-1] + pks[:4][::-1]
+
+    def percorrer(self, paginador):
+        paginas = [paginador.get_page()]
+        while paginas[-1].has_next:
+            paginas.append(paginador.get_page(paginas[-1].proximo_cursor))
+        return paginas
+
+    def test_ida_e_volta(self):
+        paginador = paginacaoServices.CursorPaginator(HistoricoEmprestimo.objects.all(), 3)
+        paginas = self.percorrer(paginador)
+        self.assertEqual([[registro.pk for registro in pagina] for pagina in paginas],
+                         [self.esperado[0:3], self.esperado[3:6], self.esperado[6:]])
+        self.assertFalse(paginas[0].has_previous)
+
+        volta = [paginas[-1]]
+        while volta[-1].has_previous:
+            volta.append(paginador.get_page(volta[-1].cursor_anterior))
+        self.assertEqual([[registro.pk for registro in pagina] for pagina in reversed(volta)],
+                         [[registro.pk for registro in pagina] for pagina in paginas])
+
+    def test_partes(self):
+        # Mesma sequência com a lista dividida em duas partes pela data
+        todos = HistoricoEmprestimo.objects.all()
+        partes = [todos.filter(data_hora__gte=self.recente), todos.filter(data_hora__lt=self.recente)]
+        paginas = self.percorrer(paginacaoServices.CursorPaginator(partes, 2))
+        self.assertEqual([registro.pk for pagina in paginas for registro in pagina], self.esperado)
+
+        pagina = paginacaoServices.CursorPaginator(partes, 2, limite_total=5).get_page(com_total=True)
+        self.assertEqual((pagina.total_aproximado, pagina.total_excede_limite), (5, True))
+
+    def test_cursor_invalido(self):
+        paginador = paginacaoServices.CursorPaginator(HistoricoEmprestimo.objects.all(), 3)
+        for token in ('lixo', 'eDoxOjI', base64.urlsafe_b64encode(b'n:muito:1').decode()):
+            with self.subTest(token=token):
+                self.assertEqual([registro.pk for registro in paginador.get_page(token)], self.esperado[:3])
+        with self.assertRaises(paginacaoServices.CursorInvalido):
+            paginacaoServices._decodificar_cursor('eDoxOjI')  # 'x:1:2': direção desconhecida
+
+    async def test_aget_page(self):
+        paginador = paginacaoServices.CursorPaginator(HistoricoEmprestimo.objects.all(), 3)
+        pagina = await paginador.aget_page()
+        seguinte = await paginador.aget_page(pagina.proximo_cursor)
+        self.assertEqual([registro.pk for atual in (pagina, seguinte) for registro in atual], self.esperado[:6])
+
+
+class ArquivoHistoricoTests(BaseTestCase):
+    """
+    arquivar_historico: meses inteiros antigos vão para o arquivo (mesmos
+    ids), com o resumo mensal; a busca do histórico só lê o arquivo quando o
+    intervalo de datas pede.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = criar_usuario('portaria', is_staff=True)
+        chave = Chave.objects.create(nome='Sala 101')
+        datas = {
+            'adquirida': date(2024, 1, 10), 'devolucao': date(2024, 1, 31), 'transferida': date(2024, 2, 5),
+        }
+        for acao, dia in datas.items():
+            registro = HistoricoEmprestimo.objects.create(chave=chave, usuario=self.staff, acao=acao)
+            HistoricoEmprestimo.objects.filter(pk=registro.pk).update(data_hora=historicoServices.inicio_do_dia(dia))
+        self.antigos = set(HistoricoEmprestimo.objects.values_list('pk', flat=True))
+        self.recente = HistoricoEmprestimo.objects.create(chave=chave, usuario=self.staff, acao='adquirida')
+
+    def arquivar(self, *argumentos):
+        saida = io.StringIO()
+        call_command('arquivar_historico', '--dias', '30', *argumentos, stdout=saida)
+        return saida.getvalue()
+
+    def test_simular_nao_move(self):
+        self.assertIn('01/2024: 2 registro(s) seriam arquivados.', self.arquivar('--simular'))
+        self.assertEqual(HistoricoEmprestimo.objects.count(), 4)
+        self.assertIsNone(arquivoServices.limite_arquivo())
+
+    def test_move_meses_inteiros(self):
+        self.assertIn('3 registro(s) arquivados em 2 mês(es).', self.arquivar())
+
+        self.assertEqual(list(HistoricoEmprestimo.objects.values_list('pk', flat=True)), [self.recente.pk])
+        self.assertEqual(set(HistoricoEmprestimoArquivo.objects.values_list('pk', flat=True)), self.antigos)
+        resumos = ResumoArquivoMensal.objects.order_by('mes')
+        self.assertEqual(
+            list(resumos.values_list('mes', 'total', 'adquiridas', 'devolucoes', 'transferidas')),
+            [(date(2024, 1, 1), 2, 1, 1, 0), (date(2024, 2, 1), 1, 0, 0, 1)],
+        )
+        self.assertEqual(arquivoServices.limite_arquivo(), historicoServices.inicio_do_dia(date(2024, 3, 1)))
+        self.assertIn('Nada a arquivar', self.arquivar())
+
+    def test_busca_le_o_arquivo_so_quando_o_intervalo_pede(self):
+        self.arquivar()
+        self.client.force_login(self.staff)
+
+        antigos = sorted(self.antigos)
+        casos = {  # (parâmetros, partes consultadas, registros)
+            'sem datas': ({}, 1, [self.recente.pk]),
+            'só o arquivo': ({'de': '2024-01-01', 'ate': '2024-01-31'}, 1, antigos[:2]),
+            'os dois': ({'de': '2024-02-01'}, 2, [antigos[2], self.recente.pk]),
+        }
+        for caso, (parametros, partes, esperado) in casos.items():
+            with self.subTest(caso):
+                self.assertEqual(len(historicoServices.partes_historico(parametros)), partes)
+                resposta = self.client.get(reverse('historico_list'), parametros)
+                self.assertEqual(sorted(registro.pk for registro in resposta.context['emprestimos_list']), sorted(esperado))
+
+
+class AgregadosUsoTests(BaseTestCase):
+    """
+    Agregados de uso: somados na transação de cada movimentação, iguais aos
+    recalculados por reconstruir() e lidos pelo painel.
+    """
+
+    MODELOS = {
+        UsoHora: ('hora',),
+        UsoChaveDia: ('chave', 'dia'),
+        UsoUsuarioDia: ('usuario', 'dia'),
+        UsoGrupoDia: ('grupo', 'dia'),
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.ana = criar_usuario('ana')
+        self.bia = criar_usuario('bia')
+        ti = Group.objects.create(name='TI')
+        lab = Group.objects.create(name='Laboratórios')
+        self.sala = Chave.objects.create(nome='Sala 101')
+        self.lab = Chave.objects.create(nome='Laboratório')
+        self.lab.grupos_permissao.add(ti, lab)
+
+    def agregados(self):
+        return {
+            modelo.__name__: sorted(modelo.objects.values_list(*campos, 'adquiridas', 'devolucoes', 'transferidas'))
+            for modelo, campos in self.MODELOS.items()
+        }
+
+    def movimentar(self):
+        # Tudo no mesmo instante: uma hora e um dia nos agregados, mesmo perto da virada
+        self.instante = timezone.now().replace(minute=30, second=0, microsecond=0)
+        with mock.patch('django.utils.timezone.now', return_value=self.instante):
+            emprestimoServices.registrar_aquisicao(self.sala, self.ana)
+            emprestimoServices.registrar_aquisicao(self.lab, self.ana)
+            emprestimoServices.registrar_aquisicao(self.sala, self.bia)  # Transferência
+            emprestimoServices.registrar_devolucao(self.sala)
+            emprestimoServices.entregar_em_lote([self.sala.pk, self.lab.pk], self.bia)
+            emprestimoServices.receber_em_lote([self.sala.pk, self.lab.pk])
+
+    def test_incrementos(self):
+        self.movimentar()
+        self.assertEqual(list(UsoHora.objects.values_list('adquiridas', 'devolucoes', 'transferidas')), [(5, 3, 2)])
+        self.assertEqual(
+            sorted(UsoChaveDia.objects.values_list('chave__nome', 'adquiridas', 'devolucoes', 'transferidas')),
+            [('Laboratório', 2, 1, 1), ('Sala 101', 3, 2, 1)],
+        )
+        self.assertEqual(
+            sorted(UsoUsuarioDia.objects.values_list('usuario__username', 'adquiridas', 'devolucoes', 'transferidas')),
+            [('ana', 2, 0, 2), ('bia', 3, 3, 0)],
+        )
+        # O laboratório conta nos seus dois grupos
+        self.assertEqual(
+            sorted(UsoGrupoDia.objects.values_list('grupo__name', 'adquiridas', 'devolucoes', 'transferidas')),
+            [('Laboratórios', 2, 1, 1), ('TI', 2, 1, 1)],
+        )
+
+    def test_reconstruir_confere_com_os_incrementos(self):
+        self.movimentar()
+        incrementais = self.agregados()
+        agregadosServices.reconstruir()
+        self.assertEqual(self.agregados(), incrementais)
+
+    def test_painel(self):
+        self.movimentar()
+        painel = agregadosServices.painel(dias=7)
+
+        self.assertEqual(painel['totais'], {'retiradas': 5, 'devolucoes': 3, 'transferencias': 2})
+        self.assertEqual(sum(hora['retiradas'] for dia in painel['mapa_calor'] for hora in dia['horas']), 5)
+        self.assertEqual(painel['horarios_pico'], [{'hora': timezone.localtime(self.instante).hour, 'retiradas': 5}])
+        chaves = dict(painel['rankings'])['Chaves mais retiradas']
+        self.assertEqual([(linha['nome'], linha['retiradas']) for linha in chaves], [('Sala 101', 3), ('Laboratório', 2)])
+
+    def test_escritas_da_retirada(self):
+        # Transação da retirada: UPDATE da chave, INSERT no histórico, grupos da chave,
+        # um upsert por agregado (hora, chave, usuário, grupo) e a sessão (mais o SAVEPOINT)
+        with self.assertNumQueries(10):
+            emprestimoServices.registrar_aquisicao(self.lab, self.ana)
+        # Sem grupos, sem o upsert por grupo
+        with self.assertNumQueries(9):
+            emprestimoServices.registrar_aquisicao(self.sala, self.ana)
+
+
+class SessoesEmprestimoTests(BaseTestCase):
+    """
+    Sessões de empréstimo: pareamento dos eventos, sessões mantidas a cada
+    movimentação iguais às reconstruídas e a tela com os filtros.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ana = criar_usuario('ana')
+        self.bia = criar_usuario('bia')
+        self.sala = Chave.objects.create(nome='Sala 101')
+        self.lab = Chave.objects.create(nome='Laboratório')
+
+    def sessoes(self):
+        return sorted(SessaoEmprestimo.objects.values_list('chave', 'usuario', 'inicio', 'fim', 'encerramento'))
+
+    def test_parear_eventos(self):
+        t = [timezone.now() + timedelta(minutes=minuto) for minuto in range(5)]
+        eventos = [
+            (1, self.ana.pk, t[0], 'adquirida'),
+            (1, self.ana.pk, t[1], 'adquirida'),  # Nova retirada de quem já estava com a chave
+            (1, self.bia.pk, t[2], 'adquirida'),  # Troca de portador sem a linha 'transferida'
+            (1, self.bia.pk, t[3], 'devolucao'),
+            (2, self.ana.pk, t[0], 'devolucao'),  # Devolução sem sessão aberta
+            (2, self.ana.pk, t[4], 'adquirida'),
+        ]
+        sessoes = [
+            (sessao.chave_id, sessao.usuario_id, sessao.inicio, sessao.fim, sessao.encerramento)
+            for sessao in sessaoServices.parear_eventos(eventos)
+        ]
+        self.assertEqual(sessoes, [
+            (1, self.ana.pk, t[0], t[2], 'transferida'),
+            (1, self.bia.pk, t[2], t[3], 'devolucao'),
+            (2, self.ana.pk, t[4], None, None),
+        ])
+
+    def test_incrementais_iguais_as_reconstruidas(self):
+        emprestimoServices.registrar_aquisicao(self.sala, self.ana)
+        emprestimoServices.registrar_aquisicao(self.sala, self.bia)  # Transferência
+        emprestimoServices.registrar_aquisicao(self.lab, self.ana)
+        emprestimoServices.receber_em_lote([self.sala.pk, self.lab.pk])  # Fecha as duas com um CASE
+        emprestimoServices.entregar_em_lote([self.sala.pk, self.lab.pk], self.bia)
+        self.lab.refresh_from_db()
+        emprestimoServices.registrar_aquisicao(self.lab, self.ana)
+
+        incrementais = self.sessoes()
+        self.assertEqual(
+            [(chave, usuario, encerramento) for chave, usuario, _, _, encerramento in incrementais],
+            [(self.sala.pk, self.ana.pk, 'transferida'), (self.sala.pk, self.bia.pk, 'devolucao'),
+             (self.sala.pk, self.bia.pk, None), (self.lab.pk, self.ana.pk, 'devolucao'),
+             (self.lab.pk, self.ana.pk, None), (self.lab.pk, self.bia.pk, 'transferida')],
+        )
+        self.assertEqual(sessaoServices.reconstruir(), 6)
+        self.assertEqual(self.sessoes(), incrementais)
+
+    def test_retirada_repetida_nao_abre_outra_sessao(self):
+        primeira = HistoricoEmprestimo(chave=self.sala, usuario=self.ana, acao='adquirida', data_hora=timezone.now())
+        repetida = HistoricoEmprestimo(
+            chave=self.sala, usuario=self.ana, acao='adquirida', data_hora=primeira.data_hora + timedelta(minutes=5)
+        )
+        sessaoServices.registrar([primeira])
+        sessaoServices.registrar([repetida])
+        self.assertEqual(self.sessoes(), [(self.sala.pk, self.ana.pk, primeira.data_hora, None, None)])
+
+    def test_tela_com_filtros(self):
+        emprestimoServices.registrar_aquisicao(self.sala, self.ana)
+        emprestimoServices.registrar_aquisicao(self.lab, self.bia)
+        emprestimoServices.registrar_devolucao(self.lab)
+        self.client.force_login(criar_usuario('portaria', is_staff=True))
+
+        casos = {
+            'sem filtro': ({}, ['Laboratório', 'Sala 101']),
+            'abertas': ({'abertas': '1'}, ['Sala 101']),
+            'usuário': ({'usuario_nome': 'bia'}, ['Laboratório']),
+            'chave': ({'chave_nome': 'Sala'}, ['Sala 101']),
+        }
+        for caso, (parametros, esperado) in casos.items():
+            with self.subTest(caso):
+                resposta = self.client.get(reverse('sessoes_list'), parametros)
+                self.assertEqual(sorted(sessao.chave.nome for sessao in resposta.context['sessoes_list']), esperado)
+                self.assertEqual('resumo' in resposta.context, bool(parametros) and 'abertas' not in parametros)
+        resposta = self.client.get(reverse('sessoes_list'), {'usuario_nome': 'bia'})
+        self.assertEqual((resposta.context['resumo']['sessoes'], resposta.context['resumo']['abertas']), (1, 0))
+
+
+class EstadoChavesEmTests(BaseTestCase):
+    """
+    Estado das chaves num instante: instantâneo mais recente até o instante
+    mais os eventos desde ele (com a margem), retroativos a partir do arquivo
+    e da tabela principal e retenção dos instantâneos antigos.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ana = criar_usuario('ana')
+        self.bia = criar_usuario('bia')
+        self.sala = Chave.objects.create(nome='Sala 101')
+        self.lab = Chave.objects.create(nome='Laboratório')
+
+    def em(self, dia, hora, minuto=0):
+        return historicoServices.inicio_do_dia(dia) + timedelta(hours=hora, minutes=minuto)
+
+    def evento(self, chave, usuario, acao, data_hora):
+        registro = HistoricoEmprestimo.objects.create(chave=chave, usuario=usuario, acao=acao)
+        HistoricoEmprestimo.objects.filter(pk=registro.pk).update(data_hora=data_hora)
+
+    def portadores(self, momento):
+        estado = instantaneoServices.estado_em(momento)
+        return None if estado is None else estado.portadores
+
+    def test_linha_do_tempo_com_mes_arquivado(self):
+        janeiro, fevereiro = date(2024, 1, 10), date(2024, 2, 3)
+        self.evento(self.sala, self.ana, 'adquirida', self.em(janeiro, 9))
+        self.evento(self.sala, self.ana, 'transferida', self.em(janeiro, 14))
+        self.evento(self.sala, self.bia, 'adquirida', self.em(janeiro, 14))
+        self.evento(self.lab, self.ana, 'adquirida', self.em(janeiro + timedelta(days=1), 10))
+        self.evento(self.sala, self.bia, 'devolucao', self.em(janeiro + timedelta(days=2), 8))
+        self.evento(self.lab, self.ana, 'devolucao', self.em(fevereiro, 9))
+        self.evento(self.sala, self.bia, 'adquirida', self.em(fevereiro, 10))
+        arquivoServices.arquivar_mes(date(2024, 1, 1))
+        self.assertEqual(HistoricoEmprestimoArquivo.objects.count(), 5)
+
+        instantaneoServices.gerar_retroativos()
+        instantaneos = {
+            timezone.localtime(instantaneo.momento).date(): instantaneo.portadores
+            for instantaneo in InstantaneoChaves.objects.all()
+        }
+        # Um por dia, desde a meia-noite seguinte ao primeiro evento
+        self.assertEqual(min(instantaneos), janeiro + timedelta(days=1))
+        self.assertEqual(instantaneos[janeiro + timedelta(days=1)], {str(self.sala.pk): self.bia.pk})
+        self.assertEqual(instantaneos[date(2024, 2, 1)], {str(self.lab.pk): self.ana.pk})  # Só do arquivo
+        self.assertEqual(instantaneos[fevereiro + timedelta(days=1)], {str(self.sala.pk): self.bia.pk})
+
+        casos = [
+            (self.em(janeiro, 12), None),  # Antes do primeiro instantâneo
+            (self.em(janeiro + timedelta(days=1), 12), {self.sala.pk: self.bia.pk, self.lab.pk: self.ana.pk}),
+            (self.em(janeiro + timedelta(days=2), 9), {self.lab.pk: self.ana.pk}),
+            (self.em(fevereiro, 9, 30), {}),
+            (self.em(fevereiro, 11), {self.sala.pk: self.bia.pk}),
+        ]
+        for momento, esperado in casos:
+            with self.subTest(momento=momento):
+                self.assertEqual(self.portadores(momento), esperado)
+
+    def test_margem_reaplica_eventos_confirmados_depois(self):
+        momento = self.em(date(2024, 3, 5), 12)
+        # Evento de 30 s antes do instantâneo, confirmado depois da leitura do estado
+        InstantaneoChaves.objects.create(momento=momento, portadores={})
+        self.evento(self.sala, self.ana, 'adquirida', momento - timedelta(seconds=30))
+
+        self.assertEqual(self.portadores(momento + timedelta(minutes=1)), {self.sala.pk: self.ana.pk})
+        with override_settings(INSTANTANEO_MARGEM_SEGUNDOS=0):
+            self.assertEqual(self.portadores(momento + timedelta(minutes=1)), {})
+
+        # Reaplicar um evento já refletido no instantâneo não muda o resultado
+        InstantaneoChaves.objects.filter(momento=momento).update(portadores={str(self.sala.pk): self.ana.pk})
+        self.assertEqual(self.portadores(momento + timedelta(minutes=1)), {self.sala.pk: self.ana.pk})
+
+    def test_retencao(self):
+        antigo = timezone.localdate() - timedelta(days=40)
+        recente = timezone.localdate() - timedelta(days=2)
+        for dia in (antigo, recente):
+            for hora in (10, 11, 12):
+                InstantaneoChaves.objects.create(momento=self.em(dia, hora))
+
+        self.assertEqual(instantaneoServices.aplicar_retencao(30), 2)
+        self.assertEqual(
+            list(InstantaneoChaves.objects.order_by('momento').values_list('momento', flat=True)),
+            [self.em(antigo, 10), self.em(recente, 10), self.em(recente, 11), self.em(recente, 12)],
+        )
+
+    def test_tela_json(self):
+        InstantaneoChaves.objects.create(momento=self.em(date(2024, 3, 5), 12), portadores={})
+        self.evento(self.sala, self.ana, 'adquirida', self.em(date(2024, 3, 5), 13))
+        self.client.force_login(criar_usuario('portaria', is_staff=True))
+
+        resposta = self.client.get(reverse('estado_chaves_em'), {'momento': '2024-03-05T11:00', 'formato': 'json'})
+        self.assertEqual(resposta.status_code, 404)
+        resposta = self.client.get(reverse('estado_chaves_em'), {'momento': '2024-03-05T14:00', 'formato': 'json'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['eventos_aplicados'], 1)
+        self.assertEqual(
+            [(item['chave'], item['usuario']) for item in resposta.json()['portadores']], [('Sala 101', str(self.ana))]
+        )
+
+
+class FiltroDatasHistoricoTests(BaseTestCase):
+    """
+    Datas impossíveis ou mal formadas nos filtros do histórico são ignoradas.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = criar_usuario('portaria', is_staff=True)
+        chave = Chave.objects.create(nome='Sala 101')
+        emprestimoServices.registrar_aquisicao(chave, self.staff)
+        self.client.force_login(self.staff)
+
+    def test_intervalo_datas(self):
+        inicio, fim = historicoServices.intervalo_datas('2025-01-01', '2025-01-31')
+        self.assertEqual((inicio.date(), fim.date()), (date(2025, 1, 1), date(2025, 2, 1)))
+        self.assertEqual(historicoServices.intervalo_datas('2025-02-31', 'ontem'), (None, None))
+        self.assertEqual(historicoServices.intervalo_datas('', None), (None, None))
+
+    def test_data_impossivel_na_tela_e_na_exportacao(self):
+        for parametros in ({'de': '2025-02-31'}, {'ate': '2025-13-01'}, {'data': '2025-02-30'}):
+            with self.subTest(parametros=parametros):
+                resposta = self.client.get(reverse('historico_list'), parametros)
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(len(resposta.context['emprestimos_list']), 1)
+
+                resposta = self.client.get(reverse('exportar_historico'), parametros)
+                self.assertEqual(resposta.status_code, 200)
+                b''.join(resposta.streaming_content)
+
+
+class BuscaChavesTests(BaseTestCase):
+    """
+    Busca de chaves pelo nome (FTS5 no SQLite), com o índice mantido pelos
+    triggers em inserções, edições e exclusões.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lab = Chave.objects.create(nome='Laboratório de Redes', descricao='Bloco B')
+        self.sala = Chave.objects.create(nome='Sala 203', descricao='Ao lado do laboratório')
+
+    def buscar(self, termo):
+        return set(buscaServices.filtrar_chaves(Chave.objects.all(), termo).values_list('nome', flat=True))
+
+    def test_busca_so_no_nome(self):
+        self.assertTrue(buscaServices.fts_disponivel())
+        self.assertEqual(self.buscar('laboratorio'), {'Laboratório de Redes'})
+        self.assertEqual(self.buscar('lab red'), {'Laboratório de Redes'})
+        self.assertEqual(self.buscar('bloco'), set())
+
+    def test_triggers_acompanham_a_tabela(self):
+        self.sala.nome = 'Auditório'
+        self.sala.save()
+        Chave.objects.bulk_create([Chave(nome='Almoxarifado')])
+        self.lab.delete()
+
+        self.assertEqual(self.buscar('sala'), set())
+        self.assertEqual(self.buscar('audit'), {'Auditório'})
+        self.assertEqual(self.buscar('almox'), {'Almoxarifado'})
+        self.assertEqual(self.buscar('redes'), set())
+
+    def test_termo_sem_palavras(self):
+        self.assertEqual(self.buscar('"*:'), {'Laboratório de Redes', 'Sala 203'})
+
+
+class RotasIndexAsync:
+    # URLs do projeto com index_async no lugar de index, como com VIEWS_ASYNC
+    urlpatterns = [
+        path('', views.index_async, name='index'),
+        path('', include(settings.ROOT_URLCONF)),
+    ]
+
+
+class MarcadoresVersaoTests(BaseTestCase):
+    """
+    ETag/304 e o fragmento dos últimos empréstimos dependem dos marcadores de
+    versão, que só são usados com VERSOES_EM_CACHE (cache compartilhado).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = criar_usuario('portaria', is_staff=True)
+        self.chave = Chave.objects.create(nome='Sala 101')
+        self.client.force_login(self.staff)
+
+    @override_settings(VERSOES_EM_CACHE=False)
+    def test_sem_marcadores_nada_fica_antigo(self):
+        resposta = self.client.get(reverse('index'))
+        self.assertFalse(resposta.has_header('ETag'))
+        self.assertEqual(resposta.context['segundos_ultimos_emprestimos'], 0)
+
+        # Registro gravado sem passar pelos marcadores (ex.: por outro processo)
+        HistoricoEmprestimo.objects.bulk_create([HistoricoEmprestimo(chave=self.chave, usuario=self.staff, acao='transferida')])
+        self.assertContains(self.client.get(reverse('index')), 'id="lista-emprestimos-staff"')
+        self.assertFalse(self.client.get(reverse('lista_chaves')).has_header('ETag'))
+
+    @override_settings(VERSOES_EM_CACHE=True)
+    def test_etag_muda_com_o_historico(self):
+        self.client.get(reverse('index'))  # Recebe o cookie CSRF, que entra no ETag
+        resposta = self.client.get(reverse('index'))
+        etag = resposta['ETag']
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            emprestimoServices.registrar_aquisicao(self.chave, self.staff)
+
+        resposta = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+        self.assertContains(resposta, 'id="lista-emprestimos-staff"')
+
+    @override_settings(VERSOES_EM_CACHE=True)
+    def test_index_async_so_consulta_sem_o_fragmento(self):
+        HistoricoEmprestimo.objects.bulk_create([HistoricoEmprestimo(chave=self.chave, usuario=self.staff, acao='transferida')])
+        self.async_client.force_login(self.staff)
+        obter = async_to_sync(self.async_client.get)
+        versaoServices.obter_versao_historico()  # Marcador já em cache: só a lista consulta o histórico
+
+        def consultas_historico(capturadas):
+            return [consulta for consulta in capturadas if 'principal_historicoemprestimo' in consulta['sql']]
+
+        with override_settings(ROOT_URLCONF=RotasIndexAsync):
+            for consultas_esperadas in (1, 0):  # Sem o fragmento e depois com ele em cache
+                with CaptureQueriesContext(connection) as capturadas:
+                    resposta = obter(reverse('index'))
+                self.assertContains(resposta, 'id="lista-emprestimos-staff"')
+                self.assertEqual(len(consultas_historico(capturadas)), consultas_esperadas)
+
+    @override_settings(VERSOES_EM_CACHE=True, VERSAO_CACHE_TIMEOUT=300)
+    def test_marcadores_expiram(self):
+        with mock.patch.object(versaoServices, 'cache') as cache:
+            cache.get.return_value = None
+            versaoServices.obter_versao_historico()
+            versaoServices.obter_versao_chaves()
+        self.assertEqual({chamada.args[2] for chamada in cache.set.call_args_list}, {300})
+
+
+class AcoesEmLoteTests(BaseTestCase):
+    """
+    Ações em lote da lista de gerenciamento: ids inválidos são ignorados e
+    uma seleção vazia vira mensagem, não erro.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = criar_usuario('portaria', is_staff=True)
+        self.ana = criar_usuario('ana')
+        self.chave = Chave.objects.create(nome='Sala 101')
+        self.client.force_login(self.staff)
+        self.url = reverse('acoes_em_lote')
+
+    def mensagens(self, resposta):
+        return [str(mensagem) for mensagem in resposta.wsgi_request._messages]
+
+    def test_selecao_vazia_ou_invalida(self):
+        for chaves in ([], ['²'], ['abc', '', '-3', '0', str(2 ** 64)]):
+            with self.subTest(chaves=chaves):
+                resposta = self.client.post(self.url, {'acao': 'receber', 'chaves': chaves})
+                self.assertRedirects(resposta, reverse('lista_chaves'), fetch_redirect_response=False)
+                self.assertIn('Nenhuma chave selecionada.', self.mensagens(resposta))
+
+    def test_ids_invalidos_sao_ignorados(self):
+        resposta = self.client.post(self.url, {
+            'acao': 'entregar', 'usuario': 'ana', 'chaves': ['²', str(self.chave.pk), str(self.chave.pk)],
+        })
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([resultado.chave_id for resultado in resposta.context['resultados']], [self.chave.pk])
+        self.chave.refresh_from_db()
+        self.assertEqual(self.chave.portador_atual, self.ana)
+
+
+class ImportarDadosTests(BaseTestCase):
+    """
+    Comando importar_dados: linhas inválidas viram erro da linha e o mapa de
+    CPFs acompanha só o que de fato vai para o banco.
+    """
+
+    def importar(self, tipo, conteudo, *opcoes, extensao='jsonl'):
+        with tempfile.TemporaryDirectory() as pasta:
+            caminho = os.path.join(pasta, f'dados.{extensao}')
+            with open(caminho, 'w', encoding='utf-8') as arquivo:
+                arquivo.write(conteudo)
+            erros = io.StringIO()
+            call_command('importar_dados', tipo, caminho, *opcoes, stdout=io.StringIO(), stderr=erros)
+        return erros.getvalue()
+
+    def cpfs(self):
+        return dict(Usuario.objects.values_list('username', 'cpf'))
+
+    def test_linhas_que_nao_sao_objetos(self):
+        erros = self.importar('usuarios', '[]\n1\n"ana"\n{quebrado\n{"username": "ana", "cpf": "111"}\n')
+
+        self.assertEqual(erros.count('objeto JSON'), 3)
+        self.assertIn('Linha 4: JSON inválido', erros)
+        self.assertEqual(self.cpfs(), {'ana': '111'})
+
+    def test_grupos_em_formato_invalido(self):
+        erros = self.importar('chaves', '{"nome": "Sala 1", "grupos": 5}\n{"nome": "Sala 2", "grupos": ["TI"]}\n')
+
+        self.assertIn('Linha 1: grupos deve ser', erros)
+        self.assertEqual(list(Chave.objects.values_list('nome', 'grupos_permissao__name')), [('Sala 2', 'TI')])
+
+    def test_linha_recusada_nao_reserva_cpf(self):
+        erros = self.importar('usuarios', '{"username": "ana", "cpf": "111", "password": "texto"}\n{"username": "bia", "cpf": "111"}\n')
+
+        self.assertIn('Linha 1: password', erros)
+        self.assertEqual(self.cpfs(), {'bia': '111'})
+
+    def test_usuario_ignorado_nao_reserva_cpf(self):
+        criar_usuario('ana', cpf='111')
+        erros = self.importar('usuarios', '{"username": "ana", "cpf": "222"}\n{"username": "bia", "cpf": "222"}\n')
+
+        self.assertEqual(erros, '')
+        self.assertEqual(self.cpfs(), {'ana': '111', 'bia': '222'})
+
+    def test_cpf_alterado_fica_livre(self):
+        criar_usuario('ana', cpf='111')
+        erros = self.importar('usuarios', '{"username": "ana", "cpf": "222"}\n{"username": "bia", "cpf": "111"}\n', '--atualizar')
+
+        self.assertEqual(erros, '')
+        self.assertEqual(self.cpfs(), {'ana': '222', 'bia': '111'})
+
+    @override_settings(VERSOES_EM_CACHE=True)
+    def test_chaves_importadas_mudam_o_etag(self):
+        staff = criar_usuario('portaria', is_staff=True)
+        sala = Chave.objects.create(nome='Sala 1')
+        self.client.force_login(staff)
+        self.client.get(reverse('lista_chaves'))  # Recebe o cookie CSRF, que entra no ETag
+        etag = self.client.get(reverse('lista_chaves'))['ETag']
+        self.assertEqual(self.client.get(reverse('lista_chaves'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.importar('chaves', 'nome,descricao\nSala 1,Bloco A\nSala 2,\n', '--atualizar', extensao='csv')
+
+        resposta = self.client.get(reverse('lista_chaves'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Sala 2')
+        sala_antes = sala.versao
+        sala.refresh_from_db()
+        self.assertEqual((sala.descricao, sala.versao), ('Bloco A', sala_antes + 1))
+        self.assertEqual(Chave.objects.get(nome='Sala 2').versao, 1)
+
+    def test_dry_run_nao_muda_as_versoes(self):
+        with mock.patch.object(versaoServices, 'registrar_alteracao_chaves') as registrar:
+            self.importar('chaves', '{"nome": "Sala 1"}\n', '--dry-run')
+        registrar.assert_not_called()
+        self.assertFalse(Chave.objects.exists())
+
+
+class FeedEventosTests(BaseTestCase):
+    """
+    Feed ao vivo (SSE): 204 sob WSGI, só staff sob ASGI, reenvio em ordem e
+    sem lacunas e descarte dos eventos do barramento já reenviados.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = criar_usuario('portaria', is_staff=True)
+        chave = Chave.objects.create(nome='Sala 101')
+        HistoricoEmprestimo.objects.bulk_create([
+            HistoricoEmprestimo(chave=chave, usuario=self.staff, acao='transferida') for _ in range(8)
+        ])
+        self.pks = sorted(HistoricoEmprestimo.objects.values_list('pk', flat=True))
+
+    def test_wsgi(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('stream_emprestimos')).status_code, 204)
+
+    async def test_asgi_so_staff(self):
+        self.assertEqual((await self.async_client.get(reverse('stream_emprestimos'))).status_code, 403)
+        ana = await sync_to_async(criar_usuario)('ana')
+        await self.async_client.aforce_login(ana)
+        self.assertEqual((await self.async_client.get(reverse('stream_emprestimos'))).status_code, 403)
+
+    def test_reenvio_em_ordem_e_sem_lacunas(self):
+        with mock.patch.object(eventosServices, 'LIMITE_REENVIO', 10):
+            eventos = eventosServices.eventos_desde(self.pks[0])
+        self.assertEqual([evento.id for evento in eventos], self.pks[1:])
+        self.assertEqual({evento.tipo for evento in eventos}, {'emprestimo'})
+
+    def test_reenvio_acima_do_limite_pede_recarga(self):
+        with mock.patch.object(eventosServices, 'LIMITE_REENVIO', 5):
+            eventos = eventosServices.eventos_desde(self.pks[0])
+            self.assertEqual(len(eventosServices.eventos_desde(self.pks[2])), 5)
+        self.assertEqual([(evento.id, evento.tipo) for evento in eventos], [(self.pks[-1], 'recarregar')])
+        self.assertIn('event: recarregar\ndata: ', eventos[0].formatar_sse())
+
+    async def test_fluxo_descarta_eventos_ja_reenviados(self):
+        fluxo = _fluxo_eventos(self.pks[5])
+        try:
+            self.assertTrue((await anext(fluxo)).startswith('retry:'))  # Já inscrito no barramento
+            reenviados = [await anext(fluxo) for _ in self.pks[6:]]
+            self.assertEqual([texto.split('\n')[0] for texto in reenviados], [f'id: {pk}' for pk in self.pks[6:]])
+
+            (assinante,) = eventosServices._assinantes
+            # Publicados durante o reenvio: os dois primeiros já foram enviados
+            for pk in (self.pks[6], self.pks[7], self.pks[7] + 1):
+                assinante.entregar(eventosServices.Evento(pk, f'<tr><td>{pk}</td></tr>'))
+            self.assertTrue((await anext(fluxo)).startswith(f'id: {self.pks[7] + 1}\n'))
+        finally:
+            await fluxo.aclose()
+        self.assertEqual(eventosServices._assinantes, set())
+
+
+class ExportacaoHistoricoTests(BaseTestCase):
+    """
+    Exportação do histórico em fluxo: iterador síncrono sob WSGI e
+    assíncrono sob ASGI, com o mesmo conteúdo.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = criar_usuario('portaria', is_staff=True)
+        chave = Chave.objects.create(nome='Sala 101')
+        emprestimoServices.registrar_aquisicao(chave, self.staff)
+        emprestimoServices.registrar_devolucao(chave)
+
+    def test_wsgi(self):
+        self.client.force_login(self.staff)
+        resposta = self.client.get(reverse('exportar_historico'), {'formato': 'jsonl'})
+
+        self.assertFalse(resposta.is_async)
+        linhas = b''.join(resposta.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(linha)['acao'] for linha in linhas], ['adquirida', 'devolucao'])
+
+    async def test_asgi(self):
+        await self.async_client.aforce_login(self.staff)
+        resposta = await self.async_client.get(reverse('exportar_historico'), {'gzip': '1'})
+
+        self.assertTrue(resposta.is_async)
+        conteudo = gzip.decompress(b''.join([parte async for parte in resposta.streaming_content])).decode()
+        self.assertEqual(len(list(csv.reader(io.StringIO(conteudo)))), 3)
+
+
+class OrcamentoConsultasTests(BaseTestCase):
+    """
+    Orçamento de consultas das telas com permissão por grupo
+    (permissaoServices): não cresce com a quantidade de usuários, grupos ou
+    chaves na página. Cada tela é aberta uma vez antes da medida, para a
+    sessão e o usuário da requisição já estarem em cache.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = criar_usuario('portaria', is_staff=True)
+        self.ana = criar_usuario('ana')
+        self.ti = Group.objects.create(name='TI')
+        self.ana.groups.add(self.ti)
+        self.livre = Chave.objects.create(nome='Sala 101')
+        self.restrita = Chave.objects.create(nome='Laboratório')
+        self.restrita.grupos_permissao.add(self.ti)
+        self.outra = Chave.objects.create(nome='Almoxarifado')
+        self.outra.grupos_permissao.add(Group.objects.create(name='Manutenção'))
+
+    def povoar(self, quantidade):
+        # Mais usuários, grupos e chaves (com e sem grupos) que uma página
+        for n in range(quantidade):
+            grupo = Group.objects.create(name=f'Grupo {n}')
+            criar_usuario(f'usuario{n}').groups.add(grupo, self.ti)
+            Chave.objects.create(nome=f'Sala {n:03d}').grupos_permissao.add(grupo)
+        autenticacaoServices.invalidar_todos()
+
+    def assertConsultas(self, numero, url):
+        self.client.get(url)
+        with self.assertNumQueries(numero):
+            resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta
+
+    def medir(self):
+        self.client.force_login(self.staff)
+        # COUNT + página de usuários, mais os grupos da chave
+        self.assertConsultas(4, reverse('entregar_chave', args=[self.restrita.pk]))
+        # Só a leitura da chave, com a permissão anotada
+        self.assertConsultas(1, reverse('pegar_chave', args=[self.livre.pk]))
+        # COUNT + página de chaves; para staff, também os últimos empréstimos (VERSOES_EM_CACHE desligado)
+        self.assertConsultas(2, reverse('lista_chaves'))
+        self.assertConsultas(3, reverse('index'))
+
+        self.client.force_login(self.ana)
+        self.assertConsultas(2, reverse('index'))
+        self.assertConsultas(1, reverse('pegar_chave', args=[self.restrita.pk]))
+        # Permissão negada: +1 para os nomes dos grupos do aviso
+        resposta = self.assertConsultas(2, reverse('pegar_chave', args=[self.outra.pk]))
+        self.assertFalse(resposta.context['chave'].tem_permissao)
+
+    def test_orcamento_nao_cresce(self):
+        self.medir()
+        self.povoar(30)
+        self.medir()
+
+    def test_permissao_anotada(self):
+        for usuario, esperado in ((self.ana, {'Sala 101': True, 'Laboratório': True, 'Almoxarifado': False}),
+                                  (self.staff, {'Sala 101': True, 'Laboratório': False, 'Almoxarifado': False})):
+            chaves = permissaoServices.anotar_permissao_chaves(Chave.objects.all(), usuario)
+            self.assertEqual({chave.nome: chave.tem_permissao for chave in chaves}, esperado)
+
+        usuarios = permissaoServices.anotar_permissao_usuarios(Usuario.objects.all(), [self.ti.pk])
+        self.assertEqual({usuario.username: usuario.tem_permissao for usuario in usuarios}, {'portaria': False, 'ana': True})
+
+
+class RetiradaQrcodeTests(BaseTestCase):
+    """
+    Retirada pelo QR Code: token assinado validado sem banco, versão antiga
+    recusada (410), confirmação no GET e retirada no POST.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.ana = criar_usuario('ana')
+        self.bia = criar_usuario('bia')
+        self.chave = Chave.objects.create(nome='Sala 101')
+        self.client.force_login(self.ana)
+
+    def url(self, token=None):
+        token = token or tokenServices.gerar_token(self.chave.pk, self.chave.versao_qrcode)
+        return reverse('retirar_por_qrcode', args=[token])
+
+    def retirar(self, token=None):
+        return self.client.post(self.url(token), HTTP_ACCEPT='application/json')
+
+    def test_ida_e_volta_do_token(self):
+        token = tokenServices.gerar_token(12345, 7)
+        self.assertEqual(tokenServices.ler_token(token), (12345, 7))
+        self.assertLess(len(token), 30)
+
+    def test_token_forjado_ou_de_outra_rotacao(self):
+        token = tokenServices.gerar_token(self.chave.pk, 1)
+        chave_b36, versao_b36, assinatura = token.split('.')
+        outra_assinatura = ('A' if assinatura[0] != 'A' else 'B') + assinatura[1:]
+        with override_settings(QRCODE_TOKEN_ROTACAO='2'):
+            de_outra_rotacao = tokenServices.gerar_token(self.chave.pk, 1)
+
+        for invalido in (f'{chave_b36}.{versao_b36}.{outra_assinatura}', de_outra_rotacao, 'abc', 'x.y.z'):
+            with self.subTest(token=invalido):
+                with self.assertNumQueries(0), self.assertRaises(tokenServices.TokenInvalido):
+                    tokenServices.ler_token(invalido)
+                self.assertEqual(self.retirar(invalido).status_code, 400)
+        self.assertFalse(HistoricoEmprestimo.objects.exists())
+
+    def test_versao_antiga(self):
+        token_antigo = tokenServices.gerar_token(self.chave.pk, self.chave.versao_qrcode)
+        Chave.objects.filter(pk=self.chave.pk).update(versao_qrcode=F('versao_qrcode') + 1)
+        self.assertEqual(self.retirar(token_antigo).status_code, 410)
+        self.assertEqual(self.client.get(self.url(token_antigo)).status_code, 410)
+
+    def test_get_so_confirma(self):
+        resposta = self.client.get(self.url())
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.context['confirmar'])
+        self.chave.refresh_from_db()
+        self.assertIsNone(self.chave.portador_atual)
+        self.assertFalse(HistoricoEmprestimo.objects.exists())
+
+    def test_post_retira(self):
+        resposta = self.retirar()
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['chave'], 'Sala 101')
+        self.assertTrue(resposta.json()['sucesso'])
+        self.chave.refresh_from_db()
+        self.assertEqual(self.chave.portador_atual, self.ana)
+        self.assertEqual(list(HistoricoEmprestimo.objects.values_list('acao', 'usuario')), [('adquirida', self.ana.pk)])
+
+        resposta = self.retirar()
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('já está com esta chave', resposta.json()['mensagem'])
+        self.assertEqual(HistoricoEmprestimo.objects.count(), 1)
+
+    def test_movimentada_por_outra_pessoa(self):
+        registrar = emprestimoServices.registrar_aquisicao
+
+        def concorrente(chave, usuario):
+            # Entre a leitura da chave e a gravação, outra pessoa a retira
+            registrar(Chave.objects.get(pk=chave.pk), self.bia)
+            return registrar(chave, usuario)
+
+        with mock.patch('principal.subviews.qrcodeViews.registrar_aquisicao', side_effect=concorrente):
+            resposta = self.retirar()
+        self.assertEqual(resposta.status_code, 409)
+        self.assertFalse(resposta.json()['sucesso'])
+        self.chave.refresh_from_db()
+        self.assertEqual(self.chave.portador_atual, self.bia)
+
+
+@override_settings(ETIQUETAS_PAGINAS_TELA=1)
+class FolhaEtiquetasTests(BaseTestCase):
+    """
+    Folha de etiquetas pela tela: montada no próprio processo, sem pool, e
+    limitada a ETIQUETAS_PAGINAS_TELA páginas (24 etiquetas cada).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = criar_usuario('portaria', is_staff=True)
+        Chave.objects.bulk_create([Chave(nome=f'Sala {n:03d}') for n in range(25)])
+        self.client.force_login(self.staff)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=media.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_sem_pool_dentro_do_limite(self):
+        with mock.patch('principal.services.etiquetaServices.ProcessPoolExecutor') as pool:
+            resposta = self.client.get(reverse('folha_etiquetas'), {'chave_nome': 'Sala 00'})
+            conteudo = b''.join(resposta.streaming_content)
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(conteudo.startswith(b'%PDF'))
+        pool.assert_not_called()
+
+    def test_acima_do_limite(self):
+        with mock.patch('principal.services.etiquetaServices.gerar_folha') as gerar:
+            resposta = self.client.get(reverse('folha_etiquetas'), {'chave_nome': 'Sala'})
+
+        self.assertRedirects(resposta, reverse('lista_chaves') + '?chave_nome=Sala', fetch_redirect_response=False)
+        self.assertIn('gerar_etiquetas', str(list(resposta.wsgi_request._messages)[0]))
+        gerar.assert_not_called()
+
+
+@override_settings(AUTENTICACAO_CACHE_SEGUNDOS=30, AUTENTICACAO_CACHE_MAXIMO=1000)
+class CacheAutenticacaoTests(BaseTestCase):
+    """
+    UsuarioEmCacheBackend: o usuário da sessão, seus grupos e permissões
+    vêm do cache do processo até uma mudança que os invalide.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.backend = UsuarioEmCacheBackend()
+        self.ana = criar_usuario('ana')
+        self.grupo = Group.objects.create(name='TI')
+        self.permissao = Permission.objects.get(codename='change_chave')
+
+    def test_acerto_sem_consultas(self):
+        self.backend.get_user(self.ana.pk)
+        with self.assertNumQueries(0):
+            usuario = self.backend.get_user(self.ana.pk)
+        self.assertEqual((usuario.username, usuario.grupo_ids), ('ana', frozenset()))
+
+        # Cada chamada recebe a sua cópia
+        usuario.first_name = 'alterado'
+        self.assertEqual(self.backend.get_user(self.ana.pk).first_name, '')
+
+    def test_permissoes_em_cache(self):
+        self.assertFalse(self.backend.get_user(self.ana.pk).has_perm('principal.change_chave'))
+        with self.assertNumQueries(0):
+            self.assertFalse(self.backend.get_user(self.ana.pk).has_perm('principal.change_chave'))
+
+    def test_invalidacao(self):
+        self.backend.get_user(self.ana.pk)
+
+        self.ana.first_name = 'Ana'
+        self.ana.save()
+        self.assertEqual(self.backend.get_user(self.ana.pk).first_name, 'Ana')
+
+        self.ana.groups.add(self.grupo)
+        self.assertEqual(self.backend.get_user(self.ana.pk).grupo_ids, frozenset({self.grupo.pk}))
+
+        self.assertFalse(self.backend.get_user(self.ana.pk).has_perm('principal.change_chave'))
+        self.grupo.permissions.add(self.permissao)
+        self.assertTrue(self.backend.get_user(self.ana.pk).has_perm('principal.change_chave'))
+
+    def test_marcador_de_outro_processo(self):
+        self.backend.get_user(self.ana.pk)
+        # Mudança feita em outro processo: só o marcador no cache compartilhado muda
+        Usuario.objects.filter(pk=self.ana.pk).update(first_name='Ana')
+        caches['default'].set(f'{autenticacaoServices.PREFIXO_USUARIO}{self.ana.pk}', 1, None)
+        self.assertEqual(self.backend.get_user(self.ana.pk).first_name, 'Ana')
+
+    @override_settings(AUTENTICACAO_CACHE_MAXIMO=2)
+    def test_maximo_de_entradas(self):
+        usuarios = [self.ana, criar_usuario('bia'), criar_usuario('caio')]
+        for usuario in usuarios:
+            self.backend.get_user(usuario.pk)
+        self.assertEqual(list(autenticacaoServices._entradas), [usuarios[1].pk, usuarios[2].pk])
+
+    @override_settings(AUTENTICACAO_CACHE_SEGUNDOS=0)
+    def test_desativado(self):
+        self.backend.get_user(self.ana.pk)
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.ana.pk)
+        self.assertEqual(autenticacaoServices._entradas, {})
+
+
+class MetricasTests(BaseTestCase):
+    """
+    /metrics: acesso restrito (staff ou METRICAS_TOKEN) e as métricas por
+    rota medidas pelo MetricasMiddleware.
+    """
+
+    def setUp(self):
+        super().setUp()
+        metricasServices.limpar()
+        self.addCleanup(metricasServices.limpar)
+        self.ana = criar_usuario('ana')
+
+    def test_acesso(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        with override_settings(METRICAS_TOKEN='segredo'):
+            self.assertEqual(self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer outro').status_code, 403)
+            self.assertEqual(self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer segredo').status_code, 200)
+            self.assertEqual(
+                self.client.get(reverse('consultas_lentas'), HTTP_AUTHORIZATION='Bearer segredo').status_code, 200
+            )
+
+        self.client.force_login(self.ana)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        self.client.force_login(criar_usuario('portaria', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 200)
+
+    def test_rota_e_consultas_da_requisicao(self):
+        self.client.force_login(self.ana)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.client.get(reverse('index')).status_code, 200)
+        quantidade = len(consultas)  # O request_started da próxima requisição limpa o log de consultas
+
+        self.client.force_login(criar_usuario('portaria', is_staff=True))
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('chaves_requisicoes_total{rota="index",metodo="GET",status="200"} 1', texto)
+        self.assertIn(f'chaves_requisicao_consultas_sum{{rota="index"}} {quantidade}', texto)
+        self.assertIn('chaves_requisicao_consultas_count{rota="index"} 1', texto)
+
+    @override_settings(METRICAS_ATIVAS=False)
+    def test_desativadas(self):
+        self.client.force_login(self.ana)
+        self.client.get(reverse('index'))
+        metricasServices.contar('chaves_cache_usuario_total', resultado='acerto')
+
+        self.client.force_login(criar_usuario('portaria', is_staff=True))
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertNotIn('rota="index"', texto)
+        self.assertNotIn('chaves_cache_usuario_total{', texto)
+
+
+def carregar_settings(**ambiente):
+    """
+    Executa de novo o módulo de settings com estas variáveis de ambiente,
+    sem trocar o módulo já carregado (django.conf.settings não muda).
+    """
+    with mock.patch.dict(os.environ, ambiente):
+        for nome in ('DB_PERFIL', 'DB_NOME', 'DB_POOL', 'DB_CONN_MAX_AGE', 'DB_REPLICA_NOME', 'DB_REPLICA_HOST'):
+            if nome not in ambiente:
+                os.environ.pop(nome, None)
+        spec = importlib.util.find_spec(os.environ['DJANGO_SETTINGS_MODULE'])
+        modulo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulo)
+    return modulo
+
+
+class PerfilBancoTests(SimpleTestCase):
+    """
+    Perfis de banco de DB_PERFIL: PRAGMAs do SQLite aplicados a cada conexão
+    nova e conexões persistentes/verificadas no PostgreSQL.
+    """
+
+    def test_pragmas_sqlite(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = carregar_settings(DB_NOME=os.path.join(diretorio.name, 'perfil.sqlite3')).DATABASES['default']
+        self.assertEqual(configuracao['OPTIONS'], {'transaction_mode': 'IMMEDIATE'})
+
+        # Conexão nova (fora da do teste): o connection_created aplica SQLITE_PRAGMAS
+        padrao = connections['default']
+        conexao = padrao.__class__({**padrao.settings_dict, 'NAME': configuracao['NAME']}, alias='perfil')
+        self.addCleanup(conexao.close)
+        with conexao.cursor() as cursor:
+            valores = {}
+            for pragma in ('journal_mode', 'busy_timeout', 'synchronous', 'mmap_size'):
+                cursor.execute(f'PRAGMA {pragma}')
+                valores[pragma] = cursor.fetchone()[0]
+        self.assertEqual(valores, {
+            'journal_mode': 'wal',
+            'busy_timeout': settings.SQLITE_PRAGMAS['busy_timeout'],
+            'synchronous': 1,  # NORMAL
+            'mmap_size': settings.SQLITE_PRAGMAS['mmap_size'],
+        })
+
+    def test_postgresql(self):
+        configuracao = carregar_settings(
+            DB_PERFIL='postgresql', DB_NOME='chaves', DB_CONN_MAX_AGE='120'
+        ).DATABASES['default']
+        self.assertEqual(configuracao['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(configuracao['NAME'], 'chaves')
+        self.assertEqual(configuracao['CONN_MAX_AGE'], 120)
+        self.assertIs(configuracao['CONN_HEALTH_CHECKS'], True)
+        self.assertEqual(carregar_settings(DB_PERFIL='postgresql').DATABASES['default']['CONN_MAX_AGE'], 60)
+
+        # Com o pool do psycopg, sem conexões persistentes
+        configuracao = carregar_settings(DB_PERFIL='postgresql', DB_POOL='1').DATABASES['default']
+        self.assertNotIn('CONN_MAX_AGE', configuracao)
+        self.assertEqual(configuracao['OPTIONS']['pool']['max_size'], 10)
+
+    def test_perfil_invalido(self):
+        with self.assertRaises(ImproperlyConfigured):
+            carregar_settings(DB_PERFIL='mysql')
+
+
+@override_settings(REPLICA_TOLERANCIA={'index': 5}, REPLICA_ADERENCIA_SEGUNDOS=10)
+class RoteadorReplicaTests(SimpleTestCase):
+    """
+    RoteadorReplica e ReplicaMiddleware: só as leituras liberadas pelo
+    middleware (view tolerante, réplica no prazo, sem escrita recente) e dos
+    modelos de REPLICA_MODELOS vão para a réplica.
+    """
+
+    def requisitar(self, url, atraso=(0.0, 5), em_dia=True, escrever=False, cookies=None):
+        """
+        Passa uma requisição pelo middleware; retorna (bancos de leitura do
+        histórico antes e depois da escrita, resposta).
+        """
+        roteador = routers.RoteadorReplica()
+        bancos = []
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            bancos.append(roteador.db_for_read(HistoricoEmprestimo))
+            if escrever:
+                roteador.db_for_write(HistoricoEmprestimo)
+                bancos.append(roteador.db_for_read(HistoricoEmprestimo))
+            resposta = HttpResponse()
+            resposta['ETag'] = '"v1"'
+            return resposta
+
+        request = RequestFactory().get(url)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(url)
+        middleware = ReplicaMiddleware(view)
+        with mock.patch.object(routers, 'replica_configurada', return_value=True), \
+                mock.patch('principal.middleware.atraso_replica', return_value=atraso), \
+                mock.patch('principal.middleware.replica_em_dia', return_value=em_dia):
+            resposta = middleware(request)
+        self.assertIsNone(routers.estado_atual())
+        return bancos, resposta
+
+    def test_fora_de_requisicao(self):
+        roteador = routers.RoteadorReplica()
+        self.assertEqual(roteador.db_for_read(HistoricoEmprestimo), 'default')
+        self.assertFalse(roteador.allow_migrate('replica', 'principal'))
+        self.assertTrue(roteador.allow_migrate('default', 'principal'))
+
+    def test_modelos(self):
+        estado, token = routers.iniciar_requisicao()
+        self.addCleanup(routers.encerrar_requisicao, token)
+        estado.replica = True
+        roteador = routers.RoteadorReplica()
+        self.assertEqual(roteador.db_for_read(HistoricoEmprestimo), 'replica')
+        self.assertEqual(roteador.db_for_read(Chave), 'replica')
+        self.assertEqual(roteador.db_for_read(Usuario), 'default')
+
+    def test_replica_em_dia(self):
+        bancos, resposta = self.requisitar(reverse('index'))
+        self.assertEqual(bancos, ['replica'])
+        self.assertEqual(resposta['ETag'], '"v1"')
+
+    def test_replica_atrasada_no_prazo(self):
+        # Lê da réplica, mas sem ETag: ele vem do principal
+        bancos, resposta = self.requisitar(reverse('index'), atraso=(3.0, 5), em_dia=False)
+        self.assertEqual(bancos, ['replica'])
+        self.assertFalse(resposta.has_header('ETag'))
+
+    def test_principal(self):
+        casos = {
+            'atraso acima da tolerância': dict(url=reverse('index'), atraso=(30.0, 5)),
+            'réplica indisponível': dict(url=reverse('index'), atraso=(None, 0)),
+            'view sem tolerância': dict(url=reverse('lista_chaves')),
+            'escrita recente': dict(url=reverse('index'), cookies={COOKIE_ADERENCIA: '1'}),
+        }
+        for caso, argumentos in casos.items():
+            with self.subTest(caso):
+                bancos, resposta = self.requisitar(**argumentos)
+                self.assertEqual(bancos, ['default'])
+                self.assertEqual(resposta['ETag'], '"v1"')
+
+    def test_escrita_volta_ao_principal(self):
+        bancos, resposta = self.requisitar(reverse('index'), escrever=True)
+        self.assertEqual(bancos, ['replica', 'default'])
+        self.assertEqual(resposta.cookies[COOKIE_ADERENCIA]['max-age'], 10)
+
+
+class EstaticosMiddlewareTests(SimpleTestCase):
+    """
+    EstaticosMiddleware: serve STATIC_ROOT com a variante comprimida aceita,
+    cache 'immutable' nos arquivos com hash e 304 nos demais; o resto segue
+    para a aplicação.
+    """
+
+    CSS = b'body { color: #333; }\n' * 40
+
+    def setUp(self):
+        raiz = tempfile.TemporaryDirectory()
+        self.addCleanup(raiz.cleanup)
+        os.makedirs(os.path.join(raiz.name, 'styles'))
+        for nome in ('style.css', 'style.0123456789ab.css'):
+            caminho = os.path.join(raiz.name, 'styles', nome)
+            with open(caminho, 'wb') as arquivo:
+                arquivo.write(self.CSS)
+            estaticosServices.comprimir(caminho)
+
+        configuracao = override_settings(ESTATICOS_SERVIR=True, ESTATICOS_MAX_AGE=300, STATIC_ROOT=raiz.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.fabrica = RequestFactory()
+        self.middleware = EstaticosMiddleware(lambda request: HttpResponse('aplicação', status=404))
+        self.middleware._imutaveis = {'styles/style.0123456789ab.css'}  # Como no manifesto do collectstatic
+
+    def test_desligado(self):
+        with override_settings(ESTATICOS_SERVIR=False), self.assertRaises(MiddlewareNotUsed):
+            EstaticosMiddleware(lambda request: None)
+
+    def test_variante_comprimida(self):
+        resposta = self.middleware(self.fabrica.get('/static/styles/style.css', HTTP_ACCEPT_ENCODING='gzip, deflate'))
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        self.assertEqual(resposta['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(resposta.content), self.CSS)
+
+        resposta = self.middleware(self.fabrica.get('/static/styles/style.css'))
+        self.assertFalse(resposta.has_header('Content-Encoding'))
+        self.assertEqual(resposta.content, self.CSS)
+        self.assertTrue(resposta['Content-Type'].startswith('text/css'))
+
+    def test_cache(self):
+        resposta = self.middleware(self.fabrica.get('/static/styles/style.0123456789ab.css'))
+        self.assertEqual(resposta['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        resposta = self.middleware(self.fabrica.get('/static/styles/style.css'))
+        self.assertEqual(resposta['Cache-Control'], 'public, max-age=300')
+        resposta = self.middleware(self.fabrica.get(
+            '/static/styles/style.css', HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified']
+        ))
+        self.assertEqual(resposta.status_code, 304)
+
+    def test_head(self):
+        resposta = self.middleware(self.fabrica.head('/static/styles/style.css'))
+        self.assertEqual((resposta.content, resposta['Content-Length']), (b'', str(len(self.CSS))))
+
+    def test_segue_para_a_aplicacao(self):
+        for caminho in ('/static/styles/nada.css', '/static/../settings.py', '/static/', '/chaves/'):
+            with self.subTest(caminho=caminho):
+                self.assertEqual(self.middleware(self.fabrica.get(caminho)).content.decode(), 'aplicação')
+        self.assertEqual(self.middleware(self.fabrica.post('/static/styles/style.css')).status_code, 404)
+
+    def test_assincrono(self):
+        async def aplicacao(request):
+            return HttpResponse('aplicação', status=404)
+
+        middleware = EstaticosMiddleware(aplicacao)
+        resposta = async_to_sync(middleware)(self.fabrica.get('/static/styles/style.css', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(gzip.decompress(resposta.content), self.CSS)
+        resposta = async_to_sync(middleware)(self.fabrica.get('/chaves/'))
+        self.assertEqual(resposta.status_code, 404)
+
+
+@override_settings(QRCODE_PROCESSOS=2, QRCODE_FILA_MAXIMA=8, QRCODE_TIMEOUT_SEGUNDOS=2)
+class PoolQrcodeTests(SimpleTestCase):
+    """
+    Pool de leitura de QR Code: o tempo limite vale só para a execução, e um
+    processo travado é substituído sem derrubar os outros.
+    """
+
+    def setUp(self):
+        qrcodeServices._vagas = None  # O semáforo é criado com QRCODE_FILA_MAXIMA do momento
+        self.addCleanup(self.encerrar_pool)
+
+    def encerrar_pool(self):
+        with qrcodeServices._condicao:
+            livres = list(qrcodeServices._livres)
+            qrcodeServices._livres.clear()
+        for leitor in livres:
+            qrcodeServices._descartar_leitor(leitor)
+        qrcodeServices._vagas = None
+
+    def em_paralelo(self, chamadas):
+        # Executa as chamadas em threads (como requisições simultâneas); retorna resultados ou exceções
+        resultados = [None] * len(chamadas)
+
+        def executar(indice, funcao, argumentos):
+            try:
+                resultados[indice] = qrcodeServices.executar_no_pool(funcao, argumentos)
+            except Exception as erro:
+                resultados[indice] = erro
+
+        threads = [threading.Thread(target=executar, args=(indice, *chamada)) for indice, chamada in enumerate(chamadas)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return resultados
+
+    def test_espera_na_fila_nao_conta_no_tempo(self):
+        # 6 leituras de 0,8 s em 2 processos: as últimas esperam mais que o limite antes de executar
+        resultados = self.em_paralelo([(time.sleep, (0.8,))] * 6)
+        self.assertEqual(resultados, [None] * 6)
+        self.assertEqual(qrcodeServices._total, 2)
+
+    @override_settings(QRCODE_TIMEOUT_SEGUNDOS=1)
+    def test_so_o_processo_travado_e_substituido(self):
+        pids = set(self.em_paralelo([(os.getpid, ())] * 2))
+        self.assertEqual(len(pids), 2)
+
+        travada, rapida = self.em_paralelo([(time.sleep, (30,)), (os.getpid, ())])
+
+        self.assertIsInstance(travada, qrcodeServices.LeituraIndisponivel)
+        self.assertIn(rapida, pids)  # O outro processo continuou atendendo
+        self.assertEqual(qrcodeServices._total, 1)
+        self.assertIn(qrcodeServices.executar_no_pool(os.getpid, ()), pids)
+
+    def test_erro_da_leitura_nao_descarta_o_processo(self):
+        with self.assertRaises(qrcodeServices.ImagemRecusada):
+            qrcodeServices.executar_no_pool(qrcodeServices.ler_qrcode, (b'nao e imagem', 10 ** 6, 100))
+        self.assertEqual(qrcodeServices._total, 1)
+        self.assertEqual(len(qrcodeServices._livres), 1)
+
+    @override_settings(QRCODE_FILA_MAXIMA=1)
+    def test_fila_cheia(self):
+        ocupada = threading.Thread(target=qrcodeServices.executar_no_pool, args=(time.sleep, (1,)))
+        ocupada.start()
+        time.sleep(0.1)
+        with self.assertRaises(qrcodeServices.LeituraIndisponivel):
+            qrcodeServices.executar_no_pool(os.getpid, ())
+        ocupada.join()
+
+
+class BenchmarkQrcodeTests(SimpleTestCase):
+    """
+    benchmark_qrcode conta as fotos recusadas em vez de interromper a medição.
+    """
+
+    def test_foto_recusada(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            Image.new('L', (200, 200), 255).save(os.path.join(pasta, 'branca.png'))
+            with open(os.path.join(pasta, 'corrompida.jpg'), 'wb') as arquivo:
+                arquivo.write(b'nao e imagem')
+            saida = io.StringIO()
+            call_command('benchmark_qrcode', pasta, '--lados', '64', '--repeticoes', '2', stdout=saida)
+
+        linhas = [linha.split() for linha in saida.getvalue().splitlines() if linha.startswith(('completa', 'reduzida', 'pipeline'))]
+        self.assertEqual([linha[0] for linha in linhas], ['completa', 'reduzida-64', 'pipeline-64'])
+        self.assertEqual({(linha[1], linha[2]) for linha in linhas}, {('0/2', '1')})
+
+
+class BenchmarkDadosTests(BaseTestCase):
+    """
+    benchmark_dados: a mesma semente gera os mesmos dados.
+    """
+
+    def gerar(self, semente):
+        # Gera num banco vazio e desfaz no final, para a próxima geração partir do mesmo estado
+        with transaction.atomic():
+            call_command(
+                'benchmark_dados', '--usuarios', '30', '--chaves', '12', '--historico', '600', '--grupos', '3',
+                '--dias', '14', '--semente', str(semente), stdout=io.StringIO(),
+            )
+            quantidades = {
+                modelo.__name__: modelo.objects.count()
+                for modelo in (Usuario, Group, Chave, HistoricoEmprestimo, SessaoEmprestimo, UsoChaveDia, InstantaneoChaves)
+            }
+            # Pelos nomes, não pelos ids (as sequências não voltam em todos os bancos)
+            conteudo = [
+                list(Usuario.objects.order_by('username').values_list(
+                    'username', 'first_name', 'last_name', 'contato', 'is_staff'
+                )),
+                sorted(Usuario.groups.through.objects.values_list('usuario__username', 'group__name')),
+                list(Chave.objects.order_by('nome').values_list('nome', 'descricao', 'status', 'portador_atual__username')),
+                sorted(Chave.grupos_permissao.through.objects.values_list('chave__nome', 'group__name')),
+                list(HistoricoEmprestimo.objects.order_by('pk').values_list(
+                    'data_hora', 'chave__nome', 'usuario__username', 'acao'
+                )),
+            ]
+            transaction.set_rollback(True)
+        return quantidades, hashlib.sha256(repr(conteudo).encode()).hexdigest()
+
+    def test_mesma_semente_mesmos_dados(self):
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now()):  # Mesmo dia nas duas execuções
+            quantidades, soma = self.gerar(7)
+            self.assertGreater(quantidades['HistoricoEmprestimo'], 0)
+            self.assertEqual(self.gerar(7), (quantidades, soma))
+            self.assertNotEqual(self.gerar(8)[1], soma)
+
+
+class BenchmarkRotasTests(SimpleTestCase):
+    """
+    Toda rota nomeada do projeto está na carga do benchmark_rotas ou, com o
+    motivo, em carga.FORA_DA_CARGA.
+    """
+
+    def nomes(self, padroes, namespace=''):
+        for padrao in padroes:
+            if isinstance(padrao, URLResolver):
+                if padrao.namespace == 'admin':
+                    continue
+                prefixo = f'{namespace}{padrao.namespace}:' if padrao.namespace else namespace
+                yield from self.nomes(padrao.url_patterns, prefixo)
+            elif padrao.name:
+                yield f'{namespace}{padrao.name}'
+
+    def test_rotas_cobertas(self):
+        rotas = set(self.nomes(get_resolver().url_patterns))
+        na_carga = {nome.split(':post')[0] for nome in carga.ROTAS}
+
+        self.assertEqual(rotas - na_carga - set(carga.FORA_DA_CARGA), set(), 'Rotas sem benchmark')
+        self.assertEqual((na_carga | set(carga.FORA_DA_CARGA)) - rotas, set(), 'Rotas que não existem mais')
+        self.assertEqual(na_carga & set(carga.FORA_DA_CARGA), set())
@@ -8,16 +8,20 @@ Arquivo de configuração de URLs do aplicativo 'principal'.
 - Define um handler customizado para erros 404.
 """
 
+from django.conf import settings
 from django.urls import include, path  # path: define rotas; include: inclui URLs de outro app
 from . import views  # importa as views locais do app 'principal'
 from django.contrib.auth import views as auth_views  # views de autenticação (login/logout) do Django
 
+# VIEWS_ASYNC (servidor ASGI): as rotas mais acessadas usam as versões assíncronas das views
+VIEWS_ASYNC = getattr(settings, 'VIEWS_ASYNC', False)
+
 # Lista de URLs do aplicativo principal
 urlpatterns = [
     # URL: / (Raiz)
-    # View: views.index
+    # View: views.index (ou views.index_async com VIEWS_ASYNC)
     # Nome: 'index' (usado em {% url 'index' %})
-    path('', views.index, name='index'),
+    path('', views.index_async if VIEWS_ASYNC else views.index, name='index'),
 
     # URL: /qr_code/
     # Inclui as URLs do app 'qr_code' com namespace 'qr_code' (evita conflitos de nomes)
@@ -29,25 +33,55 @@ urlpatterns = [
     path('scan/', views.scan_page, name='scan_page'),
 
     # URL: /historico/
-    # View: views.historico_list
+    # View: views.historico_list (ou views.historico_list_async com VIEWS_ASYNC)
     # Nome: 'historico_list'
-    path('historico/', views.historico_list, name='historico_list'),
+    path('historico/', views.historico_list_async if VIEWS_ASYNC else views.historico_list, name='historico_list'),
     
+    # URL: /historico/exportar/
+    # View: views.exportar_historico (CSV/JSONL em fluxo, com os filtros do histórico)
+    # Nome: 'exportar_historico'
+    path('historico/exportar/', views.exportar_historico, name='exportar_historico'),
+
+    # URL: /historico/sessoes/
+    # View: views.sessoes_list (períodos com cada chave: portador, início, fim e duração)
+    # Nome: 'sessoes_list'
+    path('historico/sessoes/', views.sessoes_list, name='sessoes_list'),
+
+    # URL: /historico/instante/
+    # View: views.estado_chaves_em (com quem estava cada chave num instante; ?formato=json)
+    # Nome: 'estado_chaves_em'
+    path('historico/instante/', views.estado_chaves_em, name='estado_chaves_em'),
+
+    # URL: /analise/
+    # View: views.painel_uso (painel de análise, lido dos agregados de uso)
+    # Nome: 'painel_uso'
+    path('analise/', views.painel_uso, name='painel_uso'),
+
     # URL: /api/ultimos-emprestimos/
-    # View: views.api_ultimos_emprestimos
+    # View: views.api_ultimos_emprestimos (ou views.api_ultimos_emprestimos_async com VIEWS_ASYNC)
     # Nome: 'api_ultimos_emprestimos'
-    path('api/ultimos-emprestimos/', views.api_ultimos_emprestimos, name='api_ultimos_emprestimos'),
+    path('api/ultimos-emprestimos/', views.api_ultimos_emprestimos_async if VIEWS_ASYNC else views.api_ultimos_emprestimos, name='api_ultimos_emprestimos'),
+
+    # URL: /api/eventos-emprestimos/
+    # View: views.stream_emprestimos (feed ao vivo via Server-Sent Events; requer ASGI)
+    # Nome: 'stream_emprestimos'
+    path('api/eventos-emprestimos/', views.stream_emprestimos, name='stream_emprestimos'),
     
     # URL: /chave/1/ (ou /chave/2/, etc.)
-    # View: views.pegar_chave
+    # View: views.pegar_chave (ou views.pegar_chave_async com VIEWS_ASYNC)
     # Nome: 'pegar_chave' (usado em {% url 'pegar_chave' pk=chave.pk %})
-    path('chave/<int:pk>/', views.pegar_chave, name='pegar_chave'),
+    path('chave/<int:pk>/', views.pegar_chave_async if VIEWS_ASYNC else views.pegar_chave, name='pegar_chave'),
 
     # URL: /chaves/
     # View: views.lista_chaves
     # Nome: 'lista_chaves' (usado em {% url 'lista_chaves' %})
     path('chaves/', views.lista_chaves, name='lista_chaves'),
 
+    # URL: /chaves/lote/
+    # View: views.acoes_em_lote (recebe/entrega várias chaves de uma vez)
+    # Nome: 'acoes_em_lote'
+    path('chaves/lote/', views.acoes_em_lote, name='acoes_em_lote'),
+
     # URL: /chave/<pk>/receber/
     # View: views.receber_chave (processa a devolução/recebimento de uma chave)
     # Nome: 'receber_chave'
@@ -63,6 +97,31 @@ urlpatterns = [
     # Nome: 'gerar_qrcode_chave'
     path('chave/<int:pk>/qrcode/', views.gerar_qrcode_chave, name='gerar_qrcode_chave'),
 
+    # URL: /chave/<pk>/qrcode.png (ou .svg)
+    # View: views.qrcode_chave_imagem (imagem do QR Code, gerada uma vez e guardada em MEDIA_ROOT)
+    # Nome: 'qrcode_chave_imagem'
+    path('chave/<int:pk>/qrcode.<str:formato>', views.qrcode_chave_imagem, name='qrcode_chave_imagem'),
+
+    # URL: /chaves/etiquetas/
+    # View: views.folha_etiquetas (PDF com as etiquetas das chaves filtradas)
+    # Nome: 'folha_etiquetas'
+    path('chaves/etiquetas/', views.folha_etiquetas, name='folha_etiquetas'),
+
+    # URL: /q/<token>/
+    # View: views.retirar_por_qrcode (retirada direta pela etiqueta: token assinado com id e versão da chave)
+    # Nome: 'retirar_por_qrcode'
+    path('q/<str:token>/', views.retirar_por_qrcode, name='retirar_por_qrcode'),
+
+    # URL: /metrics
+    # View: views.metricas (métricas por rota no formato Prometheus; staff ou METRICAS_TOKEN)
+    # Nome: 'metricas'
+    path('metrics', views.metricas, name='metricas'),
+
+    # URL: /metrics/consultas-lentas/
+    # View: views.consultas_lentas (amostras recentes de consultas lentas com o SQL, em JSON)
+    # Nome: 'consultas_lentas'
+    path('metrics/consultas-lentas/', views.consultas_lentas, name='consultas_lentas'),
+
     # URL: /login/
     # View: auth_views.LoginView (com template 'usuario/login.html')
     # Nome: 'login' (usado em {% url 'login' %})
@@ -4,7 +4,12 @@ from django.core.paginator import Paginator
 from django.db.models import Q
 from principal.models import HistoricoEmprestimo, Chave, Usuario
 
-from .subviews.chaveViews import lista_chaves, pegar_chave, receber_chave, entregar_chave
-from .subviews.emprestimoViews import historico_list, api_ultimos_emprestimos
-from .subviews.indexViews import index
-from .subviews.qrcodeViews import gerar_qrcode_chave, scan_page
+from .subviews.chaveViews import lista_chaves, pegar_chave, pegar_chave_async, receber_chave, entregar_chave, acoes_em_lote
+from .subviews.emprestimoViews import (
+    historico_list, historico_list_async, exportar_historico, sessoes_list, estado_chaves_em,
+    api_ultimos_emprestimos, api_ultimos_emprestimos_async, stream_emprestimos
+)
+from .subviews.indexViews import index, index_async
+from .subviews.analiseViews import painel_uso
+from .subviews.metricasViews import metricas, consultas_lentas
+from .subviews.qrcodeViews import gerar_qrcode_chave, qrcode_chave_imagem, folha_etiquetas, retirar_por_qrcode, scan_page